@@ -0,0 +1,125 @@
+"""
+Mapa de permisos efectivos por (rol, usuario) del sistema de componentes.
+
+Cada chequeo de permiso (clases de permiso de DRF en cada escritura, login,
+session-auth-state) reconstruía el mismo resultado con varias consultas. Aquí
+se guardan en la caché compartida dos piezas:
+
+- los componentes de cada rol (ComponenteRol), que comparten todos sus usuarios;
+- los overrides de cada usuario (ComponenteUsuario).
+
+Las entradas de rol llevan una versión global que se sube al cambiar
+Componente o ComponenteRol; las de usuario, además, una versión propia que se
+sube al cambiar sus ComponenteUsuario (ver signals.py). El mapa combinado se
+memoriza en la instancia del usuario durante la request, así que cada
+chequeo es un lookup en un dict.
+"""
+
+import uuid
+
+from django.core.cache import cache
+
+from .models import ComponenteRol, ComponenteUsuario
+
+
+PERMISOS_CACHE_TTL_SECONDS = 60 * 60
+PERMISOS_VERSION_CACHE_KEY = 'componentes:version:{alcance}'
+ALCANCE_GLOBAL = 'global'
+
+
+def _versiones(usuario_id):
+    claves = [
+        PERMISOS_VERSION_CACHE_KEY.format(alcance=ALCANCE_GLOBAL),
+        PERMISOS_VERSION_CACHE_KEY.format(alcance=f'usuario-{usuario_id}'),
+    ]
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            cache.add(clave, uuid.uuid4().hex, None)
+            versiones[clave] = cache.get(clave)
+    return versiones[claves[0]], versiones[claves[1]]
+
+
+def invalidar_permisos(usuario_id=None):
+    """Invalida los overrides de un usuario o, sin usuario, todo el mapa."""
+    alcance = f'usuario-{usuario_id}' if usuario_id else ALCANCE_GLOBAL
+    cache.set(PERMISOS_VERSION_CACHE_KEY.format(alcance=alcance), uuid.uuid4().hex, None)
+
+
+def _datos_componente(componente, permiso):
+    return {
+        'id': componente.id,
+        'nombre': componente.nombre,
+        'descripcion': componente.descripcion,
+        'permiso': permiso,
+    }
+
+
+def _componentes_rol(rol_id, version_global):
+    clave = f'componentes:rol:{rol_id}:{version_global}'
+    componentes = cache.get(clave)
+    if componentes is None:
+        componentes = {
+            cr.componente_id: _datos_componente(cr.componente, cr.permiso)
+            for cr in ComponenteRol.objects.filter(rol_id=rol_id).select_related('componente').order_by('id')
+        }
+        cache.set(clave, componentes, PERMISOS_CACHE_TTL_SECONDS)
+    return componentes
+
+
+def _overrides_usuario(usuario_id, version_global, version_usuario):
+    clave = f'componentes:usuario:{usuario_id}:{version_global}:{version_usuario}'
+    overrides = cache.get(clave)
+    if overrides is None:
+        overrides = {
+            cu.componente_id: (cu.activo, _datos_componente(cu.componente, cu.permiso))
+            for cu in ComponenteUsuario.objects.filter(usuario_id=usuario_id).select_related('componente')
+        }
+        cache.set(clave, overrides, PERMISOS_CACHE_TTL_SECONDS)
+    return overrides
+
+
+def componentes_efectivos(usuario):
+    """
+    {componente_id: {id, nombre, descripcion, permiso}} del usuario:
+    el override de ComponenteUsuario reemplaza al permiso del rol, un override
+    inactivo revoca el acceso aunque el rol lo conceda y un override activo
+    concede acceso aunque el rol no lo tenga. Con la caché caliente no hay
+    consultas.
+    """
+    memo = getattr(usuario, '_componentes_efectivos', None)
+    if memo is not None and memo[0] == usuario.rol_id:
+        return memo[1]
+
+    version_global, version_usuario = _versiones(usuario.pk)
+    overrides = _overrides_usuario(usuario.pk, version_global, version_usuario)
+    rol = _componentes_rol(usuario.rol_id, version_global) if usuario.rol_id else {}
+
+    efectivos = {}
+    for componente_id, datos in rol.items():
+        override = overrides.get(componente_id)
+        if override is None:
+            efectivos[componente_id] = datos
+        elif override[0]:
+            efectivos[componente_id] = override[1]
+    for componente_id, (activo, datos) in overrides.items():
+        if activo and componente_id not in efectivos:
+            efectivos[componente_id] = datos
+
+    usuario._componentes_efectivos = (usuario.rol_id, efectivos)
+    return efectivos
+
+
+def permisos_por_nombre(usuario):
+    """{nombre del componente: 'VER'/'EDITAR'} con la misma precedencia."""
+    memo = getattr(usuario, '_permisos_por_nombre', None)
+    efectivos = componentes_efectivos(usuario)
+    if memo is not None and memo[0] is efectivos:
+        return memo[1]
+
+    permisos = {}
+    for datos in efectivos.values():
+        # Con nombres de componente repetidos gana el primero.
+        permisos.setdefault(datos['nombre'], datos['permiso'])
+    usuario._permisos_por_nombre = (efectivos, permisos)
+    return permisos
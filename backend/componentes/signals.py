@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Componente, ComponenteRol, ComponenteUsuario
+from .permisos import invalidar_permisos
+
+
+@receiver(post_save, sender=Componente)
+@receiver(post_delete, sender=Componente)
+@receiver(post_save, sender=ComponenteRol)
+@receiver(post_delete, sender=ComponenteRol)
+def invalidar_permisos_de_roles(sender, **kwargs):
+    transaction.on_commit(invalidar_permisos)
+
+
+@receiver(post_save, sender=ComponenteUsuario)
+@receiver(post_delete, sender=ComponenteUsuario)
+def invalidar_permisos_de_usuario(sender, instance, **kwargs):
+    usuario_id = instance.usuario_id
+    transaction.on_commit(lambda: invalidar_permisos(usuario_id))
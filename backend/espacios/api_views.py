@@ -5,10 +5,13 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import EspacioFisico, EspacioPermitido
+from .ocupacion import IndiceOcupacion
 from horario.models import Horario
 from prestamos.models import PrestamoEspacio
+from prestamos.ocurrencias import prestamos_en_rango
 from usuarios.models import Usuario
 from mysite.auth_helpers import MISSING_SECCIONAL_MESSAGE, get_user_seccional_id, is_superuser_effective, user_supervisa_espacios
+from mysite.cache_utils import schedule_etag, schedule_not_modified, schedule_scope, with_schedule_etag
 
 
 def _filtrar_espacios_por_sede_usuario(request, queryset):
@@ -71,6 +74,13 @@ def list_all_espacios_with_horarios(request):
         if _usuario_sin_seccional(request):
             return _missing_seccional_response()
 
+        user = getattr(request, 'user_obj', None)
+        seccional_id = None if not user or is_superuser_effective(user) else get_user_seccional_id(user)
+        etag = schedule_etag(schedule_scope(seccional_id), 'list_all_espacios_with_horarios')
+        no_modificado = schedule_not_modified(request, etag)
+        if no_modificado:
+            return no_modificado
+
         base = _filtrar_espacios_por_sede_usuario(request, EspacioFisico.objects.all())
 
         espacios = base.select_related('sede', 'tipo').prefetch_related(
@@ -110,7 +120,7 @@ def list_all_espacios_with_horarios(request):
                 }
             )
 
-        return JsonResponse({'espacios': lista}, status=200)
+        return with_schedule_etag(JsonResponse({'espacios': lista}, status=200), etag)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -491,11 +501,14 @@ def proximos_apertura_cierre(request):
                     }
                 )
 
-        prestamos = PrestamoEspacio.objects.filter(
-            espacio_id__in=espacios_ids,
-            fecha=fecha_actual,
-            estado='Aprobado',
-        ).select_related('espacio', 'espacio__sede', 'espacio__tipo', 'usuario', 'tipo_actividad')
+        prestamos = prestamos_en_rango(
+            PrestamoEspacio.objects.filter(
+                espacio_id__in=espacios_ids,
+                estado='Aprobado',
+            ).select_related('espacio', 'espacio__sede', 'espacio__tipo', 'usuario', 'tipo_actividad'),
+            fecha_actual,
+            fecha_actual,
+        )
 
         for prestamo in prestamos:
             espacio = espacios_map.get(prestamo.espacio.id)
@@ -797,49 +810,6 @@ def cerrar_espacio(request, espacio_id=None):
         return JsonResponse({'error': str(e)}, status=500)
 
 
-def _calcular_duracion_horas(hora_inicio, hora_fin):
-    from datetime import datetime as dt, time
-
-    inicio_dt = dt.combine(dt.today(), hora_inicio) if isinstance(hora_inicio, time) else hora_inicio
-    fin_dt = dt.combine(dt.today(), hora_fin) if isinstance(hora_fin, time) else hora_fin
-    duracion = (fin_dt - inicio_dt).total_seconds() / 3600
-    return max(0, duracion)
-
-
-def _calcular_interseccion_horas(inicio1, fin1, inicio2, fin2):
-    inicio_interseccion = max(inicio1, inicio2)
-    fin_interseccion = min(fin1, fin2)
-    if inicio_interseccion >= fin_interseccion:
-        return 0
-    duracion = (fin_interseccion - inicio_interseccion).total_seconds() / 3600
-    return max(0, duracion)
-
-
-def _distribuir_horas_en_jornadas(hora_inicio, hora_fin):
-    from datetime import datetime as dt, time
-
-    hora_6 = time(6, 0)
-    hora_12 = time(12, 0)
-    hora_18 = time(18, 0)
-    hora_22 = time(22, 0)
-
-    inicio_dt = dt.combine(dt.today(), hora_inicio) if isinstance(hora_inicio, time) else hora_inicio
-    fin_dt = dt.combine(dt.today(), hora_fin) if isinstance(hora_fin, time) else hora_fin
-
-    manana_inicio = dt.combine(dt.today(), hora_6)
-    manana_fin = dt.combine(dt.today(), hora_12)
-    tarde_inicio = dt.combine(dt.today(), hora_12)
-    tarde_fin = dt.combine(dt.today(), hora_18)
-    noche_inicio = dt.combine(dt.today(), hora_18)
-    noche_fin = dt.combine(dt.today(), hora_22)
-
-    return {
-        'manana': _calcular_interseccion_horas(inicio_dt, fin_dt, manana_inicio, manana_fin),
-        'tarde': _calcular_interseccion_horas(inicio_dt, fin_dt, tarde_inicio, tarde_fin),
-        'noche': _calcular_interseccion_horas(inicio_dt, fin_dt, noche_inicio, noche_fin),
-    }
-
-
 @csrf_exempt
 def ocupacion_semanal(request):
     if request.method != 'GET':
@@ -861,57 +831,23 @@ def ocupacion_semanal(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)
 
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo',
-        }
-
         espacios_query = _filtrar_espacios_por_sede_usuario(request, EspacioFisico.objects.all().select_related('tipo', 'sede'))
         if tipo_espacio_id:
             espacios_query = espacios_query.filter(tipo_id=tipo_espacio_id)
         if espacio_id:
             espacios_query = espacios_query.filter(id=espacio_id)
 
+        espacios = list(espacios_query)
+        indice = IndiceOcupacion([espacio.id for espacio in espacios], lunes, sabado)
+
         ocupacion_list = []
-        for espacio in espacios_query:
-            horas_manana = 0.0
-            horas_tarde = 0.0
-            horas_noche = 0.0
+        for espacio in espacios:
             horas_disponibles = 16 * 6
+            horas_jornada = indice.horas_por_jornada(espacio.id)
 
-            fecha_actual = lunes
-            while fecha_actual <= sabado:
-                dia_nombre_en = fecha_actual.strftime('%A')
-                dia_nombre_es = dias_nombre.get(dia_nombre_en, dia_nombre_en)
-
-                horarios_dia = Horario.objects.filter(espacio=espacio, dia_semana__iexact=dia_nombre_es, estado='aprobado')
-                if not horarios_dia.exists():
-                    horarios_dia = Horario.objects.filter(espacio=espacio, dia_semana__iexact=dia_nombre_en, estado='aprobado')
-
-                prestamos_dia = PrestamoEspacio.objects.filter(espacio=espacio, fecha=fecha_actual, estado='Aprobado')
-
-                for horario in horarios_dia:
-                    horas_ocupadas = _distribuir_horas_en_jornadas(horario.hora_inicio, horario.hora_fin)
-                    horas_manana += horas_ocupadas['manana']
-                    horas_tarde += horas_ocupadas['tarde']
-                    horas_noche += horas_ocupadas['noche']
-
-                for prestamo in prestamos_dia:
-                    horas_ocupadas = _distribuir_horas_en_jornadas(prestamo.hora_inicio, prestamo.hora_fin)
-                    horas_manana += horas_ocupadas['manana']
-                    horas_tarde += horas_ocupadas['tarde']
-                    horas_noche += horas_ocupadas['noche']
-
-                fecha_actual += timedelta(days=1)
-
-            horas_manana = min(horas_manana, 36)
-            horas_tarde = min(horas_tarde, 36)
-            horas_noche = min(horas_noche, 24)
+            horas_manana = min(horas_jornada['manana'], 36)
+            horas_tarde = min(horas_jornada['tarde'], 36)
+            horas_noche = min(horas_jornada['noche'], 24)
             horas_totales = horas_manana + horas_tarde + horas_noche
 
             porcentaje_manana = (horas_manana / 36) * 100 if horas_manana > 0 else 0
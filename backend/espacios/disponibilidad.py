@@ -0,0 +1,170 @@
+"""Búsqueda de espacios libres por franja sobre bitmaps en caché.
+
+`list_espacios_disponibles_por_horario` se consulta una y otra vez mientras
+se arrastra una clase por la grilla semanal. En vez de escanear Horario en
+cada llamada, se mantiene en caché un mapa por día con un bitmap por espacio
+(un bit por minuto del día ocupado por algún horario aprobado) más los datos
+de los espacios disponibles. Una consulta (día, hora_inicio, hora_fin,
+seccional, capacidad mínima) se responde con un AND de bitmaps sin SQL.
+
+El mapa se invalida subiendo una versión desde las señales post_save y
+post_delete de Horario, EspacioFisico y Sede (ver signals.py).
+"""
+
+import time
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from horario.models import Horario
+
+from .models import EspacioFisico
+from .ocupacion import normalizar_dia_semana
+
+
+DISPONIBILIDAD_CACHE_TTL_SECONDS = 60 * 60
+DISPONIBILIDAD_VERSION_CACHE_KEY = 'disponibilidad:version'
+
+
+def _minuto_inicio(valor):
+    return valor.hour * 60 + valor.minute
+
+
+def _minuto_fin(valor):
+    # Redondea hacia arriba para no perder solapamientos de segundos sueltos.
+    return valor.hour * 60 + valor.minute + (1 if valor.second or valor.microsecond else 0)
+
+
+def mascara_franja(hora_inicio, hora_fin):
+    """Bitmap con un bit por minuto de [hora_inicio, hora_fin)."""
+    inicio = _minuto_inicio(hora_inicio)
+    fin = _minuto_fin(hora_fin)
+    if fin <= inicio:
+        return 0
+    return ((1 << (fin - inicio)) - 1) << inicio
+
+
+def _serializar_espacio(espacio):
+    sede = espacio.sede
+    seccional = sede.seccional if sede else None
+    return {
+        "id": espacio.id,
+        "nombre": espacio.nombre,
+        "tipo": espacio.tipo.nombre if espacio.tipo else "Sin tipo",
+        "capacidad": espacio.capacidad,
+        "sede_id": sede.id if sede else None,
+        "sede_nombre": sede.nombre if sede else "Sin sede",
+        "sede_seccional_id": seccional.id if seccional else None,
+        "sede_seccional_ciudad": seccional.ciudad if seccional else None,
+        "ubicacion": espacio.ubicacion,
+        "estado": espacio.estado,
+        "esta_abierto": espacio.esta_abierto,
+    }
+
+
+class MapaDisponibilidad:
+    """Ocupación semanal de todos los espacios en bitmaps por día."""
+
+    def __init__(self):
+        # Espacios con estado 'Disponible', ya serializados para la respuesta.
+        self.espacios = []
+        # dia normalizado -> {espacio_id: bitmap de minutos ocupados}
+        self.ocupacion = defaultdict(dict)
+        # horario_id -> (dia, espacio_id) y (dia, espacio_id) -> [(horario_id, bitmap)];
+        # permiten excluir el horario que se está moviendo sin volver a la base de datos.
+        self.horarios = {}
+        self.horarios_por_espacio = defaultdict(list)
+
+    @classmethod
+    def construir(cls):
+        mapa = cls()
+        espacios = EspacioFisico.objects.select_related('sede__seccional', 'tipo').filter(
+            estado='Disponible'
+        ).order_by('id')
+        mapa.espacios = [_serializar_espacio(espacio) for espacio in espacios]
+
+        horarios = Horario.objects.filter(
+            estado='aprobado',
+            espacio__isnull=False,
+        ).values_list('id', 'espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin')
+        for horario_id, espacio_id, dia_semana, hora_inicio, hora_fin in horarios:
+            dia = normalizar_dia_semana(dia_semana)
+            mascara = mascara_franja(hora_inicio, hora_fin)
+            por_espacio = mapa.ocupacion[dia]
+            por_espacio[espacio_id] = por_espacio.get(espacio_id, 0) | mascara
+            mapa.horarios[horario_id] = (dia, espacio_id)
+            mapa.horarios_por_espacio[(dia, espacio_id)].append((horario_id, mascara))
+
+        mapa.ocupacion = dict(mapa.ocupacion)
+        mapa.horarios_por_espacio = dict(mapa.horarios_por_espacio)
+        return mapa
+
+    def _ocupacion_sin_horario(self, dia, excluir_horario_id):
+        ocupacion = self.ocupacion.get(dia, {})
+        excluido = self.horarios.get(excluir_horario_id)
+        if not excluido or excluido[0] != dia:
+            return ocupacion
+
+        espacio_id = excluido[1]
+        mascara = 0
+        for horario_id, mascara_horario in self.horarios_por_espacio.get(excluido, []):
+            if horario_id != excluir_horario_id:
+                mascara |= mascara_horario
+        ocupacion = dict(ocupacion)
+        ocupacion[espacio_id] = mascara
+        return ocupacion
+
+    def espacios_libres(self, dia_semana, hora_inicio, hora_fin, seccional_id=None,
+                        capacidad_minima=None, excluir_horario_id=None):
+        dia = normalizar_dia_semana(dia_semana)
+        consulta = mascara_franja(hora_inicio, hora_fin)
+        ocupacion = self._ocupacion_sin_horario(dia, excluir_horario_id)
+
+        libres = []
+        for espacio in self.espacios:
+            if seccional_id is not None and espacio['sede_seccional_id'] != seccional_id:
+                continue
+            if capacidad_minima is not None and espacio['capacidad'] < capacidad_minima:
+                continue
+            if ocupacion.get(espacio['id'], 0) & consulta:
+                continue
+            libres.append(espacio)
+        return libres
+
+
+def _version_disponibilidad():
+    """Token aleatorio (no un contador) para que un reinicio o un `cache.clear()`
+    nunca haga coincidir la versión con la copia local de un mapa viejo."""
+    version = cache.get(DISPONIBILIDAD_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(DISPONIBILIDAD_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(DISPONIBILIDAD_VERSION_CACHE_KEY)
+    return version
+
+
+def invalidar_mapa_disponibilidad():
+    cache.set(DISPONIBILIDAD_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+# Copia ya deserializada del último mapa leído por este proceso, para no
+# deserializarlo de la caché en cada petición mientras la versión no cambie.
+# Caduca igual que la entrada de caché, por si hubo cambios sin señales
+# (p. ej. `QuerySet.update` desde un ETL).
+_mapa_local = (None, None, 0.0)
+
+
+def obtener_mapa_disponibilidad():
+    global _mapa_local
+
+    cache_key = f"disponibilidad:mapa:{_version_disponibilidad()}"
+    clave_local, mapa_local, expira = _mapa_local
+    if clave_local == cache_key and time.monotonic() < expira:
+        return mapa_local
+
+    mapa = cache.get(cache_key)
+    if mapa is None:
+        mapa = MapaDisponibilidad.construir()
+        cache.set(cache_key, mapa, DISPONIBILIDAD_CACHE_TTL_SECONDS)
+    _mapa_local = (cache_key, mapa, time.monotonic() + DISPONIBILIDAD_CACHE_TTL_SECONDS)
+    return mapa
@@ -1,7 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
+from espacios.disponibilidad import invalidar_mapa_disponibilidad
 from espacios.models import EspacioFisico
+from mysite.cache_utils import bump_global_schedule_version
 
 
 class Command(BaseCommand):
@@ -34,6 +36,10 @@ class Command(BaseCommand):
             actualizados = EspacioFisico.objects.exclude(estado="Disponible").update(
                 estado="Disponible"
             )
+            # update() no dispara las señales de EspacioFisico: se invalidan los
+            # ETag y el mapa de espacios libres aquí
+            transaction.on_commit(bump_global_schedule_version)
+            transaction.on_commit(invalidar_mapa_disponibilidad)
 
         self.stdout.write(
             self.style.SUCCESS(
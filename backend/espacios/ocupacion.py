@@ -0,0 +1,306 @@
+"""Índice en memoria de la ocupación semanal de espacios.
+
+`ocupacion_semanal` calculaba las horas por jornada consultando Horario y
+PrestamoEspacio por cada espacio y cada día (hasta tres queries por
+combinación). Este módulo carga de una vez todos los horarios aprobados y
+los préstamos aprobados de la semana, los agrupa por (espacio, día) en
+listas de intervalos ordenadas y responde las sumas por jornada sin volver
+a tocar la base de datos.
+
+Los reportes de espacios y sus PDF usan en cambio `MatrizOcupacion`, una
+matriz semana × espacio × franja de 15 minutos que se arma una sola vez y
+queda en caché por (seccional, semana, estados de horario).
+"""
+
+import unicodedata
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+
+from horario.models import Horario
+from prestamos.models import PrestamoEspacio
+from prestamos.ocurrencias import filas_en_rango
+
+
+DIAS_NOMBRE = {
+    'Monday': 'Lunes',
+    'Tuesday': 'Martes',
+    'Wednesday': 'Miércoles',
+    'Thursday': 'Jueves',
+    'Friday': 'Viernes',
+    'Saturday': 'Sábado',
+    'Sunday': 'Domingo',
+}
+
+# Jornadas en segundos desde medianoche: Mañana (6-12), Tarde (12-18), Noche (18-22).
+JORNADAS = (
+    ('manana', 6 * 3600, 12 * 3600),
+    ('tarde', 12 * 3600, 18 * 3600),
+    ('noche', 18 * 3600, 22 * 3600),
+)
+
+
+def _segundos(valor):
+    return valor.hour * 3600 + valor.minute * 60 + valor.second
+
+
+def distribuir_segundos_en_jornadas(inicio, fin):
+    """Horas de [inicio, fin) (en segundos) que caen en cada jornada."""
+    resultado = {}
+    for nombre, jornada_inicio, jornada_fin in JORNADAS:
+        interseccion = min(fin, jornada_fin) - max(inicio, jornada_inicio)
+        resultado[nombre] = interseccion / 3600 if interseccion > 0 else 0
+    return resultado
+
+
+class IndiceOcupacion:
+    """Intervalos ocupados por espacio y día para una semana (lunes a sábado).
+
+    Hace exactamente dos queries (horarios aprobados y préstamos aprobados del
+    rango) sin importar cuántos espacios se consulten. Respeta la misma regla
+    que la versión por día: se usan los horarios cuyo `dia_semana` coincide
+    (sin distinguir mayúsculas) con el nombre en español y, solo si no hay
+    ninguno, los que usan el nombre en inglés.
+    """
+
+    def __init__(self, espacios_ids, lunes, sabado):
+        self.lunes = lunes
+        self.sabado = sabado
+        self._horarios = defaultdict(list)
+        self._prestamos = defaultdict(list)
+
+        espacios_ids = list(espacios_ids)
+        if not espacios_ids:
+            return
+
+        horarios = Horario.objects.filter(
+            espacio_id__in=espacios_ids,
+            estado='aprobado',
+        ).values_list('espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin')
+        for espacio_id, dia_semana, hora_inicio, hora_fin in horarios:
+            self._horarios[(espacio_id, str(dia_semana or '').lower())].append(
+                (_segundos(hora_inicio), _segundos(hora_fin))
+            )
+
+        prestamos = PrestamoEspacio.objects.filter(
+            espacio_id__in=espacios_ids,
+            estado='Aprobado',
+        )
+        for fila in filas_en_rango(prestamos, lunes, sabado, 'espacio_id', 'hora_inicio', 'hora_fin'):
+            self._prestamos[(fila['espacio_id'], fila['fecha'])].append(
+                (_segundos(fila['hora_inicio']), _segundos(fila['hora_fin']))
+            )
+
+        for intervalos in self._horarios.values():
+            intervalos.sort()
+        for intervalos in self._prestamos.values():
+            intervalos.sort()
+
+    def fechas(self):
+        fecha_actual = self.lunes
+        while fecha_actual <= self.sabado:
+            yield fecha_actual
+            fecha_actual += timedelta(days=1)
+
+    def intervalos_horario(self, espacio_id, fecha):
+        dia_nombre_en = fecha.strftime('%A')
+        dia_nombre_es = DIAS_NOMBRE.get(dia_nombre_en, dia_nombre_en)
+        intervalos = self._horarios.get((espacio_id, dia_nombre_es.lower()))
+        if not intervalos:
+            intervalos = self._horarios.get((espacio_id, dia_nombre_en.lower()), [])
+        return intervalos
+
+    def intervalos_prestamo(self, espacio_id, fecha):
+        return self._prestamos.get((espacio_id, fecha), [])
+
+    def horas_por_jornada(self, espacio_id):
+        """Suma semanal (sin recortar) de horas ocupadas por jornada."""
+        totales = {'manana': 0.0, 'tarde': 0.0, 'noche': 0.0}
+        for fecha in self.fechas():
+            for intervalos in (
+                self.intervalos_horario(espacio_id, fecha),
+                self.intervalos_prestamo(espacio_id, fecha),
+            ):
+                for inicio, fin in intervalos:
+                    horas = distribuir_segundos_en_jornadas(inicio, fin)
+                    totales['manana'] += horas['manana']
+                    totales['tarde'] += horas['tarde']
+                    totales['noche'] += horas['noche']
+        return totales
+
+
+# ---------- Matriz de ocupación para reportes ----------
+
+RESOLUCION_MINUTOS = 15
+SEGUNDOS_POR_FRANJA = RESOLUCION_MINUTOS * 60
+FRANJAS_POR_DIA = 24 * 60 // RESOLUCION_MINUTOS
+FRANJAS_JORNADA = {
+    nombre: (inicio // SEGUNDOS_POR_FRANJA, fin // SEGUNDOS_POR_FRANJA)
+    for nombre, inicio, fin in JORNADAS
+}
+
+OCUPACION_CACHE_TTL_SECONDS = 300
+OCUPACION_VERSION_CACHE_KEY = 'ocupacion:version'
+
+# Día de la semana (0 = lunes) por nombre normalizado. Los nombres en inglés
+# solo se usan para un (espacio, día) que no tenga horarios en español.
+_DIAS_ES = {'lunes': 0, 'martes': 1, 'miercoles': 2, 'jueves': 3, 'viernes': 4, 'sabado': 5, 'domingo': 6}
+_DIAS_EN = {'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6}
+
+
+def normalizar_dia_semana(valor):
+    texto = str(valor or '').strip().lower()
+    return ''.join(
+        char for char in unicodedata.normalize('NFD', texto)
+        if unicodedata.category(char) != 'Mn'
+    )
+
+
+def _franja(segundos):
+    """Franja de 15 minutos más cercana al instante dado."""
+    return min(FRANJAS_POR_DIA, (segundos + SEGUNDOS_POR_FRANJA // 2) // SEGUNDOS_POR_FRANJA)
+
+
+class MatrizOcupacion:
+    """Ocupación semana × espacio × franja de 15 minutos.
+
+    Cada espacio tiene un `array('H')` de `dias * FRANJAS_POR_DIA` contadores:
+    cuántos horarios o préstamos ocupan cada franja. Todas las métricas de los
+    reportes de espacios (horas por jornada, horas totales, usos, capacidad)
+    se derivan de aquí, así que la semana se lee de la base de datos una sola
+    vez y se puede guardar en caché (ver `obtener_matriz_ocupacion`).
+    """
+
+    def __init__(self, lunes, sabado):
+        self.lunes = lunes
+        self.dias = (sabado - lunes).days + 1
+        self.franjas = {}
+        self.usos = defaultdict(int)
+        # Estudiantes estimados por día según el último horario del día (-1 = sin horario).
+        self.estudiantes_horario = {}
+        # Bitmask de días con algún préstamo.
+        self.dias_con_prestamo = defaultdict(int)
+
+    @classmethod
+    def construir(cls, seccional_id, lunes, sabado, estados_horario):
+        """Carga horarios y préstamos aprobados de la semana en dos queries.
+
+        `seccional_id=None` construye la matriz para todos los espacios.
+        """
+        matriz = cls(lunes, sabado)
+
+        horarios = Horario.objects.filter(
+            espacio__isnull=False,
+            estado__in=list(estados_horario),
+        )
+        prestamos = PrestamoEspacio.objects.filter(estado='Aprobado')
+        if seccional_id is not None:
+            horarios = horarios.filter(espacio__sede__seccional_id=seccional_id)
+            prestamos = prestamos.filter(espacio__sede__seccional_id=seccional_id)
+
+        horarios_por_dia = defaultdict(lambda: ([], []))
+        for espacio_id, dia_semana, hora_inicio, hora_fin, cantidad in horarios.order_by('id').values_list(
+            'espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'cantidad_estudiantes'
+        ):
+            nombre = normalizar_dia_semana(dia_semana)
+            if nombre in _DIAS_ES:
+                horarios_por_dia[(espacio_id, _DIAS_ES[nombre])][0].append((hora_inicio, hora_fin, cantidad))
+            elif nombre in _DIAS_EN:
+                horarios_por_dia[(espacio_id, _DIAS_EN[nombre])][1].append((hora_inicio, hora_fin, cantidad))
+
+        for (espacio_id, dia), (en_espanol, en_ingles) in horarios_por_dia.items():
+            if dia >= matriz.dias:
+                continue
+            filas = en_espanol or en_ingles
+            for hora_inicio, hora_fin, cantidad in filas:
+                matriz._marcar(espacio_id, dia, hora_inicio, hora_fin)
+            estudiantes = matriz.estudiantes_horario.setdefault(espacio_id, array('i', [-1] * matriz.dias))
+            estudiantes[dia] = filas[-1][2] or 30
+
+        # Incluye las ocurrencias de la semana de las series guardadas como regla
+        for fila in filas_en_rango(prestamos, lunes, sabado, 'espacio_id', 'hora_inicio', 'hora_fin'):
+            dia = (fila['fecha'] - lunes).days
+            matriz._marcar(fila['espacio_id'], dia, fila['hora_inicio'], fila['hora_fin'])
+            matriz.dias_con_prestamo[fila['espacio_id']] |= 1 << dia
+
+        return matriz
+
+    def _marcar(self, espacio_id, dia, hora_inicio, hora_fin):
+        franjas = self.franjas.get(espacio_id)
+        if franjas is None:
+            franjas = self.franjas[espacio_id] = array('H', bytes(2 * self.dias * FRANJAS_POR_DIA))
+        inicio = _franja(_segundos(hora_inicio))
+        fin = max(inicio + 1, _franja(_segundos(hora_fin)))
+        base = dia * FRANJAS_POR_DIA
+        for indice in range(base + inicio, base + min(fin, FRANJAS_POR_DIA)):
+            franjas[indice] += 1
+        self.usos[espacio_id] += 1
+
+    def horas(self, espacio_id, desde=0, hasta=FRANJAS_POR_DIA):
+        """Horas ocupadas en la semana entre las franjas [desde, hasta) de cada día."""
+        franjas = self.franjas.get(espacio_id)
+        if franjas is None:
+            return 0.0
+        total = 0
+        for dia in range(self.dias):
+            base = dia * FRANJAS_POR_DIA
+            total += sum(franjas[base + desde:base + hasta])
+        return total * RESOLUCION_MINUTOS / 60
+
+    def horas_por_jornada(self, espacio_id):
+        return {
+            nombre: self.horas(espacio_id, desde, hasta)
+            for nombre, (desde, hasta) in FRANJAS_JORNADA.items()
+        }
+
+    def usos_espacio(self, espacio_id):
+        return self.usos.get(espacio_id, 0)
+
+    def estudiantes_por_dia(self, espacio_id, capacidad):
+        """Estudiantes estimados para cada día con actividad.
+
+        Un día con clases toma `cantidad_estudiantes` del último horario (30
+        si no está definido); un día solo con préstamos asume el 30% de la
+        capacidad del espacio.
+        """
+        estudiantes = self.estudiantes_horario.get(espacio_id)
+        prestamos = self.dias_con_prestamo.get(espacio_id, 0)
+        resultado = []
+        for dia in range(self.dias):
+            if estudiantes is not None and estudiantes[dia] >= 0:
+                resultado.append(estudiantes[dia])
+            elif prestamos & (1 << dia):
+                resultado.append(int(capacidad * 0.3))
+        return resultado
+
+
+def _version_ocupacion():
+    return cache.get(OCUPACION_VERSION_CACHE_KEY, 0)
+
+
+def invalidar_matriz_ocupacion():
+    """Descarta todas las matrices cacheadas subiendo la versión de la clave."""
+    try:
+        cache.incr(OCUPACION_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(OCUPACION_VERSION_CACHE_KEY, 1, None)
+
+
+def obtener_matriz_ocupacion(seccional_id, lunes, sabado, estados_horario):
+    """Matriz de la semana para la seccional (o todas si es None), cacheada
+    por (seccional, semana, conjunto de estados de horario)."""
+    estados = sorted(set(estados_horario))
+    cache_key = 'ocupacion:matriz:{}:{}:{}:{}:{}'.format(
+        _version_ocupacion(),
+        'all' if seccional_id is None else seccional_id,
+        lunes.isoformat(),
+        sabado.isoformat(),
+        '-'.join(estados),
+    )
+    matriz = cache.get(cache_key)
+    if matriz is None:
+        matriz = MatrizOcupacion.construir(seccional_id, lunes, sabado, estados)
+        cache.set(cache_key, matriz, OCUPACION_CACHE_TTL_SECONDS)
+    return matriz
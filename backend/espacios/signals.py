@@ -0,0 +1,111 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from asignaturas.models import Asignatura
+from grupos.models import Grupo
+from horario.models import Horario
+from periodos.models import PeriodoAcademico
+from prestamos.models import PrestamoEspacio
+from programas.models import Programa
+from mysite.cache_utils import bump_global_schedule_version, bump_schedule_version
+from sedes.models import Sede
+from usuarios.models import Usuario
+
+from .disponibilidad import invalidar_mapa_disponibilidad
+from .models import EspacioFisico
+from .ocupacion import invalidar_matriz_ocupacion
+
+
+@receiver(post_save, sender=Horario)
+@receiver(post_delete, sender=Horario)
+@receiver(post_save, sender=PrestamoEspacio)
+@receiver(post_delete, sender=PrestamoEspacio)
+@receiver(post_save, sender=EspacioFisico)
+@receiver(post_delete, sender=EspacioFisico)
+def invalidar_ocupacion_cacheada(sender, **kwargs):
+    # Al confirmar: antes, una lectura concurrente podría cachear la matriz
+    # de los datos sin confirmar bajo la versión nueva.
+    transaction.on_commit(invalidar_matriz_ocupacion)
+
+
+@receiver(post_save, sender=Horario)
+@receiver(post_delete, sender=Horario)
+@receiver(post_save, sender=EspacioFisico)
+@receiver(post_delete, sender=EspacioFisico)
+@receiver(post_save, sender=Sede)
+@receiver(post_delete, sender=Sede)
+def invalidar_disponibilidad_cacheada(sender, **kwargs):
+    transaction.on_commit(invalidar_mapa_disponibilidad)
+
+
+def _subir_version_horarios(espacio_ids):
+    """Sube, al confirmar la transacción, la versión de horarios de las
+    seccionales de `espacio_ids` (y siempre la de 'all'). Si se subiera antes,
+    una lectura concurrente podría cachear datos viejos con la versión nueva."""
+    espacio_ids = {espacio_id for espacio_id in espacio_ids if espacio_id}
+
+    def _subir():
+        seccional_ids = set()
+        if espacio_ids:
+            seccional_ids = set(EspacioFisico.objects.filter(
+                id__in=espacio_ids
+            ).values_list('sede__seccional_id', flat=True))
+        bump_schedule_version(seccional_ids)
+
+    transaction.on_commit(_subir)
+
+
+@receiver(pre_save, sender=Horario)
+def recordar_espacio_anterior_horario(sender, instance, **kwargs):
+    # Las signals de horario reemplazan `_valores_originales` en post_save;
+    # se guarda aquí el espacio leído para invalidar también su seccional.
+    originales = getattr(instance, '_valores_originales', None) or {}
+    instance._espacio_id_anterior = originales.get('espacio_id')
+
+
+@receiver(post_save, sender=Horario)
+@receiver(post_delete, sender=Horario)
+def subir_version_horarios_por_horario(sender, instance, **kwargs):
+    _subir_version_horarios({instance.espacio_id, getattr(instance, '_espacio_id_anterior', None)})
+
+
+@receiver(post_save, sender=PrestamoEspacio)
+@receiver(post_delete, sender=PrestamoEspacio)
+def subir_version_horarios_por_prestamo(sender, instance, **kwargs):
+    _subir_version_horarios({instance.espacio_id})
+
+
+@receiver(post_save, sender=EspacioFisico)
+@receiver(post_delete, sender=EspacioFisico)
+@receiver(post_save, sender=Sede)
+@receiver(post_delete, sender=Sede)
+def subir_version_horarios_global(sender, **kwargs):
+    # Un espacio o una sede pueden cambiar de seccional: se invalidan todas.
+    transaction.on_commit(bump_global_schedule_version)
+
+
+# Los listados con ETag también muestran nombres de grupos, asignaturas,
+# programas, periodos y docentes: cambiar cualquiera invalida todo.
+CAMPOS_USUARIO_SIN_HORARIO = {'last_login', 'password', 'contrasena_hash'}
+
+
+@receiver(post_save, sender=Grupo)
+@receiver(post_delete, sender=Grupo)
+@receiver(post_save, sender=Asignatura)
+@receiver(post_delete, sender=Asignatura)
+@receiver(post_save, sender=Programa)
+@receiver(post_delete, sender=Programa)
+@receiver(post_save, sender=PeriodoAcademico)
+@receiver(post_delete, sender=PeriodoAcademico)
+def subir_version_horarios_por_catalogo(sender, **kwargs):
+    transaction.on_commit(bump_global_schedule_version)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def subir_version_horarios_por_usuario(sender, update_fields=None, **kwargs):
+    # Iniciar sesión o cambiar la contraseña no cambia lo que muestran los horarios
+    if update_fields and set(update_fields) <= CAMPOS_USUARIO_SIN_HORARIO:
+        return
+    transaction.on_commit(bump_global_schedule_version)
@@ -1,3 +1,199 @@
-from django.test import TestCase
+import json
+from datetime import time, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from asignaturas.models import Asignatura
+from facultades.models import Facultad
+from grupos.models import Grupo
+from horario.models import Horario
+from periodos.models import PeriodoAcademico
+from prestamos.models import PrestamoEspacio, TipoActividad
+from programas.models import Programa
+from sedes.models import Seccional, Sede
+
+from .api_views import ocupacion_semanal
+from .disponibilidad import invalidar_mapa_disponibilidad
+from .models import EspacioFisico, TipoEspacio
+from .ocupacion import invalidar_matriz_ocupacion, obtener_matriz_ocupacion
+from .views import list_espacios_disponibles_por_horario, reporte_disponibilidad
+
+
+class EspaciosConHorariosTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        hoy = timezone.now().date()
+        self.lunes = hoy - timedelta(days=hoy.weekday())
+
+        seccional = Seccional.objects.create(ciudad='Norte')
+        sede = Sede.objects.create(nombre='Sede Norte', seccional=seccional)
+        facultad = Facultad.objects.create(nombre='Facultad Norte', sede=sede)
+        programa = Programa.objects.create(nombre='Programa Norte', facultad=facultad, activo=True)
+        periodo = PeriodoAcademico.objects.create(
+            nombre='Periodo vigente',
+            fecha_inicio=self.lunes - timedelta(days=30),
+            fecha_fin=self.lunes + timedelta(days=30),
+        )
+        self.grupo = Grupo.objects.create(nombre='A', programa=programa, periodo=periodo, semestre=1)
+        self.asignatura = Asignatura.objects.create(
+            nombre='Derecho Civil',
+            codigo='DER-001',
+            creditos=3,
+            horas=2,
+            sede=sede,
+        )
+        tipo = TipoEspacio.objects.create(nombre='Aula')
+        self.espacios = [
+            EspacioFisico.objects.create(nombre=f'Aula {indice}', sede=sede, tipo=tipo, capacidad=30)
+            for indice in range(3)
+        ]
+        self.tipo_actividad = TipoActividad.objects.create(nombre='Reunion')
+
+    def _crear_horario(self, espacio, dia, hora_inicio, hora_fin):
+        return Horario.objects.create(
+            grupo=self.grupo,
+            asignatura=self.asignatura,
+            espacio=espacio,
+            dia_semana=dia,
+            hora_inicio=hora_inicio,
+            hora_fin=hora_fin,
+            estado='aprobado',
+        )
+
+
+class OcupacionSemanalTests(EspaciosConHorariosTestCase):
+    def _get_ocupacion(self):
+        response = ocupacion_semanal(self.factory.get('/api/espacios/ocupacion/semanal/'))
+        payload = json.loads(response.content.decode('utf-8'))
+        return {item['id']: item for item in payload['ocupacion']}
+
+    def test_suma_horarios_y_prestamos_por_jornada(self):
+        espacio = self.espacios[0]
+        self._crear_horario(espacio, 'Lunes', time(10, 0), time(14, 0))
+        self._crear_horario(espacio, 'Martes', time(19, 0), time(21, 30))
+        PrestamoEspacio.objects.create(
+            espacio=espacio,
+            tipo_actividad=self.tipo_actividad,
+            fecha=self.lunes + timedelta(days=2),
+            hora_inicio=time(7, 0),
+            hora_fin=time(8, 0),
+            estado='Aprobado',
+        )
+
+        ocupacion = self._get_ocupacion()[espacio.id]
+
+        self.assertEqual(ocupacion['horasOcupadasManana'], 3.0)
+        self.assertEqual(ocupacion['horasOcupadasTarde'], 2.0)
+        self.assertEqual(ocupacion['horasOcupadasNoche'], 2.5)
+        self.assertEqual(ocupacion['horasOcupadasSemana'], 7.5)
+
+    def test_usa_nombre_en_ingles_solo_si_no_hay_en_espanol(self):
+        espacio = self.espacios[1]
+        self._crear_horario(espacio, 'Thursday', time(8, 0), time(10, 0))
+
+        self.assertEqual(self._get_ocupacion()[espacio.id]['horasOcupadasManana'], 2.0)
+
+    def test_numero_de_queries_no_depende_de_los_espacios(self):
+        for espacio in self.espacios:
+            self._crear_horario(espacio, 'Viernes', time(8, 0), time(10, 0))
+
+        # espacios + horarios + préstamos
+        with self.assertNumQueries(3):
+            ocupacion = self._get_ocupacion()
+
+        self.assertEqual(len(ocupacion), len(self.espacios))
+
+    def test_matriz_de_reportes_se_reutiliza_hasta_que_cambian_los_horarios(self):
+        espacio = self.espacios[0]
+        self._crear_horario(espacio, 'Miercoles', time(8, 0), time(9, 30))
+        sabado = self.lunes + timedelta(days=5)
+
+        matriz = obtener_matriz_ocupacion(None, self.lunes, sabado, ['aprobado'])
+        self.assertEqual(matriz.horas(espacio.id), 1.5)
+        self.assertEqual(matriz.horas_por_jornada(espacio.id)['manana'], 1.5)
+        self.assertEqual(matriz.usos_espacio(espacio.id), 1)
+
+        with self.assertNumQueries(0):
+            obtener_matriz_ocupacion(None, self.lunes, sabado, ['aprobado'])
+
+        # La matriz se invalida al confirmar la transacción, no antes
+        with self.captureOnCommitCallbacks(execute=True):
+            self._crear_horario(espacio, 'Jueves', time(18, 0), time(20, 0))
+            with self.assertNumQueries(0):
+                obtener_matriz_ocupacion(None, self.lunes, sabado, ['aprobado'])
+        matriz = obtener_matriz_ocupacion(None, self.lunes, sabado, ['aprobado'])
+        self.assertEqual(matriz.horas(espacio.id), 3.5)
+
+        # aprobar_todos_horarios cambia el estado con update(), sin señales
+        Horario.objects.update(estado='pendiente')
+        invalidar_matriz_ocupacion()
+        self.assertEqual(obtener_matriz_ocupacion(None, self.lunes, sabado, ['aprobado']).horas(espacio.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('aprobar_todos_horarios', confirmar=True, stdout=StringIO())
+        self.assertEqual(obtener_matriz_ocupacion(None, self.lunes, sabado, ['aprobado']).horas(espacio.id), 3.5)
+
+    def test_reporte_disponibilidad_usa_la_matriz(self):
+        espacio = self.espacios[2]
+        self._crear_horario(espacio, 'Lunes', time(7, 0), time(11, 0))
+
+        response = reporte_disponibilidad(self.factory.get('/api/espacios/reporte/disponibilidad/'))
+        payload = json.loads(response.content.decode('utf-8'))
+        disponibilidad = {item['nombre']: item for item in payload['disponibilidad']}
+
+        self.assertEqual(disponibilidad[espacio.nombre]['horasOcupadas'], 4)
+        self.assertEqual(disponibilidad[espacio.nombre]['horasDisponibles'], 92)
+        self.assertEqual(payload['resumen']['total_ocupado'], 4)
+
+
+class EspaciosDisponiblesPorHorarioTests(EspaciosConHorariosTestCase):
+    def _libres(self, **params):
+        query = {'dia_semana': 'Lunes', 'hora_inicio': '09:00', 'hora_fin': '11:00', **params}
+        response = list_espacios_disponibles_por_horario(self.factory.get('/api/espacios/disponibles/por-horario/', query))
+        return [espacio['id'] for espacio in json.loads(response.content.decode('utf-8'))['espacios']]
+
+    def test_excluye_espacios_ocupados_sin_sql_en_consultas_repetidas(self):
+        ocupado = self.espacios[0]
+        horario = self._crear_horario(ocupado, 'Lunes', time(8, 0), time(10, 0))
+
+        self.assertNotIn(ocupado.id, self._libres())
+        with self.assertNumQueries(0):
+            self.assertNotIn(ocupado.id, self._libres(dia_semana='lunes'))
+            self.assertIn(ocupado.id, self._libres(hora_inicio='10:00', hora_fin='12:00'))
+            self.assertIn(ocupado.id, self._libres(horario_id=str(horario.id)))
+
+    def test_filtra_por_capacidad_y_se_invalida_al_guardar_horario(self):
+        grande = self.espacios[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            grande.capacidad = 80
+            grande.save()
+
+        self.assertEqual(self._libres(capacidad_minima='50'), [grande.id])
+
+        # El mapa se invalida al confirmar, no con los datos sin confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            self._crear_horario(grande, 'Lunes', time(10, 30), time(12, 0))
+            self.assertEqual(self._libres(capacidad_minima='50'), [grande.id])
+        self.assertEqual(self._libres(capacidad_minima='50'), [])
+
+    def test_comandos_con_update_invalidan_el_mapa(self):
+        EspacioFisico.objects.filter(id=self.espacios[0].id).update(estado='Mantenimiento')
+        invalidar_mapa_disponibilidad()
+        self.assertNotIn(self.espacios[0].id, self._libres())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('poner_espacios_disponibles', stdout=StringIO())
+        self.assertIn(self.espacios[0].id, self._libres())
+
+        horario = self._crear_horario(self.espacios[0], 'Lunes', time(9, 0), time(10, 0))
+        Horario.objects.filter(id=horario.id).update(estado='pendiente')
+        invalidar_mapa_disponibilidad()
+        self.assertIn(self.espacios[0].id, self._libres())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('aprobar_todos_horarios', confirmar=True, stdout=StringIO())
+        self.assertNotIn(self.espacios[0].id, self._libres())
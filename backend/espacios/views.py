@@ -1,18 +1,19 @@
 from django.shortcuts import render
 from .models import EspacioFisico, EspacioPermitido, TipoEspacio
+from .disponibilidad import obtener_mapa_disponibilidad
+from .ocupacion import IndiceOcupacion, MatrizOcupacion, obtener_matriz_ocupacion
 from sedes.models import Sede
 from usuarios.models import Usuario
 from recursos.models import Recurso, EspacioRecurso
 from horario.models import Horario
 from prestamos.models import PrestamoEspacio
+from prestamos.ocurrencias import prestamos_en_rango
 from django.http import JsonResponse
 import json
 from django.views.decorators.csrf import csrf_exempt
 from datetime import datetime, timedelta, time
 from django.utils import timezone
 from django.db.models import Count
-from collections import defaultdict
-import unicodedata
 
 from mysite.auth_helpers import MISSING_SECCIONAL_MESSAGE, get_user_seccional_id, is_superuser_effective
 
@@ -84,52 +85,25 @@ def _estado_horario_param(request, data=None):
     return 'todos' if include_pending else 'aprobado'
 
 
-def _normalizar_dia_semana(valor):
-    texto = str(valor or '').strip().lower()
-    return ''.join(
-        char for char in unicodedata.normalize('NFD', texto)
-        if unicodedata.category(char) != 'Mn'
-    )
-
-
-def _iterar_fechas_semana(lunes, sabado):
-    fecha_actual = lunes
-    while fecha_actual <= sabado:
-        yield fecha_actual
-        fecha_actual += timedelta(days=1)
+def _matriz_ocupacion_reporte(request, lunes, sabado, estado_horario='aprobado'):
+    """Matriz de ocupación compartida por los reportes de espacios y sus PDF.
 
+    Se construye para todo el alcance del usuario (su seccional, o todas si es
+    superusuario) y se cachea, así que el reporte JSON y su PDF de la misma
+    semana leen horarios y préstamos una sola vez.
+    """
+    user = getattr(request, 'user_obj', None)
+    if not user or is_superuser_effective(user):
+        seccional_id = None
+    else:
+        seccional_id = get_user_seccional_id(user)
+        if not seccional_id:
+            return MatrizOcupacion(lunes, sabado)
 
-def _preparar_datos_reporte_espacios(espacios, lunes, sabado, include_pending=False):
-    espacios_lista = list(espacios)
-    espacios_ids = [espacio.id for espacio in espacios_lista]
-    estados_horario = _estados_horario_reporte(include_pending)
-
-    horarios_por_espacio_dia = defaultdict(list)
-    if espacios_ids:
-        horarios = Horario.objects.filter(
-            espacio_id__in=espacios_ids,
-            estado__in=estados_horario
-        ).select_related('grupo')
-        for horario in horarios:
-            horarios_por_espacio_dia[
-                (horario.espacio_id, _normalizar_dia_semana(horario.dia_semana))
-            ].append(horario)
-
-    prestamos_por_espacio_fecha = defaultdict(list)
-    if espacios_ids:
-        prestamos = PrestamoEspacio.objects.filter(
-            espacio_id__in=espacios_ids,
-            fecha__range=(lunes, sabado),
-            estado='Aprobado'
-        )
-        for prestamo in prestamos:
-            prestamos_por_espacio_fecha[(prestamo.espacio_id, prestamo.fecha)].append(prestamo)
+    return obtener_matriz_ocupacion(
+        seccional_id, lunes, sabado, _estados_horario_reporte(estado_horario)
+    )
 
-    return {
-        'espacios': espacios_lista,
-        'horarios_por_espacio_dia': horarios_por_espacio_dia,
-        'prestamos_por_espacio_fecha': prestamos_por_espacio_fecha,
-    }
 
 # ---------- TipoEspacio CRUD ----------
 @csrf_exempt
@@ -400,13 +374,26 @@ def list_espacios(request):
 
 @csrf_exempt
 def list_espacios_disponibles_por_horario(request):
+    """
+    Espacios disponibles sin horarios aprobados que se crucen con la franja.
+
+    Parámetros GET:
+    - dia_semana, hora_inicio, hora_fin: franja a consultar (requeridos)
+    - seccional_id: limita a los espacios de esa seccional (opcional)
+    - capacidad_minima: capacidad mínima del espacio (opcional)
+    - horario_id: horario que se está moviendo y no cuenta como conflicto (opcional)
+
+    Se responde desde el mapa de bitmaps en caché (espacios/disponibilidad.py),
+    sin consultar la base de datos mientras no cambien horarios ni espacios.
+    """
     if request.method != 'GET':
         return JsonResponse({"error": "Solo se permite GET"}, status=405)
 
     dia_semana = request.GET.get('dia_semana')
     hora_inicio_raw = request.GET.get('hora_inicio')
     hora_fin_raw = request.GET.get('hora_fin')
-    seccional_id = request.GET.get('seccional_id')
+    seccional_raw = request.GET.get('seccional_id')
+    capacidad_raw = request.GET.get('capacidad_minima')
     horario_id = request.GET.get('horario_id')
 
     if not dia_semana or not hora_inicio_raw or not hora_fin_raw:
@@ -418,44 +405,36 @@ def list_espacios_disponibles_por_horario(request):
     except ValueError:
         return JsonResponse({"error": "Formato de hora inválido"}, status=400)
 
-    espacios_qs = EspacioFisico.objects.select_related('sede', 'tipo').filter(estado='Disponible')
+    if hora_fin <= hora_inicio:
+        return JsonResponse({"error": "hora_fin debe ser mayor que hora_inicio"}, status=400)
+
+    try:
+        excluir_horario_id = int(horario_id) if horario_id else None
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "horario_id inválido"}, status=400)
 
-    espacios_qs = _filtrar_espacios_por_sede_usuario(request, espacios_qs)
+    try:
+        seccional_id = int(seccional_raw) if seccional_raw else None
+        capacidad_minima = int(capacidad_raw) if capacidad_raw else None
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "seccional_id y capacidad_minima deben ser números"}, status=400)
 
-    horarios_conflicto = Horario.objects.filter(
-        estado='aprobado',
-        dia_semana__iexact=dia_semana,
-        hora_inicio__lt=hora_fin,
-        hora_fin__gt=hora_inicio,
+    user = getattr(request, 'user_obj', None)
+    if user and not is_superuser_effective(user):
+        seccional_usuario = get_user_seccional_id(user)
+        if not seccional_usuario or (seccional_id is not None and seccional_id != seccional_usuario):
+            return JsonResponse({"espacios": []}, status=200)
+        seccional_id = seccional_usuario
+
+    lst = obtener_mapa_disponibilidad().espacios_libres(
+        dia_semana,
+        hora_inicio,
+        hora_fin,
+        seccional_id=seccional_id,
+        capacidad_minima=capacidad_minima,
+        excluir_horario_id=excluir_horario_id,
     )
 
-    if horario_id:
-        try:
-            horarios_conflicto = horarios_conflicto.exclude(id=int(horario_id))
-        except (TypeError, ValueError):
-            return JsonResponse({"error": "horario_id inválido"}, status=400)
-
-    espacios_ocupados = horarios_conflicto.values_list('espacio_id', flat=True)
-    espacios_disponibles = espacios_qs.exclude(id__in=espacios_ocupados)
-
-    lst = []
-    for espacio in espacios_disponibles:
-        sede = espacio.sede
-        seccional = sede.seccional if sede else None
-        lst.append({
-            "id": espacio.id,
-            "nombre": espacio.nombre,
-            "tipo": espacio.tipo.nombre if espacio.tipo else "Sin tipo",
-            "capacidad": espacio.capacidad,
-            "sede_id": sede.id if sede else None,
-            "sede_nombre": sede.nombre if sede else "Sin sede",
-            "sede_seccional_id": seccional.id if seccional else None,
-            "sede_seccional_ciudad": seccional.ciudad if seccional else None,
-            "ubicacion": espacio.ubicacion,
-            "estado": espacio.estado,
-            "esta_abierto": espacio.esta_abierto,
-        })
-
     return JsonResponse({"espacios": lst}, status=200)
 
 
@@ -952,11 +931,14 @@ def proximos_apertura_cierre(request):
                 })
         
         # ========== CONSULTAR PRÉSTAMOS ==========
-        prestamos = PrestamoEspacio.objects.filter(
-            espacio_id__in=espacios_ids,
-            fecha=fecha_actual,
-            estado='Aprobado'
-        ).select_related('espacio', 'espacio__sede', 'espacio__tipo', 'usuario', 'tipo_actividad')
+        prestamos = prestamos_en_rango(
+            PrestamoEspacio.objects.filter(
+                espacio_id__in=espacios_ids,
+                estado='Aprobado',
+            ).select_related('espacio', 'espacio__sede', 'espacio__tipo', 'usuario', 'tipo_actividad'),
+            fecha_actual,
+            fecha_actual,
+        )
         
         for prestamo in prestamos:
             espacio = espacios_map.get(prestamo.espacio.id)
@@ -1317,17 +1299,6 @@ def ocupacion_semanal(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)  # Lunes + 5 días = Sábado
         
-        # Mapeo de nombres de días (inglés a español y variantes)
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
-        
         # Obtener espacios
         espacios_query = EspacioFisico.objects.all().select_related('tipo', 'sede')
         espacios_query = _filtrar_espacios_por_sede_usuario(request, espacios_query)
@@ -1338,70 +1309,20 @@ def ocupacion_semanal(request):
         if espacio_id:
             espacios_query = espacios_query.filter(id=espacio_id)
         
+        espacios = list(espacios_query)
+        indice = IndiceOcupacion([espacio.id for espacio in espacios], lunes, sabado)
+
         ocupacion_list = []
         
-        for espacio in espacios_query:
-            # Calcular horas ocupadas por cada jornada
-            horas_manana = 0.0      # 6-12 (6 horas máx)
-            horas_tarde = 0.0       # 12-18 (6 horas máx)
-            horas_noche = 0.0       # 18-22 (4 horas máx)
-            horas_totales = 0.0
-            
+        for espacio in espacios:
             # Horas disponibles en la semana: 16 horas/día * 6 días = 96 horas
             horas_disponibles = 16 * 6  # 96 horas
             
-            # Recorrer cada día de la semana (Lunes a Sábado)
-            fecha_actual = lunes
-            while fecha_actual <= sabado:
-                dia_nombre_en = fecha_actual.strftime('%A')
-                dia_nombre_es = dias_nombre.get(dia_nombre_en, dia_nombre_en)
-                
-                # Obtener horarios (clases) para este día y espacio - Solo aprobados
-                # Buscar con variantes de dia_semana (en español, en inglés, etc.)
-                horarios_dia = Horario.objects.filter(
-                    espacio=espacio,
-                    dia_semana__iexact=dia_nombre_es,
-                    estado='aprobado'  # Solo horarios aprobados
-                )
-                
-                # Si no encuentra con español, buscar con inglés
-                if not horarios_dia.exists():
-                    horarios_dia = Horario.objects.filter(
-                        espacio=espacio,
-                        dia_semana__iexact=dia_nombre_en,
-                        estado='aprobado'  # Solo horarios aprobados
-                    )
-                
-                # Obtener préstamos aprobados para este día y espacio
-                prestamos_dia = PrestamoEspacio.objects.filter(
-                    espacio=espacio,
-                    fecha=fecha_actual,
-                    estado='Aprobado'
-                )
-                
-                # Calcular horas ocupadas por horarios
-                for horario in horarios_dia:
-                    duracion = _calcular_duracion_horas(horario.hora_inicio, horario.hora_fin)
-                    horas_ocupadas_en_jornadas = _distribuir_horas_en_jornadas(
-                        horario.hora_inicio, 
-                        horario.hora_fin
-                    )
-                    horas_manana += horas_ocupadas_en_jornadas['manana']
-                    horas_tarde += horas_ocupadas_en_jornadas['tarde']
-                    horas_noche += horas_ocupadas_en_jornadas['noche']
-                
-                # Calcular horas ocupadas por préstamos
-                for prestamo in prestamos_dia:
-                    duracion = _calcular_duracion_horas(prestamo.hora_inicio, prestamo.hora_fin)
-                    horas_ocupadas_en_jornadas = _distribuir_horas_en_jornadas(
-                        prestamo.hora_inicio,
-                        prestamo.hora_fin
-                    )
-                    horas_manana += horas_ocupadas_en_jornadas['manana']
-                    horas_tarde += horas_ocupadas_en_jornadas['tarde']
-                    horas_noche += horas_ocupadas_en_jornadas['noche']
-                
-                fecha_actual += timedelta(days=1)
+            # Horas ocupadas por horarios (clases) y préstamos aprobados en cada jornada
+            horas_jornada = indice.horas_por_jornada(espacio.id)
+            horas_manana = horas_jornada['manana']      # 6-12 (6 horas máx)
+            horas_tarde = horas_jornada['tarde']        # 12-18 (6 horas máx)
+            horas_noche = horas_jornada['noche']        # 18-22 (4 horas máx)
             
             # Limitar horas máximas por jornada (para evitar duplicados)
             # Máximo 6 horas mañana (lunes-sábado)
@@ -1456,90 +1377,6 @@ def ocupacion_semanal(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-def _calcular_duracion_horas(hora_inicio, hora_fin):
-    """Calcula la duración en horas entre dos tiempos."""
-    from datetime import datetime, time
-    
-    # Convertir a datetime si son objetos time
-    if isinstance(hora_inicio, time):
-        inicio_dt = datetime.combine(datetime.today(), hora_inicio)
-    else:
-        inicio_dt = hora_inicio
-    
-    if isinstance(hora_fin, time):
-        fin_dt = datetime.combine(datetime.today(), hora_fin)
-    else:
-        fin_dt = hora_fin
-    
-    duracion = (fin_dt - inicio_dt).total_seconds() / 3600
-    return max(0, duracion)  # Asegurar que no sea negativo
-
-
-def _distribuir_horas_en_jornadas(hora_inicio, hora_fin):
-    """
-    Distribuye las horas ocupadas en las jornadas: Mañana (6-12), Tarde (12-18), Noche (18-22).
-    Retorna un diccionario con horas en cada jornada.
-    """
-    from datetime import time, datetime, timedelta
-    
-    # Definir horas de jornadas
-    hora_6 = time(6, 0)
-    hora_12 = time(12, 0)
-    hora_18 = time(18, 0)
-    hora_22 = time(22, 0)
-    
-    # Convertir a datetime para cálculos
-    if isinstance(hora_inicio, time):
-        inicio_dt = datetime.combine(datetime.today(), hora_inicio)
-    else:
-        inicio_dt = hora_inicio
-    
-    if isinstance(hora_fin, time):
-        fin_dt = datetime.combine(datetime.today(), hora_fin)
-    else:
-        fin_dt = hora_fin
-    
-    horas_manana = 0
-    horas_tarde = 0
-    horas_noche = 0
-    
-    # Calcular intersección en cada jornada
-    # MAÑANA (6:00 - 12:00)
-    manana_inicio = datetime.combine(datetime.today(), hora_6)
-    manana_fin = datetime.combine(datetime.today(), hora_12)
-    horas_manana = _calcular_interseccion_horas(inicio_dt, fin_dt, manana_inicio, manana_fin)
-    
-    # TARDE (12:00 - 18:00)
-    tarde_inicio = datetime.combine(datetime.today(), hora_12)
-    tarde_fin = datetime.combine(datetime.today(), hora_18)
-    horas_tarde = _calcular_interseccion_horas(inicio_dt, fin_dt, tarde_inicio, tarde_fin)
-    
-    # NOCHE (18:00 - 22:00)
-    noche_inicio = datetime.combine(datetime.today(), hora_18)
-    noche_fin = datetime.combine(datetime.today(), hora_22)
-    horas_noche = _calcular_interseccion_horas(inicio_dt, fin_dt, noche_inicio, noche_fin)
-    
-    return {
-        'manana': horas_manana,
-        'tarde': horas_tarde,
-        'noche': horas_noche
-    }
-
-
-def _calcular_interseccion_horas(inicio1, fin1, inicio2, fin2):
-    """
-    Calcula las horas de intersección entre dos rangos de tiempo.
-    """
-    inicio_interseccion = max(inicio1, inicio2)
-    fin_interseccion = min(fin1, fin2)
-    
-    if inicio_interseccion >= fin_interseccion:
-        return 0
-    
-    duracion = (fin_interseccion - inicio_interseccion).total_seconds() / 3600
-    return max(0, duracion)
-
-
 @csrf_exempt
 def debug_ocupacion(request):
     """
@@ -1694,45 +1531,16 @@ def generar_pdf_ocupacion_semanal(request):
         if tipo_espacio_id:
             espacios_query = espacios_query.filter(tipo_id=tipo_espacio_id)
         
+        espacios = list(espacios_query)
+        matriz = _matriz_ocupacion_reporte(request, lunes, sabado)
+
         detalles_espacios = []
-        for espacio in espacios_query:
-            horas_ocupadas = 0.0
-            horas_manana = 0.0
-            horas_tarde = 0.0
-            horas_noche = 0.0
-            fecha_actual = lunes
-            while fecha_actual <= sabado:
-                horarios = Horario.objects.filter(
-                    espacio=espacio,
-                    dia_semana__iexact=_get_dia_nombre(fecha_actual),
-                    estado='aprobado'
-                )
-                if not horarios.exists():
-                    horarios = Horario.objects.filter(
-                        espacio=espacio,
-                        dia_semana__iexact=fecha_actual.strftime('%A'),
-                        estado='aprobado'
-                    )
-                for h in horarios:
-                    horas_ocupadas += _calcular_duracion_horas(h.hora_inicio, h.hora_fin)
-                    horas_en_jornadas = _distribuir_horas_en_jornadas(h.hora_inicio, h.hora_fin)
-                    horas_manana += horas_en_jornadas['manana']
-                    horas_tarde += horas_en_jornadas['tarde']
-                    horas_noche += horas_en_jornadas['noche']
-                
-                prestamos = PrestamoEspacio.objects.filter(
-                    espacio=espacio,
-                    fecha=fecha_actual,
-                    estado='Aprobado'
-                )
-                for p in prestamos:
-                    horas_ocupadas += _calcular_duracion_horas(p.hora_inicio, p.hora_fin)
-                    horas_en_jornadas = _distribuir_horas_en_jornadas(p.hora_inicio, p.hora_fin)
-                    horas_manana += horas_en_jornadas['manana']
-                    horas_tarde += horas_en_jornadas['tarde']
-                    horas_noche += horas_en_jornadas['noche']
-                
-                fecha_actual += timedelta(days=1)
+        for espacio in espacios:
+            horas_ocupadas = matriz.horas(espacio.id)
+            horas_en_jornadas = matriz.horas_por_jornada(espacio.id)
+            horas_manana = horas_en_jornadas['manana']
+            horas_tarde = horas_en_jornadas['tarde']
+            horas_noche = horas_en_jornadas['noche']
             
             horas_manana = min(horas_manana, 36)
             horas_tarde = min(horas_tarde, 36)
@@ -1924,19 +1732,6 @@ def generar_pdf_ocupacion_semanal(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-def _get_dia_nombre(fecha):
-    """Retorna el nombre del día en español."""
-    dias_nombre = {
-        0: 'Lunes',
-        1: 'Martes',
-        2: 'Miércoles',
-        3: 'Jueves',
-        4: 'Viernes',
-        5: 'Sábado'
-    }
-    return dias_nombre.get(fecha.weekday(), '')
-
-
 # ---------- REPORTE DE OCUPACIÓN ----------
 @csrf_exempt
 def reporte_ocupacion(request):
@@ -1984,17 +1779,6 @@ def reporte_ocupacion(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)
         
-        # Mapeo de nombres de días
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
-        
         # Obtener todos los espacios
         espacios = EspacioFisico.objects.all().select_related('tipo', 'sede')
         espacios = _filtrar_espacios_por_sede_usuario(request, espacios)
@@ -2008,17 +1792,14 @@ def reporte_ocupacion(request):
                 "espacios_mas_usados": []
             }, status=200)
         
-        datos_reporte = _preparar_datos_reporte_espacios(espacios, lunes, sabado, include_pending)
+        espacios = list(espacios)
+        matriz = _matriz_ocupacion_reporte(request, lunes, sabado, include_pending)
 
         # ======== OCUPACIÓN POR JORNADA ========
-        ocupacion_por_jornada = _calcular_ocupacion_por_jornada_reporte(
-            espacios, lunes, sabado, dias_nombre, include_pending, datos_reporte
-        )
+        ocupacion_por_jornada = _calcular_ocupacion_por_jornada_reporte(espacios, matriz)
         
         # ======== ESPACIOS MÁS USADOS ========
-        espacios_mas_usados = _calcular_espacios_mas_usados_reporte(
-            espacios, lunes, sabado, dias_nombre, include_pending, datos_reporte
-        )
+        espacios_mas_usados = _calcular_espacios_mas_usados_reporte(espacios, matriz)
         
         # Construcción del periodo
         periodo = "2025-1"  # TODO: Obtener del contexto actual
@@ -2040,133 +1821,50 @@ def reporte_ocupacion(request):
         return JsonResponse({"error": f"Error del servidor: {str(e)}"}, status=500)
 
 
-def _calcular_ocupacion_por_jornada_reporte(espacios, lunes, sabado, dias_nombre, include_pending=False, datos_reporte=None):
+def _calcular_ocupacion_por_jornada_reporte(espacios, matriz):
     """
     Calcula el porcentaje de ocupación por jornada para todos los espacios.
-    Usa la misma lógica que ocupacion_semanal para calcular horas.
+    Usa las mismas jornadas que ocupacion_semanal, leídas de la matriz de ocupación.
     Retorna: lista con ocupación de cada jornada
     """
     try:
-        # Inicializar contadores totales de horas por jornada
-        horas_totales_manana = 0.0
-        horas_totales_tarde = 0.0
-        horas_totales_noche = 0.0
-        datos_reporte = datos_reporte or _preparar_datos_reporte_espacios(espacios, lunes, sabado, include_pending)
-        espacios_lista = datos_reporte['espacios']
-        horarios_por_espacio_dia = datos_reporte['horarios_por_espacio_dia']
-        prestamos_por_espacio_fecha = datos_reporte['prestamos_por_espacio_fecha']
-        
-        # Recorrer cada espacio
-        for espacio in espacios_lista:
-            horas_manana_espacio = 0.0
-            horas_tarde_espacio = 0.0
-            horas_noche_espacio = 0.0
-            
-            # Recorrer cada día de la semana
-            for fecha_actual in _iterar_fechas_semana(lunes, sabado):
-                dia_nombre_en = fecha_actual.strftime('%A')
-                dia_nombre_es = dias_nombre.get(dia_nombre_en, dia_nombre_en)
-                horarios_dia = horarios_por_espacio_dia.get(
-                    (espacio.id, _normalizar_dia_semana(dia_nombre_es)),
-                    []
-                )
-                prestamos_dia = prestamos_por_espacio_fecha.get((espacio.id, fecha_actual), [])
-                
-                # Calcular horas ocupadas por horarios
-                for horario in horarios_dia:
-                    horas_ocupadas_en_jornadas = _distribuir_horas_en_jornadas(
-                        horario.hora_inicio,
-                        horario.hora_fin
-                    )
-                    horas_manana_espacio += horas_ocupadas_en_jornadas['manana']
-                    horas_tarde_espacio += horas_ocupadas_en_jornadas['tarde']
-                    horas_noche_espacio += horas_ocupadas_en_jornadas['noche']
-                
-                # Calcular horas ocupadas por préstamos
-                for prestamo in prestamos_dia:
-                    horas_ocupadas_en_jornadas = _distribuir_horas_en_jornadas(
-                        prestamo.hora_inicio,
-                        prestamo.hora_fin
-                    )
-                    horas_manana_espacio += horas_ocupadas_en_jornadas['manana']
-                    horas_tarde_espacio += horas_ocupadas_en_jornadas['tarde']
-                    horas_noche_espacio += horas_ocupadas_en_jornadas['noche']
-                
-            # Sumar las horas de este espacio al total
-            horas_totales_manana += horas_manana_espacio
-            horas_totales_tarde += horas_tarde_espacio
-            horas_totales_noche += horas_noche_espacio
+        horas_totales = {'manana': 0.0, 'tarde': 0.0, 'noche': 0.0}
+        espacios_con_clase = {'manana': 0, 'tarde': 0, 'noche': 0}
+
+        for espacio in espacios:
+            horas_jornada = matriz.horas_por_jornada(espacio.id)
+            for jornada, horas in horas_jornada.items():
+                horas_totales[jornada] += horas
+                # Cuántos espacios tienen clases o préstamos en cada jornada
+                if horas > 0:
+                    espacios_con_clase[jornada] += 1
         
         # Calcular máximas horas posibles
-        total_espacios = len(espacios_lista)
+        total_espacios = len(espacios)
         horas_max_manana = 36 * total_espacios if total_espacios > 0 else 1
         horas_max_tarde = 36 * total_espacios if total_espacios > 0 else 1
         horas_max_noche = 24 * total_espacios if total_espacios > 0 else 1
         
         # Calcular porcentajes de ocupación
-        ocupacion_manana = int((horas_totales_manana / horas_max_manana * 100)) if horas_max_manana > 0 else 0
-        ocupacion_tarde = int((horas_totales_tarde / horas_max_tarde * 100)) if horas_max_tarde > 0 else 0
-        ocupacion_noche = int((horas_totales_noche / horas_max_noche * 100)) if horas_max_noche > 0 else 0
-        
-        # Contar cuántos espacios tienen clases en cada jornada
-        espacios_con_clase_manana = 0
-        espacios_con_clase_tarde = 0
-        espacios_con_clase_noche = 0
-        
-        for espacio in espacios_lista:
-            tiene_manana = False
-            tiene_tarde = False
-            tiene_noche = False
-            
-            for fecha_actual in _iterar_fechas_semana(lunes, sabado):
-                dia_nombre_en = fecha_actual.strftime('%A')
-                dia_nombre_es = dias_nombre.get(dia_nombre_en, dia_nombre_en)
-                horarios_dia = horarios_por_espacio_dia.get(
-                    (espacio.id, _normalizar_dia_semana(dia_nombre_es)),
-                    []
-                )
-                prestamos_dia = prestamos_por_espacio_fecha.get((espacio.id, fecha_actual), [])
-                
-                for horario in horarios_dia:
-                    dist = _distribuir_horas_en_jornadas(horario.hora_inicio, horario.hora_fin)
-                    if dist['manana'] > 0:
-                        tiene_manana = True
-                    if dist['tarde'] > 0:
-                        tiene_tarde = True
-                    if dist['noche'] > 0:
-                        tiene_noche = True
-                
-                for prestamo in prestamos_dia:
-                    dist = _distribuir_horas_en_jornadas(prestamo.hora_inicio, prestamo.hora_fin)
-                    if dist['manana'] > 0:
-                        tiene_manana = True
-                    if dist['tarde'] > 0:
-                        tiene_tarde = True
-                    if dist['noche'] > 0:
-                        tiene_noche = True
-                
-            if tiene_manana:
-                espacios_con_clase_manana += 1
-            if tiene_tarde:
-                espacios_con_clase_tarde += 1
-            if tiene_noche:
-                espacios_con_clase_noche += 1
+        ocupacion_manana = int((horas_totales['manana'] / horas_max_manana * 100)) if horas_max_manana > 0 else 0
+        ocupacion_tarde = int((horas_totales['tarde'] / horas_max_tarde * 100)) if horas_max_tarde > 0 else 0
+        ocupacion_noche = int((horas_totales['noche'] / horas_max_noche * 100)) if horas_max_noche > 0 else 0
         
         ocupacion = [
             {
                 "jornada": "Mañana (07:00 - 12:00)",
                 "ocupacion": ocupacion_manana,
-                "espacios": espacios_con_clase_manana
+                "espacios": espacios_con_clase['manana']
             },
             {
                 "jornada": "Tarde (14:00 - 18:00)",
                 "ocupacion": ocupacion_tarde,
-                "espacios": espacios_con_clase_tarde
+                "espacios": espacios_con_clase['tarde']
             },
             {
                 "jornada": "Noche (18:00 - 21:00)",
                 "ocupacion": ocupacion_noche,
-                "espacios": espacios_con_clase_noche
+                "espacios": espacios_con_clase['noche']
             }
         ]
         
@@ -2176,47 +1874,19 @@ def _calcular_ocupacion_por_jornada_reporte(espacios, lunes, sabado, dias_nombre
         return []
 
 
-def _calcular_espacios_mas_usados_reporte(espacios, lunes, sabado, dias_nombre, include_pending=False, datos_reporte=None):
+def _calcular_espacios_mas_usados_reporte(espacios, matriz):
     """
     Calcula los espacios más utilizados durante la semana.
-    Usa la misma lógica que ocupacion_semanal.
+    Usa la misma matriz de ocupación que el resto de reportes.
     Retorna: lista ordenada de espacios con más usos
     """
     try:
         espacios_uso = {}
-        datos_reporte = datos_reporte or _preparar_datos_reporte_espacios(espacios, lunes, sabado, include_pending)
-        espacios_lista = datos_reporte['espacios']
-        horarios_por_espacio_dia = datos_reporte['horarios_por_espacio_dia']
-        prestamos_por_espacio_fecha = datos_reporte['prestamos_por_espacio_fecha']
-        
-        # Recorrer cada espacio
-        for espacio in espacios_lista:
-            contador_usos = 0
-            horas_ocupadas_total = 0.0
-            horas_disponibles = 16 * 6  # 16 horas/día * 6 días = 96 horas
-            
-            # Recorrer cada día de la semana
-            for fecha_actual in _iterar_fechas_semana(lunes, sabado):
-                dia_nombre_en = fecha_actual.strftime('%A')
-                dia_nombre_es = dias_nombre.get(dia_nombre_en, dia_nombre_en)
-                horarios_dia = horarios_por_espacio_dia.get(
-                    (espacio.id, _normalizar_dia_semana(dia_nombre_es)),
-                    []
-                )
-                contador_usos += len(horarios_dia)
-                
-                # Sumar horas ocupadas por horarios
-                for horario in horarios_dia:
-                    duracion = _calcular_duracion_horas(horario.hora_inicio, horario.hora_fin)
-                    horas_ocupadas_total += duracion
-                
-                prestamos_dia = prestamos_por_espacio_fecha.get((espacio.id, fecha_actual), [])
-                contador_usos += len(prestamos_dia)
-                
-                # Sumar horas ocupadas por préstamos
-                for prestamo in prestamos_dia:
-                    duracion = _calcular_duracion_horas(prestamo.hora_inicio, prestamo.hora_fin)
-                    horas_ocupadas_total += duracion
+        horas_disponibles = 16 * 6  # 16 horas/día * 6 días = 96 horas
+        
+        for espacio in espacios:
+            contador_usos = matriz.usos_espacio(espacio.id)
+            horas_ocupadas_total = matriz.horas(espacio.id)
                 
             # Calcular porcentaje de ocupación
             porcentaje_ocupacion = int((horas_ocupadas_total / horas_disponibles * 100)) if horas_disponibles > 0 else 0
@@ -2282,15 +1952,6 @@ def generar_pdf_reporte_ocupacion(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)
 
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
 
         espacios_qs = EspacioFisico.objects.all().select_related('tipo', 'sede')
         espacios_qs = _filtrar_espacios_por_sede_usuario(request, espacios_qs)
@@ -2300,13 +1961,10 @@ def generar_pdf_reporte_ocupacion(request):
         elif tipo_espacio_id:
             espacios_qs = espacios_qs.filter(tipo_id=tipo_espacio_id)
 
-        datos_reporte = _preparar_datos_reporte_espacios(espacios_qs, lunes, sabado, include_pending)
-        ocupacion_por_jornada = _calcular_ocupacion_por_jornada_reporte(
-            espacios_qs, lunes, sabado, dias_nombre, include_pending, datos_reporte
-        )
-        espacios_mas_usados = _calcular_espacios_mas_usados_reporte(
-            espacios_qs, lunes, sabado, dias_nombre, include_pending, datos_reporte
-        )
+        espacios = list(espacios_qs)
+        matriz = _matriz_ocupacion_reporte(request, lunes, sabado, include_pending)
+        ocupacion_por_jornada = _calcular_ocupacion_por_jornada_reporte(espacios, matriz)
+        espacios_mas_usados = _calcular_espacios_mas_usados_reporte(espacios, matriz)
 
         buffer = BytesIO()
         doc = SimpleDocTemplate(
@@ -2499,17 +2157,6 @@ def reporte_disponibilidad(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)
         
-        # Mapeo de nombres de días
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
-        
         # Obtener todos los espacios
         espacios = EspacioFisico.objects.all().select_related('tipo', 'sede')
         espacios = _filtrar_espacios_por_sede_usuario(request, espacios)
@@ -2528,9 +2175,8 @@ def reporte_disponibilidad(request):
             }, status=200)
         
         # ======== CÁLCULO DE DISPONIBILIDAD ========
-        disponibilidad, resumen = _calcular_disponibilidad_reporte(
-            espacios, lunes, sabado, dias_nombre, include_pending
-        )
+        matriz = _matriz_ocupacion_reporte(request, lunes, sabado, include_pending)
+        disponibilidad, resumen = _calcular_disponibilidad_reporte(list(espacios), matriz)
         
         # Construcción del periodo
         periodo = "2025-1"  # TODO: Obtener del contexto actual
@@ -2552,7 +2198,7 @@ def reporte_disponibilidad(request):
         return JsonResponse({"error": f"Error del servidor: {str(e)}"}, status=500)
 
 
-def _calcular_disponibilidad_reporte(espacios, lunes, sabado, dias_nombre, include_pending=False, datos_reporte=None):
+def _calcular_disponibilidad_reporte(espacios, matriz):
     """
     Calcula la disponibilidad (horas disponibles vs ocupadas) para cada espacio.
     Retorna: tupla (lista con disponibilidad de cada espacio, dict con resumen)
@@ -2561,33 +2207,9 @@ def _calcular_disponibilidad_reporte(espacios, lunes, sabado, dias_nombre, inclu
         disponibilidad = []
         total_horas_disponibles = 0
         total_horas_ocupadas = 0
-        datos_reporte = datos_reporte or _preparar_datos_reporte_espacios(espacios, lunes, sabado, include_pending)
-        horarios_por_espacio_dia = datos_reporte['horarios_por_espacio_dia']
-        prestamos_por_espacio_fecha = datos_reporte['prestamos_por_espacio_fecha']
-        
-        for espacio in datos_reporte['espacios']:
-            horas_ocupadas_total = 0.0
-            
-            # Recorrer cada día de la semana
-            for fecha_actual in _iterar_fechas_semana(lunes, sabado):
-                dia_nombre_en = fecha_actual.strftime('%A')
-                dia_nombre_es = dias_nombre.get(dia_nombre_en, dia_nombre_en)
-                horarios_dia = horarios_por_espacio_dia.get(
-                    (espacio.id, _normalizar_dia_semana(dia_nombre_es)),
-                    []
-                )
-                
-                # Sumar horas ocupadas por horarios
-                for horario in horarios_dia:
-                    duracion = _calcular_duracion_horas(horario.hora_inicio, horario.hora_fin)
-                    horas_ocupadas_total += duracion
-                
-                prestamos_dia = prestamos_por_espacio_fecha.get((espacio.id, fecha_actual), [])
-                
-                # Sumar horas ocupadas por préstamos
-                for prestamo in prestamos_dia:
-                    duracion = _calcular_duracion_horas(prestamo.hora_inicio, prestamo.hora_fin)
-                    horas_ocupadas_total += duracion
+        
+        for espacio in espacios:
+            horas_ocupadas_total = matriz.horas(espacio.id)
                 
             # Calcular horas disponibles (16 horas/día * 6 días)
             horas_disponibles = 16 * 6  # 96 horas
@@ -2662,17 +2284,6 @@ def reporte_capacidad(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)
         
-        # Mapeo de nombres de días
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
-        
         # Obtener todos los espacios
         espacios = EspacioFisico.objects.all().select_related('tipo', 'sede')
         espacios = _filtrar_espacios_por_sede_usuario(request, espacios)
@@ -2686,9 +2297,8 @@ def reporte_capacidad(request):
             }, status=200)
         
         # ======== CÁLCULO DE CAPACIDAD ========
-        capacidad = _calcular_capacidad_reporte(
-            espacios, lunes, sabado, dias_nombre, include_pending
-        )
+        matriz = _matriz_ocupacion_reporte(request, lunes, sabado, include_pending)
+        capacidad = _calcular_capacidad_reporte(list(espacios), matriz)
         
         # Construcción del periodo
         periodo = "2025-1"  # TODO: Obtener del contexto actual
@@ -2736,19 +2346,11 @@ def generar_pdf_reporte_disponibilidad(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)
 
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
 
         espacios = EspacioFisico.objects.all().select_related('tipo', 'sede')
         espacios = _filtrar_espacios_por_sede_usuario(request, espacios)
-        disponibilidad, resumen = _calcular_disponibilidad_reporte(espacios, lunes, sabado, dias_nombre, include_pending)
+        matriz = _matriz_ocupacion_reporte(request, lunes, sabado, include_pending)
+        disponibilidad, resumen = _calcular_disponibilidad_reporte(list(espacios), matriz)
 
         buffer = BytesIO()
         doc = SimpleDocTemplate(
@@ -2908,19 +2510,11 @@ def generar_pdf_reporte_capacidad(request):
         lunes += timedelta(weeks=semana_offset)
         sabado = lunes + timedelta(days=5)
 
-        dias_nombre = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
 
         espacios = EspacioFisico.objects.all().select_related('tipo', 'sede')
         espacios = _filtrar_espacios_por_sede_usuario(request, espacios)
-        capacidad = _calcular_capacidad_reporte(espacios, lunes, sabado, dias_nombre, include_pending)
+        matriz = _matriz_ocupacion_reporte(request, lunes, sabado, include_pending)
+        capacidad = _calcular_capacidad_reporte(list(espacios), matriz)
 
         buffer = BytesIO()
         doc = SimpleDocTemplate(
@@ -3143,7 +2737,7 @@ def generar_pdf_reporte_capacidad(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-def _calcular_capacidad_reporte(espacios, lunes, sabado, dias_nombre, include_pending=False, datos_reporte=None):
+def _calcular_capacidad_reporte(espacios, matriz):
     """
     Calcula la capacidad utilizada agrupada por tipo de espacio.
     Usa el promedio de estudiantes simultáneos en cada franja horaria.
@@ -3151,11 +2745,8 @@ def _calcular_capacidad_reporte(espacios, lunes, sabado, dias_nombre, include_pe
     """
     try:
         capacidad_por_tipo = {}
-        datos_reporte = datos_reporte or _preparar_datos_reporte_espacios(espacios, lunes, sabado, include_pending)
-        horarios_por_espacio_dia = datos_reporte['horarios_por_espacio_dia']
-        prestamos_por_espacio_fecha = datos_reporte['prestamos_por_espacio_fecha']
         
-        for espacio in datos_reporte['espacios']:
+        for espacio in espacios:
             tipo_nombre = espacio.tipo.nombre
             
             # Inicializar si es la primera vez que vemos este tipo
@@ -3170,38 +2761,12 @@ def _calcular_capacidad_reporte(espacios, lunes, sabado, dias_nombre, include_pe
             capacidad_por_tipo[tipo_nombre]["capacidad_total"] += espacio.capacidad
             capacidad_por_tipo[tipo_nombre]["cantidad_espacios"] += 1
             
-            # Rastrear estudiantes únicos que usan este espacio
-            estudiantes_por_dia = {}
-            
-            # Recorrer cada día de la semana
-            for fecha_actual in _iterar_fechas_semana(lunes, sabado):
-                dia_nombre_en = fecha_actual.strftime('%A')
-                dia_nombre_es = dias_nombre.get(dia_nombre_en, dia_nombre_en)
-                
-                estudiantes_este_dia = set()
-                horarios_dia = horarios_por_espacio_dia.get(
-                    (espacio.id, _normalizar_dia_semana(dia_nombre_es)),
-                    []
-                )
-                
-                # Contar estudiantes en horarios
-                for horario in horarios_dia:
-                    if horario.grupo:
-                        grupo_size = horario.cantidad_estudiantes or 30
-                        estudiantes_este_dia.add(f"horario_{horario.id}")
-                        estudiantes_por_dia[fecha_actual] = grupo_size
-                
-                prestamos_dia = prestamos_por_espacio_fecha.get((espacio.id, fecha_actual), [])
-                
-                # Contar préstamos (cada préstamo = ocupación)
-                for prestamo in prestamos_dia:
-                    estudiantes_este_dia.add(f"prestamo_{prestamo.id}")
-                    if fecha_actual not in estudiantes_por_dia:
-                        estudiantes_por_dia[fecha_actual] = int(espacio.capacidad * 0.3)  # 30% de ocupación
+            # Estudiantes estimados en cada día con clases o préstamos
+            estudiantes_por_dia = matriz.estudiantes_por_dia(espacio.id, espacio.capacidad)
                 
             # Calcular ocupación promedio para este espacio
             if estudiantes_por_dia:
-                ocupacion_promedio = sum(estudiantes_por_dia.values()) / len(estudiantes_por_dia)
+                ocupacion_promedio = sum(estudiantes_por_dia) / len(estudiantes_por_dia)
             else:
                 ocupacion_promedio = 0
             
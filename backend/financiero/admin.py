@@ -87,3 +87,18 @@ class RechazoDevolacionAdmin(admin.ModelAdmin):
     list_display = ['factura', 'etapa_rechazo', 'tipo', 'fecha_rechazo']
     list_filter = ['tipo', 'etapa_rechazo', 'fecha_rechazo']
     search_fields = ['factura__numero_factura']
+
+@admin.register(models.DiaCalendario)
+class DiaCalendarioAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'es_habil', 'ordinal_habil', 'festivo']
+    list_filter = ['es_habil']
+    search_fields = ['festivo']
+    date_hierarchy = 'fecha'
+
+
+@admin.register(models.TareaFinanciera)
+class TareaFinancieraAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'clave', 'estado', 'intentos', 'ejecutar_desde', 'fecha_fin']
+    list_filter = ['estado', 'tipo']
+    search_fields = ['clave', 'ultimo_error']
+    readonly_fields = ['fecha_creacion', 'fecha_inicio', 'latido', 'fecha_fin']
@@ -0,0 +1,239 @@
+"""
+Calendario de días hábiles: lunes a viernes que no son festivos en Colombia.
+
+El comando cargar_calendario_habil llena DiaCalendario con el ordinal hábil
+acumulado de cada fecha de un rango. Con eso:
+
+- dias_habiles_entre(a, b) es una resta sobre un arreglo en memoria,
+  cargado una vez por proceso y recargado cuando el comando cambia el
+  calendario (versión en la caché compartida);
+- expresion_dias_habiles(campo) calcula lo mismo en SQL, para promediar o
+  filtrar por antigüedad hábil en la base de datos.
+
+Fuera del rango cargado se cuentan los días de lunes a viernes, sin festivos.
+"""
+
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Value
+
+
+CALENDARIO_VERSION_CACHE_KEY = 'financiero:calendario:version'
+RECARGA_SEGUNDOS = 5 * 60
+
+
+# ---------- Festivos ----------
+
+def _pascua(anio: int) -> date:
+    """Domingo de Pascua (algoritmo de Meeus/Jones/Butcher)."""
+    a, b, c = anio % 19, anio // 100, anio % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(anio, mes, dia)
+
+
+def _lunes_siguiente(fecha: date) -> date:
+    """El mismo día si es lunes; si no, el lunes siguiente (Ley 51 de 1983)."""
+    return fecha + timedelta(days=(7 - fecha.weekday()) % 7)
+
+
+def festivos_colombia(anio: int) -> Dict[date, str]:
+    pascua = _pascua(anio)
+    festivos = {
+        date(anio, 1, 1): 'Año Nuevo',
+        date(anio, 5, 1): 'Día del Trabajo',
+        date(anio, 7, 20): 'Día de la Independencia',
+        date(anio, 8, 7): 'Batalla de Boyacá',
+        date(anio, 12, 8): 'Inmaculada Concepción',
+        date(anio, 12, 25): 'Navidad',
+        pascua - timedelta(days=3): 'Jueves Santo',
+        pascua - timedelta(days=2): 'Viernes Santo',
+    }
+    trasladables = {
+        date(anio, 1, 6): 'Reyes Magos',
+        date(anio, 3, 19): 'San José',
+        date(anio, 6, 29): 'San Pedro y San Pablo',
+        date(anio, 8, 15): 'Asunción de la Virgen',
+        date(anio, 10, 12): 'Día de la Raza',
+        date(anio, 11, 1): 'Todos los Santos',
+        date(anio, 11, 11): 'Independencia de Cartagena',
+        pascua + timedelta(days=39): 'Ascensión del Señor',
+        pascua + timedelta(days=60): 'Corpus Christi',
+        pascua + timedelta(days=68): 'Sagrado Corazón',
+    }
+    for fecha, nombre in trasladables.items():
+        festivos.setdefault(_lunes_siguiente(fecha), nombre)
+    return festivos
+
+
+def dias_de_semana_entre(inicio: date, fin: date) -> int:
+    """Días de lunes a viernes en (inicio, fin], sin recorrerlos uno a uno."""
+    if fin <= inicio:
+        return 0
+    semanas, resto = divmod((fin - inicio).days, 7)
+    dia_semana = inicio.weekday()
+    return semanas * 5 + sum(1 for offset in range(1, resto + 1) if (dia_semana + offset) % 7 < 5)
+
+
+# ---------- Carga ----------
+
+def construir_dias(desde: date, hasta: date, adicionales: Optional[Dict[date, str]] = None) -> list:
+    """DiaCalendario de [desde, hasta] con ordinal hábil acumulado desde `desde`."""
+    from .models import DiaCalendario
+
+    festivos = dict(adicionales or {})
+    for anio in range(desde.year, hasta.year + 1):
+        for fecha, nombre in festivos_colombia(anio).items():
+            festivos.setdefault(fecha, nombre)
+
+    dias, ordinal, fecha = [], 0, desde
+    while fecha <= hasta:
+        festivo = festivos.get(fecha, '')
+        es_habil = fecha.weekday() < 5 and not festivo
+        ordinal += es_habil
+        dias.append(DiaCalendario(fecha=fecha, es_habil=es_habil, ordinal_habil=ordinal, festivo=festivo))
+        fecha += timedelta(days=1)
+    return dias
+
+
+def cargar_calendario(desde: date, hasta: date, adicionales: Optional[Dict[date, str]] = None) -> int:
+    """
+    Reemplaza el calendario por [desde, hasta]. Se reescribe entero porque
+    los ordinales son acumulados: un festivo nuevo desplaza todos los siguientes.
+    """
+    from .models import DiaCalendario
+
+    dias = construir_dias(desde, hasta, adicionales)
+    with transaction.atomic():
+        DiaCalendario.objects.all().delete()
+        DiaCalendario.objects.bulk_create(dias, batch_size=1000)
+        transaction.on_commit(invalidar_calendario)
+    return len(dias)
+
+
+# ---------- Calendario en memoria ----------
+
+class CalendarioHabil:
+    """Ordinales hábiles de [base, base + len - 1]; el de `base` es 0."""
+
+    def __init__(self, base: Optional[date], ordinales: List[int], desplazamiento: int = 0):
+        self.base = base
+        self.ordinales = ordinales
+        # ordinal_habil guardado en DiaCalendario = ordinal en memoria + desplazamiento
+        self.desplazamiento = desplazamiento
+        self.ultima = base + timedelta(days=len(ordinales) - 1) if base else None
+
+    def cubre(self, fecha: date) -> bool:
+        return self.base is not None and self.base <= fecha <= self.ultima
+
+    def ordinal(self, fecha: date) -> int:
+        """ordinal_habil de `fecha` tal como está en DiaCalendario (debe estar cubierta)."""
+        return self.ordinales[(fecha - self.base).days] + self.desplazamiento
+
+    def dias_habiles_entre(self, inicio: date, fin: date) -> int:
+        """Días hábiles en (inicio, fin]."""
+        if fin <= inicio:
+            return 0
+        if self.base is None:
+            return dias_de_semana_entre(inicio, fin)
+
+        dias = 0
+        if inicio < self.base:
+            corte = min(fin, self.base)
+            dias += dias_de_semana_entre(inicio, corte)
+            inicio = corte
+        if fin > self.ultima:
+            corte = max(inicio, self.ultima)
+            dias += dias_de_semana_entre(corte, fin)
+            fin = corte
+        if fin > inicio:
+            dias += self.ordinales[(fin - self.base).days] - self.ordinales[(inicio - self.base).days]
+        return dias
+
+
+_memo = {'calendario': None, 'version': None, 'revisado': 0.0}
+
+
+def _version() -> str:
+    version = cache.get(CALENDARIO_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(CALENDARIO_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CALENDARIO_VERSION_CACHE_KEY)
+    return version
+
+
+def _cargar() -> CalendarioHabil:
+    from .models import DiaCalendario
+
+    filas = list(DiaCalendario.objects.order_by('fecha').values_list('fecha', 'es_habil', 'ordinal_habil'))
+    if not filas:
+        return CalendarioHabil(None, [])
+    primera, es_habil, ordinal = filas[0]
+    # El día anterior a la primera fecha hace de base (ordinal 0)
+    desplazamiento = ordinal - (1 if es_habil else 0)
+    return CalendarioHabil(
+        primera - timedelta(days=1),
+        [0] + [ordinal_habil - desplazamiento for _, _, ordinal_habil in filas],
+        desplazamiento,
+    )
+
+
+def calendario() -> CalendarioHabil:
+    """Calendario del proceso; revisa la versión compartida cada RECARGA_SEGUNDOS."""
+    ahora = time.monotonic()
+    if _memo['calendario'] is None or ahora - _memo['revisado'] > RECARGA_SEGUNDOS:
+        version = _version()
+        if _memo['calendario'] is None or version != _memo['version']:
+            _memo['calendario'] = _cargar()
+            _memo['version'] = version
+        _memo['revisado'] = ahora
+    return _memo['calendario']
+
+
+def invalidar_calendario() -> None:
+    """Hace que todos los procesos recarguen el calendario (en RECARGA_SEGUNDOS como mucho)."""
+    cache.set(CALENDARIO_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    _memo['calendario'] = None
+
+
+def dias_habiles_entre(inicio: Optional[date], fin: Optional[date]) -> int:
+    """Días hábiles en (inicio, fin]; 0 si falta alguna fecha o fin <= inicio."""
+    if not inicio or not fin:
+        return 0
+    return calendario().dias_habiles_entre(inicio, fin)
+
+
+# ---------- SQL ----------
+
+def expresion_dias_habiles(campo: str, hasta: Optional[date] = None):
+    """
+    Expresión con los días hábiles entre `campo` (un DateField) y `hasta`
+    (hoy por defecto): el ordinal de `hasta` menos el de `campo`, leído de
+    DiaCalendario por clave primaria. Las filas con `campo` fuera del
+    calendario dan NULL (Avg las ignora). Devuelve None si `hasta` no está
+    en el calendario cargado, para que quien llama use otro cálculo.
+    """
+    from .models import DiaCalendario
+
+    hasta = hasta or date.today()
+    actual = calendario()
+    if not actual.cubre(hasta):
+        return None
+    ordinal_hasta = actual.ordinal(hasta)
+    ordinal_campo = Subquery(
+        DiaCalendario.objects.filter(fecha=OuterRef(campo)).values('ordinal_habil')[:1],
+        output_field=IntegerField(),
+    )
+    return Value(ordinal_hasta, output_field=IntegerField()) - ordinal_campo
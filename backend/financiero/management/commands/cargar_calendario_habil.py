@@ -0,0 +1,67 @@
+import csv
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from financiero.calendario import cargar_calendario, construir_dias
+from financiero.models import DiaCalendario
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera el calendario de días hábiles (lunes a viernes sin festivos de Colombia) '
+        'usado por el SLA y los tableros. Por defecto solo muestra una simulacion.'
+    )
+
+    def add_arguments(self, parser):
+        anio_actual = date.today().year
+        parser.add_argument('--desde', type=int, default=anio_actual - 10, help='Primer año del calendario.')
+        parser.add_argument('--hasta', type=int, default=anio_actual + 5, help='Último año del calendario.')
+        parser.add_argument(
+            '--festivos',
+            help='CSV con festivos adicionales (fecha AAAA-MM-DD, nombre), p. ej. días no laborables de la institución.',
+        )
+        parser.add_argument(
+            '--si-vacio',
+            action='store_true',
+            help='No hace nada si el calendario ya tiene días (para el arranque del contenedor).',
+        )
+        parser.add_argument(
+            '--confirmar',
+            action='store_true',
+            help='Reemplaza el calendario. Sin esta bandera solo muestra cuantos días y festivos tendria.',
+        )
+
+    def handle(self, *args, **options):
+        if options['desde'] > options['hasta']:
+            raise CommandError('--desde debe ser menor o igual que --hasta.')
+        desde, hasta = date(options['desde'], 1, 1), date(options['hasta'], 12, 31)
+        if options['si_vacio'] and DiaCalendario.objects.exists():
+            self.stdout.write('El calendario hábil ya está cargado.')
+            return
+        adicionales = self._leer_festivos(options['festivos']) if options['festivos'] else {}
+
+        if not options['confirmar']:
+            dias = construir_dias(desde, hasta, adicionales)
+            festivos = sum(1 for dia in dias if dia.festivo)
+            self.stdout.write(self.style.WARNING(
+                f'Simulacion: {len(dias)} días de {desde} a {hasta}, {festivos} festivos, '
+                f'{dias[-1].ordinal_habil} hábiles.'
+            ))
+            self.stdout.write('Ejecuta con --confirmar para aplicar los cambios.')
+            return
+
+        total = cargar_calendario(desde, hasta, adicionales)
+        self.stdout.write(self.style.SUCCESS(f'Calendario hábil cargado: {total} días de {desde} a {hasta}.'))
+
+    def _leer_festivos(self, ruta):
+        festivos = {}
+        try:
+            with open(ruta, newline='', encoding='utf-8') as archivo:
+                for fila in csv.reader(archivo):
+                    if not fila or not fila[0].strip() or fila[0].startswith('#'):
+                        continue
+                    festivos[date.fromisoformat(fila[0].strip())] = (fila[1].strip() if len(fila) > 1 else 'Festivo')[:100]
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+        return festivos
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from financiero.models import DocumentoAdjunto, DocumentoUnificado
+from financiero.services.blob_store import blob_store, sha256_hex
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve el contenido bytea de DocumentoAdjunto y DocumentoUnificado al almacén de blobs '
+        '(por SHA-256) y deja la columna en NULL. Se puede interrumpir y reanudar. '
+        'Por defecto solo muestra una simulacion.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Documentos por transacción (por defecto 100).')
+        parser.add_argument(
+            '--confirmar',
+            action='store_true',
+            help='Aplica los cambios. Sin esta bandera solo muestra cuantos documentos se moverian.',
+        )
+
+    def handle(self, *args, **options):
+        tamano_lote = max(1, options['lote'])
+        for modelo in (DocumentoAdjunto, DocumentoUnificado):
+            pendientes = modelo.objects.filter(contenido_archivo__isnull=False)
+            if not options['confirmar']:
+                self.stdout.write(self.style.WARNING(
+                    f'Simulacion: {pendientes.count()} {modelo._meta.verbose_name_plural} con contenido en la base de datos.'
+                ))
+                continue
+            movidos = self._migrar(pendientes, tamano_lote)
+            self.stdout.write(self.style.SUCCESS(
+                f'{modelo._meta.verbose_name_plural}: {movidos} movidos al almacén de blobs.'
+            ))
+
+        if not options['confirmar']:
+            self.stdout.write('Ejecuta con --confirmar para aplicar los cambios.')
+        else:
+            self.stdout.write('Ejecuta VACUUM sobre las tablas de documentos para recuperar el espacio en PostgreSQL.')
+
+    def _migrar(self, pendientes, tamano_lote):
+        """
+        Cada lote se escribe primero en el almacén y luego se limpia en la base
+        de datos. Un corte a mitad deja blobs de más, nunca columnas vacías sin
+        blob; los documentos ya movidos no vuelven a salir en `pendientes`.
+        """
+        movidos, ultimo_id = 0, 0
+        while True:
+            filas = list(
+                pendientes.filter(id__gt=ultimo_id).order_by('id')
+                .values_list('id', 'contenido_archivo', 'tamano_bytes')[:tamano_lote]
+            )
+            if not filas:
+                return movidos
+
+            cambios = []
+            for id_documento, contenido, tamano_bytes in filas:
+                contenido = bytes(contenido)
+                hash_archivo = blob_store.put(contenido, sha256_hex(contenido))
+                cambios.append((id_documento, hash_archivo, tamano_bytes or len(contenido)))
+
+            modelo = pendientes.model
+            with transaction.atomic():
+                for id_documento, hash_archivo, tamano_bytes in cambios:
+                    modelo.objects.filter(id=id_documento).update(
+                        contenido_archivo=None, hash_archivo=hash_archivo, tamano_bytes=tamano_bytes,
+                    )
+            movidos += len(filas)
+            ultimo_id = filas[-1][0]
+            self.stdout.write(f'  {modelo._meta.verbose_name_plural}: {movidos} movidos (hasta id {ultimo_id})')
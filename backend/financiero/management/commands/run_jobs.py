@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from financiero import tareas
+from notificaciones.retencion import archivar_si_corresponde
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta las tareas en segundo plano de financiero (copias al NAS, regenerar expedientes). '
+        'Se pueden correr varios procesos a la vez; cada tarea la toma uno solo. Sin tareas '
+        'pendientes, también archiva las notificaciones antiguas (una vez al día).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=2, help='Tareas simultáneas por proceso (por defecto 2).')
+        parser.add_argument('--espera', type=float, default=5, help='Segundos entre consultas sin trabajo (por defecto 5).')
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Ejecuta las tareas vencidas y termina, en lugar de quedarse esperando nuevas.',
+        )
+
+    def handle(self, *args, **options):
+        hilos = max(1, options['hilos'])
+        ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='financiero-tareas') if hilos > 1 else None
+        try:
+            while True:
+                tareas.liberar_vencidas()
+                lote = tareas.tomar(hilos)
+                if lote:
+                    if ejecutor is None:
+                        resultados = [tareas.ejecutar(tarea) for tarea in lote]
+                    else:
+                        resultados = list(ejecutor.map(self._ejecutar_en_hilo, lote))
+                    self.stdout.write(
+                        f'{sum(resultados)} tareas completadas, {len(resultados) - sum(resultados)} con error.'
+                    )
+                    continue
+
+                tareas.purgar_terminadas()
+                archivar_si_corresponde()
+                if options['una_vez']:
+                    return
+                close_old_connections()
+                time.sleep(options['espera'])
+        finally:
+            if ejecutor is not None:
+                ejecutor.shutdown()
+
+    @staticmethod
+    def _ejecutar_en_hilo(tarea):
+        try:
+            return tareas.ejecutar(tarea)
+        finally:
+            close_old_connections()
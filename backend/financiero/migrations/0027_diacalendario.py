@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('financiero', '0026_agregar_billeteras_permitidas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaCalendario',
+            fields=[
+                ('fecha', models.DateField(primary_key=True, serialize=False)),
+                ('es_habil', models.BooleanField()),
+                ('ordinal_habil', models.IntegerField()),
+                ('festivo', models.CharField(blank=True, default='', max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Día de Calendario',
+                'verbose_name_plural': 'Calendario Hábil',
+                'ordering': ['fecha'],
+            },
+        ),
+    ]
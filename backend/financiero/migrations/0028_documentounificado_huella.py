@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('financiero', '0027_diacalendario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentounificado',
+            name='huella',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='documentounificado',
+            name='huella_portada',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='documentounificado',
+            name='documentos_incluidos',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='documentounificado',
+            name='paginas_portada',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,60 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('financiero', '0028_documentounificado_huella'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentoadjunto',
+            name='nas_storage_status',
+            field=models.CharField(
+                blank=True, max_length=20, null=True,
+                help_text='Estado de copia al NAS: pending, stored, failed, skipped, disabled o el código del último error',
+            ),
+        ),
+        migrations.CreateModel(
+            name='TareaFinanciera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('clave', models.CharField(max_length=100)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(
+                    choices=[
+                        ('pendiente', 'Pendiente'),
+                        ('en_proceso', 'En proceso'),
+                        ('completada', 'Completada'),
+                        ('fallida', 'Fallida'),
+                        ('reemplazada', 'Reemplazada por otra pendiente'),
+                    ],
+                    default='pendiente', max_length=20,
+                )),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('max_intentos', models.PositiveIntegerField(default=5)),
+                ('ejecutar_desde', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea en segundo plano',
+                'verbose_name_plural': 'Tareas en segundo plano',
+                'indexes': [
+                    models.Index(fields=['estado', 'ejecutar_desde'], name='idx_tarea_estado_ejecutar'),
+                    models.Index(fields=['clave'], name='idx_tarea_clave'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(
+                        condition=models.Q(('estado', 'pendiente')),
+                        fields=('clave',),
+                        name='uniq_tarea_pendiente_clave',
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('financiero', '0029_tareafinanciera'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tareafinanciera',
+            name='latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -2,7 +2,7 @@ import re
 import unicodedata
 
 from django.db import models
-from django.db.models import Index
+from django.db.models import Index, Q
 from usuarios.models import Usuario
 from facultades.models import Facultad
 from django.utils import timezone
@@ -460,10 +460,10 @@ class Factura(models.Model):
 
     @property
     def dias_transcurridos(self):
+        """Días hábiles desde la recepción (calendario.py)."""
         from datetime import date
-        if not self.fecha_recepcion:
-            return 0
-        return max((date.today() - self.fecha_recepcion).days, 0)
+        from .calendario import dias_habiles_entre
+        return dias_habiles_entre(self.fecha_recepcion, date.today())
 
     @property
     def monto_alto(self):
@@ -499,6 +499,16 @@ class ItemFactura(models.Model):
 # ============================================================
 # 7. DOCUMENTO ADJUNTO
 # ============================================================
+class SinContenidoManager(models.Manager):
+    """
+    Omite `contenido_archivo` (bytea heredado) en las consultas: los archivos
+    viven en el almacén de blobs y solo se lee la columna si se pide.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer('contenido_archivo')
+
+
 class DocumentoAdjunto(models.Model):
     TIPO_DOCUMENTO_CHOICES = [
         ('Factura', 'Factura'),
@@ -539,6 +549,7 @@ class DocumentoAdjunto(models.Model):
     NAS_STATUS_FAILED = 'failed'
     NAS_STATUS_SKIPPED = 'skipped'
     NAS_STATUS_DISABLED = 'disabled'
+    NAS_STATUS_PENDING = 'pending'
 
     nas_relative_path = models.CharField(
         max_length=500, blank=True, null=True,
@@ -546,9 +557,11 @@ class DocumentoAdjunto(models.Model):
     )
     nas_storage_status = models.CharField(
         max_length=20, blank=True, null=True,
-        help_text='Estado de copia al NAS: stored, failed, skipped, disabled',
+        help_text='Estado de copia al NAS: pending, stored, failed, skipped, disabled o el código del último error',
     )
 
+    objects = SinContenidoManager()
+
     class Meta:
         indexes = [
             Index(fields=['factura'], name='idx_documento_factura'),
@@ -579,6 +592,14 @@ class DocumentoUnificado(models.Model):
         max_length=20, blank=True, null=True,
         help_text='Estado de copia al NAS del PDF unificado: stored, failed, skipped, disabled',
     )
+    # Huella del expediente: si coincide con la de los documentos actuales se
+    # sirve el PDF guardado; si solo se agregaron documentos, se le añaden.
+    huella = models.CharField(max_length=64, blank=True, default='')
+    huella_portada = models.CharField(max_length=64, blank=True, default='')
+    documentos_incluidos = models.JSONField(default=list, blank=True)
+    paginas_portada = models.PositiveIntegerField(default=0)
+
+    objects = SinContenidoManager()
 
     class Meta:
         indexes = [
@@ -860,3 +881,80 @@ class TipoCuenta(models.Model):
 
     def __str__(self):
         return self.nombre
+
+
+# ============================================================
+# 15. CALENDARIO HÁBIL
+# ============================================================
+class DiaCalendario(models.Model):
+    """
+    Un día del calendario hábil (ver calendario.py). `ordinal_habil` son los
+    días hábiles acumulados hasta esta fecha inclusive, así que los días
+    hábiles entre dos fechas son una resta. Lo llena el comando
+    cargar_calendario_habil.
+    """
+    fecha = models.DateField(primary_key=True)
+    es_habil = models.BooleanField()
+    ordinal_habil = models.IntegerField()
+    festivo = models.CharField(max_length=100, blank=True, default='')
+
+    class Meta:
+        verbose_name = 'Día de Calendario'
+        verbose_name_plural = 'Calendario Hábil'
+        ordering = ['fecha']
+
+    def __str__(self):
+        return f"{self.fecha} ({'hábil' if self.es_habil else self.festivo or 'no hábil'})"
+
+
+class TareaFinanciera(models.Model):
+    """
+    Trabajo en segundo plano de financiero (copias al NAS, regenerar el
+    expediente), guardado en la base de datos y ejecutado por el comando
+    run_jobs; ver tareas.py. Las tareas con la misma `clave` se agrupan:
+    mientras haya una pendiente no se crea otra.
+    """
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_EN_PROCESO = 'en_proceso'
+    ESTADO_COMPLETADA = 'completada'
+    ESTADO_FALLIDA = 'fallida'
+    ESTADO_REEMPLAZADA = 'reemplazada'
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_EN_PROCESO, 'En proceso'),
+        (ESTADO_COMPLETADA, 'Completada'),
+        (ESTADO_FALLIDA, 'Fallida'),
+        (ESTADO_REEMPLAZADA, 'Reemplazada por otra pendiente'),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    clave = models.CharField(max_length=100)
+    parametros = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    ejecutar_desde = models.DateTimeField(default=timezone.now)
+    fecha_inicio = models.DateTimeField(blank=True, null=True)
+    # Lo renueva el worker mientras ejecuta la tarea (ver tareas.liberar_vencidas)
+    latido = models.DateTimeField(blank=True, null=True)
+    fecha_fin = models.DateTimeField(blank=True, null=True)
+    ultimo_error = models.TextField(blank=True, default='')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            Index(fields=['estado', 'ejecutar_desde'], name='idx_tarea_estado_ejecutar'),
+            Index(fields=['clave'], name='idx_tarea_clave'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['clave'],
+                condition=Q(estado='pendiente'),
+                name='uniq_tarea_pendiente_clave',
+            ),
+        ]
+        verbose_name = 'Tarea en segundo plano'
+        verbose_name_plural = 'Tareas en segundo plano'
+
+    def __str__(self):
+        return f"{self.tipo} {self.clave} ({self.estado})"
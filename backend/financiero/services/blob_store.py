@@ -0,0 +1,184 @@
+"""
+Almacén de contenido direccionado por hash para los documentos financieros.
+
+Cada archivo se guarda una sola vez bajo su SHA-256 (el mismo valor de
+`hash_archivo`), repartido en subcarpetas para no llenar un directorio:
+
+    <FINANCIERO_BLOB_ROOT>/ab/cd/abcd…64 hex
+
+- Dos cargas con el mismo contenido comparten el mismo blob.
+- La escritura es atómica (archivo temporal + rename): un blob existe
+  completo o no existe, y reescribirlo no cambia nada.
+- Con `FINANCIERO_BLOB_NAS_TIER` cada blob se copia además al NAS
+  (blobs/ab/cd/…) y, si falta en disco local, se lee de allí y se vuelve a
+  guardar localmente.
+
+Así DocumentoAdjunto y DocumentoUnificado solo guardan metadatos; el comando
+migrar_blobs_documentos saca de PostgreSQL el contenido bytea heredado.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_TAG = '[BLOB_STORE]'
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_valid_hash(value) -> bool:
+    return bool(value) and bool(_HASH_RE.match(str(value)))
+
+
+def sha256_hex(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def shard_path(blob_hash: str) -> str:
+    """Ruta relativa del blob: ab/cd/<hash>."""
+    if not is_valid_hash(blob_hash):
+        raise ValueError(f'Hash de blob inválido: {blob_hash!r}')
+    return f'{blob_hash[:2]}/{blob_hash[2:4]}/{blob_hash}'
+
+
+# ------------------------------------------------------------------ #
+# Backends                                                            #
+# ------------------------------------------------------------------ #
+
+class LocalBlobStore:
+    """Blobs en disco local, en subcarpetas por prefijo del hash."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, blob_hash: str) -> Path:
+        return self.root / shard_path(blob_hash)
+
+    def exists(self, blob_hash: str) -> bool:
+        return self.path(blob_hash).is_file()
+
+    def put(self, blob_hash: str, content: bytes) -> bool:
+        """Guarda el blob si no existe. Devuelve True si lo escribió."""
+        destino = self.path(blob_hash)
+        if destino.is_file():
+            return False
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=destino.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as archivo:
+                archivo.write(content)
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            os.replace(temporal, destino)
+        except BaseException:
+            try:
+                os.unlink(temporal)
+            except OSError:
+                pass
+            raise
+        return True
+
+    def open(self, blob_hash: str) -> Optional[BinaryIO]:
+        try:
+            return open(self.path(blob_hash), 'rb')
+        except FileNotFoundError:
+            return None
+
+
+class NasBlobStore:
+    """Blobs en el NAS (blobs/ab/cd/<hash>) a través de SharedStorageService."""
+
+    PREFIX = 'blobs'
+
+    def __init__(self, storage=None):
+        self._storage = storage
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            from financiero.services.shared_storage_service import shared_storage
+            self._storage = shared_storage
+        return self._storage
+
+    @property
+    def enabled(self) -> bool:
+        return self.storage.enabled
+
+    def relative_path(self, blob_hash: str) -> str:
+        return f'{self.PREFIX}/{shard_path(blob_hash)}'
+
+    def put(self, blob_hash: str, content: bytes) -> bool:
+        result = self.storage.write_file(self.relative_path(blob_hash), content, overwrite=False)
+        return result.success
+
+    def read(self, blob_hash: str) -> Optional[bytes]:
+        result = self.storage.read_file(self.relative_path(blob_hash))
+        return result.content_bytes if result.success else None
+
+
+class TieredBlobStore:
+    """
+    Disco local como almacén principal y, opcionalmente, el NAS como segunda
+    copia. Lee la configuración en cada uso para respetar cambios de settings.
+    """
+
+    def __init__(self, nas: Optional[NasBlobStore] = None):
+        self.nas = nas or NasBlobStore()
+
+    @property
+    def local(self) -> LocalBlobStore:
+        return LocalBlobStore(settings.FINANCIERO_BLOB_ROOT)
+
+    @property
+    def nas_enabled(self) -> bool:
+        return bool(getattr(settings, 'FINANCIERO_BLOB_NAS_TIER', False)) and self.nas.enabled
+
+    def put(self, content: bytes, blob_hash: Optional[str] = None) -> str:
+        """Guarda `content` y devuelve su hash. No lo duplica si ya existe."""
+        blob_hash = blob_hash or sha256_hex(content)
+        self.local.put(blob_hash, content)
+        if self.nas_enabled and not self.nas.put(blob_hash, content):
+            logger.warning('%s No se pudo copiar el blob %s al NAS; queda solo en disco local.', _TAG, blob_hash)
+        return blob_hash
+
+    def local_path(self, blob_hash: str) -> Optional[Path]:
+        """Ruta local del blob (trayéndolo del NAS si hace falta), o None."""
+        if not is_valid_hash(blob_hash):
+            return None
+        local = self.local
+        if local.exists(blob_hash):
+            return local.path(blob_hash)
+        if self.nas_enabled:
+            content = self.nas.read(blob_hash)
+            if content is not None and sha256_hex(content) == blob_hash:
+                local.put(blob_hash, content)
+                return local.path(blob_hash)
+        return None
+
+    def exists(self, blob_hash: str) -> bool:
+        return self.local_path(blob_hash) is not None
+
+    def open(self, blob_hash: str) -> Optional[BinaryIO]:
+        path = self.local_path(blob_hash)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+    def read(self, blob_hash: str) -> Optional[bytes]:
+        archivo = self.open(blob_hash)
+        if archivo is None:
+            return None
+        with archivo:
+            return archivo.read()
+
+
+blob_store = TieredBlobStore()
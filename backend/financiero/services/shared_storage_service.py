@@ -22,7 +22,7 @@ import os
 import re
 import unicodedata
 from dataclasses import dataclass
-from typing import Optional
+from typing import BinaryIO, Optional
 
 from django.conf import settings
 
@@ -38,6 +38,8 @@ class StorageResult:
     error_code: Optional[str] = None
     message: str = ''
     content_bytes: Optional[bytes] = None
+    file_obj: Optional[BinaryIO] = None
+    size: Optional[int] = None
 
 
 # ------------------------------------------------------------------ #
@@ -201,6 +203,56 @@ class SharedStorageService:
         except Exception as exc:
             return self._handle_error(exc, 'leer archivo', None)
 
+    def open_file(self, nas_relative_path: str) -> StorageResult:
+        """
+        Abre un archivo del NAS para leerlo por partes (file_obj admite seek).
+        Quien lo recibe debe cerrarlo.
+        """
+        if not self.enabled:
+            return StorageResult(False, error_code='DISABLED', message='NAS no configurado')
+
+        relative = str(nas_relative_path or '').strip().replace('\\', '/').lstrip('/')
+        if not relative or '..' in relative.split('/'):
+            return StorageResult(False, error_code='INVALID_PATH', message='Ruta de NAS inválida')
+
+        try:
+            smbclient, _ = self._get_smb_client()
+            server, share, base = _parse_unc(self.unc_root)
+            full_relative = f'{base}/{relative}' if base else relative
+            path = _smb_path(server, share, full_relative)
+            size = smbclient.stat(path).st_size
+            return StorageResult(
+                True, nas_relative_path=relative, file_obj=smbclient.open_file(path, mode='rb'), size=size,
+            )
+        except Exception as exc:
+            return self._handle_error(exc, 'abrir archivo', None)
+
+    def write_file(self, nas_relative_path: str, content_bytes: bytes, overwrite: bool = True) -> StorageResult:
+        """
+        Escribe un archivo en una ruta relativa del NAS, creando sus carpetas.
+        Con overwrite=False no toca un archivo que ya existe (éxito igualmente).
+        """
+        if not self.enabled:
+            return StorageResult(False, error_code='DISABLED', message='NAS no configurado')
+
+        relative = str(nas_relative_path or '').strip().replace('\\', '/').lstrip('/')
+        if not relative or '..' in relative.split('/'):
+            return StorageResult(False, error_code='INVALID_PATH', message='Ruta de NAS inválida')
+
+        try:
+            smbclient, _ = self._get_smb_client()
+            server, share, base = _parse_unc(self.unc_root)
+            full_relative = f'{base}/{relative}' if base else relative
+            path = _smb_path(server, share, full_relative)
+            if not overwrite and smbclient.path.exists(path):
+                return StorageResult(True, nas_relative_path=relative, message='El archivo ya existía en NAS')
+            smbclient.makedirs(path.rsplit('/', 1)[0], exist_ok=True)
+            with smbclient.open_file(path, mode='wb') as remote_file:
+                remote_file.write(content_bytes)
+            return StorageResult(True, nas_relative_path=relative, message='Archivo guardado en NAS')
+        except Exception as exc:
+            return self._handle_error(exc, 'escribir archivo', None)
+
     # ---------------------------------------------------------------- #
     # Internal: SMB session                                             #
     # ---------------------------------------------------------------- #
@@ -0,0 +1,78 @@
+"""
+ZIP en streaming para las descargas de expedientes.
+
+zipfile escribe sin problema sobre un destino que no admite seek: en ese
+caso pone el tamaño y el CRC de cada entrada en un descriptor al final de la
+entrada en vez de volver atrás a corregir el encabezado. `zip_en_streaming`
+aprovecha eso para ir entregando al cliente lo que se escribe:
+
+- cada archivo se lee por partes y cada parte se comprime y se entrega antes
+  de leer la siguiente, así la memoria no depende del tamaño del expediente;
+- los PDF, imágenes y otros formatos ya comprimidos van con ZIP_STORED (no
+  se gasta CPU en comprimirlos otra vez); el resto, con ZIP_DEFLATED.
+"""
+import time
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+ZIP_CHUNK_BYTES = 64 * 1024
+EXTENSIONES_COMPRIMIDAS = (
+    '.pdf', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.zip', '.rar', '.7z', '.gz',
+    '.docx', '.xlsx', '.pptx',
+)
+
+Entrada = Tuple[str, BinaryIO, Optional[int]]
+
+
+class _Salida:
+    """Destino sin seek para ZipFile: guarda lo escrito hasta que se entrega."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, data) -> int:
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def vaciar(self) -> bytes:
+        data = b''.join(self._partes)
+        self._partes.clear()
+        return data
+
+
+def tipo_compresion(nombre: str) -> int:
+    return zipfile.ZIP_STORED if nombre.lower().endswith(EXTENSIONES_COMPRIMIDAS) else zipfile.ZIP_DEFLATED
+
+
+def zip_en_streaming(entradas: Iterable[Entrada], chunk_bytes: int = ZIP_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Genera el ZIP por partes. `entradas` produce (nombre, archivo, tamaño):
+    el archivo se lee por partes y se cierra al terminar su entrada; el
+    tamaño puede ser None si no se conoce. Conviene pasar un generador para
+    que cada archivo se abra solo cuando le toca.
+    """
+    salida = _Salida()
+    with zipfile.ZipFile(salida, 'w') as zip_file:
+        for nombre, archivo, tamano in entradas:
+            info = zipfile.ZipInfo(nombre, date_time=time.localtime()[:6])
+            info.compress_type = tipo_compresion(nombre)
+            info.external_attr = 0o600 << 16
+            info.file_size = tamano or 0
+            with archivo, zip_file.open(info, 'w') as destino:
+                while True:
+                    parte = archivo.read(chunk_bytes)
+                    if not parte:
+                        break
+                    destino.write(parte)
+                    datos = salida.vaciar()
+                    if datos:
+                        yield datos
+            datos = salida.vaciar()
+            if datos:
+                yield datos
+    datos = salida.vaciar()
+    if datos:
+        yield datos
@@ -1,13 +1,22 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import ParametroSLA, Factura
-from .sla import build_parametros_sla_map, sincronizar_sla_facturas
+from .models import Factura, HistorialFactura, ParametroSLA
+from .sla import programar_sincronizacion_sla
+from .tablero import invalidar_tablero
 
 
 @receiver(post_save, sender=ParametroSLA)
 def parametro_sla_post_save(sender, instance, **kwargs):
-    """Recalcular SLA cuando cambian los parámetros."""
-    facturas = Factura.objects.exclude(estado__in=['Pagada', 'Anulada'])
-    parametros_map = build_parametros_sla_map()
-    sincronizar_sla_facturas(facturas, parametros_map=parametros_map)
+    """Recalcular SLA cuando cambian los parámetros, en run_jobs y tras confirmar."""
+    programar_sincronizacion_sla()
+
+
+@receiver(post_save, sender=Factura)
+@receiver(post_delete, sender=Factura)
+@receiver(post_save, sender=HistorialFactura)
+@receiver(post_delete, sender=HistorialFactura)
+def factura_invalidar_tablero(sender, **kwargs):
+    """Los totales del tablero cambian con cada factura o movimiento de su historial."""
+    transaction.on_commit(invalidar_tablero)
@@ -1,12 +1,28 @@
 from __future__ import annotations
 
-from datetime import date, timedelta
-from typing import Dict, Iterable, Optional
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+import logging
 import unicodedata
 
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .calendario import dias_habiles_entre
 from .models import Factura, ParametroSLA
 
 
+logger = logging.getLogger(__name__)
+
+ESTADOS_SIN_SLA = ['Pagada', 'Anulada']
+TAMANO_LOTE_SLA = 500
+_CAMPOS_SLA = (
+    'id', 'numero_factura', 'etapa_actual', 'fecha_inicio_etapa', 'fecha_recepcion',
+    'indicador_riesgo', 'sla_cumplido', 'usuario_responsable_id', 'creado_por_id',
+)
+
+
 _ALIAS_MAP = {
     'registro por parte del funcionario': ['recepcion y registro', 'registro y recepcion', 'recepcion funcionario', 'registro funcionario'],
     'recepcion y registro': ['registro por parte del funcionario'],
@@ -96,34 +112,22 @@ def _calcular_dias_transcurridos(
     if fecha_actual < fecha_inicio:
         return 0
 
-    delta_days = (fecha_actual - fecha_inicio).days
     if not aplica_dias_habiles:
-        return delta_days
-
-    dias = 0
-    for offset in range(1, delta_days + 1):
-        dia = fecha_inicio + timedelta(days=offset)
-        if dia.weekday() < 5:
-            dias += 1
+        return (fecha_actual - fecha_inicio).days
 
-    return dias
+    return dias_habiles_entre(fecha_inicio, fecha_actual)
 
 
-def aplicar_sla_factura(
+def _clasificar(
     factura: Factura,
-    parametros_map: Optional[Dict[str, ParametroSLA]] = None,
+    parametro: Optional[ParametroSLA],
     fecha_actual: Optional[date] = None,
-) -> bool:
-    parametros_map = parametros_map or build_parametros_sla_map()
-    parametro = _resolve_parametro(factura.etapa_actual, parametros_map)
-
-    indicador_anterior = factura.indicador_riesgo
-    sla_anterior = factura.sla_cumplido
-
+) -> Optional[int]:
+    """Asigna indicador_riesgo y sla_cumplido; devuelve los días transcurridos (None sin parámetro)."""
     if not parametro or not parametro.activo:
         factura.indicador_riesgo = 'ok'
         factura.sla_cumplido = True
-        return indicador_anterior != factura.indicador_riesgo or sla_anterior != factura.sla_cumplido
+        return None
 
     fecha_inicio = factura.fecha_inicio_etapa or factura.fecha_recepcion
     dias_transcurridos = _calcular_dias_transcurridos(
@@ -147,48 +151,64 @@ def aplicar_sla_factura(
 
     factura.indicador_riesgo = indicador
     factura.sla_cumplido = dias_transcurridos <= dias_maximos
+    return dias_transcurridos
+
 
+def aplicar_sla_factura(
+    factura: Factura,
+    parametros_map: Optional[Dict[str, ParametroSLA]] = None,
+    fecha_actual: Optional[date] = None,
+) -> bool:
+    parametros_map = parametros_map or build_parametros_sla_map()
+    indicador_anterior = factura.indicador_riesgo
+    sla_anterior = factura.sla_cumplido
+    _clasificar(factura, _resolve_parametro(factura.etapa_actual, parametros_map), fecha_actual)
     return indicador_anterior != factura.indicador_riesgo or sla_anterior != factura.sla_cumplido
 
 
+def _alertas_sla(
+    factura: Factura,
+    indicador_anterior: str,
+    parametro: Optional[ParametroSLA],
+    dias_transcurridos: Optional[int],
+) -> List[dict]:
+    """Notificaciones SLA_ALERTA de una factura que pasó a un indicador de riesgo."""
+    if factura.indicador_riesgo == indicador_anterior or factura.indicador_riesgo not in {'atencion', 'atrasada', 'vencida'}:
+        return []
+
+    estado_label = {
+        'atencion': 'En riesgo',
+        'atrasada': 'Atrasada',
+        'vencida': 'Vencida',
+    }.get(factura.indicador_riesgo, 'En riesgo')
+    mensaje = (
+        f"Factura {factura.numero_factura} en etapa {factura.etapa_actual or 'Sin etapa'}: "
+        f"{estado_label}. {dias_transcurridos or 0} días de {parametro.dias_maximos if parametro else 'N/A'}."
+    )
+    prioridad = 'alta' if factura.indicador_riesgo in {'atrasada', 'vencida'} else 'media'
+    return [
+        {'id_usuario': user_id, 'tipo': 'SLA_ALERTA', 'mensaje': mensaje, 'prioridad': prioridad}
+        for user_id in {factura.usuario_responsable_id, factura.creado_por_id}
+    ]
+
+
 def actualizar_sla_factura(
     factura: Factura,
     parametros_map: Optional[Dict[str, ParametroSLA]] = None,
     fecha_actual: Optional[date] = None,
 ) -> bool:
+    parametros_map = parametros_map or build_parametros_sla_map()
+    parametro = _resolve_parametro(factura.etapa_actual, parametros_map)
     indicador_anterior = factura.indicador_riesgo
-    changed = aplicar_sla_factura(factura, parametros_map=parametros_map, fecha_actual=fecha_actual)
+    sla_anterior = factura.sla_cumplido
+    dias_transcurridos = _clasificar(factura, parametro, fecha_actual)
+    changed = indicador_anterior != factura.indicador_riesgo or sla_anterior != factura.sla_cumplido
     if changed:
         factura.save(update_fields=['indicador_riesgo', 'sla_cumplido', 'fecha_modificacion'])
 
-        if factura.indicador_riesgo != indicador_anterior and factura.indicador_riesgo in {'atencion', 'atrasada', 'vencida'}:
-            parametro = obtener_parametro_por_etapa(factura.etapa_actual, parametros_map)
-            fecha_inicio = factura.fecha_inicio_etapa or factura.fecha_recepcion
-            dias_transcurridos = _calcular_dias_transcurridos(
-                fecha_inicio,
-                fecha_actual=fecha_actual,
-                aplica_dias_habiles=parametro.aplica_dias_habiles if parametro else True,
-            )
-            estado_label = {
-                'atencion': 'En riesgo',
-                'atrasada': 'Atrasada',
-                'vencida': 'Vencida',
-            }.get(factura.indicador_riesgo, 'En riesgo')
-            mensaje = (
-                f"Factura {factura.numero_factura} en etapa {factura.etapa_actual or 'Sin etapa'}: "
-                f"{estado_label}. {dias_transcurridos} días de {parametro.dias_maximos if parametro else 'N/A'}."
-            )
+        from notificaciones.signals import crear_notificaciones_en_lote
 
-            from notificaciones.signals import crear_notificacion
-
-            destinatarios = {factura.usuario_responsable_id, factura.creado_por_id}
-            for user_id in destinatarios:
-                crear_notificacion(
-                    id_usuario=user_id,
-                    tipo='SLA_ALERTA',
-                    mensaje=mensaje,
-                    prioridad='alta' if factura.indicador_riesgo in {'atrasada', 'vencida'} else 'media',
-                )
+        crear_notificaciones_en_lote(_alertas_sla(factura, indicador_anterior, parametro, dias_transcurridos))
     return changed
 
 
@@ -197,9 +217,60 @@ def sincronizar_sla_facturas(
     parametros_map: Optional[Dict[str, ParametroSLA]] = None,
     fecha_actual: Optional[date] = None,
 ) -> int:
+    """
+    Recalcula el SLA de `facturas` en memoria: el parámetro se resuelve una vez
+    por etapa, los cambios se guardan con un bulk_update y las alertas salen
+    en un solo lote de notificaciones. Devuelve cuántas facturas cambiaron.
+    """
     parametros_map = parametros_map or build_parametros_sla_map()
-    total = 0
+    fecha_actual = fecha_actual or date.today()
+    if isinstance(facturas, QuerySet):
+        facturas = facturas.only(*_CAMPOS_SLA).iterator(chunk_size=TAMANO_LOTE_SLA)
+
+    parametros_por_etapa: Dict[Optional[str], Optional[ParametroSLA]] = {}
+    cambiadas: List[Factura] = []
+    alertas: List[dict] = []
+    ahora = timezone.now()
     for factura in facturas:
-        if actualizar_sla_factura(factura, parametros_map=parametros_map, fecha_actual=fecha_actual):
-            total += 1
-    return total
+        etapa = factura.etapa_actual
+        if etapa not in parametros_por_etapa:
+            parametros_por_etapa[etapa] = _resolve_parametro(etapa, parametros_map)
+        parametro = parametros_por_etapa[etapa]
+
+        indicador_anterior = factura.indicador_riesgo
+        sla_anterior = factura.sla_cumplido
+        dias_transcurridos = _clasificar(factura, parametro, fecha_actual)
+        if indicador_anterior != factura.indicador_riesgo or sla_anterior != factura.sla_cumplido:
+            factura.fecha_modificacion = ahora
+            cambiadas.append(factura)
+            alertas.extend(_alertas_sla(factura, indicador_anterior, parametro, dias_transcurridos))
+
+    if cambiadas:
+        from notificaciones.signals import crear_notificaciones_en_lote
+
+        with transaction.atomic():
+            Factura.objects.bulk_update(
+                cambiadas, ['indicador_riesgo', 'sla_cumplido', 'fecha_modificacion'], batch_size=TAMANO_LOTE_SLA,
+            )
+            crear_notificaciones_en_lote(alertas)
+            # bulk_update no emite post_save: los totales del tablero se invalidan aquí
+            from .tablero import invalidar_tablero
+            transaction.on_commit(invalidar_tablero)
+    return len(cambiadas)
+
+
+def sincronizar_sla_facturas_abiertas() -> int:
+    return sincronizar_sla_facturas(Factura.objects.exclude(estado__in=ESTADOS_SIN_SLA))
+
+
+# ---------- Recálculo en segundo plano ----------
+
+def programar_sincronizacion_sla() -> None:
+    """
+    Encola el recálculo del SLA de las facturas abiertas como tarea de
+    run_jobs (tareas.py), al confirmar la transacción. Mientras haya uno
+    pendiente no se encola otro.
+    """
+    from .tareas import encolar
+
+    encolar('sincronizar_sla', 'sla:facturas_abiertas')
@@ -0,0 +1,220 @@
+"""
+Totales de facturas para el tablero financiero y FacturaViewSet.estadisticas.
+
+dashboard_admin hacía una consulta COUNT/SUM por indicador y traía todas las
+facturas abiertas para promediar días en Python; estadisticas hacía un
+`count()` por estado. Aquí:
+
+- todos los totales de facturas salen de una sola consulta con agregación
+  condicional (`Count(filter=...)`, `Sum`, `Avg` sobre los días hábiles del
+  calendario), sin importar cuántas facturas haya;
+- el resultado queda unos segundos en caché bajo una versión que se renueva
+  al escribir una Factura o un HistorialFactura (ver signals.py).
+"""
+
+import uuid
+from datetime import date
+from typing import Callable, Dict
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q, QuerySet, Sum
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from usuarios.models import Usuario
+
+from .calendario import expresion_dias_habiles
+from .models import Factura, HistorialFactura, Proveedor
+from .sla import ESTADOS_SIN_SLA
+
+
+TABLERO_VERSION_CACHE_KEY = 'financiero:tablero:version'
+TABLERO_CACHE_KEY = 'financiero:tablero:{version}:{nombre}'
+TABLERO_CACHE_TTL_SECONDS = 60
+
+INDICADORES_RIESGO = ['atencion', 'atrasada', 'vencida']
+ROLES_FINANCIEROS = [
+    'Funcionario',
+    'Contabilidad',
+    'Tesorería',
+    'Tesoreria',
+    'Auditoría',
+    'Auditoria',
+    'Dirección Financiera',
+    'Direccion Financiera',
+    'Rectoría',
+    'Rectoria',
+    'Admin Financiero',
+    'admin_financiero',
+]
+ESTADOS_FACTURA = [estado for estado, _ in Factura.ESTADO_CHOICES]
+
+
+# ---------- Caché ----------
+
+def _version() -> str:
+    version = cache.get(TABLERO_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(TABLERO_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(TABLERO_VERSION_CACHE_KEY)
+    return version
+
+
+def invalidar_tablero() -> None:
+    """Descarta los totales cacheados; se llama al confirmar escrituras de facturas."""
+    cache.set(TABLERO_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def _cacheado(nombre: str, calcular: Callable[[], Dict]) -> Dict:
+    clave = TABLERO_CACHE_KEY.format(version=_version(), nombre=nombre)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, TABLERO_CACHE_TTL_SECONDS)
+    return valor
+
+
+# ---------- Agregados ----------
+
+def resumen_facturas(queryset: QuerySet, hoy: date, con_tiempo_promedio: bool = True) -> Dict:
+    """
+    Totales de `queryset` en una consulta. `tiempo_promedio_dias` es el
+    promedio de días hábiles desde la recepción de las facturas en proceso
+    (None si el calendario hábil no cubre `hoy`).
+    """
+    en_proceso = ~Q(estado__in=ESTADOS_SIN_SLA)
+    agregados = {
+        'total_facturas': Count('id'),
+        'facturas_en_proceso': Count('id', filter=en_proceso),
+        'monto_total_tramite': Sum('valor_total', filter=en_proceso),
+        'facturas_riesgo': Count('id', filter=Q(indicador_riesgo__in=INDICADORES_RIESGO)),
+        'facturas_vencidas': Count('id', filter=Q(indicador_riesgo='vencida')),
+        'facturas_atrasadas': Count('id', filter=Q(indicador_riesgo='atrasada')),
+        'pagos_aplicados_mes': Count('id', filter=Q(
+            estado__in=['Pago Aplicado', 'Pagada'],
+            fecha_pago_aplicado__year=hoy.year,
+            fecha_pago_aplicado__month=hoy.month,
+        )),
+    }
+    agregados.update({
+        f'estado_{indice}': Count('id', filter=Q(estado=estado))
+        for indice, estado in enumerate(ESTADOS_FACTURA)
+    })
+    dias_habiles = expresion_dias_habiles('fecha_recepcion', hoy) if con_tiempo_promedio else None
+    if dias_habiles is not None:
+        agregados['tiempo_promedio_dias'] = Avg(dias_habiles, filter=en_proceso & Q(fecha_recepcion__lte=hoy))
+
+    resultado = queryset.aggregate(**agregados)
+    resultado['monto_total_tramite'] = float(resultado['monto_total_tramite'] or 0)
+    resultado['por_estado'] = {
+        estado: resultado.pop(f'estado_{indice}')
+        for indice, estado in enumerate(ESTADOS_FACTURA)
+    }
+    if 'tiempo_promedio_dias' in resultado:
+        promedio = resultado['tiempo_promedio_dias']
+        resultado['tiempo_promedio_dias'] = round(promedio, 2) if promedio is not None else 0
+    else:
+        resultado['tiempo_promedio_dias'] = None
+    return resultado
+
+
+def _tiempo_promedio_sin_calendario(queryset: QuerySet) -> float:
+    # Solo sin calendario hábil cargado: días de lunes a viernes calculados en memoria
+    dias = [f.dias_transcurridos for f in queryset.exclude(estado__in=ESTADOS_SIN_SLA).only('fecha_recepcion')]
+    return round((sum(dias) / len(dias)), 2) if dias else 0
+
+
+def _calcular_dashboard_admin() -> Dict:
+    hoy = timezone.now().date()
+    facturas = Factura.objects.all()
+    resumen = resumen_facturas(facturas, hoy)
+    if resumen['tiempo_promedio_dias'] is None:
+        resumen['tiempo_promedio_dias'] = _tiempo_promedio_sin_calendario(facturas)
+
+    usuarios_activos = (
+        Usuario.objects.filter(activo=True)
+        .annotate(rol_nombre=Lower('rol__nombre'))
+        .filter(rol_nombre__in=[rol.lower() for rol in ROLES_FINANCIEROS])
+        .count()
+    )
+    proveedores_activos = Proveedor.objects.filter(estado='Activo').count()
+
+    distribucion = sorted(
+        (
+            {'estado': estado, 'cantidad': cantidad}
+            for estado, cantidad in resumen['por_estado'].items() if cantidad
+        ),
+        key=lambda fila: -fila['cantidad'],
+    )
+
+    alertas_qs = (
+        Factura.objects.filter(indicador_riesgo__in=INDICADORES_RIESGO)
+        .only('id', 'numero_factura', 'estado', 'indicador_riesgo', 'fecha_recepcion', 'valor_total')
+        .order_by('-fecha_recepcion')[:15]
+    )
+    alertas = [
+        {
+            'id': f.id,
+            'numero_factura': f.numero_factura,
+            'estado': f.estado,
+            'indicador_riesgo': f.indicador_riesgo,
+            'dias_transcurridos': f.dias_transcurridos,
+            'valor_total': float(f.valor_total or 0),
+        }
+        for f in alertas_qs
+    ]
+
+    actividades_qs = HistorialFactura.objects.select_related('factura', 'usuario').order_by('-fecha_accion')[:12]
+    actividades = [
+        {
+            'id': h.id,
+            'numero_factura': h.factura.numero_factura if h.factura else None,
+            'usuario_nombre': h.usuario_nombre or (h.usuario.nombre if h.usuario else 'Sistema'),
+            'accion': h.accion,
+            'estado_nuevo': h.estado_nuevo,
+            'fecha_accion': h.fecha_accion,
+        }
+        for h in actividades_qs
+    ]
+
+    return {
+        'resumen': {
+            'usuarios_activos': usuarios_activos,
+            'proveedores_activos': proveedores_activos,
+            'total_facturas': resumen['total_facturas'],
+            'facturas_en_proceso': resumen['facturas_en_proceso'],
+            'facturas_riesgo': resumen['facturas_riesgo'],
+            'facturas_vencidas': resumen['facturas_vencidas'],
+            'monto_total_tramite': resumen['monto_total_tramite'],
+            'tiempo_promedio_dias': resumen['tiempo_promedio_dias'],
+            'pagos_aplicados_mes': resumen['pagos_aplicados_mes'],
+        },
+        'distribucion_estados': distribucion,
+        'alertas': alertas,
+        'actividades': actividades,
+    }
+
+
+def dashboard_admin() -> Dict:
+    """Respuesta completa de ReporteGeneradoViewSet.dashboard_admin, cacheada."""
+    return _cacheado('dashboard_admin', _calcular_dashboard_admin)
+
+
+def estadisticas_facturas(solo_registro: bool = False) -> Dict:
+    """
+    Respuesta de FacturaViewSet.estadisticas, cacheada. Con `solo_registro`
+    cuenta solo las facturas que ve un Funcionario (Recibida y Registrada).
+    """
+    def calcular():
+        queryset = Factura.objects.all()
+        if solo_registro:
+            queryset = queryset.filter(estado__in=['Recibida', 'Registrada'])
+        resumen = resumen_facturas(queryset, timezone.now().date(), con_tiempo_promedio=False)
+        return {
+            'total_facturas': resumen['total_facturas'],
+            'por_estado': {estado: cantidad for estado, cantidad in resumen['por_estado'].items() if cantidad},
+            'vencidas': resumen['facturas_vencidas'],
+            'atrasadas': resumen['facturas_atrasadas'],
+        }
+
+    return _cacheado('estadisticas_registro' if solo_registro else 'estadisticas', calcular)
@@ -0,0 +1,206 @@
+"""
+Cola de tareas en segundo plano de financiero, guardada en la base de datos.
+
+Copiar un documento al NAS, regenerar el expediente unificado y recalcular
+el SLA de las facturas abiertas se hacían dentro de la request o en un hilo
+suelto por proceso. Aquí cada trabajo es una fila de TareaFinanciera:
+
+- `encolar` crea la tarea al confirmar la transacción. Las tareas con la
+  misma clave se agrupan: si ya hay una pendiente (p. ej. `expediente:<id>`
+  de dos cargas seguidas) no se crea otra;
+- el comando run_jobs toma lotes con `SELECT ... FOR UPDATE SKIP LOCKED`, así
+  que varios procesos pueden trabajar a la vez sin repetir tareas, y nunca
+  toma una clave que ya esté en proceso (un expediente se regenera de a uno);
+- si la tarea falla se reintenta con espera exponencial hasta `max_intentos`;
+- mientras una tarea se ejecuta, un hilo renueva su `latido` cada
+  TAREA_LATIDO. Solo se libera (vuelve a pendiente) la tarea cuyo latido
+  lleva más de TAREA_VENCIMIENTO sin renovarse, es decir, la de un worker que
+  se detuvo; una regeneración lenta sigue siendo de su worker.
+
+Con `settings.FINANCIERO_TAREAS_ASYNC` desactivado (solo desarrollo, sin el
+servicio backend-tareas) la tarea se ejecuta al confirmar la transacción, en
+el mismo proceso; los reintentos quedan para run_jobs.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TareaFinanciera
+
+logger = logging.getLogger(__name__)
+
+MANEJADORES = {
+    'copiar_documento_nas': 'financiero.views._copiar_documento_nas',
+    'regenerar_expediente': 'financiero.views._sincronizar_expediente_nas',
+    'sincronizar_sla': 'financiero.sla.sincronizar_sla_facturas_abiertas',
+}
+TAREA_REINTENTO_BASE = timedelta(seconds=30)
+TAREA_REINTENTO_MAXIMO = timedelta(hours=1)
+TAREA_LATIDO = timedelta(seconds=30)
+TAREA_VENCIMIENTO = timedelta(minutes=5)
+TAREA_CONSERVAR_TERMINADAS = timedelta(days=7)
+
+
+# ---------- Encolado ----------
+
+def encolar(tipo: str, clave: str, **parametros) -> None:
+    """Crea la tarea al confirmar la transacción, salvo que ya haya una pendiente con la misma clave."""
+    if tipo not in MANEJADORES:
+        raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+
+    def crear():
+        try:
+            with transaction.atomic():
+                tarea, creada = TareaFinanciera.objects.get_or_create(
+                    clave=clave,
+                    estado=TareaFinanciera.ESTADO_PENDIENTE,
+                    defaults={'tipo': tipo, 'parametros': parametros},
+                )
+        except IntegrityError:
+            # Otra request creó la misma tarea pendiente al mismo tiempo
+            return
+        if creada and not getattr(settings, 'FINANCIERO_TAREAS_ASYNC', True):
+            if _tomar_tarea(tarea):
+                ejecutar(tarea)
+
+    transaction.on_commit(crear)
+
+
+# ---------- Ejecución ----------
+
+def _tomar_tarea(tarea: TareaFinanciera) -> bool:
+    ahora = timezone.now()
+    tomada = TareaFinanciera.objects.filter(id=tarea.id, estado=TareaFinanciera.ESTADO_PENDIENTE).update(
+        estado=TareaFinanciera.ESTADO_EN_PROCESO, fecha_inicio=ahora, latido=ahora, intentos=F('intentos') + 1,
+    )
+    if tomada:
+        tarea.estado, tarea.fecha_inicio, tarea.latido = TareaFinanciera.ESTADO_EN_PROCESO, ahora, ahora
+        tarea.intentos += 1
+    return bool(tomada)
+
+
+def tomar(limite: int) -> List[TareaFinanciera]:
+    """
+    Marca en proceso hasta `limite` tareas pendientes ya vencidas y las
+    devuelve. Se saltan las filas bloqueadas por otro worker y las claves que
+    ya tienen una tarea en proceso.
+    """
+    ahora = timezone.now()
+    en_proceso = TareaFinanciera.objects.filter(estado=TareaFinanciera.ESTADO_EN_PROCESO).values('clave')
+    with transaction.atomic():
+        ids = list(
+            TareaFinanciera.objects.select_for_update(skip_locked=True)
+            .filter(estado=TareaFinanciera.ESTADO_PENDIENTE, ejecutar_desde__lte=ahora)
+            .exclude(clave__in=en_proceso)
+            .order_by('ejecutar_desde', 'id')
+            .values_list('id', flat=True)[:limite]
+        )
+        TareaFinanciera.objects.filter(id__in=ids).update(
+            estado=TareaFinanciera.ESTADO_EN_PROCESO, fecha_inicio=ahora, latido=ahora, intentos=F('intentos') + 1,
+        )
+    return list(TareaFinanciera.objects.filter(id__in=ids).order_by('ejecutar_desde', 'id'))
+
+
+class _Latido(threading.Thread):
+    """Renueva el latido de una tarea en proceso cada TAREA_LATIDO hasta `detener`."""
+
+    def __init__(self, tarea_id: int):
+        super().__init__(name=f'financiero-latido-{tarea_id}', daemon=True)
+        self.tarea_id = tarea_id
+        self.detenido = threading.Event()
+
+    def run(self) -> None:
+        try:
+            while not self.detenido.wait(TAREA_LATIDO.total_seconds()):
+                TareaFinanciera.objects.filter(
+                    id=self.tarea_id, estado=TareaFinanciera.ESTADO_EN_PROCESO,
+                ).update(latido=timezone.now())
+        except Exception:
+            logger.exception('[TAREAS] No se pudo renovar el latido de la tarea %s.', self.tarea_id)
+        finally:
+            connection.close()
+
+    def detener(self) -> None:
+        self.detenido.set()
+        self.join()
+
+
+def ejecutar(tarea: TareaFinanciera) -> bool:
+    """Ejecuta una tarea ya tomada y registra el resultado. Devuelve True si terminó bien."""
+    latido = _Latido(tarea.id)
+    latido.start()
+    try:
+        import_string(MANEJADORES[tarea.tipo])(**tarea.parametros)
+    except Exception as exc:
+        logger.exception('[TAREAS] Falló la tarea %s (%s), intento %s.', tarea.id, tarea.clave, tarea.intentos)
+        _registrar_fallo(tarea, f'{type(exc).__name__}: {exc}')
+        return False
+    finally:
+        latido.detener()
+    TareaFinanciera.objects.filter(id=tarea.id).update(
+        estado=TareaFinanciera.ESTADO_COMPLETADA, fecha_fin=timezone.now(), ultimo_error='',
+    )
+    return True
+
+
+def _reemplazar(queryset, error: str) -> None:
+    queryset.update(estado=TareaFinanciera.ESTADO_REEMPLAZADA, fecha_fin=timezone.now(), ultimo_error=error)
+
+
+def _registrar_fallo(tarea: TareaFinanciera, error: str) -> None:
+    actual = TareaFinanciera.objects.filter(id=tarea.id)
+    if tarea.intentos >= tarea.max_intentos:
+        actual.update(estado=TareaFinanciera.ESTADO_FALLIDA, fecha_fin=timezone.now(), ultimo_error=error)
+        return
+    espera = min(TAREA_REINTENTO_MAXIMO, TAREA_REINTENTO_BASE * 2 ** (tarea.intentos - 1))
+    try:
+        with transaction.atomic():
+            actual.update(
+                estado=TareaFinanciera.ESTADO_PENDIENTE, ejecutar_desde=timezone.now() + espera, ultimo_error=error,
+            )
+    except IntegrityError:
+        # Ya se encoló otra tarea con la misma clave; esa hará el trabajo
+        _reemplazar(actual, error)
+
+
+# ---------- Mantenimiento ----------
+
+def liberar_vencidas() -> int:
+    """
+    Devuelve a pendiente las tareas en proceso de un worker que se detuvo:
+    las que llevan más de TAREA_VENCIMIENTO sin renovar su latido.
+    """
+    limite = timezone.now() - TAREA_VENCIMIENTO
+    liberadas = 0
+    vencidas = TareaFinanciera.objects.filter(
+        Q(latido__lt=limite) | Q(latido__isnull=True, fecha_inicio__lt=limite),
+        estado=TareaFinanciera.ESTADO_EN_PROCESO,
+    )
+    for tarea in vencidas:
+        # El latido se vuelve a comprobar: pudo renovarse después de la consulta
+        actual = TareaFinanciera.objects.filter(
+            id=tarea.id, estado=TareaFinanciera.ESTADO_EN_PROCESO, latido=tarea.latido,
+        )
+        try:
+            with transaction.atomic():
+                liberadas += actual.update(estado=TareaFinanciera.ESTADO_PENDIENTE, ejecutar_desde=timezone.now())
+        except IntegrityError:
+            _reemplazar(actual, 'Interrumpida; la reemplaza una tarea pendiente con la misma clave.')
+    return liberadas
+
+
+def purgar_terminadas() -> int:
+    """Borra las tareas completadas o reemplazadas hace más de TAREA_CONSERVAR_TERMINADAS."""
+    borradas, _detalle = TareaFinanciera.objects.filter(
+        estado__in=[TareaFinanciera.ESTADO_COMPLETADA, TareaFinanciera.ESTADO_REEMPLAZADA],
+        fecha_fin__lt=timezone.now() - TAREA_CONSERVAR_TERMINADAS,
+    ).delete()
+    return borradas
@@ -1,11 +1,29 @@
-from django.test import TestCase
+from django.db import connection
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIRequestFactory, force_authenticate
-from datetime import date
-from unittest.mock import patch
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest.mock import PropertyMock, patch
 from . import models
 from . import views, serializers
+from .services.blob_store import blob_store, sha256_hex
 from .services.shared_storage_service import StorageResult
+from .calendario import (
+    cargar_calendario, dias_de_semana_entre, dias_habiles_entre, expresion_dias_habiles, festivos_colombia,
+    invalidar_calendario,
+)
+from .sla import sincronizar_sla_facturas
+from .tablero import dashboard_admin, estadisticas_facturas
+from . import tareas
+from notificaciones.models import Notificacion
 from usuarios.models import Usuario, Rol
 
 # Create your tests here.
@@ -116,8 +134,13 @@ class FacturaTestCase(TestCase):
         )
         force_authenticate(request, user=self.usuario)
 
-        response = views.DocumentoAdjuntoViewSet.as_view({'post': 'create'})(request)
-        self.assertEqual(response.status_code, 201)
+        # La copia al NAS es una tarea que ejecuta run_jobs, fuera de la request
+        with self.captureOnCommitCallbacks(execute=True):
+            response = views.DocumentoAdjuntoViewSet.as_view({'post': 'create'})(request)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['nas_storage_status'], models.DocumentoAdjunto.NAS_STATUS_PENDING)
+        storage_mock.copy_document.assert_not_called()
+        call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
 
         documento = models.DocumentoAdjunto.objects.get(id=response.data['id'])
         self.assertIsNone(documento.contenido_archivo)
@@ -164,3 +187,419 @@ class FacturaTestCase(TestCase):
         nombres = [doc['nombre_archivo'] for doc in serializer.data['documentos']]
 
         self.assertEqual(nombres, ['nuevo.pdf'])
+
+
+class SincronizacionSLATestCase(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            correo='sla@test.com', nombre='SLA', rol=Rol.objects.create(nombre='Contabilidad'),
+        )
+        proveedor = models.Proveedor.objects.create(nit='900', razon_social='Proveedor SLA', tipo_proveedor='Servicios')
+        departamento = models.Departamento.objects.create(codigo='DEP-SLA', nombre='Depto', tipo='Administrativo')
+        models.ParametroSLA.objects.create(
+            etapa='Radicación y Causación', rol_responsable='Contabilidad', dias_maximos=5,
+        )
+        # 0, 3, 4 y 10 días hábiles al lunes 2026-04-20 (amarillo desde 3, rojo desde 4, máximo 5)
+        self.facturas = [
+            models.Factura.objects.create(
+                numero_factura=f'SLA-{n}', proveedor=proveedor, departamento=departamento,
+                valor_subtotal=1000, valor_total=1000, tipo_documento='Factura',
+                fecha_factura=date(2026, 3, 1), fecha_recepcion=date(2026, 3, 1),
+                etapa_actual='Radicación', fecha_inicio_etapa=inicio, creado_por=self.usuario,
+            )
+            for n, inicio in enumerate([date(2026, 4, 20), date(2026, 4, 15), date(2026, 4, 14), date(2026, 4, 6)])
+        ]
+
+    def test_dias_habiles_coinciden_con_el_conteo_dia_a_dia(self):
+        for desplazamiento in range(7):
+            inicio = date(2026, 4, 1) + timedelta(days=desplazamiento)
+            for dias in range(40):
+                esperado = sum(1 for k in range(1, dias + 1) if (inicio + timedelta(days=k)).weekday() < 5)
+                self.assertEqual(dias_de_semana_entre(inicio, inicio + timedelta(days=dias)), esperado)
+
+    def test_clasifica_en_memoria_y_guarda_en_lote(self):
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            cambiadas = sincronizar_sla_facturas(
+                models.Factura.objects.all(), fecha_actual=date(2026, 4, 20),
+            )
+
+        self.assertEqual(cambiadas, 3)
+        indicadores = dict(models.Factura.objects.values_list('numero_factura', 'indicador_riesgo'))
+        self.assertEqual(
+            indicadores, {'SLA-0': 'ok', 'SLA-1': 'atencion', 'SLA-2': 'atrasada', 'SLA-3': 'vencida'},
+        )
+        self.assertFalse(models.Factura.objects.get(numero_factura='SLA-3').sla_cumplido)
+        updates = [q for q in consultas.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Notificacion.objects.filter(tipo_notificacion='SLA_ALERTA').count(), 3)
+
+    @patch('financiero.sla.sincronizar_sla_facturas_abiertas')
+    def test_cambiar_parametros_encola_un_solo_recalculo_para_run_jobs(self, sincronizar):
+        parametro = models.ParametroSLA.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            for dias in (6, 7):
+                parametro.dias_maximos = dias
+                parametro.save()
+
+        self.assertEqual(
+            list(models.TareaFinanciera.objects.values_list('tipo', 'estado')), [('sincronizar_sla', 'pendiente')],
+        )
+        sincronizar.assert_not_called()
+        call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
+        sincronizar.assert_called_once_with()
+        self.assertEqual(models.TareaFinanciera.objects.get().estado, 'completada')
+
+
+class CalendarioHabilTestCase(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cargar_calendario(date(2026, 1, 1), date(2026, 12, 31))
+
+    def tearDown(self):
+        invalidar_calendario()
+
+    def test_festivos_colombia_2026(self):
+        festivos = festivos_colombia(2026)
+        self.assertEqual(sorted(festivos), [
+            date(2026, 1, 1), date(2026, 1, 12), date(2026, 3, 23), date(2026, 4, 2), date(2026, 4, 3),
+            date(2026, 5, 1), date(2026, 5, 18), date(2026, 6, 8), date(2026, 6, 15), date(2026, 6, 29),
+            date(2026, 7, 20), date(2026, 8, 7), date(2026, 8, 17), date(2026, 10, 12), date(2026, 11, 2),
+            date(2026, 11, 16), date(2026, 12, 8), date(2026, 12, 25),
+        ])
+        self.assertEqual(festivos[date(2026, 4, 3)], 'Viernes Santo')
+
+    def test_dias_habiles_descuentan_festivos_y_salen_del_rango_sin_ellos(self):
+        # Semana Santa: solo martes 31, miércoles 1 y lunes 6
+        self.assertEqual(dias_habiles_entre(date(2026, 3, 30), date(2026, 4, 6)), 3)
+        self.assertEqual(dias_habiles_entre(date(2026, 4, 6), date(2026, 3, 30)), 0)
+        # 2025-12-26 (viernes) a 2026-01-05: 29, 30 y 31 de diciembre sin calendario; 2 y 5 de enero con él
+        self.assertEqual(dias_habiles_entre(date(2025, 12, 26), date(2026, 1, 5)), 5)
+        self.assertEqual(
+            dias_habiles_entre(date(2026, 12, 24), date(2027, 1, 4)),
+            dias_de_semana_entre(date(2026, 12, 24), date(2027, 1, 4)) - 1,
+        )
+
+    def test_expresion_sql_coincide_con_el_calculo_en_memoria(self):
+        usuario = Usuario.objects.create_user(
+            correo='calendario@test.com', nombre='Calendario', rol=Rol.objects.create(nombre='Contabilidad'),
+        )
+        proveedor = models.Proveedor.objects.create(nit='901', razon_social='Proveedor', tipo_proveedor='Servicios')
+        departamento = models.Departamento.objects.create(codigo='DEP-CAL', nombre='Depto', tipo='Administrativo')
+        recepciones = [date(2026, 3, 16), date(2026, 3, 30), date(2026, 4, 20)]
+        for n, recepcion in enumerate(recepciones):
+            models.Factura.objects.create(
+                numero_factura=f'CAL-{n}', proveedor=proveedor, departamento=departamento,
+                valor_subtotal=1000, valor_total=1000, tipo_documento='Factura',
+                fecha_factura=recepcion, fecha_recepcion=recepcion, creado_por=usuario,
+            )
+
+        hasta = date(2026, 4, 20)
+        calculados = dict(
+            models.Factura.objects.annotate(dias=expresion_dias_habiles('fecha_recepcion', hasta))
+            .values_list('fecha_recepcion', 'dias')
+        )
+        self.assertEqual(calculados, {fecha: dias_habiles_entre(fecha, hasta) for fecha in recepciones})
+        self.assertEqual(calculados[date(2026, 3, 30)], 13)
+        self.assertIsNone(expresion_dias_habiles('fecha_recepcion', date(2027, 1, 4)))
+
+
+class TableroFinancieroTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        hoy = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            cargar_calendario(date(hoy.year - 1, 1, 1), date(hoy.year + 1, 12, 31))
+            self.usuario = Usuario.objects.create_user(
+                correo='tablero@test.com', nombre='Tablero', rol=Rol.objects.create(nombre='Tesorería'),
+            )
+            proveedor = models.Proveedor.objects.create(nit='902', razon_social='Proveedor', tipo_proveedor='Servicios')
+            departamento = models.Departamento.objects.create(codigo='DEP-TAB', nombre='Depto', tipo='Administrativo')
+            for n, (estado, riesgo, dias) in enumerate([
+                ('Recibida', 'ok', 3), ('Registrada', 'vencida', 20), ('Registrada', 'atrasada', 9), ('Pagada', 'ok', 40),
+            ]):
+                models.Factura.objects.create(
+                    numero_factura=f'TAB-{n}', proveedor=proveedor, departamento=departamento,
+                    valor_subtotal=1000, valor_total=1000 * (n + 1), tipo_documento='Factura',
+                    fecha_factura=hoy - timedelta(days=dias), fecha_recepcion=hoy - timedelta(days=dias),
+                    estado=estado, indicador_riesgo=riesgo, creado_por=self.usuario,
+                )
+
+    def tearDown(self):
+        invalidar_calendario()
+
+    def test_dashboard_en_una_consulta_de_facturas_y_cacheado(self):
+        with CaptureQueriesContext(connection) as consultas:
+            datos = dashboard_admin()
+        agregadas = [q['sql'] for q in consultas.captured_queries if 'FROM "financiero_factura"' in q['sql']]
+        # Totales en una consulta agregada y otra para las alertas
+        self.assertEqual(len(agregadas), 2)
+
+        resumen = datos['resumen']
+        self.assertEqual(
+            (resumen['total_facturas'], resumen['facturas_en_proceso'], resumen['facturas_riesgo'],
+             resumen['facturas_vencidas'], resumen['monto_total_tramite'], resumen['usuarios_activos']),
+            (4, 3, 2, 1, 6000.0, 1),
+        )
+        abiertas = models.Factura.objects.exclude(estado='Pagada')
+        self.assertEqual(
+            resumen['tiempo_promedio_dias'],
+            round(sum(f.dias_transcurridos for f in abiertas) / 3, 2),
+        )
+        self.assertEqual(datos['distribucion_estados'][0], {'estado': 'Registrada', 'cantidad': 2})
+
+        with self.assertNumQueries(0):
+            dashboard_admin()
+
+        factura = models.Factura.objects.get(numero_factura='TAB-0')
+        factura.estado = 'Pagada'
+        with self.captureOnCommitCallbacks(execute=True):
+            factura.save()
+        self.assertEqual(dashboard_admin()['resumen']['facturas_en_proceso'], 2)
+
+    def test_estadisticas_por_estado_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            estadisticas = estadisticas_facturas()
+        self.assertEqual(
+            estadisticas,
+            {'total_facturas': 4, 'por_estado': {'Recibida': 1, 'Registrada': 2, 'Pagada': 1}, 'vencidas': 1, 'atrasadas': 1},
+        )
+        self.assertEqual(estadisticas_facturas(solo_registro=True)['total_facturas'], 3)
+
+
+class AlmacenBlobsTestCase(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(FINANCIERO_BLOB_ROOT=directorio.name, FINANCIERO_BLOB_NAS_TIER=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.raiz = directorio.name
+
+        usuario = Usuario.objects.create_user(
+            correo='blobs@test.com', nombre='Blobs', rol=Rol.objects.create(nombre='Contabilidad'),
+        )
+        proveedor = models.Proveedor.objects.create(nit='903', razon_social='Proveedor', tipo_proveedor='Servicios')
+        departamento = models.Departamento.objects.create(codigo='DEP-BLOB', nombre='Depto', tipo='Administrativo')
+        self.factura = models.Factura.objects.create(
+            numero_factura='BLOB-1', proveedor=proveedor, departamento=departamento,
+            valor_subtotal=1000, valor_total=1000, tipo_documento='Factura',
+            fecha_factura=date(2026, 4, 5), fecha_recepcion=date(2026, 4, 5), creado_por=usuario,
+        )
+
+    def _blobs(self):
+        return sorted(p.name for p in Path(self.raiz).rglob('*') if p.is_file())
+
+    def test_contenido_identico_se_guarda_una_vez_en_subcarpetas(self):
+        hash_archivo = blob_store.put(b'%PDF-1.4 igual')
+        self.assertEqual(blob_store.put(b'%PDF-1.4 igual'), hash_archivo)
+
+        self.assertEqual(self._blobs(), [hash_archivo])
+        self.assertEqual(
+            blob_store.local.path(hash_archivo).relative_to(self.raiz).parts[:2], (hash_archivo[:2], hash_archivo[2:4]),
+        )
+        self.assertEqual(blob_store.read(hash_archivo), b'%PDF-1.4 igual')
+        self.assertIsNone(blob_store.read(sha256_hex(b'otro')))
+
+    def test_migra_bytea_por_lotes_y_deja_la_columna_vacia(self):
+        for n, contenido in enumerate([b'uno', b'dos', b'uno']):
+            models.DocumentoAdjunto.objects.create(
+                factura=self.factura, nombre_archivo=f'doc{n}.pdf', tipo_documento='Factura',
+                contenido_archivo=contenido, hash_archivo='',
+            )
+
+        call_command('migrar_blobs_documentos', lote=2, stdout=StringIO())
+        self.assertEqual(models.DocumentoAdjunto.objects.filter(contenido_archivo__isnull=False).count(), 3)
+
+        call_command('migrar_blobs_documentos', lote=2, confirmar=True, stdout=StringIO())
+
+        self.assertFalse(models.DocumentoAdjunto.objects.filter(contenido_archivo__isnull=False).exists())
+        self.assertEqual(self._blobs(), sorted([sha256_hex(b'uno'), sha256_hex(b'dos')]))
+        documento = models.DocumentoAdjunto.objects.get(nombre_archivo='doc1.pdf')
+        self.assertEqual((documento.hash_archivo, documento.tamano_bytes), (sha256_hex(b'dos'), 3))
+        with self.assertNumQueries(0):
+            self.assertEqual(views._documento_bytes(documento), b'dos')
+
+    def _descargar(self, documento, **encabezados):
+        request = APIRequestFactory().get(f'/api/financiero/documentos/{documento.id}/contenido/', **encabezados)
+        force_authenticate(request, user=self.factura.creado_por)
+        return views.DocumentoAdjuntoViewSet.as_view({'get': 'contenido'})(request, pk=documento.id)
+
+    def test_descarga_en_streaming_con_rangos(self):
+        contenido = bytes(range(256)) * 1024
+        documento = models.DocumentoAdjunto.objects.create(
+            factura=self.factura, nombre_archivo='escaneo.pdf', tipo_documento='Factura',
+            tipo_mime='application/pdf', hash_archivo=blob_store.put(contenido),
+        )
+
+        completo = self._descargar(documento)
+        self.assertEqual(completo.status_code, 200)
+        self.assertTrue(completo.streaming)
+        self.assertEqual(completo['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(completo.streaming_content), contenido)
+
+        parcial = self._descargar(documento, HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 1000-1999/{len(contenido)}')
+        self.assertEqual(b''.join(parcial.streaming_content), contenido[1000:2000])
+
+        final = self._descargar(documento, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(final.streaming_content), contenido[-10:])
+        self.assertEqual(self._descargar(documento, HTTP_RANGE=f'bytes={len(contenido)}-').status_code, 416)
+        self.assertEqual(self._descargar(documento, HTTP_IF_NONE_MATCH=completo['ETag']).status_code, 304)
+
+        with self.settings(FINANCIERO_X_ACCEL_BLOBS_PREFIX='/_documentos/'):
+            redirigido = self._descargar(documento)
+        self.assertEqual(
+            redirigido['X-Accel-Redirect'],
+            f'/_documentos/{documento.hash_archivo[:2]}/{documento.hash_archivo[2:4]}/{documento.hash_archivo}',
+        )
+
+    def test_expediente_reutiliza_el_pdf_guardado_y_solo_agrega_lo_nuevo(self):
+        vista = views.FacturaViewSet()
+
+        def soporte(nombre):
+            return models.DocumentoAdjunto.objects.create(
+                factura=self.factura, nombre_archivo=f'{nombre}.pdf', tipo_documento='Soporte',
+                tipo_mime='application/pdf', hash_archivo=blob_store.put(vista._build_pdf_page(nombre, [nombre])),
+            )
+
+        documentos = [soporte('uno'), soporte('dos')]
+        primero = vista._pdf_consolidado_documentos(self.factura, documentos, 'all')
+
+        with patch.object(views.FacturaViewSet, '_build_portada_factura') as portada, \
+                patch.object(views.FacturaViewSet, '_documento_bytes') as lectura:
+            self.assertEqual(vista._pdf_consolidado_documentos(self.factura, documentos, 'all'), primero)
+        portada.assert_not_called()
+        lectura.assert_not_called()
+
+        documentos.append(soporte('tres'))
+        leidos = []
+
+        def leer(documento):
+            leidos.append(documento.nombre_archivo)
+            return views._documento_bytes(documento)
+
+        with patch.object(views.FacturaViewSet, '_documento_bytes', side_effect=leer):
+            tercero = vista._pdf_consolidado_documentos(self.factura, documentos, 'all')
+        self.assertEqual(leidos, ['tres.pdf'])
+
+        from pypdf import PdfReader
+        paginas = [pagina.extract_text() for pagina in PdfReader(BytesIO(tercero)).pages]
+        self.assertEqual(len(paginas), 4)
+        self.assertIn('3)', paginas[0])
+        self.assertEqual([texto.split()[0] for texto in paginas[1:]], ['uno', 'dos', 'tres'])
+        unificado = models.DocumentoUnificado.objects.get(factura=self.factura, scope='all')
+        self.assertEqual((len(unificado.documentos_incluidos), unificado.paginas_portada), (3, 1))
+        self.assertEqual(vista._expediente_vigente(self.factura, documentos, 'all'), unificado)
+        self.assertIsNone(vista._expediente_vigente(self.factura, documentos[:2], 'all'))
+
+        # Al día siguiente (más días transcurridos) el PDF guardado sigue vigente
+        with patch.object(models.Factura, 'dias_transcurridos', new_callable=PropertyMock, return_value=99):
+            self.assertEqual(vista._expediente_vigente(self.factura, documentos, 'all'), unificado)
+
+    def test_zip_del_expediente_en_streaming(self):
+        vista = views.FacturaViewSet()
+        pdf = vista._build_pdf_page('Soporte', ['soporte'])
+        models.DocumentoAdjunto.objects.create(
+            factura=self.factura, nombre_archivo='soporte.pdf', tipo_documento='Factura',
+            tipo_mime='application/pdf', hash_archivo=blob_store.put(pdf),
+        )
+        models.DocumentoAdjunto.objects.create(
+            factura=self.factura, nombre_archivo='plano.txt', tipo_documento='Soporte',
+            tipo_mime='text/plain', hash_archivo=blob_store.put(b'linea\n' * 5000),
+        )
+
+        request = APIRequestFactory().get(f'/api/financiero/facturas/{self.factura.id}/documentos_historial_zip/')
+        force_authenticate(request, user=self.factura.creado_por)
+        response = views.FacturaViewSet.as_view({'get': 'documentos_historial_zip'})(request, pk=self.factura.id)
+        self.assertTrue(response.streaming)
+
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archivo_zip:
+            entradas = {info.filename: info for info in archivo_zip.infolist()}
+            self.assertEqual(sorted(entradas), [
+                'especificos/Factura/01-soporte.pdf',
+                'especificos/Soporte/02-plano.txt',
+                'unificados/expediente_unificado.pdf',
+            ])
+            self.assertEqual(archivo_zip.read('especificos/Factura/01-soporte.pdf'), pdf)
+            self.assertEqual(archivo_zip.read('especificos/Soporte/02-plano.txt'), b'linea\n' * 5000)
+            self.assertEqual(entradas['especificos/Factura/01-soporte.pdf'].compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(entradas['especificos/Soporte/02-plano.txt'].compress_type, zipfile.ZIP_DEFLATED)
+            unificado = models.DocumentoUnificado.objects.get(factura=self.factura)
+            self.assertEqual(archivo_zip.read('unificados/expediente_unificado.pdf'), views._documento_bytes(unificado))
+
+
+@override_settings(FINANCIERO_TAREAS_ASYNC=True)
+class TareasFinancierasTestCase(TestCase):
+    def _encolar_expediente(self, factura_id=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            tareas.encolar('regenerar_expediente', f'expediente:{factura_id}', factura_id=factura_id)
+
+    def test_cargas_seguidas_de_la_misma_factura_se_agrupan(self):
+        self._encolar_expediente()
+        self._encolar_expediente()
+        self._encolar_expediente(factura_id=2)
+
+        self.assertEqual(
+            sorted(models.TareaFinanciera.objects.values_list('clave', 'estado')),
+            [('expediente:1', 'pendiente'), ('expediente:2', 'pendiente')],
+        )
+
+    @patch('financiero.views._sincronizar_expediente_nas', side_effect=[RuntimeError('NAS caído'), None])
+    def test_reintenta_con_espera_y_luego_completa(self, sincronizar):
+        self._encolar_expediente()
+
+        call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
+        tarea = models.TareaFinanciera.objects.get()
+        self.assertEqual((tarea.estado, tarea.intentos), ('pendiente', 1))
+        self.assertIn('NAS caído', tarea.ultimo_error)
+        self.assertGreater(tarea.ejecutar_desde, timezone.now() + timedelta(seconds=20))
+
+        # Aún en espera: no se vuelve a ejecutar
+        call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
+        self.assertEqual(sincronizar.call_count, 1)
+
+        models.TareaFinanciera.objects.update(ejecutar_desde=timezone.now())
+        call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.ultimo_error), ('completada', 2, ''))
+        sincronizar.assert_called_with(factura_id=1)
+
+    @patch('financiero.views._sincronizar_expediente_nas', side_effect=RuntimeError('NAS caído'))
+    def test_marca_fallida_al_agotar_los_intentos(self, _sincronizar):
+        self._encolar_expediente()
+        models.TareaFinanciera.objects.update(max_intentos=1)
+
+        call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
+        self.assertEqual(models.TareaFinanciera.objects.get().estado, 'fallida')
+
+    def test_no_toma_una_clave_en_proceso_y_libera_las_vencidas(self):
+        models.TareaFinanciera.objects.create(
+            tipo='regenerar_expediente', clave='expediente:1', parametros={'factura_id': 1},
+            estado='en_proceso', fecha_inicio=timezone.now() - timedelta(hours=1),
+        )
+        self._encolar_expediente()
+        self.assertEqual(tareas.tomar(5), [])
+
+        self.assertEqual(tareas.liberar_vencidas(), 0)
+        self.assertEqual(
+            sorted(models.TareaFinanciera.objects.values_list('estado', flat=True)), ['pendiente', 'reemplazada'],
+        )
+        self.assertEqual([tarea.clave for tarea in tareas.tomar(5)], ['expediente:1'])
+
+    def test_no_libera_una_tarea_lenta_con_latido_reciente(self):
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        lenta = models.TareaFinanciera.objects.create(
+            tipo='regenerar_expediente', clave='expediente:1', parametros={'factura_id': 1},
+            estado='en_proceso', fecha_inicio=hace_una_hora, latido=timezone.now(),
+        )
+        caida = models.TareaFinanciera.objects.create(
+            tipo='regenerar_expediente', clave='expediente:2', parametros={'factura_id': 2},
+            estado='en_proceso', fecha_inicio=hace_una_hora, latido=hace_una_hora + timedelta(minutes=10),
+        )
+
+        self.assertEqual(tareas.liberar_vencidas(), 1)
+        lenta.refresh_from_db()
+        caida.refresh_from_db()
+        self.assertEqual((lenta.estado, caida.estado), ('en_proceso', 'pendiente'))
+        self.assertEqual([tarea.clave for tarea in tareas.tomar(5)], ['expediente:2'])
@@ -4,18 +4,17 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
-from django.db import IntegrityError, transaction, close_old_connections
-from django.db.models import Count, Q, Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
 import hashlib
 import json
 import logging
 import mimetypes
 import os
-import threading
+import re
 import textwrap
-import zipfile
 from datetime import datetime
 from io import BytesIO
 from pathlib import Path
@@ -28,8 +27,10 @@ from openpyxl import Workbook
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.pdfgen import canvas
-from . import models, serializers
-from .sla import build_parametros_sla_map, actualizar_sla_factura, sincronizar_sla_facturas
+from . import models, serializers, tablero, tareas
+from .services.blob_store import blob_store, is_valid_hash, shard_path
+from .services.zip_stream import zip_en_streaming
+from .sla import ESTADOS_SIN_SLA, build_parametros_sla_map, actualizar_sla_factura, sincronizar_sla_facturas
 from usuarios.models import Usuario
 from notificaciones.signals import crear_notificacion
 
@@ -117,6 +118,15 @@ def _resolve_documento_local_path(documento):
 
 
 def _documento_bytes(documento):
+    hash_archivo = (getattr(documento, 'hash_archivo', None) or '').strip()
+    if is_valid_hash(hash_archivo):
+        try:
+            content = blob_store.read(hash_archivo)
+            if content is not None:
+                return content
+        except Exception as exc:
+            logger.warning('_documento_bytes: fallo leyendo blob doc_id=%s hash=%s error=%s', documento.id, hash_archivo, exc)
+
     nas_path = (getattr(documento, 'nas_relative_path', None) or '').strip()
     if nas_path:
         try:
@@ -138,7 +148,8 @@ def _documento_bytes(documento):
             )
 
     # Compatibilidad temporal para documentos históricos que todavía tienen
-    # contenido binario en PostgreSQL.
+    # contenido binario en PostgreSQL (ver migrar_blobs_documentos). La
+    # columna no se trae con el documento: se consulta solo en este caso.
     db_content = getattr(documento, 'contenido_archivo', None)
     if db_content is not None:
         return bytes(db_content)
@@ -161,6 +172,147 @@ def _documento_content_type(documento):
     return guessed or 'application/octet-stream'
 
 
+DOCUMENTO_CHUNK_BYTES = 64 * 1024
+_RANGO_BYTES_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _abrir_documento(documento):
+    """
+    Abre el contenido del documento sin leerlo entero, con las mismas fuentes
+    y en el mismo orden que _documento_bytes. Devuelve (archivo, tamaño,
+    ruta_blob) o None; ruta_blob es la ruta dentro del almacén de blobs cuando
+    el archivo sale de allí (para X-Accel-Redirect).
+    """
+    hash_archivo = (getattr(documento, 'hash_archivo', None) or '').strip()
+    if is_valid_hash(hash_archivo):
+        try:
+            path = blob_store.local_path(hash_archivo)
+            if path is not None:
+                return open(path, 'rb'), path.stat().st_size, shard_path(hash_archivo)
+        except Exception as exc:
+            logger.warning('_abrir_documento: fallo abriendo blob doc_id=%s hash=%s error=%s', documento.id, hash_archivo, exc)
+
+    nas_path = (getattr(documento, 'nas_relative_path', None) or '').strip()
+    if nas_path:
+        from financiero.services.shared_storage_service import shared_storage
+        result = shared_storage.open_file(nas_path)
+        if result.success:
+            return result.file_obj, result.size, None
+
+    local_path = _resolve_documento_local_path(documento)
+    if local_path:
+        try:
+            return open(local_path, 'rb'), local_path.stat().st_size, None
+        except Exception as exc:
+            logger.warning(
+                '_abrir_documento: fallo abriendo archivo local doc_id=%s path=%s error=%s',
+                documento.id, local_path, exc,
+            )
+
+    db_content = getattr(documento, 'contenido_archivo', None)
+    if db_content is not None:
+        content = bytes(db_content)
+        return BytesIO(content), len(content), None
+    return None
+
+
+def _leer_por_partes(archivo, inicio, longitud):
+    try:
+        archivo.seek(inicio)
+        restante = longitud
+        while restante > 0:
+            parte = archivo.read(min(DOCUMENTO_CHUNK_BYTES, restante))
+            if not parte:
+                break
+            restante -= len(parte)
+            yield parte
+    finally:
+        archivo.close()
+
+
+def _rango_solicitado(request, tamano, etag):
+    """
+    (inicio, fin) del encabezado Range, None para enviar el archivo completo
+    o False si el rango no se puede satisfacer. Solo se atiende un rango; con
+    varios se envía el archivo completo, como permite RFC 9110.
+    """
+    encabezado = (request.headers.get('Range') or '').strip()
+    if not encabezado:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        return None
+    coincidencia = _RANGO_BYTES_RE.match(encabezado)
+    if not coincidencia:
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        if not fin or int(fin) == 0:
+            return False if fin else None
+        return max(tamano - int(fin), 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, fin
+
+
+def _respuesta_documento(request, documento, filename, descargar):
+    """
+    Respuesta en streaming del documento, por partes de DOCUMENTO_CHUNK_BYTES
+    y con soporte de Range para que el visor PDF pida solo las páginas que
+    muestra. Si `FINANCIERO_X_ACCEL_BLOBS_PREFIX` está configurado y el
+    archivo está en el almacén de blobs local, lo entrega nginx. Devuelve
+    None si el documento no está en ninguna fuente.
+    """
+    abierto = _abrir_documento(documento)
+    if abierto is None:
+        return None
+    archivo, tamano, ruta_blob = abierto
+    content_type = _documento_content_type(documento)
+    disposition = f'{"attachment" if descargar else "inline"}; filename="{filename}"'
+    hash_archivo = (getattr(documento, 'hash_archivo', None) or '').strip()
+    etag = f'"{hash_archivo}"' if is_valid_hash(hash_archivo) else None
+
+    prefijo_x_accel = getattr(settings, 'FINANCIERO_X_ACCEL_BLOBS_PREFIX', '')
+    if ruta_blob and prefijo_x_accel:
+        archivo.close()
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f'{prefijo_x_accel.rstrip("/")}/{ruta_blob}'
+        response['Content-Disposition'] = disposition
+        response['ETag'] = etag
+        return response
+
+    if etag and request.headers.get('If-None-Match') == etag:
+        archivo.close()
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    rango = _rango_solicitado(request, tamano, etag)
+    if rango is False:
+        archivo.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return response
+
+    inicio, fin = rango or (0, tamano - 1)
+    longitud = fin - inicio + 1
+    response = StreamingHttpResponse(
+        _leer_por_partes(archivo, inicio, longitud),
+        status=206 if rango else 200,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(longitud)
+    if rango:
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
 DEFAULT_CUENTAS_CONTABLES = [
     {
         'codigo': '513505',
@@ -265,11 +417,24 @@ def _documento_upload_metadata(uploaded_file):
     )
 
 
+def _guardar_blob(content_bytes, hash_archivo=None):
+    """Guarda el contenido en el almacén de blobs; un fallo no interrumpe la carga."""
+    try:
+        return blob_store.put(content_bytes, hash_archivo if is_valid_hash(hash_archivo) else None)
+    except Exception as exc:
+        logger.warning('[BLOB_STORE] No se pudo guardar el blob hash=%s error=%s', hash_archivo, exc)
+        return None
+
+
 def _guardar_documento_en_carpeta_compartida(
     *, factura, nombre_archivo, tipo_documento, tipo_mime, content_bytes,
     tamano_bytes, hash_archivo, usuario,
 ):
-    """Guarda el binario exclusivamente en el NAS y crea solo sus metadatos en BD."""
+    """
+    Guarda el binario en el almacén de blobs, crea sus metadatos en BD y encola
+    la copia a la carpeta compartida (tarea copiar_documento_nas). Hasta que la
+    copia termina, nas_storage_status queda en 'pending'.
+    """
     from financiero.services.shared_storage_service import shared_storage
 
     if not content_bytes:
@@ -277,23 +442,15 @@ def _guardar_documento_en_carpeta_compartida(
     if not shared_storage.enabled:
         raise ValidationError({'archivo': 'La carpeta compartida no está configurada. No se puede guardar el documento.'})
 
-    ciclo_documental = _factura_ciclo_documental_actual(factura)
-    index = models.DocumentoAdjunto.objects.filter(
-        factura=factura,
-        ciclo_documental=ciclo_documental,
-    ).count() + 1
-    result = shared_storage.copy_document(
-        factura=factura,
-        index=index,
-        original_filename=nombre_archivo,
-        content_bytes=content_bytes,
-    )
-    if not result.success or not result.nas_relative_path:
-        raise ValidationError({
-            'archivo': f'No fue posible guardar el documento en la carpeta compartida: {result.message or result.error_code or "error desconocido"}.'
-        })
+    # El blob es la única copia hasta que la tarea llegue al NAS: si no se
+    # puede escribir, la carga falla.
+    try:
+        hash_archivo = blob_store.put(content_bytes, hash_archivo if is_valid_hash(hash_archivo) else None)
+    except Exception as exc:
+        logger.error('[BLOB_STORE] No se pudo guardar el documento en el almacén de blobs: %s', exc)
+        raise ValidationError({'archivo': 'No fue posible guardar el documento en el almacenamiento local.'})
 
-    return models.DocumentoAdjunto.objects.create(
+    documento = models.DocumentoAdjunto.objects.create(
         factura=factura,
         nombre_archivo=nombre_archivo[:255],
         tipo_documento=tipo_documento,
@@ -303,11 +460,13 @@ def _guardar_documento_en_carpeta_compartida(
         archivo=None,
         contenido_archivo=None,
         hash_archivo=hash_archivo,
-        ciclo_documental=ciclo_documental,
+        ciclo_documental=_factura_ciclo_documental_actual(factura),
         cargado_por=usuario,
-        nas_relative_path=result.nas_relative_path,
-        nas_storage_status=models.DocumentoAdjunto.NAS_STATUS_STORED,
+        nas_relative_path='',
+        nas_storage_status=models.DocumentoAdjunto.NAS_STATUS_PENDING,
     )
+    tareas.encolar('copiar_documento_nas', f'documento:{documento.id}', documento_id=documento.id)
+    return documento
 
 
 def _es_archivo_plano_txt(tipo_documento, nombre_archivo, tipo_mime):
@@ -790,93 +949,7 @@ class ReporteGeneradoViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='dashboard_admin')
     def dashboard_admin(self, request):
-        facturas = models.Factura.objects.all()
-        estados_cierre = ['Pagada', 'Anulada']
-        facturas_en_proceso = facturas.exclude(estado__in=estados_cierre)
-
-        roles_financieros = [
-            'Funcionario',
-            'Contabilidad',
-            'Tesorería',
-            'Tesoreria',
-            'Auditoría',
-            'Auditoria',
-            'Dirección Financiera',
-            'Direccion Financiera',
-            'Rectoría',
-            'Rectoria',
-            'Admin Financiero',
-            'admin_financiero',
-        ]
-        roles_q = Q()
-        for nombre_rol in roles_financieros:
-            roles_q |= Q(rol__nombre__iexact=nombre_rol)
-
-        usuarios_activos = Usuario.objects.filter(activo=True).filter(roles_q).count()
-        proveedores_activos = models.Proveedor.objects.filter(estado='Activo').count()
-
-        total_facturas = facturas.count()
-        cantidad_proceso = facturas_en_proceso.count()
-        monto_total = facturas_en_proceso.aggregate(total=Sum('valor_total')).get('total') or 0
-        facturas_riesgo = facturas.filter(indicador_riesgo__in=['atencion', 'atrasada', 'vencida']).count()
-        facturas_vencidas = facturas.filter(indicador_riesgo='vencida').count()
-
-        now = timezone.now()
-        pagos_aplicados_mes = facturas.filter(
-            estado__in=['Pago Aplicado', 'Pagada'],
-            fecha_pago_aplicado__year=now.year,
-            fecha_pago_aplicado__month=now.month,
-        ).count()
-
-        dias = [f.dias_transcurridos for f in facturas_en_proceso.only('fecha_recepcion')]
-        tiempo_promedio = round((sum(dias) / len(dias)), 2) if dias else 0
-
-        distribucion = list(
-            facturas.values('estado').annotate(cantidad=Count('id')).order_by('-cantidad')
-        )
-
-        alertas_qs = models.Factura.objects.filter(indicador_riesgo__in=['atencion', 'atrasada', 'vencida']).order_by('-fecha_recepcion')[:15]
-        alertas = [
-            {
-                'id': f.id,
-                'numero_factura': f.numero_factura,
-                'estado': f.estado,
-                'indicador_riesgo': f.indicador_riesgo,
-                'dias_transcurridos': f.dias_transcurridos,
-                'valor_total': float(f.valor_total or 0),
-            }
-            for f in alertas_qs
-        ]
-
-        actividades_qs = models.HistorialFactura.objects.select_related('factura', 'usuario').order_by('-fecha_accion')[:12]
-        actividades = [
-            {
-                'id': h.id,
-                'numero_factura': h.factura.numero_factura if h.factura else None,
-                'usuario_nombre': h.usuario_nombre or (h.usuario.nombre if h.usuario else 'Sistema'),
-                'accion': h.accion,
-                'estado_nuevo': h.estado_nuevo,
-                'fecha_accion': h.fecha_accion,
-            }
-            for h in actividades_qs
-        ]
-
-        return Response({
-            'resumen': {
-                'usuarios_activos': usuarios_activos,
-                'proveedores_activos': proveedores_activos,
-                'total_facturas': total_facturas,
-                'facturas_en_proceso': cantidad_proceso,
-                'facturas_riesgo': facturas_riesgo,
-                'facturas_vencidas': facturas_vencidas,
-                'monto_total_tramite': float(monto_total),
-                'tiempo_promedio_dias': tiempo_promedio,
-                'pagos_aplicados_mes': pagos_aplicados_mes,
-            },
-            'distribucion_estados': distribucion,
-            'alertas': alertas,
-            'actividades': actividades,
-        })
+        return Response(tablero.dashboard_admin())
 
     @action(detail=False, methods=['post'], url_path='exportar')
     def exportar(self, request):
@@ -1001,8 +1074,10 @@ class DocumentoAdjuntoViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'], url_path='contenido')
     def contenido(self, request, pk=None):
         documento = self.get_object()
-        raw_bytes = _documento_bytes(documento)
-        if raw_bytes is None:
+        descargar = (request.query_params.get('descargar') or '').strip().lower() in {'1', 'true', 'si', 'yes'}
+        filename = documento.nombre_archivo or f'documento-{documento.id}'
+        response = _respuesta_documento(request, documento, filename, descargar)
+        if response is None:
             return Response(
                 {
                     'error': 'El documento no está disponible en ninguna fuente configurada.',
@@ -1011,11 +1086,6 @@ class DocumentoAdjuntoViewSet(viewsets.ModelViewSet):
                 },
                 status=status.HTTP_404_NOT_FOUND,
             )
-
-        descargar = (request.query_params.get('descargar') or '').strip().lower() in {'1', 'true', 'si', 'yes'}
-        filename = documento.nombre_archivo or f'documento-{documento.id}'
-        response = HttpResponse(raw_bytes, content_type=_documento_content_type(documento))
-        response['Content-Disposition'] = f'{"attachment" if descargar else "inline"}; filename="{filename}"'
         return response
 
     def perform_create(self, serializer):
@@ -1476,9 +1546,11 @@ class FacturaViewSet(viewsets.ModelViewSet):
         pdf.setFont('Helvetica', 10)
         pdf.setFillColor(COLOR_TEXT)
         
+        # La portada se guarda y se reutiliza (ver _huellas_expediente): los
+        # días transcurridos quedan como una foto a la fecha de generación
         dias_transcurridos = factura.dias_transcurridos or 0
         info_operativa = [
-            ('Días Transcurridos:', f'{dias_transcurridos} días'),
+            ('Días Transcurridos:', f'{dias_transcurridos} días (al {timezone.localdate():%d/%m/%Y})'),
             ('Área Solicitante:', getattr(factura.departamento, 'nombre', 'N/A') if factura.departamento else 'N/A'),
             ('Observaciones:', (factura.observaciones or 'Sin observaciones')[:50]),
         ]
@@ -1515,12 +1587,12 @@ class FacturaViewSet(viewsets.ModelViewSet):
         pdf.save()
         return output.getvalue()
 
-    def _append_pdf_bytes(self, writer, raw_bytes):
+    def _append_pdf_bytes(self, writer, raw_bytes, desde_pagina=0):
         try:
             from pypdf import PdfReader
             reader = PdfReader(BytesIO(raw_bytes))
-            for page in reader.pages:
-                writer.add_page(page)
+            for indice in range(desde_pagina, len(reader.pages)):
+                writer.add_page(reader.pages[indice])
             return True
         except Exception:
             return False
@@ -1543,14 +1615,61 @@ class FacturaViewSet(viewsets.ModelViewSet):
     def _documento_bytes(self, documento):
         return _documento_bytes(documento)
 
-    def _guardar_pdf_unificado(self, factura, content, scope):
+    def _clave_documento_expediente(self, documento):
+        return f'{documento.id}:{documento.hash_archivo or documento.tamano_bytes or ""}'
+
+    def _huellas_expediente(self, factura, documentos, scope):
+        """
+        (huella, huella_portada, claves) del expediente. La huella depende del
+        scope, el ciclo y los documentos en orden; la de la portada, de los
+        datos de la factura que la portada muestra. Los días transcurridos no
+        cuentan: cambian a diario y la portada los muestra a su fecha de
+        generación.
+        """
+        claves = [self._clave_documento_expediente(documento) for documento in documentos]
+        huella = hashlib.sha256(
+            json.dumps([scope or 'all', _factura_ciclo_documental_actual(factura), claves]).encode()
+        ).hexdigest()
+        proveedor = factura.proveedor
+        datos_portada = [
+            factura.numero_factura, factura.estado, factura.etapa_actual, factura.fecha_factura,
+            factura.fecha_recepcion, factura.valor_subtotal, factura.valor_iva, factura.valor_total,
+            factura.observaciones,
+            getattr(factura.departamento, 'nombre', None) if factura.departamento else None,
+            [getattr(proveedor, campo, None) for campo in ('razon_social', 'nit', 'email')] if proveedor else None,
+            [(documento.tipo_documento, documento.nombre_archivo) for documento in documentos],
+        ]
+        huella_portada = hashlib.sha256(json.dumps(datos_portada, default=str).encode()).hexdigest()
+        return huella, huella_portada, claves
+
+    def _expediente_guardado(self, factura, scope):
+        return models.DocumentoUnificado.objects.filter(
+            factura=factura,
+            scope=scope or 'all',
+            ciclo_documental=_factura_ciclo_documental_actual(factura),
+        ).first()
+
+    def _expediente_vigente(self, factura, documentos, scope):
+        """El DocumentoUnificado guardado si corresponde exactamente a `documentos`, o None."""
+        unificado = self._expediente_guardado(factura, scope)
+        if not unificado or not unificado.huella:
+            return None
+        huella, huella_portada, _claves = self._huellas_expediente(factura, documentos, scope)
+        if (unificado.huella, unificado.huella_portada) != (huella, huella_portada):
+            return None
+        return unificado
+
+    def _guardar_pdf_unificado(self, factura, content, scope, huellas=None, paginas_portada=0):
         safe_scope = models._safe_path_segment(scope or 'all')
         safe_factura = models._safe_path_segment(factura.numero_factura or f'factura-{factura.id}')
         nombre_archivo = f'Documentos_{safe_factura}_{safe_scope}.pdf'
         ciclo_documental = _factura_ciclo_documental_actual(factura)
+        huella, huella_portada, claves = huellas or ('', '', [])
 
         from financiero.services.shared_storage_service import shared_storage
         result = shared_storage.copy_unified_pdf(content, factura, scope)
+        hash_archivo = hashlib.sha256(content).hexdigest()
+        _guardar_blob(content, hash_archivo)
 
         models.DocumentoUnificado.objects.update_or_create(
             factura=factura,
@@ -1561,12 +1680,16 @@ class FacturaViewSet(viewsets.ModelViewSet):
                 'tipo_mime': 'application/pdf',
                 'tamano_bytes': len(content),
                 'contenido_archivo': None,
-                'hash_archivo': hashlib.sha256(content).hexdigest(),
+                'hash_archivo': hash_archivo,
                 'nas_relative_path': result.nas_relative_path or '',
                 'nas_storage_status': (
                     models.DocumentoAdjunto.NAS_STATUS_STORED if result.success
                     else (result.error_code or models.DocumentoAdjunto.NAS_STATUS_FAILED)
                 ),
+                'huella': huella,
+                'huella_portada': huella_portada,
+                'documentos_incluidos': claves,
+                'paginas_portada': paginas_portada,
             },
         )
 
@@ -1576,7 +1699,53 @@ class FacturaViewSet(viewsets.ModelViewSet):
                 factura.id, result.error_code, result.message,
             )
 
+    def _agregar_documento_expediente(self, writer, documento):
+        """Agrega las páginas de un documento al expediente (o una hoja de resumen si no se puede)."""
+        raw_bytes = self._documento_bytes(documento)
+        lower_name = (documento.nombre_archivo or '').lower()
+        lower_mime = (documento.tipo_mime or '').lower()
+        merged = False
+
+        if raw_bytes is not None:
+            if lower_name.endswith('.pdf') or lower_mime == 'application/pdf':
+                merged = self._append_pdf_bytes(writer, raw_bytes)
+            elif lower_name.endswith(('.png', '.jpg', '.jpeg')) or lower_mime in {'image/png', 'image/jpeg'}:
+                merged = self._append_image_bytes_as_pdf(writer, raw_bytes)
+            elif lower_name.endswith('.txt') or lower_mime in {'text/plain', 'application/octet-stream'}:
+                try:
+                    texto = raw_bytes.decode('utf-8', errors='replace')
+                    lineas = [f'Archivo: {documento.nombre_archivo}', '']
+                    lineas += texto.splitlines()
+                    resumen = self._build_pdf_page('Archivo Plano SEVEN', lineas)
+                    merged = self._append_pdf_bytes(writer, resumen)
+                except Exception:
+                    pass
+
+        if not merged:
+            resumen = self._build_pdf_page(
+                f'Soporte no integrado: {documento.tipo_documento}',
+                [
+                    f'Archivo: {documento.nombre_archivo}',
+                    f'Tipo MIME: {documento.tipo_mime or "No registrado"}',
+                    f'Fecha de carga: {documento.fecha_carga}',
+                    '',
+                    'Este soporte no pudo integrarse como pagina PDF, pero hace parte del expediente de la factura.',
+                    f'URL registrada: {documento.url_storage or "Sin URL disponible"}',
+                ],
+            )
+            self._append_pdf_bytes(writer, resumen)
+
     def _pdf_consolidado_documentos(self, factura, documentos, scope, incluir_portada=True, guardar=True):
+        """
+        PDF del expediente. Con `guardar` (el expediente completo, con portada)
+        se reutiliza el DocumentoUnificado guardado:
+
+        - si su huella coincide con la de `documentos`, se devuelve tal cual;
+        - si sus documentos son el comienzo de `documentos` (se agregaron
+          soportes), se toma ese PDF sin su portada, se le pone la portada
+          nueva y solo se procesan los documentos nuevos;
+        - si no, se arma completo.
+        """
         try:
             from pypdf import PdfWriter
         except Exception:
@@ -1591,59 +1760,41 @@ class FacturaViewSet(viewsets.ModelViewSet):
                 ],
             )
 
+        huellas = None
+        anterior = None
+        if guardar and incluir_portada:
+            huellas = self._huellas_expediente(factura, documentos, scope)
+            huella, huella_portada, claves = huellas
+            unificado = self._expediente_guardado(factura, scope)
+            incluidos = (unificado.documentos_incluidos or []) if unificado and unificado.huella else None
+            if incluidos is not None and claves[:len(incluidos)] == incluidos:
+                guardado = _documento_bytes(unificado)
+                if guardado is not None:
+                    if (unificado.huella, unificado.huella_portada) == (huella, huella_portada):
+                        return guardado
+                    anterior = (guardado, len(incluidos), unificado.paginas_portada)
+
         writer = PdfWriter()
+        paginas_portada = 0
         if incluir_portada:
             portada = self._build_portada_factura(factura, documentos, scope)
             self._append_pdf_bytes(writer, portada)
+            paginas_portada = len(writer.pages)
 
-        if not documentos:
-            buffer = BytesIO()
-            writer.write(buffer)
-            content = buffer.getvalue()
-            if guardar:
-                self._guardar_pdf_unificado(factura, content, scope)
-            return content
-
-        for documento in documentos:
-            raw_bytes = self._documento_bytes(documento)
-            lower_name = (documento.nombre_archivo or '').lower()
-            lower_mime = (documento.tipo_mime or '').lower()
-            merged = False
-
-            if raw_bytes is not None:
-                if lower_name.endswith('.pdf') or lower_mime == 'application/pdf':
-                    merged = self._append_pdf_bytes(writer, raw_bytes)
-                elif lower_name.endswith(('.png', '.jpg', '.jpeg')) or lower_mime in {'image/png', 'image/jpeg'}:
-                    merged = self._append_image_bytes_as_pdf(writer, raw_bytes)
-                elif lower_name.endswith('.txt') or lower_mime in {'text/plain', 'application/octet-stream'}:
-                    try:
-                        texto = raw_bytes.decode('utf-8', errors='replace')
-                        lineas = [f'Archivo: {documento.nombre_archivo}', '']
-                        lineas += texto.splitlines()
-                        resumen = self._build_pdf_page('Archivo Plano SEVEN', lineas)
-                        merged = self._append_pdf_bytes(writer, resumen)
-                    except Exception:
-                        pass
-
-            if not merged:
-                resumen = self._build_pdf_page(
-                    f'Soporte no integrado: {documento.tipo_documento}',
-                    [
-                        f'Archivo: {documento.nombre_archivo}',
-                        f'Tipo MIME: {documento.tipo_mime or "No registrado"}',
-                        f'Fecha de carga: {documento.fecha_carga}',
-                        '',
-                        'Este soporte no pudo integrarse como pagina PDF, pero hace parte del expediente de la factura.',
-                        f'URL registrada: {documento.url_storage or "Sin URL disponible"}',
-                    ],
-                )
-                self._append_pdf_bytes(writer, resumen)
+        pendientes = documentos
+        if anterior is not None:
+            guardado, cantidad_incluidos, paginas_portada_anterior = anterior
+            if self._append_pdf_bytes(writer, guardado, desde_pagina=paginas_portada_anterior):
+                pendientes = documentos[cantidad_incluidos:]
+
+        for documento in pendientes:
+            self._agregar_documento_expediente(writer, documento)
 
         buffer = BytesIO()
         writer.write(buffer)
         content = buffer.getvalue()
         if guardar:
-            self._guardar_pdf_unificado(factura, content, scope)
+            self._guardar_pdf_unificado(factura, content, scope, huellas=huellas, paginas_portada=paginas_portada)
         return content
 
     def get_serializer_class(self):
@@ -1812,24 +1963,18 @@ class FacturaViewSet(viewsets.ModelViewSet):
         descargar = (request.query_params.get('descargar') or '').strip().lower() in {'1', 'true', 'si', 'yes'}
         doc_id = request.query_params.get('doc_id')
 
-        # El expediente consolidado se sirve desde la carpeta compartida. Solo se
-        # regenera si aún no existe para este ciclo documental o si fue eliminado.
+        documentos = self._documentos_filtrados_por_scope(factura, scope)
+
+        # El expediente guardado se sirve en streaming mientras su huella
+        # coincida con los documentos actuales; si no, se actualiza abajo.
         if not doc_id:
-            unificado = models.DocumentoUnificado.objects.filter(
-                factura=factura,
-                scope=scope,
-                ciclo_documental=_factura_ciclo_documental_actual(factura),
-            ).first()
-            if unificado and unificado.nas_relative_path:
-                from financiero.services.shared_storage_service import shared_storage
-                result = shared_storage.read_file(unificado.nas_relative_path)
-                if result.success and result.content_bytes is not None:
-                    filename = unificado.nombre_archivo or f'Documentos_{factura.numero_factura}_{scope}.pdf'
-                    response = HttpResponse(result.content_bytes, content_type='application/pdf')
-                    response['Content-Disposition'] = f'{"attachment" if descargar else "inline"}; filename="{filename}"'
+            unificado = self._expediente_vigente(factura, documentos, scope)
+            if unificado:
+                filename = unificado.nombre_archivo or f'Documentos_{factura.numero_factura}_{scope}.pdf'
+                response = _respuesta_documento(request, unificado, filename, descargar)
+                if response is not None:
                     return response
 
-        documentos = self._documentos_filtrados_por_scope(factura, scope)
         if doc_id:
             documentos = [d for d in documentos if str(d.id) == str(doc_id)]
             if not documentos:
@@ -1855,15 +2000,21 @@ class FacturaViewSet(viewsets.ModelViewSet):
         factura = self.get_object()
         scope = self._resolve_scope_documental(request)
         documentos = self._documentos_filtrados_por_scope(factura, scope)
-        consolidado = self._pdf_consolidado_documentos(factura, documentos, scope)
 
-        output = BytesIO()
-        used_names = set()
-        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            zip_file.writestr('unificados/expediente_unificado.pdf', consolidado)
+        # El expediente unificado se toma del PDF guardado si sigue vigente;
+        # si no, se actualiza (y queda guardado) antes de empezar el ZIP.
+        unificado = self._expediente_vigente(factura, documentos, scope)
+        abierto = _abrir_documento(unificado) if unificado else None
+        if abierto is None:
+            consolidado = self._pdf_consolidado_documentos(factura, documentos, scope)
+            abierto = (BytesIO(consolidado), len(consolidado), None)
+
+        def entradas():
+            archivo, tamano, _ruta_blob = abierto
+            yield 'unificados/expediente_unificado.pdf', archivo, tamano
 
+            used_names = set()
             for index, documento in enumerate(documentos, 1):
-                raw_bytes = self._documento_bytes(documento)
                 base_name = models._safe_path_segment(documento.nombre_archivo or f'documento-{index}')
                 folder = models._safe_path_segment(documento.tipo_documento or 'documento')
                 zip_name = f'especificos/{folder}/{index:02d}-{base_name}'
@@ -1872,19 +2023,19 @@ class FacturaViewSet(viewsets.ModelViewSet):
                     zip_name = f'especificos/{folder}/{index:02d}-{documento.id}-{base_name}'
                 used_names.add(zip_name)
 
-                if raw_bytes is not None:
-                    zip_file.writestr(zip_name, raw_bytes)
+                contenido = _abrir_documento(documento)
+                if contenido is not None:
+                    archivo, tamano, _ruta_blob = contenido
+                    yield zip_name, archivo, tamano
                 else:
-                    zip_file.writestr(
+                    yield (
                         f'{zip_name}.txt',
-                        'No fue posible leer este archivo desde el almacenamiento, pero existe el registro documental en Benji.',
+                        BytesIO('No fue posible leer este archivo desde el almacenamiento, pero existe el registro documental en Benji.'.encode()),
+                        None,
                     )
 
-        content = output.getvalue()
-        output.close()
-
         filename = f'Expediente_{models._safe_path_segment(factura.numero_factura or factura.id)}.zip'
-        response = HttpResponse(content, content_type='application/zip')
+        response = StreamingHttpResponse(zip_en_streaming(entradas()), content_type='application/zip')
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
 
@@ -2987,34 +3138,13 @@ class FacturaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def estadisticas(self, request):
         """Obtener estadísticas de facturas"""
-        queryset = models.Factura.objects.all()
         rol_nombre = (request.user.rol.nombre if getattr(request.user, 'rol', None) else '').strip()
-        if rol_nombre == 'Funcionario':
-            queryset = queryset.filter(estado__in=['Recibida', 'Registrada'])
-
-        total = queryset.count()
-        por_estado = {}
-        estados = [choice[0] for choice in models.Factura.ESTADO_CHOICES]
-        
-        for estado in estados:
-            count = queryset.filter(estado=estado).count()
-            if count > 0:
-                por_estado[estado] = count
-
-        vencidas = queryset.filter(indicador_riesgo='vencida').count()
-        atrasadas = queryset.filter(indicador_riesgo='atrasada').count()
-
-        return Response({
-            'total_facturas': total,
-            'por_estado': por_estado,
-            'vencidas': vencidas,
-            'atrasadas': atrasadas
-        })
+        return Response(tablero.estadisticas_facturas(solo_registro=rol_nombre == 'Funcionario'))
 
     @action(detail=False, methods=['post'], url_path='sincronizar_sla')
     def sincronizar_sla(self, request):
         """Sincroniza indicadores SLA para facturas en proceso."""
-        facturas = models.Factura.objects.exclude(estado__in=['Pagada', 'Anulada'])
+        facturas = models.Factura.objects.exclude(estado__in=ESTADOS_SIN_SLA)
         parametros_map = build_parametros_sla_map()
         actualizadas = sincronizar_sla_facturas(facturas, parametros_map=parametros_map)
         return Response({'actualizadas': actualizadas, 'total': facturas.count()})
@@ -3094,101 +3224,99 @@ class FacturaViewSet(viewsets.ModelViewSet):
 # HELPERS DE PDF — accesibles desde cualquier ViewSet
 # ============================================================
 
-def _sincronizar_documento_y_pdf_nas(documento_id):
+def _copiar_documento_nas(documento_id):
     """
-    Sincroniza en segundo plano el documento individual y el PDF unificado con el NAS.
-    Nunca interrumpe el flujo HTTP del usuario.
+    Tarea copiar_documento_nas (ver tareas.py): copia al NAS un documento ya
+    guardado en el almacén de blobs y deja el resultado en nas_storage_status.
+    Lanza una excepción si la copia falló, para que la tarea se reintente.
     """
-    close_old_connections()
-    try:
-        from financiero.services.shared_storage_service import shared_storage
+    from financiero.services.shared_storage_service import shared_storage
 
-        documento = (
-            models.DocumentoAdjunto.objects
-            .select_related('factura')
-            .filter(id=documento_id)
-            .first()
-        )
-        if not documento or not documento.factura_id:
-            return
+    documento = (
+        models.DocumentoAdjunto.objects
+        .select_related('factura')
+        .filter(id=documento_id)
+        .first()
+    )
+    if not documento or not documento.factura_id:
+        return
+    if documento.nas_storage_status == models.DocumentoAdjunto.NAS_STATUS_STORED and documento.nas_relative_path:
+        return
 
-        raw_bytes = _documento_bytes(documento)
-        if raw_bytes is None:
-            logger.warning(
-                '[SHARED_STORAGE] No fue posible obtener bytes del documento para sincronizar NAS. documento_id=%s',
-                documento_id,
-            )
-            return
+    raw_bytes = _documento_bytes(documento)
+    if raw_bytes is None:
+        raise RuntimeError(f'No fue posible leer el documento {documento_id} para copiarlo al NAS.')
 
-        index = (
-            models.DocumentoAdjunto.objects
-            .filter(
-                factura=documento.factura,
-                ciclo_documental=_factura_ciclo_documental_actual(documento.factura),
-            )
-            .filter(fecha_carga__lt=documento.fecha_carga)
-            .count()
-        ) + 1
-
-        result = shared_storage.copy_document(
-            factura=documento.factura,
-            index=index,
-            original_filename=documento.nombre_archivo,
-            content_bytes=raw_bytes,
-        )
-        documento.nas_relative_path = result.nas_relative_path or ''
-        documento.nas_storage_status = (
-            models.DocumentoAdjunto.NAS_STATUS_STORED if result.success
-            else (result.error_code or models.DocumentoAdjunto.NAS_STATUS_FAILED)
-        )
-        documento.save(update_fields=['nas_relative_path', 'nas_storage_status'])
+    index = models.DocumentoAdjunto.objects.filter(
+        factura_id=documento.factura_id,
+        ciclo_documental=documento.ciclo_documental,
+        id__lt=documento.id,
+    ).count() + 1
+    result = shared_storage.copy_document(
+        factura=documento.factura,
+        index=index,
+        original_filename=documento.nombre_archivo,
+        content_bytes=raw_bytes,
+    )
+    documento.nas_relative_path = result.nas_relative_path or ''
+    documento.nas_storage_status = (
+        models.DocumentoAdjunto.NAS_STATUS_STORED if result.success
+        else (result.error_code or models.DocumentoAdjunto.NAS_STATUS_FAILED)
+    )
+    documento.save(update_fields=['nas_relative_path', 'nas_storage_status'])
 
-        if not result.success:
-            logger.warning(
-                '[SHARED_STORAGE] Documento no copiado al NAS. documento_id=%s factura_id=%s error_code=%s message=%s',
-                documento.id,
-                documento.factura_id,
-                result.error_code,
-                result.message,
-            )
+    if not result.success and result.error_code != 'DISABLED':
+        raise RuntimeError(f'Documento {documento_id} no copiado al NAS: {result.error_code} {result.message or ""}'.strip())
 
-        _regenerar_pdf_unificado_nas(documento.factura)
-    except Exception:
-        logger.exception('[SHARED_STORAGE] Error sincronizando documento/PDF con NAS. documento_id=%s', documento_id)
-    finally:
-        close_old_connections()
 
+def _sincronizar_expediente_nas(factura_id):
+    """
+    Tarea regenerar_expediente (ver tareas.py): actualiza el PDF unificado de
+    la factura con sus documentos actuales y lo copia al NAS. Si el PDF ya
+    estaba al día pero su copia al NAS había fallado, solo repite la copia.
+    """
+    from financiero.services.shared_storage_service import shared_storage
 
-def _programar_sincronizacion_nas_documento(documento_id):
-    def _runner():
-        _sincronizar_documento_y_pdf_nas(documento_id)
+    factura = models.Factura.objects.select_related('proveedor', 'departamento').filter(id=factura_id).first()
+    if not factura:
+        return
+    documentos = list(
+        models.DocumentoAdjunto.objects
+        .filter(
+            factura=factura,
+            ciclo_documental=_factura_ciclo_documental_actual(factura),
+        )
+        .select_related('cargado_por__rol')
+        .order_by('fecha_carga', 'id')
+    )
+    vista = FacturaViewSet()
+    unificado = vista._expediente_vigente(factura, documentos, 'all')
+    if unificado is None:
+        vista._pdf_consolidado_documentos(factura, documentos, 'all')
+        unificado = vista._expediente_guardado(factura, 'all')
+    elif unificado.nas_storage_status != models.DocumentoAdjunto.NAS_STATUS_STORED:
+        content = _documento_bytes(unificado)
+        if content is None:
+            raise RuntimeError(f'No fue posible leer el PDF unificado de la factura {factura_id}.')
+        result = shared_storage.copy_unified_pdf(content, factura, 'all')
+        unificado.nas_relative_path = result.nas_relative_path or ''
+        unificado.nas_storage_status = (
+            models.DocumentoAdjunto.NAS_STATUS_STORED if result.success
+            else (result.error_code or models.DocumentoAdjunto.NAS_STATUS_FAILED)
+        )
+        unificado.save(update_fields=['nas_relative_path', 'nas_storage_status'])
 
-    try:
-        transaction.on_commit(lambda: threading.Thread(target=_runner, daemon=True).start())
-    except Exception:
-        logger.exception('[SHARED_STORAGE] No se pudo programar sincronización NAS. documento_id=%s', documento_id)
+    estado = unificado.nas_storage_status if unificado else None
+    if estado not in {models.DocumentoAdjunto.NAS_STATUS_STORED, 'DISABLED'}:
+        raise RuntimeError(f'PDF unificado de la factura {factura_id} no copiado al NAS: {estado}')
 
 
 def _regenerar_pdf_unificado_nas(factura):
     """
-    Regenera el PDF unificado con todos los documentos actuales de la factura
-    y lo sube al NAS, reemplazando el anterior.
-    Se llama automáticamente cada vez que se agrega un documento.
+    Encola la regeneración del PDF unificado de la factura y su copia al NAS.
+    Varias cargas seguidas de la misma factura se resuelven en una sola tarea.
     """
-    try:
-        documentos = list(
-            models.DocumentoAdjunto.objects
-            .filter(
-                factura=factura,
-                ciclo_documental=_factura_ciclo_documental_actual(factura),
-            )
-            .select_related('cargado_por__rol')
-            .order_by('fecha_carga', 'id')
-        )
-        _vs = FacturaViewSet()
-        _vs._pdf_consolidado_documentos(factura, documentos, 'all')
-    except Exception:
-        logger.exception('[SHARED_STORAGE] Error regenerando PDF unificado. factura_id=%s', factura.id)
+    tareas.encolar('regenerar_expediente', f'expediente:{factura.id}', factura_id=factura.id)
 
 
 # ============================================================
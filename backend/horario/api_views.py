@@ -3,11 +3,13 @@ import json
 
 from django.db.models import Q
 from django.core.exceptions import ValidationError
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from notificaciones.signals import crear_notificacion
 from mysite.auth_helpers import MISSING_SECCIONAL_MESSAGE, get_role_name, get_user_seccional_id, is_admin_global, is_admin_sistema
+from mysite.cache_utils import SCHEDULE_ALL_SCOPE, schedule_etag, schedule_not_modified, schedule_scope, with_schedule_etag
 from usuarios.models import Usuario
 from espacios.models import EspacioFisico
 
@@ -54,6 +56,79 @@ def _missing_seccional_response():
     return JsonResponse({'code': 'usuario_sin_seccional', 'error': MISSING_SECCIONAL_MESSAGE}, status=403)
 
 
+# Filas leídas por bloque al iterar listados grandes de horarios.
+HORARIOS_CHUNK_SIZE = 2000
+MAX_HORARIOS_POR_PAGINA = 5000
+
+
+def _parametros_listado(request):
+    """
+    Lee `after_id`/`limit` (paginación por cursor sobre id) y el modo de
+    respuesta: `?stream=1` transmite el mismo JSON por partes y
+    `?format=ndjson` (o `Accept: application/x-ndjson`) un horario por línea.
+    """
+    try:
+        after_id = int(request.GET.get('after_id') or 0)
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+    except ValueError:
+        return None, JsonResponse({'error': 'after_id y limit deben ser enteros'}, status=400)
+    if after_id < 0 or (limit is not None and not 0 < limit <= MAX_HORARIOS_POR_PAGINA):
+        return None, JsonResponse(
+            {'error': f'after_id debe ser positivo y limit estar entre 1 y {MAX_HORARIOS_POR_PAGINA}'},
+            status=400,
+        )
+
+    formato = (request.GET.get('format') or '').lower()
+    ndjson = formato == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    stream = ndjson or request.GET.get('stream', '').lower() in ('1', 'true', 'yes')
+    return {'after_id': after_id, 'limit': limit, 'stream': stream, 'ndjson': ndjson}, None
+
+
+def _respuesta_horarios(qs, campos, serializar, parametros):
+    """
+    Responde un listado de horarios leyendo solo `campos` con `.values()`, en
+    orden de id a partir de `after_id`. En modo stream las filas se leen con
+    `.iterator()` y se codifican una a una, sin armar la lista en memoria.
+    Con `limit` la respuesta JSON incluye `next_after_id` (None al terminar);
+    en NDJSON el cursor siguiente es el id de la última línea.
+    """
+    qs = qs.filter(id__gt=parametros['after_id']).order_by('id').values(*campos)
+    limit = parametros['limit']
+    if limit:
+        qs = qs[:limit]
+
+    if not parametros['stream']:
+        lst = [serializar(fila) for fila in qs]
+        payload = {'horarios': lst}
+        if limit:
+            payload['next_after_id'] = lst[-1]['id'] if len(lst) == limit else None
+        return JsonResponse(payload, status=200)
+
+    def codificar(fila):
+        return json.dumps(serializar(fila), cls=DjangoJSONEncoder)
+
+    def filas_ndjson():
+        for fila in qs.iterator(chunk_size=HORARIOS_CHUNK_SIZE):
+            yield codificar(fila) + '\n'
+
+    def documento_json():
+        yield '{"horarios": ['
+        total = 0
+        ultimo_id = None
+        for fila in qs.iterator(chunk_size=HORARIOS_CHUNK_SIZE):
+            yield (',' if total else '') + codificar(fila)
+            total += 1
+            ultimo_id = fila['id']
+        yield ']'
+        if limit:
+            yield ', "next_after_id": ' + json.dumps(ultimo_id if total == limit else None)
+        yield '}'
+
+    if parametros['ndjson']:
+        return StreamingHttpResponse(filas_ndjson(), content_type='application/x-ndjson')
+    return StreamingHttpResponse(documento_json(), content_type='application/json')
+
+
 @csrf_exempt
 def mi_horario_docente(request):
     if request.method != 'GET':
@@ -71,6 +146,12 @@ def mi_horario_docente(request):
         if not _is_admin_user(user) and user.id != int(usuario_id):
             return JsonResponse({'error': 'No autorizado'}, status=403)
 
+        # Los horarios de un docente pueden estar en cualquier seccional.
+        etag = schedule_etag(SCHEDULE_ALL_SCOPE, 'mi_horario_docente', usuario_id)
+        no_modificado = schedule_not_modified(request, etag)
+        if no_modificado:
+            return no_modificado
+
         try:
             docente = Usuario.objects.get(id=usuario_id)
         except Usuario.DoesNotExist:
@@ -102,7 +183,7 @@ def mi_horario_docente(request):
                 }
             )
 
-        return JsonResponse({'horarios': lst}, status=200)
+        return with_schedule_etag(JsonResponse({'horarios': lst}, status=200), etag)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -195,6 +276,42 @@ def inscribir_estudiante(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+_CAMPOS_HORARIO_EXTENDIDO = (
+    'id', 'grupo_id', 'grupo__nombre', 'grupo__programa_id', 'grupo__programa__nombre',
+    'grupo__periodo_id', 'grupo__periodo__nombre', 'grupo__semestre', 'asignatura_id',
+    'asignatura__nombre', 'docente_id', 'docente__nombre', 'espacio_id', 'espacio__nombre',
+    'dia_semana', 'hora_inicio', 'hora_fin', 'fecha_inicio', 'fecha_fin',
+    'cantidad_estudiantes', 'estado',
+)
+
+
+def _serializar_horario_extendido(fila):
+    tiene_grupo = fila['grupo_id'] is not None
+    return {
+        'id': fila['id'],
+        'grupo_id': fila['grupo_id'],
+        'grupo_nombre': fila['grupo__nombre'] if tiene_grupo else 'Sin grupo',
+        'programa_id': fila['grupo__programa_id'],
+        'programa_nombre': fila['grupo__programa__nombre'] if fila['grupo__programa_id'] else 'Sin programa',
+        'periodo_id': fila['grupo__periodo_id'],
+        'periodo_nombre': fila['grupo__periodo__nombre'],
+        'semestre': fila['grupo__semestre'],
+        'asignatura_id': fila['asignatura_id'],
+        'asignatura_nombre': fila['asignatura__nombre'] if fila['asignatura_id'] else 'Sin asignatura',
+        'docente_id': fila['docente_id'],
+        'docente_nombre': fila['docente__nombre'] if fila['docente_id'] else 'Sin asignar',
+        'espacio_id': fila['espacio_id'],
+        'espacio_nombre': fila['espacio__nombre'] if fila['espacio_id'] else 'Sin espacio',
+        'dia_semana': fila['dia_semana'],
+        'hora_inicio': str(fila['hora_inicio']),
+        'hora_fin': str(fila['hora_fin']),
+        'fecha_inicio': str(fila['fecha_inicio']) if fila['fecha_inicio'] else None,
+        'fecha_fin': str(fila['fecha_fin']) if fila['fecha_fin'] else None,
+        'cantidad_estudiantes': fila['cantidad_estudiantes'],
+        'estado': fila['estado'],
+    }
+
+
 @csrf_exempt
 def list_horarios_extendidos(request):
     if request.method != 'GET':
@@ -205,7 +322,24 @@ def list_horarios_extendidos(request):
     include_pending = request.GET.get('include_pending', '').lower() in ('1', 'true', 'yes')
     estado_horario = (request.GET.get('estado_horario') or request.GET.get('estadoHorario') or '').strip().lower()
 
-    qs = Horario.objects.select_related('grupo', 'asignatura', 'docente', 'espacio', 'grupo__programa', 'grupo__periodo')
+    parametros, error = _parametros_listado(request)
+    if error:
+        return error
+
+    seccional_scope_id, is_superuser = _get_authenticated_seccional_scope(request)
+    if not es_consulta_publica and not is_superuser and not seccional_scope_id:
+        return _missing_seccional_response()
+
+    alcance = schedule_scope(None if es_consulta_publica or is_superuser else seccional_scope_id)
+    etag = schedule_etag(
+        alcance, 'list_horarios_extendidos', 'publica' if es_consulta_publica else 'usuario',
+        request.META.get('HTTP_ACCEPT', ''), request.GET.urlencode(),
+    )
+    no_modificado = schedule_not_modified(request, etag)
+    if no_modificado:
+        return no_modificado
+
+    qs = Horario.objects.all()
     # Ningún usuario público puede descubrir horarios pendientes, aunque el
     # frontend incluya el parámetro heredado include_pending=1.
     if es_consulta_publica:
@@ -217,46 +351,52 @@ def list_horarios_extendidos(request):
     else:
         qs = qs.filter(estado='aprobado')
 
-    seccional_scope_id, is_superuser = _get_authenticated_seccional_scope(request)
     if not es_consulta_publica and not is_superuser:
-        if seccional_scope_id:
-            qs = qs.filter(espacio__sede__seccional_id=seccional_scope_id)
-        else:
-            return _missing_seccional_response()
-
-    lst = []
-    for i in qs:
-        grupo = i.grupo
-        programa = grupo.programa if grupo else None
-        asignatura = i.asignatura
-        espacio = i.espacio
-        lst.append(
-            {
-                'id': i.id,
-                'grupo_id': grupo.id if grupo else None,
-                'grupo_nombre': grupo.nombre if grupo else 'Sin grupo',
-                'programa_id': programa.id if programa else None,
-                'programa_nombre': programa.nombre if programa else 'Sin programa',
-                'periodo_id': grupo.periodo_id if grupo else None,
-                'periodo_nombre': grupo.periodo.nombre if grupo and grupo.periodo else None,
-                'semestre': grupo.semestre if grupo else None,
-                'asignatura_id': asignatura.id if asignatura else None,
-                'asignatura_nombre': asignatura.nombre if asignatura else 'Sin asignatura',
-                'docente_id': (i.docente.id if i.docente else None),
-                'docente_nombre': i.docente.nombre if i.docente else 'Sin asignar',
-                'espacio_id': espacio.id if espacio else None,
-                'espacio_nombre': espacio.nombre if espacio else 'Sin espacio',
-                'dia_semana': i.dia_semana,
-                'hora_inicio': str(i.hora_inicio),
-                'hora_fin': str(i.hora_fin),
-                'fecha_inicio': str(i.fecha_inicio) if i.fecha_inicio else None,
-                'fecha_fin': str(i.fecha_fin) if i.fecha_fin else None,
-                'cantidad_estudiantes': i.cantidad_estudiantes,
-                'estado': i.estado,
-            }
-        )
-
-    return JsonResponse({'horarios': lst}, status=200)
+        qs = qs.filter(espacio__sede__seccional_id=seccional_scope_id)
+
+    respuesta = _respuesta_horarios(qs, _CAMPOS_HORARIO_EXTENDIDO, _serializar_horario_extendido, parametros)
+    return with_schedule_etag(respuesta, etag)
+
+
+_CAMPOS_HORARIO_ASIGNACION = (
+    'id', 'grupo_id', 'grupo__nombre', 'grupo__programa_id', 'grupo__programa__nombre',
+    'grupo__semestre', 'grupo__periodo_id', 'asignatura_id', 'asignatura__nombre', 'docente_id',
+    'docente__nombre', 'espacio_id', 'espacio__nombre', 'dia_semana', 'hora_inicio', 'hora_fin',
+    'cantidad_estudiantes', 'estado',
+    # Sede del espacio o, si no tiene, la de la facultad del programa del grupo
+    'espacio__sede_id', 'espacio__sede__nombre', 'espacio__sede__seccional_id',
+    'espacio__sede__seccional__ciudad', 'grupo__programa__facultad__sede_id',
+    'grupo__programa__facultad__sede__nombre', 'grupo__programa__facultad__sede__seccional_id',
+    'grupo__programa__facultad__sede__seccional__ciudad',
+)
+
+
+def _serializar_horario_asignacion(fila):
+    prefijo_sede = 'espacio__sede' if fila['espacio__sede_id'] else 'grupo__programa__facultad__sede'
+    return {
+        'id': fila['id'],
+        'grupo_id': fila['grupo_id'],
+        'grupo_nombre': fila['grupo__nombre'] if fila['grupo_id'] is not None else 'Sin grupo',
+        'programa_id': fila['grupo__programa_id'],
+        'programa_nombre': fila['grupo__programa__nombre'] if fila['grupo__programa_id'] else 'Sin programa',
+        'semestre': fila['grupo__semestre'],
+        'asignatura_id': fila['asignatura_id'],
+        'asignatura_nombre': fila['asignatura__nombre'] if fila['asignatura_id'] else 'Sin asignatura',
+        'docente_id': fila['docente_id'],
+        'docente_nombre': fila['docente__nombre'] if fila['docente_id'] else 'Sin asignar',
+        'espacio_id': fila['espacio_id'],
+        'espacio_nombre': fila['espacio__nombre'] if fila['espacio_id'] else 'Sin espacio',
+        'dia_semana': fila['dia_semana'],
+        'hora_inicio': str(fila['hora_inicio']),
+        'hora_fin': str(fila['hora_fin']),
+        'cantidad_estudiantes': fila['cantidad_estudiantes'],
+        'estado': fila['estado'],
+        'sede_id': fila[f'{prefijo_sede}_id'],
+        'sede_nombre': fila[f'{prefijo_sede}__nombre'],
+        'seccional_id': fila[f'{prefijo_sede}__seccional_id'],
+        'seccional_nombre': fila[f'{prefijo_sede}__seccional__ciudad'],
+        'periodo_id': fila['grupo__periodo_id'],
+    }
 
 
 @csrf_exempt
@@ -274,16 +414,11 @@ def list_horarios_asignacion_espacios(request):
     estado = request.GET.get('estado')
     solo_sin_espacio = request.GET.get('solo_sin_espacio', '1').lower() in ('1', 'true', 'yes')
 
-    qs = Horario.objects.select_related(
-        'grupo',
-        'grupo__programa',
-        'grupo__programa__facultad',
-        'grupo__programa__facultad__sede',
-        'asignatura',
-        'docente',
-        'espacio',
-        'espacio__sede',
-    )
+    parametros, error = _parametros_listado(request)
+    if error:
+        return error
+
+    qs = Horario.objects.all()
 
     if estado:
         estados = [item.strip() for item in estado.split(',') if item.strip()]
@@ -324,52 +459,7 @@ def list_horarios_asignacion_espacios(request):
     elif not is_superuser:
         return _missing_seccional_response()
 
-    def resolve_sede(horario):
-        if horario.espacio and horario.espacio.sede:
-            return horario.espacio.sede
-
-        grupo = horario.grupo
-        programa = grupo.programa if grupo else None
-        facultad = programa.facultad if programa else None
-        return facultad.sede if facultad else None
-
-    lst = []
-    for i in qs:
-        grupo = i.grupo
-        programa = grupo.programa if grupo else None
-        asignatura = i.asignatura
-        espacio = i.espacio
-        sede = resolve_sede(i)
-        seccional = sede.seccional if sede else None
-
-        lst.append(
-            {
-                'id': i.id,
-                'grupo_id': grupo.id if grupo else None,
-                'grupo_nombre': grupo.nombre if grupo else 'Sin grupo',
-                'programa_id': programa.id if programa else None,
-                'programa_nombre': programa.nombre if programa else 'Sin programa',
-                'semestre': grupo.semestre if grupo else None,
-                'asignatura_id': asignatura.id if asignatura else None,
-                'asignatura_nombre': asignatura.nombre if asignatura else 'Sin asignatura',
-                'docente_id': (i.docente.id if i.docente else None),
-                'docente_nombre': i.docente.nombre if i.docente else 'Sin asignar',
-                'espacio_id': espacio.id if espacio else None,
-                'espacio_nombre': espacio.nombre if espacio else 'Sin espacio',
-                'dia_semana': i.dia_semana,
-                'hora_inicio': str(i.hora_inicio),
-                'hora_fin': str(i.hora_fin),
-                'cantidad_estudiantes': i.cantidad_estudiantes,
-                'estado': i.estado,
-                'sede_id': sede.id if sede else None,
-                'sede_nombre': sede.nombre if sede else None,
-                'seccional_id': seccional.id if seccional else None,
-                'seccional_nombre': seccional.ciudad if seccional else None,
-                'periodo_id': grupo.periodo_id if grupo else None,
-            }
-        )
-
-    return JsonResponse({'horarios': lst}, status=200)
+    return _respuesta_horarios(qs, _CAMPOS_HORARIO_ASIGNACION, _serializar_horario_asignacion, parametros)
 
 
 @csrf_exempt
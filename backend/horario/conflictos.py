@@ -0,0 +1,402 @@
+"""
+Servicio de detección de conflictos de horarios.
+
+`validate_many(horarios)` valida un lote de Horario (nuevos o modificados) con
+un número fijo de consultas, sin importar el tamaño del lote:
+
+1. Grupos de los horarios (para conocer su periodo).
+2. Horarios candidatos de los mismos espacios, días y periodos, junto con la
+   versión guardada de los horarios que se están modificando.
+3. Espacios involucrados (nombre y capacidad).
+4 y 5. Préstamos activos (PrestamoEspacio y PrestamoEspacioPublico), con las
+   fechas de las series guardadas como regla expandidas en el rango.
+
+Los solapamientos se detectan ordenando cada franja (periodo, espacio, día)
+por hora de inicio y barriéndola una sola vez, y se devuelven todos los
+conflictos encontrados en vez de detenerse en el primero.
+
+La señal pre_save de Horario usa este servicio para un solo horario. Las
+cargas masivas (seeders, migración desde Oracle) pueden envolver sus
+guardados en `validacion_diferida()` para validar todo el lote una sola vez
+al final en lugar de desconectar la señal.
+"""
+
+import threading
+import unicodedata
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.db.models import Q
+
+
+DIAS_SEMANA = ('lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo')
+ESTADOS_PRESTAMO_ACTIVOS = ('Pendiente', 'Aprobado')
+
+# Orden en que se reportan los conflictos de un mismo horario (igual que la
+# validación original: primero préstamos, luego otras clases y capacidad).
+_PRIORIDAD_TIPO = {'prestamo': 0, 'solapamiento': 1, 'capacidad': 1}
+
+_CAMPOS_RELEVANTES = (
+    'espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'fecha_inicio',
+    'fecha_fin', 'asignatura_id', 'docente_id', 'cantidad_estudiantes',
+)
+
+
+def time_to_minutes(time_obj):
+    """Convierte un objeto time a minutos desde medianoche"""
+    return time_obj.hour * 60 + time_obj.minute
+
+
+def hay_solapamiento(inicio1, fin1, inicio2, fin2):
+    """Verifica si dos rangos de tiempo se solapan"""
+    return (
+        time_to_minutes(inicio1) < time_to_minutes(fin2) and
+        time_to_minutes(inicio2) < time_to_minutes(fin1)
+    )
+
+
+def rangos_fecha_se_solapan(inicio1, fin1, inicio2, fin2):
+    """Verifica si dos rangos de fecha se solapan.
+
+    Un horario sin fecha_inicio/fecha_fin (p.ej. creado manualmente antes de
+    que Oracle reportara ese dato) se trata como vigente todo el periodo, para
+    preservar el comportamiento previo a la existencia de estos campos.
+    """
+    if inicio1 is None or fin1 is None or inicio2 is None or fin2 is None:
+        return True
+    return inicio1 <= fin2 and inicio2 <= fin1
+
+
+def normalizar_nombre_dia(nombre_dia):
+    """Normaliza tildes y mayúsculas para comparar nombres de días."""
+    return ''.join(
+        caracter
+        for caracter in unicodedata.normalize('NFD', nombre_dia or '')
+        if unicodedata.category(caracter) != 'Mn'
+    ).lower()
+
+
+@dataclass
+class ConflictoHorario:
+    horario: object
+    tipo: str  # 'prestamo', 'solapamiento' o 'capacidad'
+    mensaje: str
+
+
+@dataclass
+class _Fila:
+    """Vista mínima de un horario (guardado o en validación) para el barrido."""
+    indice: int  # posición en el lote validado; None si es un horario existente
+    id: int
+    grupo_id: int
+    grupo_nombre: str
+    periodo_id: int
+    asignatura_id: int
+    docente_id: int
+    espacio_id: int
+    dia_semana: str
+    hora_inicio: object
+    hora_fin: object
+    fecha_inicio: object
+    fecha_fin: object
+    cantidad_estudiantes: int
+
+    @property
+    def es_nueva(self):
+        return self.indice is not None
+
+    def clave_clase(self):
+        return (self.asignatura_id, self.docente_id, self.hora_inicio, self.hora_fin)
+
+
+def _sin_cambios_relevantes(horario, guardado):
+    return all(getattr(horario, campo) == guardado[campo] for campo in _CAMPOS_RELEVANTES)
+
+
+def _conflictos_prestamo(filas, periodos):
+    """
+    Primer préstamo activo que choca con cada horario del lote (2 consultas,
+    más las excepciones de las series guardadas como regla, cuyas fechas se
+    expanden en el rango con prestamos/ocurrencias.py).
+    """
+    from prestamos.models import PrestamoEspacio, PrestamoEspacioPublico
+    from prestamos.ocurrencias import filas_en_rango
+
+    rangos = {}
+    for fila in filas:
+        periodo = periodos.get(fila.periodo_id)
+        rango_inicio = fila.fecha_inicio or (periodo.fecha_inicio if periodo else None)
+        rango_fin = fila.fecha_fin or (periodo.fecha_fin if periodo else None)
+        if rango_inicio and rango_fin:
+            rangos[fila.indice] = (rango_inicio, rango_fin)
+    if not rangos:
+        return {}
+
+    filas_con_rango = [fila for fila in filas if fila.indice in rangos]
+    filtros = {
+        'espacio_id__in': {fila.espacio_id for fila in filas_con_rango},
+        'hora_inicio__lt': max(fila.hora_fin for fila in filas_con_rango),
+        'hora_fin__gt': min(fila.hora_inicio for fila in filas_con_rango),
+        'estado__in': ESTADOS_PRESTAMO_ACTIVOS,
+    }
+    desde = min(rango[0] for rango in rangos.values())
+    hasta = max(rango[1] for rango in rangos.values())
+
+    prestamos_por_dia = defaultdict(list)
+    for modelo in (PrestamoEspacio, PrestamoEspacioPublico):
+        for prestamo in filas_en_rango(
+            modelo.objects.filter(**filtros), desde, hasta, 'espacio_id', 'hora_inicio', 'hora_fin'
+        ):
+            clave = (prestamo['espacio_id'], DIAS_SEMANA[prestamo['fecha'].weekday()])
+            prestamos_por_dia[clave].append(prestamo)
+
+    conflictos = {}
+    for fila in filas_con_rango:
+        rango_inicio, rango_fin = rangos[fila.indice]
+        candidatos = prestamos_por_dia.get((fila.espacio_id, normalizar_nombre_dia(fila.dia_semana)), [])
+        for prestamo in sorted(candidatos, key=lambda p: (p['fecha'], p['hora_inicio'])):
+            if (rango_inicio <= prestamo['fecha'] <= rango_fin and
+                    prestamo['hora_inicio'] < fila.hora_fin and prestamo['hora_fin'] > fila.hora_inicio):
+                conflictos[fila.indice] = prestamo
+                break
+    return conflictos
+
+
+def _barrer_franja(filas, espacio, horarios, conflictos):
+    """Detecta solapamientos y exceso de capacidad en una franja (espacio, día, periodo)."""
+    filas.sort(key=lambda f: (time_to_minutes(f.hora_inicio), time_to_minutes(f.hora_fin), f.id or 0))
+
+    activos = []
+    for fila in filas:
+        inicio = time_to_minutes(fila.hora_inicio)
+        activos = [activo for activo in activos if time_to_minutes(activo.hora_fin) > inicio]
+        for activo in activos:
+            if not (fila.es_nueva or activo.es_nueva):
+                continue
+            if fila.clave_clase() == activo.clave_clase():
+                # Misma clase compartida por varios grupos: se valida abajo la capacidad.
+                continue
+            if not rangos_fecha_se_solapan(fila.fecha_inicio, fila.fecha_fin,
+                                           activo.fecha_inicio, activo.fecha_fin):
+                # Mismos dia/hora/espacio pero rangos de fecha que no coinciden
+                # (p.ej. dos sesiones del mismo salon en semanas distintas del
+                # periodo): no hay conflicto real.
+                continue
+            nueva, existente = (fila, activo) if fila.es_nueva else (activo, fila)
+            conflictos.append(ConflictoHorario(
+                horario=horarios[nueva.indice],
+                tipo='solapamiento',
+                mensaje=(
+                    f"El espacio {espacio.nombre} ya está ocupado el {nueva.dia_semana} "
+                    f"de {existente.hora_inicio.strftime('%H:%M')} a "
+                    f"{existente.hora_fin.strftime('%H:%M')} "
+                    f"por el grupo {existente.grupo_nombre}"
+                ),
+            ))
+        activos.append(fila)
+
+    clases = defaultdict(list)
+    for fila in filas:
+        clases[fila.clave_clase()].append(fila)
+    for compartida in clases.values():
+        if len(compartida) < 2 or not any(fila.es_nueva for fila in compartida):
+            continue
+        total_estudiantes = sum(fila.cantidad_estudiantes or 0 for fila in compartida)
+        if total_estudiantes <= espacio.capacidad:
+            continue
+        for nueva in (fila for fila in compartida if fila.es_nueva):
+            otras = [fila for fila in compartida if fila is not nueva]
+            total_existentes = sum(fila.cantidad_estudiantes or 0 for fila in otras)
+            grupos_compartiendo = ', '.join(fila.grupo_nombre for fila in otras)
+            conflictos.append(ConflictoHorario(
+                horario=horarios[nueva.indice],
+                tipo='capacidad',
+                mensaje=(
+                    f"El espacio {espacio.nombre} no tiene capacidad suficiente. "
+                    f"Ya hay {total_existentes} estudiantes del grupo(s) {grupos_compartiendo} "
+                    f"en esta clase. Total: {total_estudiantes}/{espacio.capacidad}"
+                ),
+            ))
+
+
+def validate_many(horarios, solo_cambios=True):
+    """
+    Valida un lote de horarios contra la base de datos y entre sí.
+
+    Devuelve la lista de `ConflictoHorario` (vacía si no hay conflictos),
+    ordenada por la posición del horario en el lote. Con `solo_cambios=True`
+    los horarios ya guardados cuyos campos relevantes no cambiaron se omiten.
+    Los horarios sin espacio asignado no pueden chocar y no se validan.
+    """
+    from espacios.models import EspacioFisico
+    from grupos.models import Grupo
+    from .models import Horario
+
+    # Un mismo horario guardado dos veces en el lote cuenta una sola vez.
+    por_clave = {}
+    for horario in horarios:
+        if horario.espacio_id is None:
+            continue
+        por_clave[horario.pk if horario.pk is not None else id(horario)] = horario
+    horarios = list(por_clave.values())
+    if not horarios:
+        return []
+
+    grupos = Grupo.objects.select_related('periodo').in_bulk({h.grupo_id for h in horarios})
+    periodos = {grupo.periodo_id: grupo.periodo for grupo in grupos.values()}
+    ids_en_lote = {h.pk for h in horarios if h.pk is not None}
+
+    candidatos = Horario.objects.filter(
+        Q(
+            espacio_id__in={h.espacio_id for h in horarios},
+            dia_semana__in={h.dia_semana for h in horarios},
+            grupo__periodo_id__in=set(periodos),
+        ) | Q(pk__in=ids_en_lote)
+    ).values(
+        'id', 'grupo_id', 'grupo__nombre', 'grupo__periodo_id', 'asignatura_id', 'docente_id',
+        'espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'fecha_inicio', 'fecha_fin',
+        'cantidad_estudiantes',
+    )
+
+    guardados = {}
+    franjas = defaultdict(list)
+    for fila in candidatos:
+        if fila['id'] in ids_en_lote:
+            guardados[fila['id']] = fila
+            continue
+        franjas[(fila['grupo__periodo_id'], fila['espacio_id'], fila['dia_semana'])].append(_Fila(
+            indice=None,
+            id=fila['id'],
+            grupo_id=fila['grupo_id'],
+            grupo_nombre=fila['grupo__nombre'],
+            periodo_id=fila['grupo__periodo_id'],
+            asignatura_id=fila['asignatura_id'],
+            docente_id=fila['docente_id'],
+            espacio_id=fila['espacio_id'],
+            dia_semana=fila['dia_semana'],
+            hora_inicio=fila['hora_inicio'],
+            hora_fin=fila['hora_fin'],
+            fecha_inicio=fila['fecha_inicio'],
+            fecha_fin=fila['fecha_fin'],
+            cantidad_estudiantes=fila['cantidad_estudiantes'],
+        ))
+
+    nuevas = []
+    for indice, horario in enumerate(horarios):
+        grupo = grupos.get(horario.grupo_id)
+        guardado = guardados.get(horario.pk)
+        if grupo is None:
+            continue
+        if solo_cambios and guardado is not None and _sin_cambios_relevantes(horario, guardado):
+            # La versión guardada sigue ocupando su franja tal como está.
+            continue
+        fila = _Fila(
+            indice=indice,
+            id=horario.pk,
+            grupo_id=horario.grupo_id,
+            grupo_nombre=grupo.nombre,
+            periodo_id=grupo.periodo_id,
+            asignatura_id=horario.asignatura_id,
+            docente_id=horario.docente_id,
+            espacio_id=horario.espacio_id,
+            dia_semana=horario.dia_semana,
+            hora_inicio=horario.hora_inicio,
+            hora_fin=horario.hora_fin,
+            fecha_inicio=horario.fecha_inicio,
+            fecha_fin=horario.fecha_fin,
+            cantidad_estudiantes=horario.cantidad_estudiantes,
+        )
+        nuevas.append(fila)
+        franjas[(fila.periodo_id, fila.espacio_id, fila.dia_semana)].append(fila)
+
+    # Horarios del lote que no se validan siguen ocupando su franja con la versión guardada.
+    validados = {fila.id for fila in nuevas if fila.id is not None}
+    for horario_id, guardado in guardados.items():
+        if horario_id in validados:
+            continue
+        franjas[(guardado['grupo__periodo_id'], guardado['espacio_id'], guardado['dia_semana'])].append(_Fila(
+            indice=None,
+            id=horario_id,
+            grupo_id=guardado['grupo_id'],
+            grupo_nombre=guardado['grupo__nombre'],
+            periodo_id=guardado['grupo__periodo_id'],
+            asignatura_id=guardado['asignatura_id'],
+            docente_id=guardado['docente_id'],
+            espacio_id=guardado['espacio_id'],
+            dia_semana=guardado['dia_semana'],
+            hora_inicio=guardado['hora_inicio'],
+            hora_fin=guardado['hora_fin'],
+            fecha_inicio=guardado['fecha_inicio'],
+            fecha_fin=guardado['fecha_fin'],
+            cantidad_estudiantes=guardado['cantidad_estudiantes'],
+        ))
+
+    if not nuevas:
+        return []
+
+    conflictos = []
+    for indice, prestamo in _conflictos_prestamo(nuevas, periodos).items():
+        conflictos.append(ConflictoHorario(
+            horario=horarios[indice],
+            tipo='prestamo',
+            mensaje=(
+                f"El espacio ya está reservado el {prestamo['fecha']} "
+                f"de {prestamo['hora_inicio'].strftime('%H:%M')} a "
+                f"{prestamo['hora_fin'].strftime('%H:%M')} por un préstamo activo"
+            ),
+        ))
+
+    espacios = EspacioFisico.objects.only('id', 'nombre', 'capacidad').in_bulk(
+        {fila.espacio_id for fila in nuevas}
+    )
+    for (_, espacio_id, _), filas in franjas.items():
+        espacio = espacios.get(espacio_id)
+        if espacio is None or not any(fila.es_nueva for fila in filas):
+            continue
+        _barrer_franja(filas, espacio, horarios, conflictos)
+
+    posiciones = {id(horario): indice for indice, horario in enumerate(horarios)}
+    conflictos.sort(key=lambda c: (posiciones[id(c.horario)], _PRIORIDAD_TIPO[c.tipo]))
+    return conflictos
+
+
+# Validación diferida para cargas masivas ----------------------------------
+
+_estado_hilo = threading.local()
+
+
+class LoteValidacion:
+    """Horarios guardados dentro de `validacion_diferida()` y sus conflictos."""
+
+    def __init__(self):
+        self.horarios = []
+        self.conflictos = []
+
+
+def lote_diferido_activo():
+    return getattr(_estado_hilo, 'lote', None)
+
+
+@contextmanager
+def validacion_diferida():
+    """
+    Mientras está activo, la señal pre_save de Horario no valida cada guardado:
+    acumula los horarios y, al salir, los valida todos juntos con
+    `validate_many`. Los conflictos quedan en `lote.conflictos` para que el
+    llamador decida si reportarlos o revertir; no se lanza excepción.
+    """
+    anterior = lote_diferido_activo()
+    lote = LoteValidacion()
+    _estado_hilo.lote = lote
+    try:
+        yield lote
+    finally:
+        _estado_hilo.lote = anterior
+    lote.conflictos = validate_many(lote.horarios, solo_cambios=False)
+
+
+def omitir_validacion(horario):
+    """Marca un horario ya validado con `validate_many` para que la señal no lo repita."""
+    horario._conflictos_validados = True
+    return horario
@@ -0,0 +1,281 @@
+"""
+Mantenimiento de HorarioFusionado.
+
+Un HorarioFusionado resume una clase compartida por varios grupos, es decir,
+los Horario con la misma clave de fusión:
+
+    (espacio, día, hora_inicio, hora_fin, asignatura, docente, periodo)
+
+Las signals de Horario ya no recalculan la fusión en cada guardado: solo
+anotan la clave afectada (la nueva y, si cambió, la anterior) y piden un
+recálculo con `transaction.on_commit`. Todos los guardados de una misma
+transacción (o de un bloque `fusionados_diferidos()`) se resuelven con un solo
+recálculo por clave: una consulta GROUP BY sobre Horario, una sobre
+HorarioFusionado y solo las escrituras necesarias.
+
+`recalcular_todos()` aplica el mismo cálculo a toda la tabla (ver el comando
+`rebuild_fusionados`).
+"""
+
+import threading
+import weakref
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Min, Sum
+
+from .models import Horario, HorarioFusionado
+
+
+MAX_GRUPOS_FUSIONADO = 3
+
+_CAMPOS_CLAVE = (
+    'espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'asignatura_id',
+    'docente_id', 'grupo__periodo_id',
+)
+# Misma clave leída de un Horario, con el grupo en lugar del periodo
+_CAMPOS_HORARIO = (
+    'espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'asignatura_id', 'docente_id', 'grupo_id',
+)
+
+_estado_hilo = threading.local()
+
+
+def _estado():
+    """
+    Estado del hilo: las claves pendientes de cada transacción (y savepoint),
+    por (alias, savepoint_ids), y las de los bloques `fusionados_diferidos()`.
+    """
+    if not hasattr(_estado_hilo, 'pendientes'):
+        _estado_hilo.pendientes = {}
+        _estado_hilo.diferidas = set()
+        _estado_hilo.diferidos = 0
+    return _estado_hilo
+
+
+def _descartar(clave_lote, pendientes):
+    estado = _estado()
+    if estado.pendientes.get(clave_lote) is pendientes:
+        del estado.pendientes[clave_lote]
+
+
+def valores_clave(horario):
+    return {campo: getattr(horario, campo) for campo in _CAMPOS_HORARIO}
+
+
+def clave_sin_periodo(valores):
+    """Clave de fusión con el grupo en lugar del periodo (se resuelve al recalcular)."""
+    if any(campo not in valores for campo in _CAMPOS_HORARIO):
+        return None
+    if valores['espacio_id'] is None or valores['grupo_id'] is None:
+        # Sin espacio no hay clase compartida que fusionar
+        return None
+    return tuple(valores[campo] for campo in _CAMPOS_HORARIO)
+
+
+def programar_recalculo(horarios):
+    """
+    Anota las claves de fusión de `horarios` (la actual y la que tenían al
+    leerse de la base de datos, si cambió) y agenda su recálculo al confirmar
+    la transacción.
+    """
+    claves = set()
+    for horario in horarios:
+        for valores in (valores_clave(horario), getattr(horario, '_valores_originales', None)):
+            clave = clave_sin_periodo(valores) if valores else None
+            if clave is not None:
+                claves.add(clave)
+        horario._valores_originales = valores_clave(horario)
+    if not claves:
+        return
+
+    estado = _estado()
+    if estado.diferidos:
+        estado.diferidas.update(claves)
+        return
+    conexion = transaction.get_connection()
+    if not conexion.in_atomic_block:
+        recalcular_claves(list(claves))
+        return
+
+    clave_lote = (conexion.alias, tuple(conexion.savepoint_ids))
+    pendientes = estado.pendientes.get(clave_lote)
+    if pendientes is None:
+        pendientes = estado.pendientes[clave_lote] = set()
+
+        def procesar():
+            _descartar(clave_lote, pendientes)
+            if _estado().diferidos:
+                # Confirmada dentro de un bloque diferido: se recalcula al salir de él
+                _estado().diferidas.update(pendientes)
+            else:
+                recalcular_claves(list(pendientes))
+
+        # Al revertir la transacción o el savepoint Django descarta el
+        # on_commit sin ejecutarlo; al liberarse, sus claves dejan de estar
+        # pendientes y no pasan a la siguiente transacción del hilo.
+        weakref.finalize(procesar, _descartar, clave_lote, pendientes)
+        transaction.on_commit(procesar)
+    pendientes.update(claves)
+
+
+@contextmanager
+def fusionados_diferidos(en_lote=False):
+    """
+    Agrupa los recálculos de todos los guardados del bloque en uno solo al
+    salir, aunque el bloque no esté dentro de una transacción (p.ej. un ETL
+    que guarda fila por fila en autocommit). Con `en_lote=True` los
+    HorarioFusionado se escriben sin signals (sin notificaciones).
+    """
+    estado = _estado()
+    estado.diferidos += 1
+    try:
+        yield
+    finally:
+        estado.diferidos -= 1
+        if not estado.diferidos and estado.diferidas:
+            # Aunque el bloque falle: lo que ya se confirmó debe quedar fusionado
+            claves = list(estado.diferidas)
+            estado.diferidas.clear()
+            transaction.on_commit(lambda: recalcular_claves(claves, en_lote=en_lote))
+
+
+def _grupos_por_clave(filtros):
+    """
+    GROUP BY (clave de fusión, grupo) sobre Horario. Devuelve, por clave, los
+    grupos en orden de creación de su primer horario y la suma de estudiantes
+    de cada grupo.
+    """
+    filas = Horario.objects.filter(espacio__isnull=False, **filtros).values(
+        *_CAMPOS_CLAVE, 'grupo_id'
+    ).annotate(
+        primer_id=Min('id'),
+        cantidad=Sum('cantidad_estudiantes'),
+    ).order_by()
+
+    por_clave = defaultdict(list)
+    for fila in filas:
+        clave = tuple(fila[campo] for campo in _CAMPOS_CLAVE)
+        por_clave[clave].append((fila['primer_id'], fila['grupo_id'], fila['cantidad'] or 0))
+    for grupos in por_clave.values():
+        grupos.sort()
+    return por_clave
+
+
+def _fusionados_por_clave(filtros):
+    por_clave = defaultdict(list)
+    fusionados = HorarioFusionado.objects.select_related('grupo1').filter(**filtros).order_by('id')
+    for fusionado in fusionados:
+        clave = (
+            fusionado.espacio_id, fusionado.dia_semana, fusionado.hora_inicio, fusionado.hora_fin,
+            fusionado.asignatura_id, fusionado.docente_id, fusionado.grupo1.periodo_id,
+        )
+        por_clave[clave].append(fusionado)
+    return por_clave
+
+
+def _aplicar(claves, grupos_por_clave, fusionados_por_clave, en_lote=False, simular=False):
+    """
+    Deja HorarioFusionado como indica `grupos_por_clave` para cada clave.
+    Con `en_lote=True` usa bulk_create/bulk_update (sin signals); si no, save()
+    para que se sigan emitiendo las notificaciones de HorarioFusionado.
+    Con `simular=True` solo cuenta los cambios.
+    """
+    crear, actualizar, eliminar = [], [], []
+    for clave in claves:
+        grupos = grupos_por_clave.get(clave, [])[:MAX_GRUPOS_FUSIONADO]
+        existentes = fusionados_por_clave.get(clave, [])
+        if len(grupos) < 2:
+            eliminar.extend(f.id for f in existentes)
+            continue
+
+        grupos_ids = [grupo_id for _, grupo_id, _ in grupos]
+        cantidad_total = sum(cantidad for _, _, cantidad in grupos)
+        grupos_ids += [None] * (MAX_GRUPOS_FUSIONADO - len(grupos_ids))
+
+        if not existentes:
+            espacio_id, dia_semana, hora_inicio, hora_fin, asignatura_id, docente_id, _ = clave
+            crear.append(HorarioFusionado(
+                grupo1_id=grupos_ids[0],
+                grupo2_id=grupos_ids[1],
+                grupo3_id=grupos_ids[2],
+                asignatura_id=asignatura_id,
+                docente_id=docente_id,
+                espacio_id=espacio_id,
+                dia_semana=dia_semana,
+                hora_inicio=hora_inicio,
+                hora_fin=hora_fin,
+                cantidad_estudiantes=cantidad_total,
+                comentario=f"Clase compartida entre {len(grupos)} grupos",
+            ))
+            continue
+
+        fusionado, duplicados = existentes[0], existentes[1:]
+        eliminar.extend(f.id for f in duplicados)
+        actuales = [fusionado.grupo1_id, fusionado.grupo2_id, fusionado.grupo3_id]
+        cambio = False
+        if set(actuales) != set(grupos_ids):
+            fusionado.grupo1_id, fusionado.grupo2_id, fusionado.grupo3_id = grupos_ids
+            cambio = True
+        if fusionado.cantidad_estudiantes != cantidad_total:
+            fusionado.cantidad_estudiantes = cantidad_total
+            cambio = True
+        if cambio:
+            actualizar.append(fusionado)
+
+    resumen = {'creados': len(crear), 'actualizados': len(actualizar), 'eliminados': len(eliminar)}
+    if simular:
+        return resumen
+    if eliminar:
+        HorarioFusionado.objects.filter(id__in=eliminar).delete()
+    if en_lote:
+        HorarioFusionado.objects.bulk_create(crear)
+        HorarioFusionado.objects.bulk_update(
+            actualizar, ['grupo1', 'grupo2', 'grupo3', 'cantidad_estudiantes']
+        )
+    else:
+        for fusionado in crear + actualizar:
+            fusionado.save()
+    return resumen
+
+
+def recalcular_claves(claves_sin_periodo, en_lote=False):
+    """Recalcula la fusión de las claves dadas (con grupo_id en lugar de periodo)."""
+    from grupos.models import Grupo
+
+    periodos = dict(Grupo.objects.filter(
+        id__in={clave[6] for clave in claves_sin_periodo}
+    ).values_list('id', 'periodo_id'))
+    claves = {
+        clave[:6] + (periodos[clave[6]],)
+        for clave in claves_sin_periodo
+        if clave[6] in periodos
+    }
+    if not claves:
+        return {'creados': 0, 'actualizados': 0, 'eliminados': 0}
+
+    espacios = {clave[0] for clave in claves}
+    dias = {clave[1] for clave in claves}
+    asignaturas = {clave[4] for clave in claves}
+    grupos_por_clave = _grupos_por_clave({
+        'espacio_id__in': espacios,
+        'dia_semana__in': dias,
+        'asignatura_id__in': asignaturas,
+        'grupo__periodo_id__in': {clave[6] for clave in claves},
+    })
+    fusionados_por_clave = _fusionados_por_clave({
+        'espacio_id__in': espacios,
+        'dia_semana__in': dias,
+        'asignatura_id__in': asignaturas,
+    })
+    return _aplicar(claves, grupos_por_clave, fusionados_por_clave, en_lote=en_lote)
+
+
+def recalcular_todos(simular=False):
+    """Reconstruye todos los HorarioFusionado con un solo GROUP BY sobre Horario."""
+    grupos_por_clave = _grupos_por_clave({})
+    fusionados_por_clave = _fusionados_por_clave({})
+    claves = set(grupos_por_clave) | set(fusionados_por_clave)
+    with transaction.atomic():
+        return _aplicar(claves, grupos_por_clave, fusionados_por_clave, en_lote=True, simular=simular)
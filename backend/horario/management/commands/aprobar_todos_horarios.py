@@ -2,7 +2,10 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
 
+from espacios.disponibilidad import invalidar_mapa_disponibilidad
+from espacios.ocupacion import invalidar_matriz_ocupacion
 from horario.models import Horario
+from mysite.cache_utils import bump_global_schedule_version
 
 
 class Command(BaseCommand):
@@ -36,6 +39,12 @@ class Command(BaseCommand):
 
         with transaction.atomic():
             actualizados = queryset.update(estado='aprobado')
+            # update() no dispara las señales de Horario: se invalidan los ETag,
+            # la matriz de ocupación y el mapa de espacios libres (dependen del
+            # estado de los horarios) aquí
+            transaction.on_commit(bump_global_schedule_version)
+            transaction.on_commit(invalidar_matriz_ocupacion)
+            transaction.on_commit(invalidar_mapa_disponibilidad)
 
         self.stdout.write(
             self.style.SUCCESS(
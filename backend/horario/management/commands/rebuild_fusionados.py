@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from horario.fusionados import recalcular_todos
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye todos los HorarioFusionado a partir de los horarios existentes '
+        '(un solo GROUP BY). Por defecto solo muestra una simulacion.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--confirmar',
+            action='store_true',
+            help='Aplica los cambios. Sin esta bandera solo muestra cuantos fusionados cambiarian.',
+        )
+
+    def handle(self, *args, **options):
+        simular = not options['confirmar']
+        resumen = recalcular_todos(simular=simular)
+        detalle = (
+            f"creados: {resumen['creados']}, "
+            f"actualizados: {resumen['actualizados']}, "
+            f"eliminados: {resumen['eliminados']}"
+        )
+
+        if simular:
+            self.stdout.write(self.style.WARNING(f'Simulacion: HorarioFusionado {detalle}.'))
+            self.stdout.write('Ejecuta con --confirmar para aplicar los cambios.')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'HorarioFusionado reconstruidos: {detalle}.'))
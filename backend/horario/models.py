@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import DEFERRED
 from django.db.models import F, CheckConstraint, Q, Index
 from grupos.models import Grupo
 from asignaturas.models import Asignatura
@@ -52,6 +53,16 @@ class Horario(models.Model):
             Index(fields=['docente'], name='idx_horario_docente'),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores leídos de la base de datos: las signals los usan para saber
+        # de qué clase fusionada sale el horario si se cambia de espacio u hora.
+        instance._valores_originales = {
+            campo: valor for campo, valor in zip(field_names, values) if valor is not DEFERRED
+        }
+        return instance
+
     def __str__(self):
         return f"{self.dia_semana} {self.hora_inicio}-{self.hora_fin}"
 
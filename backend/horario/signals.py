@@ -7,342 +7,52 @@ y valida solapamientos/capacidad antes de guardar
 from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
-from datetime import datetime, timedelta
-import unicodedata
-from .models import Horario, HorarioFusionado
-
-
-def time_to_minutes(time_obj):
-    """Convierte un objeto time a minutos desde medianoche"""
-    return time_obj.hour * 60 + time_obj.minute
-
-
-def hay_solapamiento(inicio1, fin1, inicio2, fin2):
-    """Verifica si dos rangos de tiempo se solapan"""
-    inicio1_min = time_to_minutes(inicio1)
-    fin1_min = time_to_minutes(fin1)
-    inicio2_min = time_to_minutes(inicio2)
-    fin2_min = time_to_minutes(fin2)
-
-    return (
-        (inicio1_min >= inicio2_min and inicio1_min < fin2_min) or
-        (fin1_min > inicio2_min and fin1_min <= fin2_min) or
-        (inicio1_min < inicio2_min and fin1_min > fin2_min)
-    )
-
-
-def rangos_fecha_se_solapan(inicio1, fin1, inicio2, fin2):
-    """Verifica si dos rangos de fecha se solapan.
-
-    Un horario sin fecha_inicio/fecha_fin (p.ej. creado manualmente antes de
-    que Oracle reportara ese dato) se trata como vigente todo el periodo, para
-    preservar el comportamiento previo a la existencia de estos campos.
-    """
-    if inicio1 is None or fin1 is None or inicio2 is None or fin2 is None:
-        return True
-    return inicio1 <= fin2 and inicio2 <= fin1
-
-
-def normalizar_nombre_dia(nombre_dia):
-    """Normaliza tildes y mayúsculas para comparar nombres de días."""
-    return ''.join(
-        caracter
-        for caracter in unicodedata.normalize('NFD', nombre_dia or '')
-        if unicodedata.category(caracter) != 'Mn'
-    ).lower()
-
-
-def obtener_conflicto_prestamo(instance):
-    """Busca préstamos activos que coincidan con una clase recurrente."""
-    from prestamos.models import PrestamoEspacio, PrestamoEspacioPublico
-
-    periodo = instance.grupo.periodo
-    dia_horario = normalizar_nombre_dia(instance.dia_semana)
-    dias_semana = ('lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo')
-
-    # Si el horario trae su propio rango de fechas (dato de Oracle), acotamos
-    # la busqueda de prestamos a ese rango en lugar del periodo completo.
-    rango_inicio = instance.fecha_inicio or periodo.fecha_inicio
-    rango_fin = instance.fecha_fin or periodo.fecha_fin
-
-    filtros = {
-        'espacio_id': instance.espacio_id,
-        'fecha__range': (rango_inicio, rango_fin),
-        'hora_inicio__lt': instance.hora_fin,
-        'hora_fin__gt': instance.hora_inicio,
-        'estado__in': ['Pendiente', 'Aprobado'],
-    }
-
-    for modelo in (PrestamoEspacio, PrestamoEspacioPublico):
-        for prestamo in modelo.objects.filter(**filtros).order_by('fecha', 'hora_inicio'):
-            if dias_semana[prestamo.fecha.weekday()] == dia_horario:
-                return prestamo
-
-    return None
+from .conflictos import lote_diferido_activo, validate_many
+from .fusionados import programar_recalculo
+from .models import Horario
 
 
 @receiver(pre_save, sender=Horario)
 def validar_horario(sender, instance, **kwargs):
     """
     Signal que se ejecuta ANTES de guardar un Horario.
-    Valida:
-    1. Que no haya solapamiento de horarios en el mismo espacio (excepto si es la misma clase)
-    2. Que la capacidad del espacio sea suficiente si grupos comparten la misma clase
+    Valida con el servicio de conflictos (ver conflictos.py):
+    1. Que el espacio no esté reservado por un préstamo activo
+    2. Que no haya solapamiento de horarios en el mismo espacio (excepto si es la misma clase)
+    3. Que la capacidad del espacio sea suficiente si grupos comparten la misma clase
+    Dentro de `validacion_diferida()` solo acumula el horario para validarlo en lote.
     """
-    # Solo validar si es un nuevo horario (no tiene pk) o si cambiaron campos relevantes
-    if instance.pk is None:
-        # Es un nuevo horario, validar
-        pass
-    else:
-        # Es una actualización, verificar si cambiaron campos relevantes
-        try:
-            horario_anterior = Horario.objects.get(pk=instance.pk)
-            # Si no cambiaron los campos relevantes, no validar
-            if (horario_anterior.espacio_id == instance.espacio_id and
-                horario_anterior.dia_semana == instance.dia_semana and
-                horario_anterior.hora_inicio == instance.hora_inicio and
-                horario_anterior.hora_fin == instance.hora_fin and
-                horario_anterior.fecha_inicio == instance.fecha_inicio and
-                horario_anterior.fecha_fin == instance.fecha_fin and
-                horario_anterior.asignatura_id == instance.asignatura_id and
-                horario_anterior.docente_id == instance.docente_id and
-                horario_anterior.cantidad_estudiantes == instance.cantidad_estudiantes):
-                return
-        except Horario.DoesNotExist:
-            pass
-    
-    periodo_id = instance.grupo.periodo_id
-
-    conflicto_prestamo = obtener_conflicto_prestamo(instance)
-    if conflicto_prestamo:
-        raise ValidationError(
-            f"El espacio ya está reservado el {conflicto_prestamo.fecha} "
-            f"de {conflicto_prestamo.hora_inicio.strftime('%H:%M')} a "
-            f"{conflicto_prestamo.hora_fin.strftime('%H:%M')} por un préstamo activo"
-        )
+    if getattr(instance, '_conflictos_validados', False):
+        # Ya validado por quien lo guarda (p.ej. create_horario)
+        instance._conflictos_validados = False
+        return
 
-    # Buscar horarios que usan el mismo espacio en el mismo día y periodo
-    horarios_mismo_espacio = Horario.objects.filter(
-        espacio_id=instance.espacio_id,
-        dia_semana=instance.dia_semana,
-        grupo__periodo_id=periodo_id,
-    ).exclude(pk=instance.pk if instance.pk else None)
-    
-    # Verificar solapamientos
-    for horario_existente in horarios_mismo_espacio:
-        if not rangos_fecha_se_solapan(
-            instance.fecha_inicio,
-            instance.fecha_fin,
-            horario_existente.fecha_inicio,
-            horario_existente.fecha_fin
-        ):
-            # Mismos dia/hora/espacio pero rangos de fecha que no coinciden
-            # (p.ej. dos sesiones del mismo salon en semanas distintas del
-            # periodo): no hay conflicto real.
-            continue
+    lote = lote_diferido_activo()
+    if lote is not None:
+        lote.horarios.append(instance)
+        return
 
-        if hay_solapamiento(
-            instance.hora_inicio,
-            instance.hora_fin,
-            horario_existente.hora_inicio,
-            horario_existente.hora_fin
-        ):
-            # Hay solapamiento, verificar si es la misma clase
-            es_misma_clase = (
-                instance.asignatura_id == horario_existente.asignatura_id and
-                instance.docente_id == horario_existente.docente_id and
-                instance.hora_inicio == horario_existente.hora_inicio and
-                instance.hora_fin == horario_existente.hora_fin
-            )
-            
-            if es_misma_clase:
-                # Es la misma clase, verificar capacidad del espacio
-                from espacios.models import EspacioFisico
-                
-                espacio = EspacioFisico.objects.get(pk=instance.espacio_id)
-                
-                # Sumar estudiantes de todos los horarios que comparten exactamente la misma clase
-                horarios_misma_clase = Horario.objects.filter(
-                    espacio_id=instance.espacio_id,
-                    dia_semana=instance.dia_semana,
-                    grupo__periodo_id=periodo_id,
-                    asignatura_id=instance.asignatura_id,
-                    docente_id=instance.docente_id,
-                    hora_inicio=instance.hora_inicio,
-                    hora_fin=instance.hora_fin
-                ).exclude(pk=instance.pk if instance.pk else None)
-                
-                total_estudiantes_existentes = sum(
-                    h.cantidad_estudiantes or 0 for h in horarios_misma_clase
-                )
-                total_estudiantes = total_estudiantes_existentes + (instance.cantidad_estudiantes or 0)
-                
-                if total_estudiantes > espacio.capacidad:
-                    grupos_compartiendo = ', '.join([
-                        h.grupo.nombre for h in horarios_misma_clase
-                    ])
-                    raise ValidationError(
-                        f"El espacio {espacio.nombre} no tiene capacidad suficiente. "
-                        f"Ya hay {total_estudiantes_existentes} estudiantes del grupo(s) {grupos_compartiendo} "
-                        f"en esta clase. Total: {total_estudiantes}/{espacio.capacidad}"
-                    )
-                # Si la capacidad es suficiente, permitir compartir el espacio
-            else:
-                # No es la misma clase, hay conflicto
-                from espacios.models import EspacioFisico
-                espacio = EspacioFisico.objects.get(pk=instance.espacio_id)
-                raise ValidationError(
-                    f"El espacio {espacio.nombre} ya está ocupado el {instance.dia_semana} "
-                    f"de {horario_existente.hora_inicio.strftime('%H:%M')} a "
-                    f"{horario_existente.hora_fin.strftime('%H:%M')} "
-                    f"por el grupo {horario_existente.grupo.nombre}"
-                )
+    conflictos = validate_many([instance])
+    if conflictos:
+        raise ValidationError(conflictos[0].mensaje)
 
 
 @receiver(post_save, sender=Horario)
 def crear_horario_fusionado(sender, instance, created, **kwargs):
     """
     Signal que se ejecuta después de guardar un Horario.
-    Si detecta que hay otros grupos con la misma clase (asignatura, docente, día, hora),
-    crea o actualiza un registro en HorarioFusionado.
+    Agenda el recálculo de HorarioFusionado para la clase del horario (y para la
+    que tenía antes, si cambió). El recálculo corre una vez por clase al
+    confirmar la transacción (ver fusionados.py).
     """
-    if not created:
-        # Solo procesar cuando se crea un nuevo horario
-        return
-    
-    # Buscar horarios que compartan la misma clase
-    horarios_compartidos = Horario.objects.filter(
-        asignatura_id=instance.asignatura_id,
-        docente_id=instance.docente_id,
-        dia_semana=instance.dia_semana,
-        hora_inicio=instance.hora_inicio,
-        hora_fin=instance.hora_fin,
-        espacio_id=instance.espacio_id,
-        grupo__periodo_id=instance.grupo.periodo_id,
-    ).exclude(
-        id=instance.id  # Excluir el horario recién creado
-    ).order_by('id')
-    
-    if horarios_compartidos.count() == 0:
-        # No hay otros grupos compartiendo esta clase
-        return
-    
-    # Hay al menos un grupo compartiendo la clase
-    grupos_ids = [instance.grupo_id] + list(horarios_compartidos.values_list('grupo_id', flat=True))
-    
-    # Limitar a máximo 3 grupos
-    grupo1_id = grupos_ids[0] if len(grupos_ids) > 0 else None
-    grupo2_id = grupos_ids[1] if len(grupos_ids) > 1 else None
-    grupo3_id = grupos_ids[2] if len(grupos_ids) > 2 else None
-    
-    if grupo1_id is None or grupo2_id is None:
-        # Se necesitan al menos 2 grupos para fusionar
-        return
-    
-    # Calcular cantidad total de estudiantes
-    horarios_para_sumar = Horario.objects.filter(
-        grupo_id__in=[g for g in [grupo1_id, grupo2_id, grupo3_id] if g is not None],
-        asignatura_id=instance.asignatura_id,
-        docente_id=instance.docente_id,
-        dia_semana=instance.dia_semana,
-        hora_inicio=instance.hora_inicio,
-        hora_fin=instance.hora_fin,
-        grupo__periodo_id=instance.grupo.periodo_id,
-    )
-    
-    cantidad_total = sum(h.cantidad_estudiantes or 0 for h in horarios_para_sumar)
-    
-    # Verificar si ya existe un HorarioFusionado con estos grupos
-    # Buscamos cualquier combinación que incluya estos grupos
-    from django.db.models import Q
-    
-    fusionado_existente = HorarioFusionado.objects.filter(
-        asignatura_id=instance.asignatura_id,
-        docente_id=instance.docente_id,
-        dia_semana=instance.dia_semana,
-        hora_inicio=instance.hora_inicio,
-        hora_fin=instance.hora_fin
-    ).filter(
-        Q(grupo1_id__in=grupos_ids[:3]) | 
-        Q(grupo2_id__in=grupos_ids[:3]) | 
-        Q(grupo3_id__in=grupos_ids[:3])
-    ).first()
-    
-    if fusionado_existente:
-        # Actualizar el existente si es necesario
-        actualizar = False
-        
-        # Obtener los grupos que ya están en el fusionado
-        grupos_existentes = {
-            fusionado_existente.grupo1_id,
-            fusionado_existente.grupo2_id,
-            fusionado_existente.grupo3_id
-        }
-        grupos_existentes.discard(None)  # Remover None si existe
-        
-        # Combinar con los nuevos grupos
-        todos_grupos = list(grupos_existentes.union(set(grupos_ids[:3])))
-        
-        # Reasignar si hay cambios
-        if len(todos_grupos) > len(grupos_existentes):
-            fusionado_existente.grupo1_id = todos_grupos[0] if len(todos_grupos) > 0 else None
-            fusionado_existente.grupo2_id = todos_grupos[1] if len(todos_grupos) > 1 else None
-            fusionado_existente.grupo3_id = todos_grupos[2] if len(todos_grupos) > 2 else None
-            actualizar = True
-        
-        if fusionado_existente.cantidad_estudiantes != cantidad_total:
-            fusionado_existente.cantidad_estudiantes = cantidad_total
-            actualizar = True
-        
-        if actualizar:
-            fusionado_existente.save()
-            print(f"✅ HorarioFusionado actualizado: ID {fusionado_existente.id}")
-    else:
-        # Crear nuevo HorarioFusionado
-        try:
-            fusionado = HorarioFusionado.objects.create(
-                grupo1_id=grupo1_id,
-                grupo2_id=grupo2_id,
-                grupo3_id=grupo3_id,
-                asignatura_id=instance.asignatura_id,
-                docente_id=instance.docente_id,
-                espacio_id=instance.espacio_id,
-                dia_semana=instance.dia_semana,
-                hora_inicio=instance.hora_inicio,
-                hora_fin=instance.hora_fin,
-                cantidad_estudiantes=cantidad_total,
-                comentario=f"Clase compartida entre {len([g for g in [grupo1_id, grupo2_id, grupo3_id] if g is not None])} grupos"
-            )
-            print(f"✅ HorarioFusionado creado automáticamente: ID {fusionado.id} para grupos {grupo1_id}, {grupo2_id}" + (f", {grupo3_id}" if grupo3_id else ""))
-        except Exception as e:
-            print(f"⚠️ Error al crear HorarioFusionado: {e}")
+    programar_recalculo([instance])
+
 
 @receiver(post_delete, sender=Horario)
 def eliminar_horario_fusionado_relacionado(sender, instance, **kwargs):
     """
     Signal que se ejecuta después de eliminar un Horario.
-    Busca y elimina HorarioFusionado que coincida con el horario eliminado.
-    Un HorarioFusionado coincide si:
-    - Tiene la misma asignatura, espacio, día y hora
-    - El grupo del horario eliminado es uno de los grupos (grupo1, grupo2 o grupo3) del fusionado
+    Agenda el recálculo de su clase: si quedan menos de dos grupos el
+    HorarioFusionado se elimina; si no, se actualizan grupos y estudiantes.
     """
-    from django.db.models import Q
-    
-    # Buscar HorarioFusionado que coincida con el horario eliminado
-    fusionados_relacionados = HorarioFusionado.objects.filter(
-        asignatura_id=instance.asignatura_id,
-        espacio_id=instance.espacio_id,
-        dia_semana=instance.dia_semana,
-        hora_inicio=instance.hora_inicio,
-        hora_fin=instance.hora_fin
-    ).filter(
-        Q(grupo1_id=instance.grupo_id) | 
-        Q(grupo2_id=instance.grupo_id) | 
-        Q(grupo3_id=instance.grupo_id)
-    )
-    
-    if fusionados_relacionados.exists():
-        count = fusionados_relacionados.count()
-        ids = list(fusionados_relacionados.values_list('id', flat=True))
-        fusionados_relacionados.delete()
-        print(f"🗑️ Eliminados {count} HorarioFusionado relacionados (IDs: {ids}) al eliminar Horario {instance.id} del grupo {instance.grupo.nombre}")
+    programar_recalculo([instance])
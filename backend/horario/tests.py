@@ -1,10 +1,17 @@
 import json
 from datetime import date, time
+from io import StringIO
+from unittest.mock import patch
 
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
 from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 
 from asignaturas.models import Asignatura
-from espacios.models import TipoEspacio
+from espacios.models import EspacioFisico, TipoEspacio
 from facultades.models import Facultad
 from grupos.models import Grupo
 from periodos.models import PeriodoAcademico
@@ -12,8 +19,12 @@ from programas.models import Programa
 from sedes.models import Seccional, Sede
 from usuarios.models import Rol, Usuario
 
-from .api_views import list_horarios_asignacion_espacios
-from .models import Horario
+from notificaciones.models import Notificacion
+
+from .api_views import list_horarios_asignacion_espacios, list_horarios_extendidos
+from .conflictos import validacion_diferida, validate_many
+from .models import Horario, HorarioFusionado
+from .views import create_horarios_bulk
 
 
 class SeccionalScopeTests(TestCase):
@@ -88,8 +99,8 @@ class SeccionalScopeTests(TestCase):
         usuario.save()
         return usuario
 
-    def _get_horarios(self, usuario):
-        request = self.factory.get('/api/horarios/sin-espacio/')
+    def _get_horarios(self, usuario, **params):
+        request = self.factory.get('/api/horarios/sin-espacio/', params)
         request.user_obj = usuario
         request.sede = usuario.sede
         response = list_horarios_asignacion_espacios(request)
@@ -105,6 +116,87 @@ class SeccionalScopeTests(TestCase):
         self.assertIn(self.horario_a.id, ids)
         self.assertNotIn(self.horario_b.id, ids)
 
+    def test_paginacion_por_cursor_con_after_id(self):
+        extras = [
+            Horario.objects.create(
+                grupo=self.grupo_a,
+                asignatura=self.asignatura,
+                dia_semana=dia,
+                hora_inicio=time(8, 0),
+                hora_fin=time(10, 0),
+                estado='pendiente',
+            )
+            for dia in ('Miercoles', 'Jueves')
+        ]
+        usuario = self._crear_usuario_planeacion(self.sede_a)
+
+        _, pagina = self._get_horarios(usuario, limit='2')
+        self.assertEqual([h['id'] for h in pagina['horarios']], [self.horario_a.id, extras[0].id])
+        self.assertEqual(pagina['next_after_id'], extras[0].id)
+
+        _, pagina = self._get_horarios(usuario, limit='2', after_id=str(pagina['next_after_id']))
+        self.assertEqual([h['id'] for h in pagina['horarios']], [extras[1].id])
+        self.assertIsNone(pagina['next_after_id'])
+
+    def test_modo_ndjson_transmite_una_linea_por_horario(self):
+        usuario = self._crear_usuario_planeacion(self.sede_a)
+        request = self.factory.get('/api/horarios/sin-espacio/', {'format': 'ndjson'})
+        request.user_obj = usuario
+        request.sede = usuario.sede
+
+        response = list_horarios_asignacion_espacios(request)
+        lineas = b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(linea)['id'] for linea in lineas], [self.horario_a.id])
+        self.assertEqual(json.loads(lineas[0])['seccional_id'], self.seccional_a.id)
+
+    def _get_extendidos(self, usuario, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        request = self.factory.get('/api/horarios/list/extendidos/', **headers)
+        request.user_obj = usuario
+        request.sede = usuario.sede
+        return list_horarios_extendidos(request)
+
+    def test_etag_responde_304_sin_consultas_hasta_que_cambia_su_seccional(self):
+        cache.clear()
+        tipo = TipoEspacio.objects.get(nombre='Aula')
+        espacio_a = EspacioFisico.objects.create(nombre='Aula Norte', sede=self.sede_a, tipo=tipo, capacidad=30)
+        espacio_b = EspacioFisico.objects.create(nombre='Aula Sur', sede=self.sede_b, tipo=tipo, capacidad=30)
+        usuario = self._crear_usuario_planeacion(self.sede_a)
+
+        etag = self._get_extendidos(usuario)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get_extendidos(usuario, etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.horario_b.espacio = espacio_b
+            self.horario_b.save()
+        self.assertEqual(self._get_extendidos(usuario, etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.horario_a.espacio = espacio_a
+            self.horario_a.save()
+        response = self._get_extendidos(usuario, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_cambia_al_renombrar_la_asignatura_o_aprobar_en_bloque(self):
+        cache.clear()
+        usuario = self._crear_usuario_planeacion(self.sede_a)
+        etag = self._get_extendidos(usuario)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.asignatura.nombre = 'Cálculo II'
+            self.asignatura.save()
+        response = self._get_extendidos(usuario, etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('aprobar_todos_horarios', confirmar=True, stdout=StringIO())
+        self.assertEqual(self._get_extendidos(usuario, etag).status_code, 200)
+
     def test_admin_planeacion_sin_sede_no_ve_todas_las_seccionales(self):
         usuario = self._crear_usuario_planeacion()
 
@@ -112,3 +204,200 @@ class SeccionalScopeTests(TestCase):
 
         self.assertEqual(response.status_code, 403)
         self.assertEqual(payload['code'], 'usuario_sin_seccional')
+
+
+class HorariosMismoEspacioTestCase(TestCase):
+    def setUp(self):
+        # Las notificaciones de los datos base se escriben al confirmar (ver notificaciones/outbox.py)
+        with self.captureOnCommitCallbacks(execute=True):
+            seccional = Seccional.objects.create(ciudad='Norte')
+            sede = Sede.objects.create(nombre='Sede Norte', seccional=seccional)
+            facultad = Facultad.objects.create(nombre='Facultad Norte', sede=sede)
+            programa = Programa.objects.create(nombre='Programa Norte', facultad=facultad, activo=True)
+            periodo = PeriodoAcademico.objects.create(
+                nombre='2026-2',
+                fecha_inicio=date(2026, 7, 20),
+                fecha_fin=date(2026, 11, 30),
+            )
+            self.grupos = [
+                Grupo.objects.create(nombre=nombre, programa=programa, periodo=periodo, semestre=1)
+                for nombre in ('A', 'B', 'C')
+            ]
+            self.civil, self.penal = [
+                Asignatura.objects.create(nombre=nombre, codigo=codigo, creditos=3, horas=2, sede=sede)
+                for nombre, codigo in (('Derecho Civil', 'DER-001'), ('Derecho Penal', 'DER-002'))
+            ]
+            tipo = TipoEspacio.objects.create(nombre='Aula')
+            self.espacio = EspacioFisico.objects.create(nombre='Aula 101', sede=sede, tipo=tipo, capacidad=40)
+
+    def _horario(self, grupo, asignatura, hora_inicio, hora_fin, cantidad=20, dia='Lunes'):
+        return Horario(
+            grupo=grupo,
+            asignatura=asignatura,
+            espacio=self.espacio,
+            dia_semana=dia,
+            hora_inicio=hora_inicio,
+            hora_fin=hora_fin,
+            cantidad_estudiantes=cantidad,
+            estado='aprobado',
+        )
+
+
+class ConflictosHorarioTests(HorariosMismoEspacioTestCase):
+    def test_validate_many_devuelve_todos_los_conflictos_con_consultas_fijas(self):
+        self._horario(self.grupos[0], self.civil, time(8, 0), time(10, 0)).save()
+        lote = [
+            self._horario(self.grupos[1], self.penal, time(9, 0), time(11, 0)),
+            self._horario(self.grupos[2], self.penal, time(7, 0), time(8, 30)),
+            self._horario(self.grupos[1], self.civil, time(8, 0), time(10, 0), cantidad=30),
+            self._horario(self.grupos[2], self.civil, time(14, 0), time(16, 0)),
+        ]
+
+        # grupos + horarios candidatos + 2 modelos de préstamo + espacios
+        with self.assertNumQueries(5):
+            conflictos = validate_many(lote)
+
+        por_horario = {}
+        for conflicto in conflictos:
+            por_horario.setdefault(id(conflicto.horario), []).append(conflicto.tipo)
+        self.assertIn('solapamiento', por_horario[id(lote[0])])
+        self.assertIn('solapamiento', por_horario[id(lote[1])])
+        self.assertIn('capacidad', por_horario[id(lote[2])])
+        self.assertNotIn(id(lote[3]), por_horario)
+
+    def test_signal_rechaza_solapamiento_y_omite_cambios_irrelevantes(self):
+        existente = self._horario(self.grupos[0], self.civil, time(8, 0), time(10, 0))
+        existente.save()
+
+        with self.assertRaisesMessage(ValidationError, 'ya está ocupado el Lunes de 08:00 a 10:00 por el grupo A'):
+            self._horario(self.grupos[1], self.penal, time(9, 0), time(11, 0)).save()
+
+        existente.estado = 'pendiente'
+        existente.save()
+
+    def test_validacion_diferida_valida_el_lote_al_final(self):
+        with validacion_diferida() as lote:
+            self._horario(self.grupos[0], self.civil, time(8, 0), time(10, 0)).save()
+            self._horario(self.grupos[1], self.penal, time(9, 0), time(11, 0)).save()
+
+        self.assertEqual(Horario.objects.count(), 2)
+        self.assertEqual([conflicto.tipo for conflicto in lote.conflictos], ['solapamiento'])
+
+
+class CreateHorariosBulkTests(HorariosMismoEspacioTestCase):
+    def _post(self, filas):
+        request = RequestFactory().post(
+            '/horario/bulk/',
+            data=json.dumps({'horarios': filas}),
+            content_type='application/json',
+        )
+        response = create_horarios_bulk(request)
+        return response, json.loads(response.content.decode('utf-8'))
+
+    def _fila(self, grupo, asignatura, hora_inicio, hora_fin, dia='Martes'):
+        return {
+            'grupo_id': grupo.id,
+            'asignatura_id': asignatura.id,
+            'espacio_id': self.espacio.id,
+            'dia_semana': dia,
+            'hora_inicio': hora_inicio,
+            'hora_fin': hora_fin,
+            'cantidad_estudiantes': 15,
+        }
+
+    def test_crea_todas_las_filas_fusiona_y_notifica_en_lote(self):
+        filas = [
+            self._fila(self.grupos[0], self.civil, '08:00', '10:00'),
+            self._fila(self.grupos[1], self.civil, '08:00', '10:00'),
+            self._fila(self.grupos[2], self.penal, '10:00', '12:00'),
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response, payload = self._post(filas)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(payload['ids']), 3)
+        self.assertEqual(Horario.objects.filter(dia_semana='Martes').count(), 3)
+        fusionado = HorarioFusionado.objects.get(asignatura=self.civil, dia_semana='Martes')
+        self.assertEqual(fusionado.cantidad_estudiantes, 30)
+        self.assertEqual(Notificacion.objects.filter(tipo_notificacion='HORARIO_CREADO').count(), 3)
+
+    def test_un_conflicto_rechaza_todo_el_lote(self):
+        filas = [
+            self._fila(self.grupos[0], self.civil, '08:00', '10:00'),
+            self._fila(self.grupos[1], self.penal, '14:00', '16:00'),
+            self._fila(self.grupos[2], self.penal, '09:00', '11:00'),
+        ]
+
+        response, payload = self._post(filas)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([c['fila'] for c in payload['conflictos']], [2])
+        self.assertFalse(Horario.objects.exists())
+
+
+class HorarioFusionadoIncrementalTests(HorariosMismoEspacioTestCase):
+    def test_un_recalculo_por_clase_al_confirmar_la_transaccion(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            with transaction.atomic():
+                horarios = [
+                    self._horario(grupo, self.civil, time(8, 0), time(10, 0), cantidad=10)
+                    for grupo in self.grupos
+                ]
+                for horario in horarios:
+                    horario.save()
+            self.assertFalse(HorarioFusionado.objects.exists())
+
+        # Tres guardados de la misma clase: un solo recálculo (un solo GROUP BY)
+        with CaptureQueriesContext(connection) as consultas:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(sum('GROUP BY' in q['sql'] for q in consultas.captured_queries), 1)
+
+        fusionado = HorarioFusionado.objects.get()
+        self.assertEqual(
+            {fusionado.grupo1_id, fusionado.grupo2_id, fusionado.grupo3_id},
+            {grupo.id for grupo in self.grupos},
+        )
+        self.assertEqual(fusionado.cantidad_estudiantes, 30)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            horarios[0].delete()
+        fusionado.refresh_from_db()
+        self.assertIsNone(fusionado.grupo3_id)
+        self.assertEqual(fusionado.cantidad_estudiantes, 20)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            horarios[1].dia_semana = 'Martes'
+            horarios[1].save()
+        self.assertFalse(HorarioFusionado.objects.exists())
+
+    def test_claves_de_una_transaccion_revertida_no_pasan_a_la_siguiente(self):
+        with patch('horario.fusionados.recalcular_claves') as recalcular:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        self._horario(self.grupos[0], self.civil, time(8, 0), time(10, 0)).save()
+                        raise ValueError
+                except ValueError:
+                    pass
+                with transaction.atomic():
+                    self._horario(self.grupos[1], self.civil, time(14, 0), time(16, 0)).save()
+
+        recalcular.assert_called_once()
+        (claves,), _ = recalcular.call_args
+        self.assertEqual([clave[2] for clave in claves], [time(14, 0)])
+
+    def test_rebuild_fusionados_reconstruye_desde_los_horarios(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            for grupo in self.grupos[:2]:
+                self._horario(grupo, self.penal, time(14, 0), time(16, 0)).save()
+        self.assertFalse(HorarioFusionado.objects.exists())
+
+        call_command('rebuild_fusionados', stdout=StringIO())
+        self.assertFalse(HorarioFusionado.objects.exists())
+
+        call_command('rebuild_fusionados', '--confirmar', stdout=StringIO())
+        fusionado = HorarioFusionado.objects.get()
+        self.assertEqual(fusionado.asignatura_id, self.penal.id)
+        self.assertEqual(fusionado.cantidad_estudiantes, 40)
@@ -21,6 +21,7 @@ urlpatterns = [
     path('exportar-excel-docente/', views.exportar_horarios_excel_docente, name='exportar_horario_excel_docente'),
     path('exportar-pdf-usuario/', views.exportar_pdf_usuario, name='exportar_pdf_usuario'),
     path('exportar-excel-usuario/', views.exportar_excel_usuario, name='exportar_excel_usuario'),
+    path('bulk/', views.create_horarios_bulk, name='create_horarios_bulk'),
     path('update/', views.update_horario, name='update_horario'),
     path('delete/', views.delete_horario, name='delete_horario'),
     path('list/', views.list_horarios, name='list_horarios'),
@@ -1,15 +1,20 @@
 from django.shortcuts import render
 from .models import Horario, HorarioFusionado, HorarioEstudiante, SolicitudEspacio
+from .conflictos import omitir_validacion, validate_many
+from .fusionados import programar_recalculo
 from grupos.models import Grupo
 from asignaturas.models import Asignatura
 from usuarios.models import Usuario
 from espacios.models import EspacioFisico
 from django.http import JsonResponse, HttpResponse
 from django.core.exceptions import ValidationError
+from django.db import transaction
 import json
 from django.views.decorators.csrf import csrf_exempt
 import datetime
-from notificaciones.signals import crear_notificacion
+from notificaciones.signals import (
+    crear_notificacion, crear_notificacion_para_roles, crear_notificaciones_en_lote, obtener_id_usuario,
+)
 from mysite.auth_helpers import MISSING_SECCIONAL_MESSAGE, get_user_seccional_id, is_superuser_effective
 from reportlab.lib.pagesizes import landscape, A4
 from reportlab.lib import colors
@@ -230,14 +235,12 @@ def create_horario(request):
             solicitud.save()
             
             # Crear notificación para administradores de facultad y planeación
-            administradores = Usuario.objects.filter(rol__nombre__in=['admin', 'admin_planeacion']).distinct()
-            for admin in administradores:
-                crear_notificacion(
-                    id_usuario=admin.id,
-                    tipo='solicitud_espacio',
-                    mensaje=f'Nueva solicitud de espacio (ID: {solicitud.id}): {asignatura.nombre} - Grupo {grupo.nombre} - Aula: {espacio.nombre} - {dia_semana} {hi}-{hf}',
-                    prioridad='alta'
-                )
+            crear_notificacion_para_roles(
+                ['admin', 'admin_planeacion'],
+                tipo='solicitud_espacio',
+                mensaje=f'Nueva solicitud de espacio (ID: {solicitud.id}): {asignatura.nombre} - Grupo {grupo.nombre} - Aula: {espacio.nombre} - {dia_semana} {hi}-{hf}',
+                prioridad='alta'
+            )
             
             return JsonResponse({
                 "message": "Solicitud de espacio creada exitosamente",
@@ -257,7 +260,13 @@ def create_horario(request):
                 cantidad_estudiantes=int(cantidad) if cantidad is not None else None,
                 estado='aprobado'
             )
-            h.save()
+            conflictos = validate_many([h])
+            if conflictos:
+                return JsonResponse({
+                    "error": conflictos[0].mensaje,
+                    "conflictos": [c.mensaje for c in conflictos]
+                }, status=400)
+            omitir_validacion(h).save()
             return JsonResponse({
                 "message": "Horario creado",
                 "id": h.id,
@@ -275,6 +284,199 @@ def create_horario(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+MAX_HORARIOS_BULK = 1000
+
+
+def _id_entero(valor):
+    try:
+        return int(valor) if valor not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _invalidar_caches_horarios():
+    """bulk_create no dispara post_save: invalida a mano lo que invalidan las signals de espacios."""
+    from espacios.disponibilidad import invalidar_mapa_disponibilidad
+    from espacios.ocupacion import invalidar_matriz_ocupacion
+    from mysite.cache_utils import bump_global_schedule_version
+    invalidar_matriz_ocupacion()
+    invalidar_mapa_disponibilidad()
+    bump_global_schedule_version()
+
+
+@csrf_exempt
+def create_horarios_bulk(request):
+    """
+    Crea muchos horarios (o solicitudes de espacio, si quien los envía es
+    planificador) en una sola petición. Todo o nada: si alguna fila es
+    inválida o choca con otra clase o préstamo, no se guarda ninguna.
+
+    Body: {"usuario_id": ..., "horarios": [{grupo_id, asignatura_id, espacio_id,
+    dia_semana, hora_inicio, hora_fin, docente_id?, cantidad_estudiantes?}, ...]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        data = json.loads(request.body)
+        filas = data.get('horarios')
+        usuario_id = _id_entero(data.get('usuario_id'))
+        if not isinstance(filas, list) or not filas:
+            return JsonResponse({"error": "Se requiere una lista 'horarios' no vacía"}, status=400)
+        if len(filas) > MAX_HORARIOS_BULK:
+            return JsonResponse({"error": f"Máximo {MAX_HORARIOS_BULK} horarios por petición"}, status=400)
+        if not all(isinstance(fila, dict) for fila in filas):
+            return JsonResponse({"error": "Cada horario debe ser un objeto JSON"}, status=400)
+        for fila in filas:
+            for campo in ('grupo_id', 'asignatura_id', 'espacio_id', 'docente_id'):
+                fila[campo] = _id_entero(fila.get(campo))
+
+        # Resolver todas las relaciones con una consulta por modelo
+        grupos = Grupo.objects.select_related('periodo').in_bulk({f.get('grupo_id') for f in filas} - {None})
+        asignaturas = Asignatura.objects.in_bulk({f.get('asignatura_id') for f in filas} - {None})
+        espacios = EspacioFisico.objects.in_bulk({f.get('espacio_id') for f in filas} - {None})
+        usuarios = Usuario.objects.select_related('rol').in_bulk(
+            ({f.get('docente_id') for f in filas} | {usuario_id}) - {None}
+        )
+        usuario = usuarios.get(usuario_id) if usuario_id else None
+        if usuario_id and usuario is None:
+            return JsonResponse({"error": "Usuario no encontrado."}, status=404)
+        es_planificador = usuario and usuario.rol and usuario.rol.nombre == 'planeacion_facultad'
+
+        errores = []
+        horarios = []
+        for indice, fila in enumerate(filas):
+            if not all(fila.get(campo) for campo in ('grupo_id', 'asignatura_id', 'espacio_id', 'dia_semana', 'hora_inicio', 'hora_fin')):
+                errores.append({"fila": indice, "error": "Faltan campos requeridos"})
+                continue
+            grupo = grupos.get(fila['grupo_id'])
+            asignatura = asignaturas.get(fila['asignatura_id'])
+            espacio = espacios.get(fila['espacio_id'])
+            docente_id = fila.get('docente_id')
+            docente = usuarios.get(docente_id) if docente_id else None
+            if grupo is None or asignatura is None or espacio is None or (docente_id and docente is None):
+                errores.append({"fila": indice, "error": "Relacionada no encontrada."})
+                continue
+            try:
+                hi = datetime.time.fromisoformat(fila['hora_inicio'])
+                hf = datetime.time.fromisoformat(fila['hora_fin'])
+                cantidad = fila.get('cantidad_estudiantes')
+                cantidad = int(cantidad) if cantidad is not None else None
+            except (TypeError, ValueError):
+                errores.append({"fila": indice, "error": "Formato de hora inválido o valor numérico incorrecto."})
+                continue
+            if hf <= hi:
+                errores.append({"fila": indice, "error": "hora_fin debe ser mayor que hora_inicio"})
+                continue
+            horarios.append(Horario(
+                grupo=grupo,
+                asignatura=asignatura,
+                docente=docente,
+                espacio=espacio,
+                dia_semana=fila['dia_semana'],
+                hora_inicio=hi,
+                hora_fin=hf,
+                cantidad_estudiantes=cantidad,
+                estado='aprobado'
+            ))
+
+        if errores:
+            return JsonResponse({"error": "Hay filas inválidas", "errores": errores}, status=400)
+
+        # Las solicitudes de planificador no ocupan el espacio hasta aprobarse,
+        # igual que en create_horario.
+        if es_planificador:
+            with transaction.atomic():
+                solicitudes = SolicitudEspacio.objects.bulk_create([
+                    SolicitudEspacio(
+                        grupo=h.grupo,
+                        asignatura=h.asignatura,
+                        docente=h.docente,
+                        espacio_solicitado=h.espacio,
+                        planificador=usuario,
+                        dia_semana=h.dia_semana,
+                        hora_inicio=h.hora_inicio,
+                        hora_fin=h.hora_fin,
+                        cantidad_estudiantes=h.cantidad_estudiantes,
+                        estado='pendiente'
+                    )
+                    for h in horarios
+                ])
+            administradores = list(
+                Usuario.objects.filter(rol__nombre__in=['admin', 'admin_planeacion']).distinct().values_list('id', flat=True)
+            )
+            crear_notificaciones_en_lote(
+                {
+                    'id_usuario': admin_id,
+                    'tipo': 'solicitud_espacio',
+                    'mensaje': f'Nueva solicitud de espacio (ID: {s.id}): {s.asignatura.nombre} - Grupo {s.grupo.nombre} - Aula: {s.espacio_solicitado.nombre} - {s.dia_semana} {s.hora_inicio}-{s.hora_fin}',
+                    'prioridad': 'alta'
+                }
+                for s in solicitudes for admin_id in administradores
+            )
+            return JsonResponse({
+                "message": f"{len(solicitudes)} solicitudes de espacio creadas exitosamente",
+                "ids": [s.id for s in solicitudes],
+                "tipo": "solicitud"
+            }, status=201)
+
+        with transaction.atomic():
+            # bulk_create no dispara la validación de las signals: se bloquean
+            # los espacios y grupos del lote (en orden de id, sin interbloqueos)
+            # para que otro lote concurrente no valide contra los mismos datos
+            # antes de que este se inserte.
+            list(EspacioFisico.objects.select_for_update().filter(
+                id__in={h.espacio_id for h in horarios if h.espacio_id}
+            ).order_by('id').values_list('id', flat=True))
+            list(Grupo.objects.select_for_update().filter(
+                id__in={h.grupo_id for h in horarios}
+            ).order_by('id').values_list('id', flat=True))
+
+            # Valida contra la base de datos y entre las filas del lote a la vez
+            conflictos = validate_many(horarios)
+            if conflictos:
+                posiciones = {id(h): indice for indice, h in enumerate(horarios)}
+                return JsonResponse({
+                    "error": conflictos[0].mensaje,
+                    "conflictos": [
+                        {"fila": posiciones[id(c.horario)], "tipo": c.tipo, "error": c.mensaje}
+                        for c in conflictos
+                    ]
+                }, status=400)
+
+            Horario.objects.bulk_create(horarios)
+            # Un recálculo de HorarioFusionado por clase afectada, al confirmar
+            programar_recalculo(horarios)
+            transaction.on_commit(_invalidar_caches_horarios)
+
+        # Las mismas notificaciones que la signal de post_save, en un solo INSERT
+        id_usuario = obtener_id_usuario()
+        notificaciones = []
+        for h in horarios:
+            notificaciones.append({
+                'id_usuario': id_usuario,
+                'tipo': 'HORARIO_CREADO',
+                'mensaje': f'Nuevo horario creado: {h.asignatura.nombre} - {h.dia_semana} {h.hora_inicio}-{h.hora_fin}',
+                'prioridad': 'alta'
+            })
+            if h.docente:
+                notificaciones.append({
+                    'id_usuario': h.docente.id,
+                    'tipo': 'HORARIO_ASIGNADO',
+                    'mensaje': f'Se te ha asignado un horario: {h.asignatura.nombre} - {h.dia_semana} {h.hora_inicio}',
+                    'prioridad': 'alta'
+                })
+        crear_notificaciones_en_lote(notificaciones)
+
+        return JsonResponse({
+            "message": f"{len(horarios)} horarios creados",
+            "ids": [h.id for h in horarios],
+            "tipo": "horario"
+        }, status=201)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "JSON inválido."}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
 @csrf_exempt
 def update_horario(request):
     if request.method != 'PUT':
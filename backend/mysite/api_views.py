@@ -34,11 +34,12 @@ from recursos.serializers import EspacioRecursoSerializer, RecursoSerializer
 from sedes.models import Seccional, Sede
 from sedes.serializers import SeccionalSerializer, SedeSerializer
 from usuarios.models import Rol, Usuario
-from notificaciones.signals import crear_notificacion
+from notificaciones.signals import crear_notificacion_para_roles
 from usuarios.serializers import RolSerializer, UsuarioMinimalSerializer, UsuarioSerializer
 
 from .auth_helpers import is_admin_global, is_admin_sistema, is_superuser_effective, user_supervisa_espacios
 from .cache_utils import CachedCatalogMixin
+from .identity import get_session_identity
 from .seccional_auth import SeccionalMixin
 from .permissions import (
     IsAdminGlobal,
@@ -396,18 +397,16 @@ class HorarioViewSet(SeccionalMixin, viewsets.ModelViewSet):
                 )
                 solicitud.save()
 
-                administradores = Usuario.objects.filter(rol__nombre__in=['admin', 'admin_planeacion']).distinct()
-                for admin in administradores:
-                    crear_notificacion(
-                        id_usuario=admin.id,
-                        tipo='solicitud_espacio',
-                        mensaje=(
-                            f'Nueva solicitud de espacio (ID: {solicitud.id}): '
-                            f'{asignatura.nombre} - Grupo {grupo.nombre} - Aula: {espacio.nombre} - '
-                            f'{dia_semana} {hi}-{hf}'
-                        ),
-                        prioridad='alta'
-                    )
+                crear_notificacion_para_roles(
+                    ['admin', 'admin_planeacion'],
+                    tipo='solicitud_espacio',
+                    mensaje=(
+                        f'Nueva solicitud de espacio (ID: {solicitud.id}): '
+                        f'{asignatura.nombre} - Grupo {grupo.nombre} - Aula: {espacio.nombre} - '
+                        f'{dia_semana} {hi}-{hf}'
+                    ),
+                    prioridad='alta'
+                )
 
                 return Response(
                     {
@@ -621,42 +620,9 @@ class UsuarioViewSet(SeccionalMixin, viewsets.ModelViewSet):
         if not usuario.rol:
             return []
 
-        from componentes.models import ComponenteRol, ComponenteUsuario
-
-        componentes_rol = ComponenteRol.objects.filter(rol=usuario.rol).select_related('componente')
-        componentes_usuario = ComponenteUsuario.objects.filter(usuario=usuario).select_related('componente')
-        overrides = {item.componente_id: item for item in componentes_usuario}
-
-        componentes = []
-        for cr in componentes_rol:
-            override = overrides.get(cr.componente_id)
-            if override and not override.activo:
-                continue
-
-            permiso = override.permiso if override else cr.permiso
-            componentes.append(
-                {
-                    'id': cr.componente.id,
-                    'nombre': cr.componente.nombre,
-                    'descripcion': cr.componente.descripcion,
-                    'permiso': permiso,
-                }
-            )
-
-        componentes_por_id = {item['id']: item for item in componentes}
-        for override in componentes_usuario:
-            if not override.activo:
-                continue
-
-            if override.componente_id not in componentes_por_id:
-                componentes_por_id[override.componente_id] = {
-                    'id': override.componente.id,
-                    'nombre': override.componente.nombre,
-                    'descripcion': override.componente.descripcion,
-                    'permiso': override.permiso,
-                }
+        from componentes.permisos import componentes_efectivos
 
-        return list(componentes_por_id.values())
+        return list(componentes_efectivos(usuario).values())
 
     def _build_espacios_permitidos(self, usuario):
         from espacios.models import EspacioPermitido
@@ -786,9 +752,8 @@ class UsuarioViewSet(SeccionalMixin, viewsets.ModelViewSet):
         if not user_id:
             return Response({'error': 'No autenticado'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        try:
-            usuario = Usuario.objects.select_related('rol').get(id=user_id)
-        except Usuario.DoesNotExist:
+        usuario = get_session_identity(request)
+        if usuario is None:
             return Response({'error': 'Usuario no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
         componentes = self._build_componentes(usuario)
@@ -7,5 +7,6 @@ class MysiteConfig(AppConfig):
     verbose_name = 'Configuración del Sistema'
 
     def ready(self):
-        from .cache_signals import register_catalog_cache_signals
+        from .cache_signals import register_catalog_cache_signals, register_identity_cache_signals
         register_catalog_cache_signals()
+        register_identity_cache_signals()
@@ -3,10 +3,23 @@ ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+El flujo en vivo de notificaciones (notificaciones/flujo/) es una vista
+asíncrona que mantiene la conexión abierta: solo funciona servido por ASGI.
+El resto de la aplicación sigue en gunicorn (WSGI) y esta ruta la sirve
+``uvicorn mysite.asgi:application`` en el puerto 8002 (servicio
+backend-flujo de docker-compose o start.sh); nginx le envía
+/api/notificaciones/flujo/. Servido por WSGI responde 501 y el frontend
+vuelve a consultar.
+
+Las notificaciones se escriben en los workers de gunicorn: solo llegan a
+este proceso por el canal de Redis (notificaciones/push.py). Sin REDIS_URL
+se avisa al arrancar y start.sh no inicia este servidor.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import logging
 import os
 
 from django.core.asgi import get_asgi_application
@@ -14,3 +27,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if not settings.REDIS_URL:
+    logging.getLogger('notificaciones').warning(
+        'REDIS_URL no está definida: el flujo en vivo solo recibe las notificaciones '
+        'escritas por este mismo proceso, no las de los workers de gunicorn.'
+    )
@@ -104,27 +104,9 @@ def get_componente_permiso(user, nombre_componente):
     if not is_authenticated_user(user):
         return None
 
-    from componentes.models import Componente, ComponenteRol, ComponenteUsuario
+    from componentes.permisos import permisos_por_nombre
 
-    try:
-        componente = Componente.objects.get(nombre=nombre_componente)
-    except Componente.DoesNotExist:
-        return None
-
-    override = ComponenteUsuario.objects.filter(usuario=user, componente=componente).first()
-
-    rol = getattr(user, 'rol', None)
-    cr = ComponenteRol.objects.filter(rol=rol, componente=componente).first() if rol else None
-
-    if cr:
-        if override and not override.activo:
-            return None
-        return override.permiso if override else cr.permiso
-
-    if override and override.activo:
-        return override.permiso
-
-    return None
+    return permisos_por_nombre(user).get(nombre_componente)
 
 
 def user_can_edit_componente(user, nombre_componente):
@@ -7,7 +7,7 @@ from django.shortcuts import redirect
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.http import require_GET
 
-from componentes.models import ComponenteRol, ComponenteUsuario
+from componentes.permisos import componentes_efectivos
 from espacios.models import EspacioPermitido
 from mysite.auth_helpers import role_supervisa_espacios
 from usuarios.models import Usuario
@@ -16,41 +16,7 @@ from usuarios.models import Usuario
 def _build_componentes(usuario: Usuario):
     if not usuario.rol:
         return []
-
-    componentes_rol = ComponenteRol.objects.filter(rol=usuario.rol).select_related('componente')
-    componentes_usuario = ComponenteUsuario.objects.filter(usuario=usuario).select_related('componente')
-    overrides = {item.componente_id: item for item in componentes_usuario}
-
-    componentes = []
-    for cr in componentes_rol:
-        override = overrides.get(cr.componente_id)
-        if override and not override.activo:
-            continue
-
-        permiso = override.permiso if override else cr.permiso
-        componentes.append(
-            {
-                'id': cr.componente.id,
-                'nombre': cr.componente.nombre,
-                'descripcion': cr.componente.descripcion,
-                'permiso': permiso,
-            }
-        )
-
-    componentes_por_id = {item['id']: item for item in componentes}
-    for override in componentes_usuario:
-        if not override.activo:
-            continue
-
-        if override.componente_id not in componentes_por_id:
-            componentes_por_id[override.componente_id] = {
-                'id': override.componente.id,
-                'nombre': override.componente.nombre,
-                'descripcion': override.componente.descripcion,
-                'permiso': override.permiso,
-            }
-
-    return list(componentes_por_id.values())
+    return list(componentes_efectivos(usuario).values())
 
 
 def _build_espacios_permitidos(usuario: Usuario):
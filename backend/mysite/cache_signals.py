@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
@@ -8,10 +9,11 @@ from grupos.models import Grupo
 from prestamos.models import TipoActividad
 from programas.models import Programa
 from recursos.models import Recurso
-from sedes.models import Sede
-from usuarios.models import Rol
+from sedes.models import Seccional, Sede
+from usuarios.models import Rol, Usuario
 
 from .cache_utils import invalidate_catalog_cache
+from .identity import bump_identity_version
 
 _CATALOG_MODELS = {
     Sede: 'SedeViewSet',
@@ -38,3 +40,22 @@ def register_catalog_cache_signals() -> None:
         handler = _make_handler(viewset_class_name)
         post_save.connect(handler, sender=model, weak=False)
         post_delete.connect(handler, sender=model, weak=False)
+
+
+# Modelos que cambian la identidad de muchos usuarios a la vez (ver identity.py).
+_IDENTITY_GLOBAL_MODELS = (Rol, Sede, Seccional)
+
+
+def _bump_identity_usuario(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_identity_version(instance.pk))
+
+
+def _bump_identity_global(sender, **kwargs):
+    transaction.on_commit(bump_identity_version)
+
+
+def register_identity_cache_signals() -> None:
+    for signal in (post_save, post_delete):
+        signal.connect(_bump_identity_usuario, sender=Usuario, weak=False)
+        for model in _IDENTITY_GLOBAL_MODELS:
+            signal.connect(_bump_identity_global, sender=model, weak=False)
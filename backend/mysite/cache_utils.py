@@ -1,6 +1,12 @@
 from __future__ import annotations
 
+import hashlib
+import uuid
+
 from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from rest_framework.response import Response
 
 from .auth_helpers import is_superuser_effective
@@ -60,3 +66,83 @@ def invalidate_catalog_cache(viewset_class_name: str) -> None:
         cache.delete_pattern(f"catalog:{viewset_class_name}:*")
     except AttributeError:
         cache.clear()
+
+
+SCHEDULE_VERSION_CACHE_KEY = 'horarios:version:{scope}'
+# Versión que comparten todos los alcances: subirla invalida los ETag de
+# todas las seccionales a la vez.
+SCHEDULE_GLOBAL_SCOPE = 'global'
+# Alcance sin filtro de seccional (superusuario, consulta pública o vistas
+# que cruzan seccionales como el horario de un docente).
+SCHEDULE_ALL_SCOPE = 'all'
+# Las versiones vencen aunque nada las suba: un cambio que no pase por las
+# señales (un `update()` masivo, SQL directo) deja de servir 304 a lo sumo
+# después de este tiempo.
+SCHEDULE_VERSION_TTL_SECONDS = 15 * 60
+
+
+def schedule_scope(seccional_id=None) -> str:
+    return f"sec-{seccional_id}" if seccional_id else SCHEDULE_ALL_SCOPE
+
+
+def get_schedule_versions(scope: str) -> tuple[str, str]:
+    """Devuelve (versión global, versión del alcance) en una sola lectura.
+
+    Son tokens aleatorios y no contadores, para que un `cache.clear()` o un
+    reinicio de Redis nunca vuelva a producir un ETag ya entregado.
+    """
+    keys = [SCHEDULE_VERSION_CACHE_KEY.format(scope=s) for s in (SCHEDULE_GLOBAL_SCOPE, scope)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, SCHEDULE_VERSION_TTL_SECONDS)
+            versions[key] = cache.get(key)
+    return versions[keys[0]], versions[keys[1]]
+
+
+def bump_schedule_version(seccional_ids=()) -> None:
+    """Sube la versión de horarios de las seccionales dadas y la de 'all'
+    (que ve todas las seccionales). Se llama desde las señales de Horario,
+    EspacioFisico y PrestamoEspacio (ver espacios/signals.py)."""
+    scopes = {SCHEDULE_ALL_SCOPE} | {schedule_scope(s) for s in seccional_ids if s}
+    cache.set_many(
+        {SCHEDULE_VERSION_CACHE_KEY.format(scope=s): uuid.uuid4().hex for s in scopes},
+        SCHEDULE_VERSION_TTL_SECONDS,
+    )
+
+
+def bump_global_schedule_version() -> None:
+    """Invalida los ETag de horarios de todas las seccionales."""
+    cache.set(
+        SCHEDULE_VERSION_CACHE_KEY.format(scope=SCHEDULE_GLOBAL_SCOPE), uuid.uuid4().hex, SCHEDULE_VERSION_TTL_SECONDS,
+    )
+
+
+def schedule_etag(scope: str, *parts) -> str:
+    """ETag de un listado de horarios: versión global y del alcance más lo
+    que distinga la respuesta (vista, usuario, parámetros)."""
+    raw = '|'.join(str(part) for part in (*get_schedule_versions(scope), scope, *parts))
+    return '"%s"' % hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def schedule_not_modified(request, etag: str):
+    """304 si el cliente ya tiene `etag` (If-None-Match); si no, None.
+
+    Se consulta antes de tocar el ORM, así que una revalidación cuesta solo
+    la lectura de las versiones en caché.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return None
+    etags = {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}
+    if etag not in etags and '*' not in etags:
+        return None
+    return with_schedule_etag(HttpResponseNotModified(), etag)
+
+
+def with_schedule_etag(response, etag: str):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        # El navegador debe revalidar siempre: el ETag cambia con cada horario.
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
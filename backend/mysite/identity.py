@@ -0,0 +1,84 @@
+"""Identidad del usuario de sesión compartida por middleware, autenticación y permisos.
+
+Antes cada request autenticada leía el Usuario dos veces (SedeFilterMiddleware
+y SessionUsuarioAuthentication). Ahora el Usuario se carga una sola vez con
+rol, sede y seccional y se guarda en la caché compartida; las requests
+siguientes lo resuelven sin SQL. Sus permisos de componentes viven en
+componentes/permisos.py.
+
+La clave incluye dos versiones: la del usuario (se sube al guardar el Usuario)
+y una global (se sube al cambiar roles, sedes o seccionales, que afectan a
+muchos usuarios). Ver cache_signals.py. El TTL cubre los cambios hechos sin
+señales (`QuerySet.update`).
+"""
+
+from __future__ import annotations
+
+import uuid
+
+from django.core.cache import cache
+
+IDENTITY_CACHE_TTL_SECONDS = 300
+IDENTITY_VERSION_CACHE_KEY = 'identity:version:{scope}'
+IDENTITY_GLOBAL_SCOPE = 'global'
+
+
+def _version_keys(user_id) -> list[str]:
+    return [
+        IDENTITY_VERSION_CACHE_KEY.format(scope=IDENTITY_GLOBAL_SCOPE),
+        IDENTITY_VERSION_CACHE_KEY.format(scope=f"user-{user_id}"),
+    ]
+
+
+def _get_versions(user_id) -> list[str]:
+    keys = _version_keys(user_id)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_identity_version(user_id=None) -> None:
+    """Invalida la identidad cacheada de un usuario, o la de todos si no se indica."""
+    scope = f"user-{user_id}" if user_id else IDENTITY_GLOBAL_SCOPE
+    cache.set(IDENTITY_VERSION_CACHE_KEY.format(scope=scope), uuid.uuid4().hex, None)
+
+
+def load_identity(user_id):
+    """Usuario `user_id` con rol, sede y seccional, desde la caché si su
+    versión sigue vigente."""
+    from usuarios.models import Usuario
+
+    cache_key = f"identity:usuario:{user_id}:{':'.join(_get_versions(user_id))}"
+    usuario = cache.get(cache_key)
+    if usuario is not None:
+        return usuario
+
+    # Los hashes de contraseña no se guardan en la caché compartida.
+    usuario = Usuario.objects.select_related('rol', 'sede', 'sede__seccional', 'seccional').defer(
+        'password', 'contrasena_hash'
+    ).filter(id=user_id).first()
+    if usuario is None:
+        return None
+
+    cache.set(cache_key, usuario, IDENTITY_CACHE_TTL_SECONDS)
+    return usuario
+
+
+def get_session_identity(request):
+    """Usuario de la sesión (o None), resuelto una sola vez por request.
+
+    Acepta tanto el HttpRequest como el Request de DRF: el resultado se guarda
+    en el HttpRequest subyacente para que middleware y autenticación lo compartan.
+    """
+    http_request = getattr(request, '_request', request)
+    if hasattr(http_request, '_session_identity'):
+        return http_request._session_identity
+
+    session = getattr(http_request, 'session', None)
+    user_id = session.get('user_id') if session is not None else None
+    usuario = load_identity(user_id) if user_id else None
+    http_request._session_identity = usuario
+    return usuario
@@ -13,6 +13,8 @@ from programas.models import Programa
 from periodos.models import PeriodoAcademico
 from grupos.models import Grupo
 from horario.models import Horario
+from horario.conflictos import validacion_diferida
+from horario.fusionados import fusionados_diferidos
 
 
 def create_horarios_sede_centro(stdout, style):
@@ -26,11 +28,6 @@ def create_horarios_sede_principal(stdout, style):
     """Crear horarios para la sede principal (sede norte)"""
     stdout.write('  → Creando horarios sede principal (norte)...')
     
-    # Desconectar temporalmente la validación de horarios durante el seed
-    from django.db.models.signals import pre_save
-    from horario.signals import validar_horario
-    pre_save.disconnect(validar_horario, sender=Horario)
-    
     # Mapeo de días en español a formato consistente
     dias_map = {
         'LUNES': 'Lunes',
@@ -924,82 +921,83 @@ def create_horarios_sede_principal(stdout, style):
     skipped_count = 0
     errors = []
     
-    # Crear horarios
-    for data in horarios_data:
-        try:
-            grupo_nombre, materia_nombre, profesor_nombre, dia, hora_inicio, hora_fin, espacio_nombre = data
+    # Crear horarios (los conflictos se validan en lote al final)
+    with validacion_diferida() as lote, fusionados_diferidos():
+        for data in horarios_data:
+            try:
+                grupo_nombre, materia_nombre, profesor_nombre, dia, hora_inicio, hora_fin, espacio_nombre = data
             
-            # Normalizar día
-            dia_normalizado = dias_map.get(dia.upper(), dia)
+                # Normalizar día
+                dia_normalizado = dias_map.get(dia.upper(), dia)
             
-            # Obtener asignatura (por nombre o código)
-            asignatura = Asignatura.objects.filter(
-                Q(nombre__iexact=materia_nombre.strip()) | Q(codigo__iexact=materia_nombre.strip())
-            ).first()
+                # Obtener asignatura (por nombre o código)
+                asignatura = Asignatura.objects.filter(
+                    Q(nombre__iexact=materia_nombre.strip()) | Q(codigo__iexact=materia_nombre.strip())
+                ).first()
             
-            if not asignatura:
-                errors.append(f'Asignatura no encontrada: {materia_nombre}')
-                skipped_count += 1
-                continue
+                if not asignatura:
+                    errors.append(f'Asignatura no encontrada: {materia_nombre}')
+                    skipped_count += 1
+                    continue
             
-            # Obtener grupo
-            try:
-                grupo = Grupo.objects.get(nombre=grupo_nombre, periodo=periodo)
-            except Grupo.DoesNotExist:
-                errors.append(f'Grupo no encontrado: {grupo_nombre}')
-                skipped_count += 1
-                continue
+                # Obtener grupo
+                try:
+                    grupo = Grupo.objects.get(nombre=grupo_nombre, periodo=periodo)
+                except Grupo.DoesNotExist:
+                    errors.append(f'Grupo no encontrado: {grupo_nombre}')
+                    skipped_count += 1
+                    continue
             
-            # Obtener o crear profesor
-            profesor = None
-            if profesor_nombre and profesor_nombre.strip() != '':
-                base_email = profesor_nombre.lower().replace(' ', '.').replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u').replace('ñ', 'n')[:30]
-                email = f'{base_email}@sihul.edu.co'
-                counter = 1
-                while Usuario.objects.filter(correo=email).exists():
-                    email = f'{base_email[:20]}_{counter}@sihul.edu.co'
-                    counter += 1
+                # Obtener o crear profesor
+                profesor = None
+                if profesor_nombre and profesor_nombre.strip() != '':
+                    base_email = profesor_nombre.lower().replace(' ', '.').replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u').replace('ñ', 'n')[:30]
+                    email = f'{base_email}@sihul.edu.co'
+                    counter = 1
+                    while Usuario.objects.filter(correo=email).exists():
+                        email = f'{base_email[:20]}_{counter}@sihul.edu.co'
+                        counter += 1
                 
-                try:
-                    rol_docente = Rol.objects.get(nombre='Docente')
-                except Rol.DoesNotExist:
-                    rol_docente = None
+                    try:
+                        rol_docente = Rol.objects.get(nombre='Docente')
+                    except Rol.DoesNotExist:
+                        rol_docente = None
                 
-                profesor, _ = Usuario.objects.get_or_create(
-                    correo=email,
-                    defaults={
-                        'nombre': profesor_nombre,
-                        'contrasena_hash': 'hash_placeholder',
-                        'rol': rol_docente,
-                        'activo': True
-                    }
-                )
+                    profesor, _ = Usuario.objects.get_or_create(
+                        correo=email,
+                        defaults={
+                            'nombre': profesor_nombre,
+                            'contrasena_hash': 'hash_placeholder',
+                            'rol': rol_docente,
+                            'activo': True
+                        }
+                    )
             
-            # Obtener espacio físico
-            try:
-                espacio = EspacioFisico.objects.get(nombre=espacio_nombre, sede=sede)
-            except EspacioFisico.DoesNotExist:
-                errors.append(f'Espacio no encontrado: {espacio_nombre}')
-                skipped_count += 1
-                continue
+                # Obtener espacio físico
+                try:
+                    espacio = EspacioFisico.objects.get(nombre=espacio_nombre, sede=sede)
+                except EspacioFisico.DoesNotExist:
+                    errors.append(f'Espacio no encontrado: {espacio_nombre}')
+                    skipped_count += 1
+                    continue
             
-            # Crear el horario (ya limpiamos todos los anteriores)
-            horario = Horario.objects.create(
-                asignatura=asignatura,
-                grupo=grupo,
-                dia_semana=dia_normalizado,
-                hora_inicio=hora_inicio,
-                hora_fin=hora_fin,
-                espacio=espacio,
-                docente=profesor,
-                estado='aprobado'
-            )
+                # Crear el horario (ya limpiamos todos los anteriores)
+                horario = Horario.objects.create(
+                    asignatura=asignatura,
+                    grupo=grupo,
+                    dia_semana=dia_normalizado,
+                    hora_inicio=hora_inicio,
+                    hora_fin=hora_fin,
+                    espacio=espacio,
+                    docente=profesor,
+                    estado='aprobado'
+                )
             
-            created_count += 1
+                created_count += 1
                 
-        except Exception as e:
-            errors.append(f'Error en {grupo_nombre} - {materia_nombre}: {str(e)}')
-            skipped_count += 1
+            except Exception as e:
+                errors.append(f'Error en {grupo_nombre} - {materia_nombre}: {str(e)}')
+                skipped_count += 1
     
     total = len(horarios_data)
     stdout.write(style.SUCCESS(f'    ✓ {created_count} horarios creados, {skipped_count} omitidos ({total} totales)'))
@@ -1011,5 +1009,9 @@ def create_horarios_sede_principal(stdout, style):
         if len(errors) > 10:
             stdout.write(style.WARNING(f'      ... y {len(errors) - 10} errores más'))
     
-    # Reconectar la validación de horarios
-    pre_save.connect(validar_horario, sender=Horario)
+    if lote.conflictos:
+        stdout.write(style.WARNING(f'\n    Conflictos de espacio en los datos sembrados ({len(lote.conflictos)}):'))
+        for conflicto in lote.conflictos[:10]:
+            stdout.write(style.WARNING(f'      • {conflicto.mensaje}'))
+        if len(lote.conflictos) > 10:
+            stdout.write(style.WARNING(f'      ... y {len(lote.conflictos) - 10} conflictos más'))
@@ -12,17 +12,14 @@ from programas.models import Programa
 from periodos.models import PeriodoAcademico
 from grupos.models import Grupo
 from horario.models import Horario
+from horario.conflictos import validacion_diferida
+from horario.fusionados import fusionados_diferidos
 
 
 def create_horarios_sede_centro(stdout, style):
     """Crear horarios para la sede centro"""
     stdout.write('  → Creando horarios sede centro...')
     
-    # Desconectar temporalmente la validación de horarios durante el seed
-    from django.db.models.signals import pre_save
-    from horario.signals import validar_horario
-    pre_save.disconnect(validar_horario, sender=Horario)
-    
     # Mapeo de días en español a formato consistente
     dias_map = {
         'LUNES': 'Lunes',
@@ -1310,202 +1307,204 @@ def create_horarios_sede_centro(stdout, style):
         'DERECHO E': None,
     }
 
-    for grupo_nombre, materia_nombre, profesor_nombre, dia, hora_inicio_str, hora_fin_str, espacio_nombre in horarios_data:
-        try:
-            # Aplicar mapeo de nombre informal → nombre formal de grupo DERECHO
-            grupo_nombre_resuelto = grupos_derecho_map.get(grupo_nombre, grupo_nombre)
-
-            # Buscar la asignatura - si no existe, crearla
-            asignatura = Asignatura.objects.filter(
-                Q(nombre__iexact=materia_nombre.strip()) | Q(codigo__iexact=materia_nombre.strip())
-            ).first()
-            if not asignatura:
-                # Crear la asignatura automáticamente con código único
-                import hashlib
-                codigo_base = materia_nombre.strip()[:15].upper().replace(' ', '-').replace(':', '')
-                codigo_hash = hashlib.sha256(materia_nombre.encode()).hexdigest()[:6].upper()
-                codigo_unico = f'{codigo_hash}'
+    # Los conflictos se validan en lote al final en vez de en cada guardado
+    with validacion_diferida() as lote, fusionados_diferidos():
+        for grupo_nombre, materia_nombre, profesor_nombre, dia, hora_inicio_str, hora_fin_str, espacio_nombre in horarios_data:
+            try:
+                # Aplicar mapeo de nombre informal → nombre formal de grupo DERECHO
+                grupo_nombre_resuelto = grupos_derecho_map.get(grupo_nombre, grupo_nombre)
+
+                # Buscar la asignatura - si no existe, crearla
+                asignatura = Asignatura.objects.filter(
+                    Q(nombre__iexact=materia_nombre.strip()) | Q(codigo__iexact=materia_nombre.strip())
+                ).first()
+                if not asignatura:
+                    # Crear la asignatura automáticamente con código único
+                    import hashlib
+                    codigo_base = materia_nombre.strip()[:15].upper().replace(' ', '-').replace(':', '')
+                    codigo_hash = hashlib.sha256(materia_nombre.encode()).hexdigest()[:6].upper()
+                    codigo_unico = f'{codigo_hash}'
                 
-                # Asegurar que el código sea único
-                contador = 1
-                codigo_final = codigo_unico
-                while Asignatura.objects.filter(codigo=codigo_final).exists():
-                    codigo_final = f'{codigo_unico}{contador}'
-                    contador += 1
+                    # Asegurar que el código sea único
+                    contador = 1
+                    codigo_final = codigo_unico
+                    while Asignatura.objects.filter(codigo=codigo_final).exists():
+                        codigo_final = f'{codigo_unico}{contador}'
+                        contador += 1
                 
-                asignatura = Asignatura.objects.create(
-                    nombre=materia_nombre.strip(),
-                    codigo=codigo_final,
-                    creditos=3,
-                    horas=3,
-                    tipo='mixta'
-                )
+                    asignatura = Asignatura.objects.create(
+                        nombre=materia_nombre.strip(),
+                        codigo=codigo_final,
+                        creditos=3,
+                        horas=3,
+                        tipo='mixta'
+                    )
             
-            # Buscar o crear el grupo
-            grupo = None
-            programa_detectado = determinar_programa(grupo_nombre_resuelto) if grupo_nombre_resuelto.strip() else programa_derecho
+                # Buscar o crear el grupo
+                grupo = None
+                programa_detectado = determinar_programa(grupo_nombre_resuelto) if grupo_nombre_resuelto.strip() else programa_derecho
 
-            if grupo_nombre_resuelto.strip():
-                # Extraer semestre del nombre original para validación
-                semestre_extraido = extraer_semestre(grupo_nombre)
+                if grupo_nombre_resuelto.strip():
+                    # Extraer semestre del nombre original para validación
+                    semestre_extraido = extraer_semestre(grupo_nombre)
                 
-                # ─── Grupos formales DERECHO (ej. "DERECHO A", "DERECHO B") ───
-                if grupo_nombre_resuelto.strip().upper().startswith('DERECHO '):
-                    # VALIDACIÓN REFORZADA: Buscar Con nombre Y semestre
-                    if semestre_extraido:
-                        # Construir el nombre completo con número romano (ej: "V DERECHO A")
-                        romanos = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X']
-                        nombre_completo = f'{romanos[semestre_extraido-1]} {grupo_nombre_resuelto.strip()}'
+                    # ─── Grupos formales DERECHO (ej. "DERECHO A", "DERECHO B") ───
+                    if grupo_nombre_resuelto.strip().upper().startswith('DERECHO '):
+                        # VALIDACIÓN REFORZADA: Buscar Con nombre Y semestre
+                        if semestre_extraido:
+                            # Construir el nombre completo con número romano (ej: "V DERECHO A")
+                            romanos = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X']
+                            nombre_completo = f'{romanos[semestre_extraido-1]} {grupo_nombre_resuelto.strip()}'
                         
-                        grupo = Grupo.objects.filter(
-                            periodo=periodo,
-                            programa=programa_derecho,
-                            nombre__iexact=nombre_completo,
-                            semestre=semestre_extraido
-                        ).first()
-                    else:
-                        # Fallback: buscar solo por nombre si no se pudo extraer semestre
-                        grupo = Grupo.objects.filter(
-                            periodo=periodo,
-                            programa=programa_derecho,
-                            nombre__iexact=grupo_nombre_resuelto.strip(),
-                        ).first()
+                            grupo = Grupo.objects.filter(
+                                periodo=periodo,
+                                programa=programa_derecho,
+                                nombre__iexact=nombre_completo,
+                                semestre=semestre_extraido
+                            ).first()
+                        else:
+                            # Fallback: buscar solo por nombre si no se pudo extraer semestre
+                            grupo = Grupo.objects.filter(
+                                periodo=periodo,
+                                programa=programa_derecho,
+                                nombre__iexact=grupo_nombre_resuelto.strip(),
+                            ).first()
                     
-                    if not grupo:
-                        errors.append(f'Grupo formal no encontrado en BD: {grupo_nombre_resuelto} semestre {semestre_extraido} (original: {grupo_nombre})')
-                        skipped_count += 1
-                        continue
-                else:
-                    # ─── Grupos informales: extraer semestre del texto ───
-                    semestre = extraer_semestre(grupo_nombre_resuelto)
+                        if not grupo:
+                            errors.append(f'Grupo formal no encontrado en BD: {grupo_nombre_resuelto} semestre {semestre_extraido} (original: {grupo_nombre})')
+                            skipped_count += 1
+                            continue
+                    else:
+                        # ─── Grupos informales: extraer semestre del texto ───
+                        semestre = extraer_semestre(grupo_nombre_resuelto)
 
-                    if not semestre:
-                        semestre = 1  # Default a primer semestre
+                        if not semestre:
+                            semestre = 1  # Default a primer semestre
 
-                    # Primero intentar buscar por nombre exacto
-                    grupo = Grupo.objects.filter(
-                        periodo=periodo,
-                        programa=programa_detectado,
-                        nombre__iexact=grupo_nombre_resuelto.strip()
-                    ).first()
-
-                    # Si no se encuentra, buscar por programa y semestre
-                    if not grupo:
+                        # Primero intentar buscar por nombre exacto
                         grupo = Grupo.objects.filter(
                             periodo=periodo,
                             programa=programa_detectado,
-                            semestre=semestre
+                            nombre__iexact=grupo_nombre_resuelto.strip()
                         ).first()
 
-                    if not grupo:
-                        # Crear grupo
-                        romanos = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X']
-                        nombre_grupo = f'{romanos[semestre-1]} {programa_detectado.nombre[:20]} Centro'
-                        grupo, created = Grupo.objects.get_or_create(
-                            programa=programa_detectado,
-                            periodo=periodo,
-                            semestre=semestre,
-                            nombre=nombre_grupo,
-                            defaults={'activo': True}
-                        )
-            else:
-                # Para horarios sin grupo específico, crear/usar un grupo general
-                grupo, created = Grupo.objects.get_or_create(
-                    programa=programa_derecho,
-                    periodo=periodo,
-                    semestre=1,
-                    nombre='I DERECHO GENERAL',
-                    defaults={'activo': True}
-                )
+                        # Si no se encuentra, buscar por programa y semestre
+                        if not grupo:
+                            grupo = Grupo.objects.filter(
+                                periodo=periodo,
+                                programa=programa_detectado,
+                                semestre=semestre
+                            ).first()
+
+                        if not grupo:
+                            # Crear grupo
+                            romanos = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X']
+                            nombre_grupo = f'{romanos[semestre-1]} {programa_detectado.nombre[:20]} Centro'
+                            grupo, created = Grupo.objects.get_or_create(
+                                programa=programa_detectado,
+                                periodo=periodo,
+                                semestre=semestre,
+                                nombre=nombre_grupo,
+                                defaults={'activo': True}
+                            )
+                else:
+                    # Para horarios sin grupo específico, crear/usar un grupo general
+                    grupo, created = Grupo.objects.get_or_create(
+                        programa=programa_derecho,
+                        periodo=periodo,
+                        semestre=1,
+                        nombre='I DERECHO GENERAL',
+                        defaults={'activo': True}
+                    )
             
-            if not grupo:
-                errors.append(f'Grupo no creado: {grupo_nombre}')
-                skipped_count += 1
-                continue
+                if not grupo:
+                    errors.append(f'Grupo no creado: {grupo_nombre}')
+                    skipped_count += 1
+                    continue
             
-            # Buscar el docente (puede ser null)
-            docente = None
-            if profesor_nombre.strip():
-                # Normalizar nombre para búsqueda
-                nombre_busqueda = profesor_nombre.strip().upper()
-                # Intentar búsqueda flexible
-                docente = Usuario.objects.filter(
-                    nombre__icontains=nombre_busqueda
-                ).first()
+                # Buscar el docente (puede ser null)
+                docente = None
+                if profesor_nombre.strip():
+                    # Normalizar nombre para búsqueda
+                    nombre_busqueda = profesor_nombre.strip().upper()
+                    # Intentar búsqueda flexible
+                    docente = Usuario.objects.filter(
+                        nombre__icontains=nombre_busqueda
+                    ).first()
                 
-                if not docente:
-                    # Intentar con partes del nombre
-                    partes = nombre_busqueda.split()
-                    if len(partes) >= 2:
-                        docente = Usuario.objects.filter(
-                            nombre__icontains=partes[0]
-                        ).filter(
-                            nombre__icontains=partes[-1]
-                        ).first()
+                    if not docente:
+                        # Intentar con partes del nombre
+                        partes = nombre_busqueda.split()
+                        if len(partes) >= 2:
+                            docente = Usuario.objects.filter(
+                                nombre__icontains=partes[0]
+                            ).filter(
+                                nombre__icontains=partes[-1]
+                            ).first()
             
-            # Buscar o crear el espacio físico
-            espacio_normalizado = espacio_nombre.strip()
-            espacio = EspacioFisico.objects.filter(
-                nombre__iexact=espacio_normalizado,
-                sede=sede_centro
-            ).first()
-            
-            if not espacio:
-                # Intentar búsqueda parcial
+                # Buscar o crear el espacio físico
+                espacio_normalizado = espacio_nombre.strip()
                 espacio = EspacioFisico.objects.filter(
-                    nombre__icontains=espacio_normalizado.split()[0],
+                    nombre__iexact=espacio_normalizado,
                     sede=sede_centro
                 ).first()
+            
+                if not espacio:
+                    # Intentar búsqueda parcial
+                    espacio = EspacioFisico.objects.filter(
+                        nombre__icontains=espacio_normalizado.split()[0],
+                        sede=sede_centro
+                    ).first()
                 
-            if not espacio:
-                # Crear el espacio si no existe
-                try:
-                    espacio = EspacioFisico.objects.create(
-                        nombre=espacio_normalizado,
-                        sede=sede_centro,
-                        tipo=tipo_aula,
-                        capacidad=30,  # Capacidad por defecto
-                        estado='Disponible'
-                    )
-                except Exception as e:
-                    errors.append(f'No se pudo crear espacio {espacio_nombre}: {str(e)}')
-                    skipped_count += 1
-                    continue
+                if not espacio:
+                    # Crear el espacio si no existe
+                    try:
+                        espacio = EspacioFisico.objects.create(
+                            nombre=espacio_normalizado,
+                            sede=sede_centro,
+                            tipo=tipo_aula,
+                            capacidad=30,  # Capacidad por defecto
+                            estado='Disponible'
+                        )
+                    except Exception as e:
+                        errors.append(f'No se pudo crear espacio {espacio_nombre}: {str(e)}')
+                        skipped_count += 1
+                        continue
             
-            # Normalizar día
-            dia_normalizado = dias_map.get(dia.upper().strip(), dia.strip())
+                # Normalizar día
+                dia_normalizado = dias_map.get(dia.upper().strip(), dia.strip())
             
-            # Convertir horas
-            hora_inicio = time.fromisoformat(hora_inicio_str)
-            hora_fin = time.fromisoformat(hora_fin_str)
+                # Convertir horas
+                hora_inicio = time.fromisoformat(hora_inicio_str)
+                hora_fin = time.fromisoformat(hora_fin_str)
             
-            # Crear el horario (sin validación de conflictos durante seed)
-            horario, created = Horario.objects.get_or_create(
-                grupo=grupo,
-                asignatura=asignatura,
-                dia_semana=dia_normalizado,
-                hora_inicio=hora_inicio,
-                hora_fin=hora_fin,
-                espacio=espacio,
-                defaults={
-                    'docente': docente,
-                    'estado': 'aprobado'
-                }
-            )
+                # Crear el horario (los conflictos se validan en lote al final)
+                horario, created = Horario.objects.get_or_create(
+                    grupo=grupo,
+                    asignatura=asignatura,
+                    dia_semana=dia_normalizado,
+                    hora_inicio=hora_inicio,
+                    hora_fin=hora_fin,
+                    espacio=espacio,
+                    defaults={
+                        'docente': docente,
+                        'estado': 'aprobado'
+                    }
+                )
             
-            # Si ya existía pero está pendiente, actualizarlo a aprobado
-            if not created and horario.estado == 'pendiente':
-                horario.estado = 'aprobado'
-                horario.save()
+                # Si ya existía pero está pendiente, actualizarlo a aprobado
+                if not created and horario.estado == 'pendiente':
+                    horario.estado = 'aprobado'
+                    horario.save()
             
-            if created:
-                created_count += 1
-            else:
-                skipped_count += 1
+                if created:
+                    created_count += 1
+                else:
+                    skipped_count += 1
                 
-        except Exception as e:
-            errors.append(f'Error en {materia_nombre}: {str(e)}')
-            skipped_count += 1
+            except Exception as e:
+                errors.append(f'Error en {materia_nombre}: {str(e)}')
+                skipped_count += 1
     
     total = len(horarios_data)
     stdout.write(style.SUCCESS(f'    ✓ {created_count} horarios creados, {skipped_count} omitidos ({total} totales)'))
@@ -1517,8 +1516,12 @@ def create_horarios_sede_centro(stdout, style):
         if len(errors) > 20:
             stdout.write(style.WARNING(f'      ... y {len(errors) - 20} errores más'))
     
-    # Reconectar la validación de horarios
-    pre_save.connect(validar_horario, sender=Horario)
+    if lote.conflictos:
+        stdout.write(style.WARNING(f'\n    Conflictos de espacio en los datos sembrados ({len(lote.conflictos)}):'))
+        for conflicto in lote.conflictos[:20]:
+            stdout.write(style.WARNING(f'      • {conflicto.mensaje}'))
+        if len(lote.conflictos) > 20:
+            stdout.write(style.WARNING(f'      ... y {len(lote.conflictos) - 20} conflictos más'))
 
 
 
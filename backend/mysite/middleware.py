@@ -14,28 +14,18 @@ class SedeFilterMiddleware(MiddlewareMixin):
         """
         Procesa cada request y agrega información de la sede del usuario
         """
-        # Obtener el ID de usuario desde la sesión
-        user_id = request.session.get('user_id')
-        
-        if user_id:
-            try:
-                from usuarios.models import Usuario
-                usuario = Usuario.objects.select_related('sede').get(id=user_id)
-                
-                # Agregar información de sede al request
-                request.sede_id = usuario.sede_id if usuario.sede else None
-                request.sede = usuario.sede
-                request.seccional = usuario.seccional if getattr(usuario, 'seccional_id', None) else getattr(usuario.sede, 'seccional', None)
-                request.user_obj = usuario  # También agregar el usuario completo
-                
-            except Usuario.DoesNotExist:
-                # Usuario no encontrado, establecer valores por defecto
-                request.sede_id = None
-                request.sede = None
-                request.seccional = None
-                request.user_obj = None
+        # Identidad compartida con SessionUsuarioAuthentication (ver identity.py)
+        from .identity import get_session_identity
+        usuario = get_session_identity(request)
+
+        if usuario:
+            # Agregar información de sede al request
+            request.sede_id = usuario.sede_id if usuario.sede else None
+            request.sede = usuario.sede
+            request.seccional = usuario.seccional if getattr(usuario, 'seccional_id', None) else getattr(usuario.sede, 'seccional', None)
+            request.user_obj = usuario  # También agregar el usuario completo
         else:
-            # No hay usuario autenticado
+            # No hay usuario autenticado (o ya no existe)
             request.sede_id = None
             request.sede = None
             request.seccional = None
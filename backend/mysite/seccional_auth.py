@@ -10,6 +10,7 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.exceptions import ValidationError as DRFValidationError
 
 from .auth_helpers import MISSING_SECCIONAL_MESSAGE, is_superuser_effective
+from .identity import get_session_identity
 
 
 class SessionUsuarioAuthentication(BaseAuthentication):
@@ -20,16 +21,13 @@ class SessionUsuarioAuthentication(BaseAuthentication):
     """
 
     def authenticate(self, request: Any):
-        user_id = request.session.get('user_id')
-        if not user_id:
+        if not request.session.get('user_id'):
             return None
 
-        from usuarios.models import Usuario
-
-        try:
-            usuario = Usuario.objects.select_related('sede', 'seccional').get(id=user_id, activo=True)
-        except Usuario.DoesNotExist as exc:
-            raise AuthenticationFailed('Usuario de sesión no válido.') from exc
+        # Mismo objeto que SedeFilterMiddleware dejó en request.user_obj.
+        usuario = get_session_identity(request)
+        if usuario is None or not usuario.activo:
+            raise AuthenticationFailed('Usuario de sesión no válido.')
 
         return (usuario, None)
 
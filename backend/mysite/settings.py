@@ -50,6 +50,15 @@ DEFAULT_FRONTEND_URL = 'http://localhost:5173' if DEBUG else 'https://sihul.unil
 FRONTEND_URL = os.getenv('FRONTEND_URL', DEFAULT_FRONTEND_URL).rstrip('/')
 MICROSOFT_OAUTH_ENABLED = bool(MICROSOFT_CLIENT_ID and MICROSOFT_CLIENT_SECRET)
 CHATBOT_FASTAPI_URL = os.getenv('CHATBOT_FASTAPI_URL', 'http://chatbot:8001/api/v1').rstrip('/')
+# Préstamos recurrentes sin fin ('never') guardados como una sola fila con su
+# regla en lugar de una fila por fecha (ver prestamos/ocurrencias.py).
+PRESTAMOS_OCURRENCIAS_VIRTUALES = env_bool('PRESTAMOS_OCURRENCIAS_VIRTUALES', False)
+# Escribir las notificaciones confirmadas desde un hilo de fondo en lugar de
+# dentro de la request (ver notificaciones/outbox.py).
+NOTIFICACIONES_OUTBOX_ASYNC = env_bool('NOTIFICACIONES_OUTBOX_ASYNC', False)
+# Días que se conservan las notificaciones leídas antes de archivarlas; 0 desactiva
+# el archivado automático (ver notificaciones/retencion.py).
+NOTIFICACIONES_RETENCION_DIAS = int(os.getenv('NOTIFICACIONES_RETENCION_DIAS', '90'))
 
 
 # Application definition
@@ -223,6 +232,17 @@ MEDIA_ROOT = Path(
 FINANCIERO_DOCUMENT_NETWORK_ROOT = os.getenv('FINANCIERO_DOCUMENT_NETWORK_ROOT', '')
 FINANCIERO_DOCUMENT_NETWORK_USER = os.getenv('FINANCIERO_DOCUMENT_NETWORK_USER', '')
 FINANCIERO_DOCUMENT_NETWORK_PASSWORD = os.getenv('FINANCIERO_DOCUMENT_NETWORK_PASSWORD', '')
+# Almacén de documentos por hash (financiero/services/blob_store.py)
+FINANCIERO_BLOB_ROOT = Path(os.getenv('FINANCIERO_BLOB_ROOT') or MEDIA_ROOT / 'blobs')
+FINANCIERO_BLOB_NAS_TIER = env_bool('FINANCIERO_BLOB_NAS_TIER', False)
+# Prefijo de la location interna de nginx que sirve FINANCIERO_BLOB_ROOT
+# (ver nginx2.conf). Vacío: Django envía los documentos en streaming.
+FINANCIERO_X_ACCEL_BLOBS_PREFIX = os.getenv('FINANCIERO_X_ACCEL_BLOBS_PREFIX', '')
+# Cola de tareas de financiero (financiero/tareas.py). Por defecto las copias
+# al NAS y la regeneración del expediente las ejecuta `manage.py run_jobs`
+# (servicio backend-tareas, o el que arranca start.sh). Con 0 se ejecutan al confirmar la transacción,
+# dentro de la request: solo para desarrollo sin ese servicio.
+FINANCIERO_TAREAS_ASYNC = env_bool('FINANCIERO_TAREAS_ASYNC', True)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Notificacion
+from .models import Notificacion, NotificacionArchivada
 
 @admin.register(Notificacion)
 class NotificacionAdmin(admin.ModelAdmin):
@@ -40,3 +40,11 @@ class NotificacionAdmin(admin.ModelAdmin):
         queryset.update(es_leida=False, fecha_lectura=None)
         self.message_user(request, f'{queryset.count()} notificación(es) marcada(s) como no leída(s).')
     marcar_como_no_leida.short_description = 'Marcar como no leída'
+
+
+@admin.register(NotificacionArchivada)
+class NotificacionArchivadaAdmin(admin.ModelAdmin):
+    list_display = ('tipo_notificacion', 'id_usuario', 'prioridad', 'fecha_creacion', 'fecha_archivo')
+    list_filter = ('prioridad', 'fecha_creacion')
+    search_fields = ('mensaje', 'id_usuario')
+    readonly_fields = [campo.name for campo in NotificacionArchivada._meta.fields]
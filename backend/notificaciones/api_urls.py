@@ -9,6 +9,7 @@ from .api_views import (
     NotificacionMarcarTodasLeidasAPIView,
     NotificacionMisNotificacionesAPIView,
 )
+from .views import flujo_notificaciones
 
 urlpatterns = [
     path('', NotificacionListCreateAPIView.as_view(), name='api-notificacion-list-create'),
@@ -17,5 +18,6 @@ urlpatterns = [
     path('mis-notificaciones/', NotificacionMisNotificacionesAPIView.as_view(), name='api-notificacion-mis-notificaciones'),
     path('marcar-leida/<int:id>/', NotificacionMarcarLeidaAPIView.as_view(), name='api-notificacion-marcar-leida'),
     path('marcar-todas-leidas/', NotificacionMarcarTodasLeidasAPIView.as_view(), name='api-notificacion-marcar-todas-leidas'),
+    path('flujo/', flujo_notificaciones, name='api-notificacion-flujo'),
     path('<int:pk>/', NotificacionDetailAPIView.as_view(), name='api-notificacion-detail'),
 ]
@@ -1,36 +1,14 @@
-from datetime import timedelta
-
-from django.db.models import Q
-from django.utils import timezone
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from mysite.auth_helpers import is_admin_global
 
+from .bandeja import consultar_bandeja, estadisticas_usuario, filtrar_relevantes_por_rol, invalidar_estadisticas
 from .models import Notificacion
 from .serializers import NotificacionSerializer
 
 
-TIPOS_IRRELEVANTES_NO_ADMIN = [
-    'usuario_creado',
-    'usuario_actualizado',
-    'usuario_eliminado',
-    'rol_creado',
-    'rol_actualizado',
-    'rol_eliminado',
-    'facultad_creada',
-    'facultad_actualizada',
-    'facultad_eliminada',
-    'componente_creado',
-    'componente_actualizado',
-    'componente_eliminado',
-    'componente_rol_asignado',
-    'componente_rol_actualizado',
-    'componente_rol_eliminado',
-]
-
-
 def _resolve_target_user_id(user, requested_user_id):
     if not user or not getattr(user, 'is_authenticated', False):
         return requested_user_id
@@ -41,42 +19,6 @@ def _resolve_target_user_id(user, requested_user_id):
     return user.id
 
 
-def _filter_relevantes_por_rol(queryset, user):
-    if not user or not getattr(user, 'is_authenticated', False):
-        return queryset
-
-    if is_admin_global(user):
-        return queryset
-
-    rol_nombre = (getattr(getattr(user, 'rol', None), 'nombre', '') or '').strip().lower()
-
-    if rol_nombre == 'proveedor':
-        tipos_permitidos_proveedor = [
-            'factura_etapa_actualizada',
-            'factura_devuelta',
-            'cuenta_creada',
-            'cambio_contrasena',
-            'cambio_nombre',
-            'alerta',
-            'advertencia',
-            'error',
-            'sistema',
-        ]
-        filtro_proveedor = Q()
-        for tipo in tipos_permitidos_proveedor:
-            filtro_proveedor |= Q(tipo_notificacion__iexact=tipo)
-        return queryset.filter(filtro_proveedor)
-
-    if rol_nombre in {'admin', 'admin financiero'}:
-        return queryset
-
-    filtros_admin = Q()
-    for tipo in TIPOS_IRRELEVANTES_NO_ADMIN:
-        filtros_admin |= Q(tipo_notificacion__iexact=tipo)
-
-    return queryset.exclude(filtros_admin)
-
-
 class NotificacionListCreateAPIView(generics.ListCreateAPIView):
     queryset = Notificacion.objects.all().order_by('-fecha_creacion')
     serializer_class = NotificacionSerializer
@@ -93,7 +35,7 @@ class NotificacionListCreateAPIView(generics.ListCreateAPIView):
             return queryset.none()
 
         queryset = queryset.filter(id_usuario=user.id)
-        return _filter_relevantes_por_rol(queryset, user)
+        return filtrar_relevantes_por_rol(queryset, user)
 
     def perform_create(self, serializer):
         user = getattr(self.request, 'user', None)
@@ -120,6 +62,10 @@ class NotificacionDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
 
         return queryset.filter(id_usuario=user.id)
 
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidar_estadisticas([instance.id_usuario])
+
 
 class NotificacionEstadisticasAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -132,24 +78,7 @@ class NotificacionEstadisticasAPIView(APIView):
         if not id_usuario:
             return Response({'error': 'id_usuario es requerido'}, status=status.HTTP_400_BAD_REQUEST)
 
-        queryset = Notificacion.objects.filter(id_usuario=id_usuario)
-        queryset = _filter_relevantes_por_rol(queryset, user)
-
-        total = queryset.count()
-        no_leidas = queryset.filter(es_leida=False).count()
-        leidas = total - no_leidas
-
-        por_prioridad = {
-            prioridad: queryset.filter(prioridad=prioridad).count()
-            for prioridad in ['alta', 'media', 'baja']
-        }
-
-        return Response({
-            'total': total,
-            'leidas': leidas,
-            'no_leidas': no_leidas,
-            'por_prioridad': por_prioridad,
-        }, status=status.HTTP_200_OK)
+        return Response(estadisticas_usuario(id_usuario, user), status=status.HTTP_200_OK)
 
 
 class NotificacionListAPIView(APIView):
@@ -172,7 +101,7 @@ class NotificacionListAPIView(APIView):
         if id_usuario:
             queryset = queryset.filter(id_usuario=id_usuario)
 
-        queryset = _filter_relevantes_por_rol(queryset, user)
+        queryset = filtrar_relevantes_por_rol(queryset, user)
 
         if no_leidas:
             queryset = queryset.filter(es_leida=False)
@@ -202,62 +131,24 @@ class NotificacionMisNotificacionesAPIView(APIView):
         no_leidas = request.query_params.get('no_leidas', 'false').lower() == 'true'
         pagina = max(int(request.query_params.get('pagina', 1)), 1)
         limite = min(max(int(request.query_params.get('limite', 10)), 1), 100)
-        busqueda = request.query_params.get('busqueda', '').strip()
-        tipo = request.query_params.get('tipo', '').strip()
-        prioridad = request.query_params.get('prioridad', '').strip()
-        filtro_tiempo = request.query_params.get('filtro_tiempo', '').strip()
-        categoria = request.query_params.get('categoria', '').strip()
 
         if not id_usuario:
             return Response({'error': 'id_usuario es requerido'}, status=status.HTTP_400_BAD_REQUEST)
 
-        queryset = Notificacion.objects.filter(id_usuario=id_usuario)
-        queryset = _filter_relevantes_por_rol(queryset, user)
-
-        if no_leidas:
-            queryset = queryset.filter(es_leida=False)
-
-        if busqueda:
-            queryset = queryset.filter(
-                Q(mensaje__icontains=busqueda) | Q(tipo_notificacion__icontains=busqueda)
-            )
-
-        if tipo:
-            queryset = queryset.filter(tipo_notificacion__icontains=tipo)
-
-        if categoria:
-            tipos_importantes = [
-                'solicitud', 'solicitud_espacio', 'solicitud_aprobada', 'solicitud_rechazada',
-                'horario', 'grupo', 'prestamo', 'profesor_sin_asignar', 'grupo_sin_espacio',
-                'licencia', 'periodo_academico',
-            ]
-
-            if categoria == 'importantes':
-                queryset = queryset.filter(tipo_notificacion__in=tipos_importantes, es_leida=False)
-            elif categoria == 'pendientes':
-                queryset = queryset.filter(es_leida=False)
-            elif categoria == 'leidas':
-                queryset = queryset.filter(es_leida=True)
-
-        if prioridad and prioridad in ['alta', 'media', 'baja']:
-            queryset = queryset.filter(prioridad=prioridad)
-
-        if filtro_tiempo:
-            now = timezone.now()
-            if filtro_tiempo == 'dia':
-                queryset = queryset.filter(fecha_creacion__gte=now - timedelta(days=1))
-            elif filtro_tiempo == 'semana':
-                queryset = queryset.filter(fecha_creacion__gte=now - timedelta(weeks=1))
-            elif filtro_tiempo == 'mes':
-                queryset = queryset.filter(fecha_creacion__gte=now - timedelta(days=30))
-
-        queryset = queryset.order_by('-fecha_creacion')
-        total = queryset.count()
-        inicio = (pagina - 1) * limite
-        fin = inicio + limite
-        paginadas = queryset[inicio:fin]
-
-        data = [
+        bandeja = consultar_bandeja(
+            id_usuario,
+            user,
+            no_leidas=no_leidas,
+            busqueda=request.query_params.get('busqueda', '').strip(),
+            tipo=request.query_params.get('tipo', '').strip(),
+            prioridad=request.query_params.get('prioridad', '').strip(),
+            filtro_tiempo=request.query_params.get('filtro_tiempo', '').strip(),
+            categoria=request.query_params.get('categoria', '').strip(),
+            pagina=pagina,
+            limite=limite,
+            cursor=request.query_params.get('cursor', '').strip(),
+        )
+        bandeja['notificaciones'] = [
             {
                 'id': item.id,
                 'id_usuario': item.id_usuario,
@@ -267,17 +158,10 @@ class NotificacionMisNotificacionesAPIView(APIView):
                 'fecha_creacion': item.fecha_creacion.isoformat(),
                 'prioridad': item.prioridad,
             }
-            for item in paginadas
+            for item in bandeja['notificaciones']
         ]
 
-        return Response({
-            'notificaciones': data,
-            'total': total,
-            'pagina_actual': pagina,
-            'total_paginas': (total + limite - 1) // limite,
-            'tiene_siguiente': fin < total,
-            'tiene_anterior': pagina > 1,
-        }, status=status.HTTP_200_OK)
+        return Response(bandeja, status=status.HTTP_200_OK)
 
 
 class NotificacionMarcarLeidaAPIView(APIView):
@@ -313,6 +197,7 @@ class NotificacionMarcarTodasLeidasAPIView(APIView):
             return Response({'error': 'id_usuario es requerido'}, status=status.HTTP_400_BAD_REQUEST)
 
         count = Notificacion.objects.filter(id_usuario=id_usuario, es_leida=False).update(es_leida=True)
+        invalidar_estadisticas([id_usuario])
         return Response({
             'message': f'{count} notificación(es) marcada(s) como leída(s)',
             'cantidad': count,
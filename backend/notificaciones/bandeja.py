@@ -0,0 +1,254 @@
+"""
+Consulta de la bandeja de notificaciones de un usuario.
+
+`mis_notificaciones` hacía un `count()` y un OFFSET/LIMIT sobre todas las
+notificaciones del usuario, con el filtro por rol armado como una cadena de
+`tipo_notificacion__iexact` que ningún índice resuelve. Aquí:
+
+- el filtro por rol es un `IN` sobre `Notificacion.tipo` (el tipo normalizado);
+- las páginas se piden por cursor sobre (fecha_creacion, id), apoyadas en el
+  índice (id_usuario, -fecha_creacion, -id): pedir la primera página (o la
+  siguiente) cuesta lo mismo con 50 que con 50.000 notificaciones;
+- los totales (total, no leídas, por prioridad) salen de una sola consulta
+  agregada que queda en caché por usuario hasta que cambian sus
+  notificaciones (ver signals.py).
+"""
+
+import base64
+import uuid
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from mysite.auth_helpers import is_admin_global
+
+from .models import Notificacion, normalizar_tipo
+from .push import publicar
+
+
+TIPOS_IRRELEVANTES_NO_ADMIN = [
+    'usuario_creado',
+    'usuario_actualizado',
+    'usuario_eliminado',
+    'rol_creado',
+    'rol_actualizado',
+    'rol_eliminado',
+    'facultad_creada',
+    'facultad_actualizada',
+    'facultad_eliminada',
+    'componente_creado',
+    'componente_actualizado',
+    'componente_eliminado',
+    'componente_rol_asignado',
+    'componente_rol_actualizado',
+    'componente_rol_eliminado',
+]
+
+TIPOS_PERMITIDOS_PROVEEDOR = [
+    'factura_etapa_actualizada',
+    'factura_devuelta',
+    'cuenta_creada',
+    'cambio_contrasena',
+    'cambio_nombre',
+    'alerta',
+    'advertencia',
+    'error',
+    'sistema',
+]
+
+TIPOS_IMPORTANTES = [
+    'solicitud', 'solicitud_espacio', 'solicitud_aprobada', 'solicitud_rechazada',
+    'horario', 'grupo', 'prestamo', 'profesor_sin_asignar', 'grupo_sin_espacio',
+    'licencia', 'periodo_academico',
+]
+
+PRIORIDADES = ['alta', 'media', 'baja']
+
+ESTADISTICAS_CACHE_TTL_SECONDS = 10 * 60
+NOTIFICACIONES_VERSION_CACHE_KEY = 'notificaciones:version:{id_usuario}'
+
+
+# ---------- Filtro por rol ----------
+
+def alcance_por_rol(user):
+    """'todas', 'proveedor' o 'general': qué tipos de notificación ve el usuario."""
+    if not user or not getattr(user, 'is_authenticated', False) or is_admin_global(user):
+        return 'todas'
+    rol_nombre = (getattr(getattr(user, 'rol', None), 'nombre', '') or '').strip().lower()
+    if rol_nombre == 'proveedor':
+        return 'proveedor'
+    if rol_nombre in {'admin', 'admin financiero'}:
+        return 'todas'
+    return 'general'
+
+
+def filtrar_relevantes_por_rol(queryset, user):
+    alcance = alcance_por_rol(user)
+    if alcance == 'proveedor':
+        return queryset.filter(tipo__in=TIPOS_PERMITIDOS_PROVEEDOR)
+    if alcance == 'general':
+        return queryset.exclude(tipo__in=TIPOS_IRRELEVANTES_NO_ADMIN)
+    return queryset
+
+
+def es_relevante_por_rol(tipo, user):
+    """Mismo criterio que filtrar_relevantes_por_rol para un tipo normalizado suelto."""
+    alcance = alcance_por_rol(user)
+    if alcance == 'proveedor':
+        return tipo in TIPOS_PERMITIDOS_PROVEEDOR
+    if alcance == 'general':
+        return tipo not in TIPOS_IRRELEVANTES_NO_ADMIN
+    return True
+
+
+# ---------- Estadísticas cacheadas ----------
+
+def _version(id_usuario):
+    clave = NOTIFICACIONES_VERSION_CACHE_KEY.format(id_usuario=id_usuario)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, uuid.uuid4().hex, None)
+        version = cache.get(clave)
+    return version
+
+
+def invalidar_estadisticas(ids_usuario):
+    """
+    Descarta los totales cacheados de los usuarios dados y avisa a sus
+    conexiones en vivo para que envíen los nuevos (ver push.py).
+    """
+    ids_usuario = set(ids_usuario)
+    cache.set_many({
+        NOTIFICACIONES_VERSION_CACHE_KEY.format(id_usuario=id_usuario): uuid.uuid4().hex
+        for id_usuario in ids_usuario
+    }, None)
+    publicar([(id_usuario, {'evento': 'estadisticas'}) for id_usuario in ids_usuario])
+
+
+def estadisticas_usuario(id_usuario, user):
+    """
+    {total, leidas, no_leidas, por_prioridad} de las notificaciones de
+    `id_usuario` visibles para `user`, con una consulta agregada y en caché.
+    """
+    alcance = alcance_por_rol(user)
+    clave = f'notificaciones:estadisticas:{id_usuario}:{alcance}:{_version(id_usuario)}'
+    estadisticas = cache.get(clave)
+    if estadisticas is not None:
+        return estadisticas
+
+    queryset = filtrar_relevantes_por_rol(Notificacion.objects.filter(id_usuario=id_usuario), user)
+    totales = queryset.aggregate(
+        total=Count('id'),
+        no_leidas=Count('id', filter=Q(es_leida=False)),
+        **{prioridad: Count('id', filter=Q(prioridad=prioridad)) for prioridad in PRIORIDADES},
+    )
+    estadisticas = {
+        'total': totales['total'],
+        'leidas': totales['total'] - totales['no_leidas'],
+        'no_leidas': totales['no_leidas'],
+        'por_prioridad': {prioridad: totales[prioridad] for prioridad in PRIORIDADES},
+    }
+    cache.set(clave, estadisticas, ESTADISTICAS_CACHE_TTL_SECONDS)
+    return estadisticas
+
+
+# ---------- Cursor ----------
+
+def codificar_cursor(notificacion):
+    valor = f'{notificacion.fecha_creacion.isoformat()}|{notificacion.id}'
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """(fecha_creacion, id) del cursor, o None si no es válido."""
+    try:
+        valor = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        fecha, id_ = valor.rsplit('|', 1)
+        return datetime.fromisoformat(fecha), int(id_)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+# ---------- Bandeja ----------
+
+def consultar_bandeja(
+    id_usuario, user, *, no_leidas=False, busqueda='', tipo='', prioridad='', filtro_tiempo='',
+    categoria='', pagina=1, limite=10, cursor='',
+):
+    """
+    Página de la bandeja de `id_usuario` vista por `user`.
+
+    Con `cursor` (el `siguiente_cursor` de la página anterior) o en la primera
+    página se lee por keyset sin OFFSET; `pagina` > 1 sin cursor conserva el
+    OFFSET para los clientes que saltan a una página concreta. `total` sale de
+    las estadísticas cacheadas cuando los filtros lo permiten y de un
+    `count()` del filtro completo si no, también con cursor. Devuelve un dict con las claves de la respuesta de
+    mis_notificaciones (`notificaciones` son instancias).
+    """
+    queryset = filtrar_relevantes_por_rol(Notificacion.objects.filter(id_usuario=id_usuario), user)
+    # Qué parte de las estadísticas cacheadas corresponde al filtro, si alguna
+    total_cacheado = 'no_leidas' if no_leidas else 'total'
+
+    if no_leidas:
+        queryset = queryset.filter(es_leida=False)
+
+    if busqueda:
+        queryset = queryset.filter(Q(mensaje__icontains=busqueda) | Q(tipo__contains=normalizar_tipo(busqueda)))
+        total_cacheado = None
+
+    if tipo:
+        queryset = queryset.filter(tipo__contains=normalizar_tipo(tipo))
+        total_cacheado = None
+
+    if categoria == 'importantes':
+        queryset = queryset.filter(tipo__in=TIPOS_IMPORTANTES, es_leida=False)
+        total_cacheado = None
+    elif categoria == 'pendientes':
+        queryset = queryset.filter(es_leida=False)
+        total_cacheado = 'no_leidas'
+    elif categoria == 'leidas':
+        queryset = queryset.filter(es_leida=True)
+        total_cacheado = 'leidas' if not no_leidas else None
+
+    if prioridad in PRIORIDADES:
+        queryset = queryset.filter(prioridad=prioridad)
+        total_cacheado = None
+
+    dias = {'dia': 1, 'semana': 7, 'mes': 30}.get(filtro_tiempo)
+    if dias:
+        queryset = queryset.filter(fecha_creacion__gte=timezone.now() - timedelta(days=dias))
+        total_cacheado = None
+
+    queryset = queryset.order_by('-fecha_creacion', '-id')
+    # El total es el de todo el filtro, no el que queda después del cursor
+    filtradas = queryset
+
+    posicion = decodificar_cursor(cursor) if cursor else None
+    if posicion is not None:
+        fecha, id_ = posicion
+        queryset = queryset.filter(Q(fecha_creacion__lt=fecha) | Q(fecha_creacion=fecha, id__lt=id_))
+        inicio = None
+    else:
+        inicio = (pagina - 1) * limite
+
+    # Un elemento de más indica si hay página siguiente sin contar
+    filas = list(queryset[inicio or 0:(inicio or 0) + limite + 1])
+    tiene_siguiente = len(filas) > limite
+    filas = filas[:limite]
+
+    if total_cacheado is not None:
+        total = estadisticas_usuario(id_usuario, user)[total_cacheado]
+    else:
+        total = filtradas.count()
+
+    return {
+        'notificaciones': filas,
+        'total': total,
+        'pagina_actual': pagina,
+        'total_paginas': (total + limite - 1) // limite,
+        'tiene_siguiente': tiene_siguiente,
+        'tiene_anterior': pagina > 1 or posicion is not None,
+        'siguiente_cursor': codificar_cursor(filas[-1]) if tiene_siguiente else None,
+    }
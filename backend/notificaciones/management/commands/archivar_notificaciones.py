@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notificaciones.retencion import TAMANO_LOTE, archivables, archivar_notificaciones
+
+
+class Command(BaseCommand):
+    help = (
+        "Archiva las notificaciones leidas mas antiguas que el periodo de retencion "
+        "(NOTIFICACIONES_RETENCION_DIAS). Pensado para ejecutarse a diario desde cron. "
+        "Por seguridad, sin --confirmar solo muestra una simulacion."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=None,
+            help="Antiguedad minima en dias. Por defecto NOTIFICACIONES_RETENCION_DIAS.",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=TAMANO_LOTE,
+            help=f"Notificaciones por transaccion (por defecto {TAMANO_LOTE}).",
+        )
+        parser.add_argument(
+            "--archivo",
+            default=None,
+            help="Ruta .jsonl.gz donde agregar las notificaciones en lugar de la tabla de archivo.",
+        )
+        parser.add_argument(
+            "--confirmar",
+            action="store_true",
+            help="Ejecuta el archivado real. Sin esta bandera solo simula.",
+        )
+
+    def handle(self, *args, **options):
+        dias = settings.NOTIFICACIONES_RETENCION_DIAS if options["dias"] is None else options["dias"]
+        if dias <= 0:
+            raise CommandError("El periodo de retencion debe ser mayor que cero.")
+        if options["lote"] <= 0:
+            raise CommandError("--lote debe ser mayor que cero.")
+
+        total = archivables(dias).count()
+        if total == 0:
+            self.stdout.write(
+                self.style.SUCCESS(f"No hay notificaciones leidas con mas de {dias} dias.")
+            )
+            return
+
+        destino = options["archivo"] or "la tabla de notificaciones archivadas"
+        self.stdout.write(
+            self.style.WARNING(f"Notificaciones leidas con mas de {dias} dias: {total}. Destino: {destino}.")
+        )
+
+        if not options["confirmar"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Modo simulacion: no se archivo ningun registro. "
+                    "Ejecuta nuevamente con --confirmar para archivar."
+                )
+            )
+            return
+
+        archivadas = archivar_notificaciones(
+            dias=dias, tamano_lote=options["lote"], ruta_archivo=options["archivo"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Archivado completado. Registros archivados: {archivadas}.")
+        )
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
+from notificaciones.bandeja import invalidar_estadisticas
 from notificaciones.models import Notificacion
 
 
@@ -41,7 +42,9 @@ class Command(BaseCommand):
             return
 
         with transaction.atomic():
+            ids_usuario = list(Notificacion.objects.values_list('id_usuario', flat=True).distinct())
             eliminadas, detalle = Notificacion.objects.all().delete()
+            transaction.on_commit(lambda: invalidar_estadisticas(ids_usuario))
 
         self.stdout.write(
             self.style.SUCCESS(
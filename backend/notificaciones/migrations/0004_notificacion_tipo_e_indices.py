@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+def normalizar_tipos(apps, schema_editor):
+    Notificacion = apps.get_model('notificaciones', 'Notificacion')
+    Notificacion.objects.update(tipo=Lower(Trim('tipo_notificacion')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0003_alter_notificacion_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacion',
+            name='tipo',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(normalizar_tipos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['id_usuario', 'es_leida', '-fecha_creacion'], name='idx_notif_usuario_leida_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['id_usuario', '-fecha_creacion', '-id'], name='idx_notif_usuario_fecha_id'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['id_usuario', 'tipo'], name='idx_notif_usuario_tipo'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0004_notificacion_tipo_e_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionArchivada',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('id_usuario', models.BigIntegerField()),
+                ('tipo_notificacion', models.CharField(max_length=100)),
+                ('mensaje', models.TextField()),
+                ('prioridad', models.CharField(default='media', max_length=20)),
+                ('fecha_creacion', models.DateTimeField()),
+                ('fecha_archivo', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['id_usuario', '-fecha_creacion'], name='idx_notif_arch_usuario_fecha'),
+                ],
+            },
+        ),
+    ]
@@ -1,13 +1,62 @@
 from django.db import models
+from django.db.models import Index
+
+
+def normalizar_tipo(valor):
+    """Forma canónica (minúsculas, sin espacios extremos) de un tipo de notificación."""
+    return (valor or '').strip().lower()
+
 
 class Notificacion(models.Model):
     id = models.AutoField(primary_key=True)
     id_usuario = models.BigIntegerField()
     tipo_notificacion = models.CharField(max_length=100)
+    # tipo_notificacion normalizado: los filtros por tipo son IN exactos e indexables
+    # en lugar de cadenas de `__iexact` (ver bandeja.py).
+    tipo = models.CharField(max_length=100, default='', editable=False)
     mensaje = models.TextField()
     es_leida = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     prioridad = models.CharField(max_length=20, default='media')
 
+    class Meta:
+        indexes = [
+            # Bandeja con filtro de leídas/no leídas y contador de no leídas
+            Index(fields=['id_usuario', 'es_leida', '-fecha_creacion'], name='idx_notif_usuario_leida_fecha'),
+            # Paginación por cursor (fecha_creacion, id) de la bandeja completa
+            Index(fields=['id_usuario', '-fecha_creacion', '-id'], name='idx_notif_usuario_fecha_id'),
+            Index(fields=['id_usuario', 'tipo'], name='idx_notif_usuario_tipo'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.tipo = normalizar_tipo(self.tipo_notificacion)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'tipo_notificacion' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'tipo'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.tipo_notificacion} - Usuario {self.id_usuario}"
+
+
+class NotificacionArchivada(models.Model):
+    """
+    Notificación leída que salió de la tabla principal por antigüedad (ver
+    retencion.py). Solo guarda lo necesario para consultarla: conserva el id
+    original y no tiene estado de lectura.
+    """
+    id = models.IntegerField(primary_key=True)
+    id_usuario = models.BigIntegerField()
+    tipo_notificacion = models.CharField(max_length=100)
+    mensaje = models.TextField()
+    prioridad = models.CharField(max_length=20, default='media')
+    fecha_creacion = models.DateTimeField()
+    fecha_archivo = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            Index(fields=['id_usuario', '-fecha_creacion'], name='idx_notif_arch_usuario_fecha'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo_notificacion} - Usuario {self.id_usuario} (archivada)"
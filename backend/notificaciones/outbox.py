@@ -0,0 +1,247 @@
+"""
+Bandeja de salida de notificaciones.
+
+crear_notificacion hacía un INSERT por notificación dentro de la request, a
+veces uno por administrador. Aquí las notificaciones se acumulan por
+transacción y se escriben al confirmarla:
+
+- todas las notificaciones de una transacción salen en un solo `bulk_create`
+  registrado con `transaction.on_commit`; si la transacción (o el savepoint en
+  el que se encolaron) se revierte, se descartan junto con ella;
+- las notificaciones para todos los usuarios de unos roles se expanden en la
+  base de datos con un `INSERT ... SELECT` en lugar de un bucle en Python;
+- con `settings.NOTIFICACIONES_OUTBOX_ASYNC` los lotes confirmados los escribe
+  un hilo de fondo, así que la request no espera los INSERT;
+- una vez escritas, las notificaciones se publican a las conexiones en vivo
+  de sus destinatarios (push.py).
+
+Fuera de una transacción on_commit se ejecuta de inmediato: cada llamada es su
+propio lote.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import weakref
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import BooleanField, CharField, DateTimeField, TextField, Value
+from django.utils import timezone
+
+from .bandeja import invalidar_estadisticas
+from .models import Notificacion, normalizar_tipo
+from .push import publicar
+
+logger = logging.getLogger(__name__)
+
+_lotes = threading.local()
+_cola = queue.Queue()
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+# ---------- Encolado ----------
+
+def _pendientes():
+    if not hasattr(_lotes, 'pendientes'):
+        _lotes.pendientes = {}
+    return _lotes.pendientes
+
+
+def _descartar(clave, lote):
+    pendientes = _pendientes()
+    if pendientes.get(clave) is lote:
+        del pendientes[clave]
+
+
+def _agregar(clave_lote, valor):
+    """
+    Agrega `valor` al lote de la transacción (y savepoint) actual. Cada
+    savepoint tiene su propio lote y su propio on_commit, así que revertir el
+    savepoint descarta solo las notificaciones encoladas dentro de él.
+    """
+    conexion = transaction.get_connection()
+    if not conexion.in_atomic_block:
+        _despachar({'filas': [], 'difusiones': [], 'despachado': False, clave_lote: [valor]})
+        return
+
+    clave = (conexion.alias, tuple(conexion.savepoint_ids))
+    pendientes = _pendientes()
+    lote = pendientes.get(clave)
+    if lote is None:
+        lote = pendientes[clave] = {'filas': [], 'difusiones': [], 'despachado': False}
+
+        def despachar():
+            _descartar(clave, lote)
+            _despachar(lote)
+
+        # Al revertir la transacción o el savepoint Django descarta el
+        # on_commit sin ejecutarlo; cuando se libera, el lote sale de los
+        # pendientes y la siguiente transacción empieza uno nuevo.
+        weakref.finalize(despachar, _descartar, clave, lote)
+        transaction.on_commit(despachar)
+    lote[clave_lote].append(valor)
+
+
+def encolar(id_usuario, tipo, mensaje, prioridad='media'):
+    """Encola una notificación para `id_usuario`; se escribe al confirmar la transacción."""
+    if not id_usuario:
+        return
+    _agregar('filas', Notificacion(
+        id_usuario=id_usuario,
+        tipo_notificacion=tipo,
+        tipo=normalizar_tipo(tipo),
+        mensaje=mensaje,
+        prioridad=prioridad,
+    ))
+
+
+def encolar_para_roles(roles, tipo, mensaje, prioridad='media'):
+    """Encola una notificación para cada usuario con alguno de los `roles` (por nombre)."""
+    _agregar('difusiones', (list(roles), tipo, mensaje, prioridad))
+
+
+# ---------- Escritura ----------
+
+def _difundir(roles, tipo, mensaje, prioridad):
+    """
+    INSERT ... SELECT de una notificación por usuario de `roles`. Devuelve las
+    notificaciones creadas sin guardar en memoria (con id si la base de datos
+    lo devuelve), para invalidar y publicar.
+    """
+    from usuarios.models import Usuario
+
+    fecha_creacion = timezone.now()
+    destinatarios = (
+        Usuario.objects.filter(rol__nombre__in=roles)
+        .annotate(
+            _tipo_notificacion=Value(tipo, output_field=CharField()),
+            _tipo=Value(normalizar_tipo(tipo), output_field=CharField()),
+            _mensaje=Value(mensaje, output_field=TextField()),
+            _es_leida=Value(False, output_field=BooleanField()),
+            _fecha_creacion=Value(fecha_creacion, output_field=DateTimeField()),
+            _prioridad=Value(prioridad, output_field=CharField()),
+        )
+        .values_list(
+            'id', '_tipo_notificacion', '_tipo', '_mensaje', '_es_leida', '_fecha_creacion', '_prioridad',
+        )
+        .distinct()
+    )
+    select, params = destinatarios.query.sql_with_params()
+    columnas = ', '.join(
+        connection.ops.quote_name(Notificacion._meta.get_field(campo).column)
+        for campo in ('id_usuario', 'tipo_notificacion', 'tipo', 'mensaje', 'es_leida', 'fecha_creacion', 'prioridad')
+    )
+    sql = f'INSERT INTO {connection.ops.quote_name(Notificacion._meta.db_table)} ({columnas}) {select}'
+    retorna = connection.features.can_return_rows_from_bulk_insert
+    if retorna:
+        sql += f' RETURNING {connection.ops.quote_name("id")}, {connection.ops.quote_name("id_usuario")}'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        creadas = cursor.fetchall() if retorna else [
+            (None, id_usuario)
+            for id_usuario in Usuario.objects.filter(rol__nombre__in=roles).values_list('id', flat=True).distinct()
+        ]
+    return [
+        Notificacion(
+            id=id_notificacion, id_usuario=id_usuario, tipo_notificacion=tipo, mensaje=mensaje,
+            prioridad=prioridad, fecha_creacion=fecha_creacion,
+        )
+        for id_notificacion, id_usuario in creadas
+    ]
+
+
+def serializar(notificacion):
+    """Diccionario de una notificación como lo devuelve mis_notificaciones."""
+    return {
+        "id": notificacion.id,
+        "id_usuario": notificacion.id_usuario,
+        "tipo_notificacion": notificacion.tipo_notificacion,
+        "mensaje": notificacion.mensaje,
+        "es_leida": notificacion.es_leida,
+        "fecha_creacion": notificacion.fecha_creacion.isoformat(),
+        "prioridad": notificacion.prioridad,
+    }
+
+
+def publicar_creadas(creadas):
+    """Publica notificaciones ya guardadas a las conexiones en vivo de sus destinatarios."""
+    publicar([
+        (notificacion.id_usuario, {'evento': 'notificacion', 'datos': serializar(notificacion)})
+        for notificacion in creadas
+    ])
+
+
+def escribir(lote):
+    """
+    Escribe un lote (filas y difusiones), invalida las estadísticas de sus
+    destinatarios y publica las nuevas notificaciones a sus conexiones en vivo.
+    """
+    try:
+        with transaction.atomic():
+            creadas = list(lote['filas'])
+            if creadas:
+                Notificacion.objects.bulk_create(creadas)
+            for difusion in lote['difusiones']:
+                creadas.extend(_difundir(*difusion))
+        if creadas:
+            invalidar_estadisticas(notificacion.id_usuario for notificacion in creadas)
+            publicar_creadas(creadas)
+    except Exception as e:
+        logger.error(f"Error escribiendo notificaciones: {e}")
+
+
+def _despachar(lote):
+    lote['despachado'] = True
+    if not lote['filas'] and not lote['difusiones']:
+        return
+    if getattr(settings, 'NOTIFICACIONES_OUTBOX_ASYNC', False):
+        _iniciar_hilo()
+        _cola.put(lote)
+    else:
+        escribir(lote)
+
+
+# ---------- Hilo de fondo ----------
+
+def _trabajar():
+    while True:
+        lotes = [_cola.get()]
+        # Lo que se acumuló mientras se escribía el lote anterior sale en el mismo INSERT
+        while True:
+            try:
+                lotes.append(_cola.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            escribir({
+                'filas': [fila for lote in lotes for fila in lote['filas']],
+                'difusiones': [difusion for lote in lotes for difusion in lote['difusiones']],
+            })
+        finally:
+            if _cola.empty():
+                connections.close_all()
+            for _ in lotes:
+                _cola.task_done()
+
+
+def _iniciar_hilo():
+    global _hilo
+    if _hilo is not None and _hilo.is_alive():
+        return
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_trabajar, name='notificaciones-outbox', daemon=True)
+            _hilo.start()
+
+
+def drenar():
+    """Espera a que el hilo de fondo escriba los lotes pendientes."""
+    if _hilo is not None and _hilo.is_alive():
+        _cola.join()
+
+
+atexit.register(drenar)
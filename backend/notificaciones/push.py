@@ -0,0 +1,130 @@
+"""
+Entrega en vivo de notificaciones a los clientes conectados.
+
+El frontend consultaba `estadisticas` cada 30 segundos para el contador de no
+leídas. Con el flujo SSE (views.flujo_notificaciones) cada conexión se
+suscribe aquí por usuario y recibe:
+
+- `notificacion`: una notificación nueva, publicada por outbox.escribir
+  después de guardarla;
+- `estadisticas`: aviso de que cambiaron los totales del usuario, publicado
+  por bandeja.invalidar_estadisticas; la conexión envía los nuevos totales.
+
+Sin `settings.REDIS_URL` los eventos se reparten dentro del proceso. Con Redis
+se publican en un canal compartido y cada proceso con conexiones abiertas los
+escucha desde un hilo, así que llegan sin importar qué worker escribió la
+notificación.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CANAL_REDIS = 'sihul:notificaciones'
+EVENTOS_EN_COLA_MAXIMO = 100
+
+_suscriptores = {}
+_lock = threading.Lock()
+_oyente = None
+_cliente_redis = None
+
+
+def _redis():
+    global _cliente_redis
+    if _cliente_redis is None:
+        import redis
+
+        _cliente_redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _cliente_redis
+
+
+# ---------- Suscripciones ----------
+
+def suscribir(id_usuario):
+    """
+    Registra una conexión de `id_usuario` en el bucle de eventos actual.
+    Devuelve la suscripción; sus eventos llegan a `suscripcion[1]` (asyncio.Queue).
+    """
+    suscripcion = (asyncio.get_running_loop(), asyncio.Queue(maxsize=EVENTOS_EN_COLA_MAXIMO))
+    with _lock:
+        _suscriptores.setdefault(id_usuario, set()).add(suscripcion)
+    if getattr(settings, 'REDIS_URL', None):
+        _iniciar_oyente()
+    return suscripcion
+
+
+def desuscribir(id_usuario, suscripcion):
+    with _lock:
+        conexiones = _suscriptores.get(id_usuario)
+        if conexiones is not None:
+            conexiones.discard(suscripcion)
+            if not conexiones:
+                del _suscriptores[id_usuario]
+
+
+def _poner(cola, evento):
+    try:
+        cola.put_nowait(evento)
+    except asyncio.QueueFull:
+        # Cliente que no lee: se pierde el evento, el siguiente `estadisticas` lo resincroniza
+        pass
+
+
+def _entregar(eventos):
+    with _lock:
+        destinos = [
+            (suscripcion, evento)
+            for id_usuario, evento in eventos
+            for suscripcion in _suscriptores.get(id_usuario, ())
+        ]
+    for (bucle, cola), evento in destinos:
+        try:
+            bucle.call_soon_threadsafe(_poner, cola, evento)
+        except RuntimeError:
+            # Bucle ya cerrado: la conexión se está cerrando
+            pass
+
+
+# ---------- Publicación ----------
+
+def publicar(eventos):
+    """Envía [(id_usuario, evento)] a las conexiones abiertas de cada usuario."""
+    eventos = [(id_usuario, evento) for id_usuario, evento in eventos if id_usuario]
+    if not eventos:
+        return
+    if not getattr(settings, 'REDIS_URL', None):
+        _entregar(eventos)
+        return
+    try:
+        _redis().publish(CANAL_REDIS, json.dumps(eventos, default=str))
+    except Exception as e:
+        logger.error(f"Error publicando eventos de notificaciones: {e}")
+
+
+def _escuchar():
+    while True:
+        try:
+            pubsub = _redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CANAL_REDIS)
+            for mensaje in pubsub.listen():
+                if mensaje.get('type') == 'message':
+                    _entregar([tuple(par) for par in json.loads(mensaje['data'])])
+        except Exception as e:
+            logger.error(f"Error escuchando eventos de notificaciones: {e}")
+            time.sleep(1)
+
+
+def _iniciar_oyente():
+    global _oyente
+    if _oyente is not None and _oyente.is_alive():
+        return
+    with _lock:
+        if _oyente is None or not _oyente.is_alive():
+            _oyente = threading.Thread(target=_escuchar, name='notificaciones-push', daemon=True)
+            _oyente.start()
@@ -0,0 +1,109 @@
+"""
+Retención de notificaciones.
+
+La tabla de notificaciones solo crecía: la única limpieza era borrarla entera
+con eliminar_todas_notificaciones. Aquí las notificaciones leídas más antiguas
+que `settings.NOTIFICACIONES_RETENCION_DIAS` salen de la tabla principal:
+
+- a NotificacionArchivada (por defecto), o
+- a un archivo JSON Lines comprimido con gzip, si se indica uno.
+
+Se procesan por lotes de ids crecientes, cada lote en su propia transacción,
+así que un archivado grande no bloquea la tabla ni deja un lote a medias.
+
+El archivado se ejecuta con el comando `archivar_notificaciones` (cron) o
+desde archivar_si_corresponde, que el worker de tareas en segundo plano
+(`manage.py run_jobs`, servicio backend-tareas) llama cuando no tiene
+trabajo; se archiva como mucho una vez por intervalo y nunca dentro de una
+request ni del hilo que escribe las notificaciones.
+"""
+
+import gzip
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .bandeja import invalidar_estadisticas
+from .models import Notificacion, NotificacionArchivada
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 1000
+INTERVALO_AUTOMATICO_SEGUNDOS = 24 * 60 * 60
+RETENCION_CACHE_KEY = 'notificaciones:retencion:ultima'
+
+_CAMPOS = ('id', 'id_usuario', 'tipo_notificacion', 'mensaje', 'prioridad', 'fecha_creacion')
+
+
+def archivables(dias):
+    """Notificaciones leídas con más de `dias` días."""
+    limite = timezone.now() - timedelta(days=dias)
+    return Notificacion.objects.filter(es_leida=True, fecha_creacion__lt=limite)
+
+
+def _archivar_en_tabla(filas):
+    NotificacionArchivada.objects.bulk_create(
+        [NotificacionArchivada(**fila) for fila in filas],
+        ignore_conflicts=True,
+    )
+
+
+def _archivar_en_archivo(filas, archivo):
+    for fila in filas:
+        archivo.write(json.dumps(dict(fila, fecha_creacion=fila['fecha_creacion'].isoformat()), ensure_ascii=False))
+        archivo.write('\n')
+
+
+def archivar_notificaciones(dias=None, tamano_lote=TAMANO_LOTE, ruta_archivo=None):
+    """
+    Mueve las notificaciones archivables a NotificacionArchivada o, con
+    `ruta_archivo`, al final de ese .jsonl.gz. Devuelve cuántas se movieron.
+    """
+    dias = settings.NOTIFICACIONES_RETENCION_DIAS if dias is None else dias
+    queryset = archivables(dias).order_by('id')
+    archivo = gzip.open(ruta_archivo, 'at', encoding='utf-8') if ruta_archivo else None
+    total, ultimo_id = 0, 0
+    try:
+        while True:
+            filas = list(queryset.filter(id__gt=ultimo_id).values(*_CAMPOS)[:tamano_lote])
+            if not filas:
+                break
+            ids = [fila['id'] for fila in filas]
+            if archivo is not None:
+                # En el archivo antes de borrar: un fallo deja filas repetidas, no perdidas
+                _archivar_en_archivo(filas, archivo)
+                archivo.flush()
+            with transaction.atomic():
+                if archivo is None:
+                    _archivar_en_tabla(filas)
+                Notificacion.objects.filter(id__in=ids).delete()
+                ids_usuario = {fila['id_usuario'] for fila in filas}
+                transaction.on_commit(lambda ids_usuario=ids_usuario: invalidar_estadisticas(ids_usuario))
+            total += len(filas)
+            ultimo_id = ids[-1]
+    finally:
+        if archivo is not None:
+            archivo.close()
+    return total
+
+
+def archivar_si_corresponde():
+    """
+    Archiva con la configuración por defecto si no se hizo en el último
+    intervalo. La marca en la caché compartida evita que varios procesos lo
+    hagan a la vez.
+    """
+    if settings.NOTIFICACIONES_RETENCION_DIAS <= 0:
+        return 0
+    if not cache.add(RETENCION_CACHE_KEY, timezone.now().isoformat(), INTERVALO_AUTOMATICO_SEGUNDOS):
+        return 0
+    try:
+        return archivar_notificaciones()
+    except Exception as e:
+        logger.error(f"Error archivando notificaciones: {e}")
+        return 0
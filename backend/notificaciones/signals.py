@@ -2,6 +2,7 @@
 Signals para crear notificaciones automáticas en operaciones CRUD
 """
 from django.db.models.signals import post_save, post_delete, pre_save
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import AnonymousUser
 from threading import local
@@ -20,6 +21,8 @@ from horario.models import Horario, HorarioFusionado, HorarioEstudiante
 from prestamos.models import PrestamoEspacio, TipoActividad, PrestamoRecurso
 from componentes.models import Componente, ComponenteRol
 from chatbot.models import Agente, PreguntaSugerida
+from notificaciones.bandeja import invalidar_estadisticas
+from notificaciones.outbox import encolar, encolar_para_roles
 from notificaciones.models import Notificacion
 
 logger = logging.getLogger(__name__)
@@ -55,18 +58,42 @@ class CurrentUserMiddleware:
         return response
 
 def crear_notificacion(id_usuario, tipo, mensaje, prioridad='media'):
-    """Función helper para crear notificaciones"""
+    """
+    Función helper para crear notificaciones. La notificación se encola y se
+    escribe, junto con las demás de la transacción, al confirmarla (ver outbox.py).
+    """
     try:
-        if id_usuario:
-            Notificacion.objects.create(
-                id_usuario=id_usuario,
-                tipo_notificacion=tipo,
-                mensaje=mensaje,
-                prioridad=prioridad
-            )
+        encolar(id_usuario, tipo, mensaje, prioridad)
     except Exception as e:
         logger.error(f"Error creando notificación: {e}")
 
+def crear_notificaciones_en_lote(notificaciones):
+    """
+    Encola varias notificaciones, que salen en el mismo INSERT que las demás
+    de la transacción. Recibe diccionarios con las mismas claves que
+    crear_notificacion (id_usuario, tipo, mensaje y opcionalmente prioridad).
+    """
+    try:
+        total = 0
+        for n in notificaciones:
+            if n.get('id_usuario'):
+                encolar(n['id_usuario'], n['tipo'], n['mensaje'], n.get('prioridad', 'media'))
+                total += 1
+        return total
+    except Exception as e:
+        logger.error(f"Error creando notificaciones en lote: {e}")
+        return 0
+
+def crear_notificacion_para_roles(roles, tipo, mensaje, prioridad='media'):
+    """
+    Notifica a todos los usuarios con alguno de los `roles` (por nombre). Los
+    destinatarios se expanden en la base de datos con un INSERT ... SELECT.
+    """
+    try:
+        encolar_para_roles(roles, tipo, mensaje, prioridad)
+    except Exception as e:
+        logger.error(f"Error creando notificación para roles: {e}")
+
 def obtener_id_usuario():
     """Obtiene el ID del usuario actual o retorna 1 (admin) por defecto"""
     user = get_current_user()
@@ -791,3 +818,14 @@ def pregunta_sugerida_post_delete(sender, instance, **kwargs):
         mensaje=f'Se ha eliminado una pregunta sugerida del agente {instance.agente.nombre}',
         prioridad='baja'
     )
+
+# ==================== SEÑALES PARA NOTIFICACION ====================
+
+@receiver(post_save, sender=Notificacion)
+def notificacion_post_save(sender, instance, **kwargs):
+    """
+    Descarta los totales cacheados de la bandeja del destinatario (ver
+    bandeja.py). Sin receptor de post_delete a propósito: así los borrados
+    masivos siguen siendo un solo DELETE; quien borra invalida explícitamente.
+    """
+    transaction.on_commit(lambda: invalidar_estadisticas([instance.id_usuario]))
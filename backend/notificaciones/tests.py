@@ -1,3 +1,269 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from usuarios.models import Rol, Usuario
+
+from . import outbox
+from .bandeja import consultar_bandeja, estadisticas_usuario
+from .models import Notificacion, NotificacionArchivada
+from .retencion import archivar_notificaciones
+from .signals import crear_notificacion, crear_notificacion_para_roles, crear_notificaciones_en_lote
+from .views import create_notificacion, mis_notificaciones
+
+
+class BandejaNotificacionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario = Usuario.objects.create(
+                correo='docente@sihul.local', nombre='Docente', rol=Rol.objects.create(nombre='docente'),
+                activo=True, contrasena_hash='!',
+            )
+            crear_notificaciones_en_lote(
+                [
+                    {'id_usuario': self.usuario.id, 'tipo': 'PRESTAMO_SOLICITADO', 'mensaje': f'Préstamo {n}'}
+                    for n in range(23)
+                ]
+                + [{'id_usuario': self.usuario.id, 'tipo': 'USUARIO_CREADO', 'mensaje': 'Usuario nuevo'}]
+            )
+
+    def test_paginacion_por_cursor_recorre_la_bandeja_sin_repetir(self):
+        esperados = list(
+            Notificacion.objects.filter(tipo='prestamo_solicitado').order_by('-fecha_creacion', '-id')
+            .values_list('id', flat=True)
+        )
+        vistos, cursor = [], ''
+        while True:
+            pagina = consultar_bandeja(self.usuario.id, self.usuario, limite=10, cursor=cursor)
+            vistos.extend(n.id for n in pagina['notificaciones'])
+            cursor = pagina['siguiente_cursor']
+            if not pagina['tiene_siguiente']:
+                break
+
+        # USUARIO_CREADO no es relevante para un rol que no es administrador
+        self.assertEqual(vistos, esperados)
+        self.assertIsNone(cursor)
+
+    def test_total_con_cursor_y_filtro_sin_cache(self):
+        primera = consultar_bandeja(self.usuario.id, self.usuario, limite=10, prioridad='media')
+        segunda = consultar_bandeja(
+            self.usuario.id, self.usuario, limite=10, prioridad='media', cursor=primera['siguiente_cursor'],
+        )
+
+        total = Notificacion.objects.filter(tipo='prestamo_solicitado', prioridad='media').count()
+        self.assertGreater(total, 10)
+        for pagina in (primera, segunda):
+            self.assertEqual((pagina['total'], pagina['total_paginas']), (total, (total + 9) // 10))
+
+    def test_primera_pagina_con_estadisticas_en_cache_es_una_consulta(self):
+        request = RequestFactory().get('/notificaciones/mis-notificaciones/', {'limite': 10})
+        request.user = self.usuario
+        mis_notificaciones(request)
+
+        with self.assertNumQueries(1):
+            respuesta = json.loads(mis_notificaciones(request).content)
+
+        self.assertEqual(respuesta['total'], 23)
+        self.assertEqual(respuesta['total_paginas'], 3)
+        self.assertEqual(len(respuesta['notificaciones']), 10)
+        self.assertTrue(respuesta['siguiente_cursor'])
+
+    def test_contador_de_no_leidas_se_invalida_al_leer(self):
+        self.assertEqual(estadisticas_usuario(self.usuario.id, self.usuario)['no_leidas'], 23)
+
+        notificacion = Notificacion.objects.filter(id_usuario=self.usuario.id, tipo='prestamo_solicitado').first()
+        notificacion.es_leida = True
+        with self.captureOnCommitCallbacks(execute=True):
+            notificacion.save(update_fields=['es_leida'])
+
+        with self.assertNumQueries(1):
+            estadisticas = estadisticas_usuario(self.usuario.id, self.usuario)
+        self.assertEqual((estadisticas['no_leidas'], estadisticas['leidas']), (22, 1))
+        self.assertEqual(estadisticas['por_prioridad']['media'], 23)
+
+
+class OutboxNotificacionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            admin, planeacion = Rol.objects.create(nombre='admin'), Rol.objects.create(nombre='admin_planeacion')
+            self.admins = [
+                Usuario.objects.create(
+                    correo=f'admin{n}@sihul.local', nombre=f'Admin {n}', rol=rol, activo=True, contrasena_hash='!',
+                )
+                for n, rol in enumerate([admin, admin, planeacion])
+            ]
+            self.docente = Usuario.objects.create(
+                correo='docente@sihul.local', nombre='Docente', rol=Rol.objects.create(nombre='docente'),
+                activo=True, contrasena_hash='!',
+            )
+        # Los avisos de alta de usuarios no interesan aquí
+        Notificacion.objects.all().delete()
+
+    def _inserts(self, consultas):
+        return [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('INSERT')]
+
+    def test_notificaciones_de_la_transaccion_salen_en_un_insert_al_confirmar(self):
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for n in range(5):
+                    crear_notificacion(self.docente.id, 'PRESTAMO_SOLICITADO', f'Préstamo {n}')
+                try:
+                    with transaction.atomic():
+                        crear_notificacion(self.docente.id, 'PRESTAMO_SOLICITADO', 'Revertido')
+                        raise ValueError
+                except ValueError:
+                    pass
+                self.assertFalse(Notificacion.objects.exists())
+                # El lote del savepoint revertido no queda pendiente
+                self.assertEqual(len(outbox._pendientes()), 1)
+
+        self.assertEqual(outbox._pendientes(), {})
+        self.assertEqual(len(self._inserts(consultas)), 1)
+        self.assertEqual(
+            sorted(Notificacion.objects.values_list('mensaje', flat=True)), [f'Préstamo {n}' for n in range(5)],
+        )
+        self.assertEqual(Notificacion.objects.filter(tipo='prestamo_solicitado').count(), 5)
+
+    def test_notificacion_para_roles_se_expande_con_insert_select(self):
+        self.assertEqual(estadisticas_usuario(self.admins[0].id, self.admins[0])['no_leidas'], 0)
+
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            crear_notificacion_para_roles(
+                ['admin', 'admin_planeacion'], 'SOLICITUD_ESPACIO', 'Nueva solicitud', prioridad='alta',
+            )
+
+        inserts = self._inserts(consultas)
+        self.assertEqual(len(inserts), 1)
+        self.assertIn('SELECT', inserts[0])
+        self.assertEqual(
+            sorted(Notificacion.objects.values_list('id_usuario', flat=True)), [u.id for u in self.admins],
+        )
+        notificacion = Notificacion.objects.get(id_usuario=self.admins[2].id)
+        self.assertEqual(
+            (notificacion.tipo_notificacion, notificacion.tipo, notificacion.prioridad, notificacion.es_leida),
+            ('SOLICITUD_ESPACIO', 'solicitud_espacio', 'alta', False),
+        )
+        self.assertEqual(estadisticas_usuario(self.admins[0].id, self.admins[0])['no_leidas'], 1)
+
+
+class RetencionNotificacionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        hace_un_anio = timezone.now() - timedelta(days=365)
+        for n, (es_leida, antigua) in enumerate([(True, True), (True, True), (False, True), (True, False)]):
+            notificacion = Notificacion.objects.create(
+                id_usuario=7, tipo_notificacion='PRESTAMO_APROBADO', mensaje=f'Préstamo {n}', es_leida=es_leida,
+            )
+            if antigua:
+                Notificacion.objects.filter(id=notificacion.id).update(fecha_creacion=hace_un_anio)
+
+    def test_archiva_solo_leidas_antiguas_por_lotes(self):
+        self.assertEqual(estadisticas_usuario(7, None)['total'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archivar_notificaciones(dias=90, tamano_lote=1), 2)
+
+        self.assertEqual(
+            sorted(Notificacion.objects.values_list('mensaje', flat=True)), ['Préstamo 2', 'Préstamo 3'],
+        )
+        self.assertEqual(
+            sorted(NotificacionArchivada.objects.values_list('mensaje', flat=True)), ['Préstamo 0', 'Préstamo 1'],
+        )
+        self.assertEqual(estadisticas_usuario(7, None)['total'], 2)
+
+    def test_el_worker_de_tareas_archiva_una_vez_por_intervalo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
+        self.assertEqual(NotificacionArchivada.objects.count(), 2)
+
+        Notificacion.objects.filter(es_leida=False).update(es_leida=True)
+        call_command('run_jobs', una_vez=True, hilos=1, stdout=StringIO())
+        self.assertEqual(NotificacionArchivada.objects.count(), 2)
+
+    def test_archiva_en_archivo_comprimido(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'notificaciones.jsonl.gz')
+            self.assertEqual(archivar_notificaciones(dias=90, ruta_archivo=ruta), 2)
+            with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+                filas = [json.loads(linea) for linea in archivo]
+
+        self.assertEqual([fila['mensaje'] for fila in filas], ['Préstamo 0', 'Préstamo 1'])
+        self.assertEqual(filas[0]['id_usuario'], 7)
+        self.assertFalse(NotificacionArchivada.objects.exists())
+        self.assertEqual(Notificacion.objects.count(), 2)
+
+
+class FlujoNotificacionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario = Usuario.objects.create(
+                correo='docente@sihul.local', nombre='Docente', rol=Rol.objects.create(nombre='docente'),
+                activo=True, contrasena_hash='!',
+            )
+        Notificacion.objects.all().delete()
+        sesion = SessionStore()
+        sesion['user_id'] = self.usuario.id
+        sesion.save()
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = sesion.session_key
+
+    def _notificar(self, tipo, mensaje):
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_notificacion(self.usuario.id, tipo, mensaje)
+
+    async def _leer(self, eventos):
+        cabecera, datos = (await anext(eventos)).decode().strip().split('\n')
+        return cabecera.removeprefix('event: '), json.loads(datos.removeprefix('data: '))
+
+    def test_crear_notificacion_por_la_api_se_publica_al_confirmar(self):
+        request = RequestFactory().post(
+            '/notificaciones/create/', data=json.dumps({'tipo_notificacion': 'Aviso', 'mensaje': 'Hola'}),
+            content_type='application/json',
+        )
+        request.user = self.usuario
+        with patch('notificaciones.outbox.publicar') as publicar:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = create_notificacion(request)
+                publicar.assert_not_called()
+
+        self.assertEqual(response.status_code, 201, response.content)
+        [(id_usuario, evento)] = publicar.call_args.args[0]
+        self.assertEqual(
+            (id_usuario, evento['evento'], evento['datos']['id']),
+            (self.usuario.id, 'notificacion', json.loads(response.content)['id']),
+        )
+
+    async def test_envia_estadisticas_y_las_notificaciones_nuevas(self):
+        response = await self.async_client.get('/notificaciones/flujo/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        eventos = aiter(response.streaming_content)
+        try:
+            evento, datos = await self._leer(eventos)
+            self.assertEqual((evento, datos['no_leidas']), ('estadisticas', 0))
+
+            # USUARIO_CREADO no es relevante para un docente: solo cambian los totales
+            await sync_to_async(self._notificar)('USUARIO_CREADO', 'Usuario nuevo')
+            await sync_to_async(self._notificar)('PRESTAMO_APROBADO', 'Préstamo aprobado')
+
+            evento, datos = await self._leer(eventos)
+            self.assertEqual((evento, datos['mensaje']), ('notificacion', 'Préstamo aprobado'))
+            evento, datos = await self._leer(eventos)
+            self.assertEqual((evento, datos['no_leidas']), ('estadisticas', 1))
+        finally:
+            await eventos.aclose()
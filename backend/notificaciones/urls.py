@@ -18,4 +18,5 @@ urlpatterns = [
     path('estadisticas/', views.estadisticas, name='estadisticas_notificaciones'),
     path('marcar-leida/<int:id>/', views.marcar_como_leida, name='marcar_notificacion_leida'),
     path('marcar-todas-leidas/', views.marcar_todas_como_leidas, name='marcar_todas_notificaciones_leidas'),
+    path('flujo/', views.flujo_notificaciones, name='flujo_notificaciones'),
 ]
@@ -1,8 +1,14 @@
+import asyncio
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from .models import Notificacion
-from django.http import JsonResponse
-from django.db.models import Q
+from .bandeja import consultar_bandeja, es_relevante_por_rol, estadisticas_usuario, invalidar_estadisticas
+from .models import Notificacion, normalizar_tipo
+from .outbox import publicar_creadas
+from . import push
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.core.exceptions import ValidationError
+from django.db import transaction
 import json
 from django.views.decorators.csrf import csrf_exempt
 from datetime import datetime
@@ -35,41 +41,6 @@ def _resolve_target_user_id(request, requested_user_id):
     return current_user.id
 
 
-def _filter_relevantes_por_rol(notificaciones, user):
-    if not user:
-        return notificaciones
-
-    if is_admin_global(user):
-        return notificaciones
-
-    rol_nombre = (getattr(getattr(user, 'rol', None), 'nombre', '') or '').strip().lower()
-    if rol_nombre in {'admin', 'admin financiero'}:
-        return notificaciones
-
-    tipos_irrelevantes = [
-        'usuario_creado',
-        'usuario_actualizado',
-        'usuario_eliminado',
-        'rol_creado',
-        'rol_actualizado',
-        'rol_eliminado',
-        'facultad_creada',
-        'facultad_actualizada',
-        'facultad_eliminada',
-        'componente_creado',
-        'componente_actualizado',
-        'componente_eliminado',
-        'componente_rol_asignado',
-        'componente_rol_actualizado',
-        'componente_rol_eliminado',
-    ]
-
-    filtros_admin = Q()
-    for tipo in tipos_irrelevantes:
-        filtros_admin |= Q(tipo_notificacion__iexact=tipo)
-
-    return notificaciones.exclude(filtros_admin)
-
 # ---------- Notificacion CRUD ----------
 @csrf_exempt
 def create_notificacion(request):
@@ -110,6 +81,9 @@ def create_notificacion(request):
                 es_leida=False
             )
             notif.save()
+            # Se guarda aquí (la respuesta lleva su id) pero se publica como
+            # las de la bandeja de salida; los totales los invalida post_save
+            transaction.on_commit(lambda: publicar_creadas([notif]))
             return JsonResponse({
                 "message": "Notificación creada",
                 "id": notif.id,
@@ -177,6 +151,7 @@ def delete_notificacion(request):
             if not is_admin_global(user) and notif.id_usuario != user.id:
                 return JsonResponse({"error": "No autorizado para eliminar esta notificación"}, status=403)
             notif.delete()
+            invalidar_estadisticas([notif.id_usuario])
             return JsonResponse({"message": "Notificación eliminada"}, status=200)
         except Notificacion.DoesNotExist:
             return JsonResponse({"error": "Notificación no encontrada."}, status=404)
@@ -261,11 +236,12 @@ def list_notificaciones(request):
 
 @csrf_exempt
 def mis_notificaciones(request):
-    """Obtiene las notificaciones del usuario específico con soporte para paginación y filtros"""
+    """
+    Obtiene las notificaciones del usuario específico con soporte para paginación y filtros.
+    Para páginas siguientes conviene enviar `cursor` (el `siguiente_cursor` de la
+    respuesta anterior) en lugar de `pagina`: ver bandeja.consultar_bandeja.
+    """
     if request.method == 'GET':
-        from datetime import timedelta
-        from django.utils import timezone
-
         user, auth_error = _require_auth(request)
         if auth_error:
             return auth_error
@@ -274,12 +250,7 @@ def mis_notificaciones(request):
         no_leidas = request.GET.get('no_leidas', 'false').lower() == 'true'
         pagina = int(request.GET.get('pagina', 1))
         limite = int(request.GET.get('limite', 10))
-        busqueda = request.GET.get('busqueda', '').strip()
-        tipo = request.GET.get('tipo', '').strip()
-        prioridad = request.GET.get('prioridad', '').strip()
-        filtro_tiempo = request.GET.get('filtro_tiempo', '').strip()
-        categoria = request.GET.get('categoria', '').strip()
-        
+
         current_user = user
         id_usuario_resuelto = _resolve_target_user_id(request, id_usuario)
 
@@ -291,72 +262,20 @@ def mis_notificaciones(request):
             pagina = 1
         if limite < 1 or limite > 100:
             limite = 10
-        
-        # Filtro base
-        notificaciones = Notificacion.objects.filter(id_usuario=id_usuario_resuelto)
-        notificaciones = _filter_relevantes_por_rol(notificaciones, current_user)
-        
-        # Filtro por leídas/no leídas
-        if no_leidas:
-            notificaciones = notificaciones.filter(es_leida=False)
-        
-        # Filtro por búsqueda en mensaje
-        if busqueda:
-            notificaciones = notificaciones.filter(
-                Q(mensaje__icontains=busqueda) | Q(tipo_notificacion__icontains=busqueda)
-            )
-        
-        # Filtro por categoría (SOLO 3 CATEGORÍAS PRINCIPALES)
-        if categoria:
-            TIPOS_IMPORTANTES = [
-                'solicitud', 'solicitud_espacio', 'solicitud_aprobada', 'solicitud_rechazada',
-                'horario', 'grupo', 'prestamo', 'profesor_sin_asignar', 'grupo_sin_espacio',
-                'licencia', 'periodo_academico'
-            ]
-            
-            if categoria == 'importantes':
-                # IMPORTANTES: Solo notificaciones NO LEÍDAS de tipos importantes
-                notificaciones = notificaciones.filter(
-                    tipo_notificacion__in=TIPOS_IMPORTANTES,
-                    es_leida=False
-                )
-            elif categoria == 'pendientes':
-                # PENDIENTES: Todas las notificaciones NO LEÍDAS (sin importar tipo)
-                notificaciones = notificaciones.filter(es_leida=False)
-            elif categoria == 'leidas':
-                # LEIDAS: Solo notificaciones YA LEÍDAS
-                notificaciones = notificaciones.filter(es_leida=True)
-        
-        # Filtro por prioridad
-        if prioridad and prioridad in ['alta', 'media', 'baja']:
-            notificaciones = notificaciones.filter(prioridad=prioridad)
-        
-        # Filtro por tiempo
-        if filtro_tiempo:
-            now = timezone.now()
-            if filtro_tiempo == 'dia':
-                fecha_inicio = now - timedelta(days=1)
-                notificaciones = notificaciones.filter(fecha_creacion__gte=fecha_inicio)
-            elif filtro_tiempo == 'semana':
-                fecha_inicio = now - timedelta(weeks=1)
-                notificaciones = notificaciones.filter(fecha_creacion__gte=fecha_inicio)
-            elif filtro_tiempo == 'mes':
-                fecha_inicio = now - timedelta(days=30)
-                notificaciones = notificaciones.filter(fecha_creacion__gte=fecha_inicio)
-            # 'todo' no aplica ningún filtro de tiempo
-        
-        # Ordenar por fecha de creación (más recientes primero)
-        notificaciones = notificaciones.order_by('-fecha_creacion')
-        
-        # Calcular totales antes de paginar
-        total = notificaciones.count()
-        
-        # Aplicar paginación
-        inicio = (pagina - 1) * limite
-        fin = inicio + limite
-        notificaciones_paginadas = notificaciones[inicio:fin]
-        
-        lst = [{
+
+        bandeja = consultar_bandeja(
+            id_usuario_resuelto,
+            current_user,
+            no_leidas=no_leidas,
+            busqueda=request.GET.get('busqueda', '').strip(),
+            prioridad=request.GET.get('prioridad', '').strip(),
+            filtro_tiempo=request.GET.get('filtro_tiempo', '').strip(),
+            categoria=request.GET.get('categoria', '').strip(),
+            pagina=pagina,
+            limite=limite,
+            cursor=request.GET.get('cursor', '').strip(),
+        )
+        bandeja['notificaciones'] = [{
             "id": n.id,
             "id_usuario": n.id_usuario,
             "tipo_notificacion": n.tipo_notificacion,
@@ -364,16 +283,9 @@ def mis_notificaciones(request):
             "es_leida": n.es_leida,
             "fecha_creacion": n.fecha_creacion.isoformat(),
             "prioridad": n.prioridad
-        } for n in notificaciones_paginadas]
-        
-        return JsonResponse({
-            "notificaciones": lst,
-            "total": total,
-            "pagina_actual": pagina,
-            "total_paginas": (total + limite - 1) // limite,  # Ceil division
-            "tiene_siguiente": fin < total,
-            "tiene_anterior": pagina > 1
-        }, status=200)
+        } for n in bandeja['notificaciones']]
+
+        return JsonResponse(bandeja, status=200)
 
 
 @csrf_exempt
@@ -391,23 +303,8 @@ def estadisticas(request):
         if not id_usuario_resuelto:
             return JsonResponse({"error": "id_usuario es requerido"}, status=400)
 
-        base_qs = Notificacion.objects.filter(id_usuario=id_usuario_resuelto)
-        base_qs = _filter_relevantes_por_rol(base_qs, current_user)
-        
-        total = base_qs.count()
-        no_leidas = base_qs.filter(es_leida=False).count()
-        leidas = total - no_leidas
-        
-        por_prioridad = {}
-        for prioridad in ['alta', 'media', 'baja']:
-            por_prioridad[prioridad] = base_qs.filter(prioridad=prioridad).count()
-        
-        return JsonResponse({
-            "total": total,
-            "leidas": leidas,
-            "no_leidas": no_leidas,
-            "por_prioridad": por_prioridad
-        }, status=200)
+        # Una consulta agregada, cacheada hasta que cambian las notificaciones del usuario
+        return JsonResponse(estadisticas_usuario(id_usuario_resuelto, current_user), status=200)
 
 
 @csrf_exempt
@@ -454,6 +351,7 @@ def marcar_todas_como_leidas(request):
                 id_usuario=id_usuario_resuelto,
                 es_leida=False
             ).update(es_leida=True)
+            invalidar_estadisticas([id_usuario_resuelto])
             
             return JsonResponse({
                 "message": f"{count} notificación(es) marcada(s) como leída(s)",
@@ -464,3 +362,72 @@ def marcar_todas_como_leidas(request):
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
 
+
+# ---------- Flujo en vivo (SSE) ----------
+LATIDO_SSE_SEGUNDOS = 25
+
+
+def _evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos)}\n\n"
+
+
+async def _eventos_notificaciones(id_usuario, user):
+    """
+    Eventos SSE de las notificaciones de `id_usuario`: primero sus estadísticas
+    y después cada notificación nueva y los totales cada vez que cambian. Un
+    comentario periódico mantiene abierta la conexión a través de proxies.
+    """
+    suscripcion = push.suscribir(id_usuario)
+    cola = suscripcion[1]
+    try:
+        yield _evento_sse('estadisticas', await sync_to_async(estadisticas_usuario)(id_usuario, user))
+        while True:
+            try:
+                eventos = [await asyncio.wait_for(cola.get(), timeout=LATIDO_SSE_SEGUNDOS)]
+            except asyncio.TimeoutError:
+                yield ": latido\n\n"
+                continue
+            while not cola.empty():
+                eventos.append(cola.get_nowait())
+
+            for evento in eventos:
+                datos = evento.get('datos')
+                if evento['evento'] == 'notificacion' and es_relevante_por_rol(
+                    normalizar_tipo(datos['tipo_notificacion']), user
+                ):
+                    yield _evento_sse('notificacion', datos)
+            # Varios cambios seguidos se resumen en un solo recálculo
+            if any(evento['evento'] == 'estadisticas' for evento in eventos):
+                yield _evento_sse('estadisticas', await sync_to_async(estadisticas_usuario)(id_usuario, user))
+    finally:
+        push.desuscribir(id_usuario, suscripcion)
+
+
+@csrf_exempt
+async def flujo_notificaciones(request):
+    """
+    Server-Sent Events con las notificaciones nuevas y las estadísticas del
+    usuario (eventos `notificacion` y `estadisticas`), en lugar de consultar
+    `estadisticas` periódicamente. Requiere servir la aplicación por ASGI
+    (mysite/asgi.py): por WSGI responde 501 y el cliente sigue consultando.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "El flujo en vivo requiere un servidor ASGI"}, status=501)
+
+    user, auth_error = await sync_to_async(_require_auth)(request)
+    if auth_error:
+        return auth_error
+    try:
+        id_usuario = int(await sync_to_async(_resolve_target_user_id)(request, request.GET.get('id_usuario')))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "id_usuario inválido"}, status=400)
+
+    response = StreamingHttpResponse(
+        _eventos_notificaciones(id_usuario, user), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # nginx no debe acumular la respuesta antes de enviarla
+    response['X-Accel-Buffering'] = 'no'
+    return response
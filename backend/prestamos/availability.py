@@ -4,6 +4,7 @@ from django.db.models import Q
 from horario.models import Horario
 
 from .models import PrestamoEspacio, PrestamoEspacioPublico
+from .ocurrencias import filas_en_rango
 
 
 DIAS_SEMANA = {
@@ -32,7 +33,6 @@ def validar_disponibilidad_prestamo(prestamo):
 
     filtros_prestamos = {
         'espacio_id': prestamo.espacio_id,
-        'fecha': prestamo.fecha,
         'estado__in': ['Pendiente', 'Aprobado'],
         'hora_inicio__lt': prestamo.hora_fin,
         'hora_fin__gt': prestamo.hora_inicio,
@@ -40,15 +40,26 @@ def validar_disponibilidad_prestamo(prestamo):
 
     for modelo in (PrestamoEspacio, PrestamoEspacioPublico):
         conflictos = modelo.objects.filter(**filtros_prestamos)
-        if isinstance(prestamo, modelo) and prestamo.pk:
-            conflictos = conflictos.exclude(pk=prestamo.pk)
+        reemplazada = None
+        if isinstance(prestamo, modelo):
+            if prestamo.pk:
+                conflictos = conflictos.exclude(pk=prestamo.pk)
+            # Una excepción ocupa el lugar de la ocurrencia virtual de su serie
+            reemplazada = (prestamo.prestamo_padre_id, prestamo.fecha_original)
 
-        conflicto = conflictos.order_by('hora_inicio').first()
+        conflicto = min(
+            (
+                fila for fila in filas_en_rango(conflictos, prestamo.fecha, prestamo.fecha, 'hora_inicio', 'hora_fin')
+                if (fila['id'], fila['fecha']) != reemplazada
+            ),
+            key=lambda fila: fila['hora_inicio'],
+            default=None,
+        )
         if conflicto:
             raise ValidationError(
                 f'El espacio ya está reservado el {prestamo.fecha} '
-                f'de {conflicto.hora_inicio.strftime("%H:%M")} a '
-                f'{conflicto.hora_fin.strftime("%H:%M")} por un préstamo activo.'
+                f'de {conflicto["hora_inicio"].strftime("%H:%M")} a '
+                f'{conflicto["hora_fin"].strftime("%H:%M")} por un préstamo activo.'
             )
 
     conflicto_horario = Horario.objects.filter(
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prestamos', '0009_prestamoespacio_periodo_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prestamoespacio',
+            name='ocurrencias_virtuales',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='prestamoespacio',
+            name='fecha_original',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prestamoespaciopublico',
+            name='ocurrencias_virtuales',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='prestamoespaciopublico',
+            name='fecha_original',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -72,6 +72,11 @@ class PrestamoEspacio(models.Model):
     fin_repeticion_tipo = models.CharField(max_length=20, choices=FIN_REPETICION_CHOICES, default='never')
     fin_repeticion_fecha = models.DateField(null=True, blank=True)
     fin_repeticion_ocurrencias = models.PositiveIntegerField(null=True, blank=True)
+    # Serie guardada como regla: sus ocurrencias se calculan por rango de
+    # fechas (ver prestamos/ocurrencias.py) y solo las excepciones son filas.
+    ocurrencias_virtuales = models.BooleanField(default=False)
+    # En una excepción, la fecha de la ocurrencia virtual que reemplaza.
+    fecha_original = models.DateField(null=True, blank=True)
     fecha = models.DateField()
     hora_inicio = models.TimeField()
     hora_fin = models.TimeField()
@@ -156,6 +161,11 @@ class PrestamoEspacioPublico(models.Model):
     fin_repeticion_tipo = models.CharField(max_length=20, choices=FIN_REPETICION_CHOICES, default='never')
     fin_repeticion_fecha = models.DateField(null=True, blank=True)
     fin_repeticion_ocurrencias = models.PositiveIntegerField(null=True, blank=True)
+    # Serie guardada como regla: sus ocurrencias se calculan por rango de
+    # fechas (ver prestamos/ocurrencias.py) y solo las excepciones son filas.
+    ocurrencias_virtuales = models.BooleanField(default=False)
+    # En una excepción, la fecha de la ocurrencia virtual que reemplaza.
+    fecha_original = models.DateField(null=True, blank=True)
     fecha = models.DateField()
     hora_inicio = models.TimeField()
     hora_fin = models.TimeField()
@@ -0,0 +1,274 @@
+"""
+Ocurrencias virtuales de préstamos recurrentes sin fin.
+
+Una serie con `fin_repeticion_tipo='never'` se materializaba como una fila por
+fecha hasta el fin del periodo académico (o el horizonte de respaldo). Con
+`settings.PRESTAMOS_OCURRENCIAS_VIRTUALES` la serie se guarda como una sola
+fila base con `ocurrencias_virtuales=True` y su regla (frecuencia, intervalo,
+dias_semana); las demás fechas se calculan solo para el rango que pide cada
+consulta (disponibilidad, ocupación, listados).
+
+Solo las excepciones son filas: una ocurrencia editada o cancelada se guarda
+como hija de la base (`prestamo_padre`) con `fecha_original` igual a la fecha
+virtual que reemplaza. Una excepción cancelada queda con estado 'Rechazado',
+así que deja de ocupar el espacio sin que la regla vuelva a generarla.
+
+Cada ocurrencia virtual toma el periodo académico de su propia fecha (o
+ninguno si ese periodo aún no existe), no el de la fila base.
+"""
+
+import calendar
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+FRECUENCIAS_VIRTUALES = ('daily', 'weekdays', 'weekly', 'monthly')
+
+_CAMPOS_REGLA = (
+    'id', 'fecha', 'frecuencia', 'intervalo', 'dias_semana',
+    'fin_repeticion_tipo', 'fin_repeticion_fecha', 'ocurrencias_virtuales',
+)
+
+
+def sumar_meses(fecha, meses):
+    """Misma fecha `meses` después, recortada al último día del mes si hace falta."""
+    indice = fecha.month - 1 + meses
+    anio = fecha.year + indice // 12
+    mes = indice % 12 + 1
+    return datetime.date(anio, mes, min(fecha.day, calendar.monthrange(anio, mes)[1]))
+
+
+def usar_ocurrencias_virtuales(recurrencia):
+    """Si una serie con esta recurrencia se guarda como regla en lugar de por fechas."""
+    from django.conf import settings
+
+    return bool(
+        getattr(settings, 'PRESTAMOS_OCURRENCIAS_VIRTUALES', False)
+        and recurrencia['es_recurrente']
+        and recurrencia['fin_repeticion_tipo'] == 'never'
+        and recurrencia['frecuencia'] in FRECUENCIAS_VIRTUALES
+    )
+
+
+def regla(prestamo):
+    """Recurrencia de una fila (instancia o diccionario de `.values()`)."""
+    if isinstance(prestamo, dict):
+        return prestamo
+    return {campo: getattr(prestamo, campo) for campo in _CAMPOS_REGLA}
+
+
+def fechas_de_regla(fecha_base, recurrencia, desde, hasta):
+    """
+    Fechas de la serie dentro de [desde, hasta], sin la fecha base (que es la
+    propia fila). Mismo calendario que _generar_fechas_ocurrencias en views.py,
+    pero saltando directamente al inicio del rango en lugar de recorrer la
+    serie desde su primera fecha.
+    """
+    inicio = max(desde, fecha_base + datetime.timedelta(days=1))
+    if recurrencia['fin_repeticion_tipo'] == 'until_date' and recurrencia['fin_repeticion_fecha']:
+        hasta = min(hasta, recurrencia['fin_repeticion_fecha'])
+    if inicio > hasta:
+        return []
+
+    frecuencia = recurrencia['frecuencia']
+    intervalo = max(1, recurrencia['intervalo'] or 1)
+    fechas = []
+
+    if frecuencia == 'daily':
+        saltos = -(-(inicio - fecha_base).days // intervalo)
+        fecha = fecha_base + datetime.timedelta(days=saltos * intervalo)
+        while fecha <= hasta:
+            fechas.append(fecha)
+            fecha += datetime.timedelta(days=intervalo)
+
+    elif frecuencia == 'weekdays':
+        fecha = inicio
+        while fecha <= hasta:
+            if fecha.weekday() < 5:
+                fechas.append(fecha)
+            fecha += datetime.timedelta(days=1)
+
+    elif frecuencia == 'weekly':
+        dias_semana = sorted(set(recurrencia['dias_semana'] or [fecha_base.weekday()]))
+        lunes_base = fecha_base - datetime.timedelta(days=fecha_base.weekday())
+        semana = (inicio - lunes_base).days // 7 // intervalo
+        while True:
+            lunes_semana = lunes_base + datetime.timedelta(weeks=semana * intervalo)
+            if lunes_semana > hasta:
+                break
+            for dia in dias_semana:
+                candidata = lunes_semana + datetime.timedelta(days=dia)
+                if inicio <= candidata <= hasta:
+                    fechas.append(candidata)
+            semana += 1
+
+    elif frecuencia == 'monthly':
+        meses = (inicio.year - fecha_base.year) * 12 + inicio.month - fecha_base.month
+        i = max(0, meses // intervalo - 1)
+        while True:
+            fecha = sumar_meses(fecha_base, i * intervalo)
+            if fecha > hasta:
+                break
+            if fecha >= inicio:
+                fechas.append(fecha)
+            i += 1
+
+    return fechas
+
+
+def _excepciones(modelo, bases_ids, desde, hasta):
+    """{(base_id, fecha_original)} de las excepciones ya guardadas en el rango."""
+    if not bases_ids:
+        return set()
+    return set(modelo.objects.filter(
+        prestamo_padre_id__in=bases_ids,
+        fecha_original__range=(desde, hasta),
+    ).values_list('prestamo_padre_id', 'fecha_original'))
+
+
+def _en_rango_o_regla(queryset, desde, hasta):
+    # Las bases anteriores al rango solo se leen para expandir su regla
+    return queryset.filter(
+        Q(fecha__range=(desde, hasta))
+        | Q(ocurrencias_virtuales=True, prestamo_padre__isnull=True, fecha__lt=desde)
+    )
+
+
+def _expandir(filas, modelo, desde, hasta):
+    """[(fila, fecha)] de las filas reales del rango y de cada ocurrencia virtual."""
+    bases = [fila for fila in filas if regla(fila)['ocurrencias_virtuales']]
+    excluidas = _excepciones(modelo, [regla(base)['id'] for base in bases], desde, hasta)
+
+    resultado = [(fila, regla(fila)['fecha']) for fila in filas if regla(fila)['fecha'] >= desde]
+    for base in bases:
+        datos = regla(base)
+        resultado.extend(
+            (base, fecha)
+            for fecha in fechas_de_regla(datos['fecha'], datos, desde, hasta)
+            if (datos['id'], fecha) not in excluidas
+        )
+    return resultado
+
+
+def periodos_por_fecha(desde, hasta):
+    """
+    Función fecha -> PeriodoAcademico (o None) para fechas en [desde, hasta],
+    con una sola consulta y el mismo criterio que asignar_periodo_prestamo.
+    """
+    from periodos.models import PeriodoAcademico
+
+    periodos = list(PeriodoAcademico.objects.filter(
+        fecha_inicio__lte=hasta,
+        fecha_fin__gte=desde,
+    ).order_by('-fecha_inicio', '-id'))
+    return lambda fecha: next((p for p in periodos if p.fecha_inicio <= fecha <= p.fecha_fin), None)
+
+
+def filas_en_rango(queryset, desde, hasta, *campos):
+    """
+    Diccionarios con `campos` de las filas de `queryset` con fecha en
+    [desde, hasta], más uno por cada ocurrencia virtual del rango (con su
+    fecha en lugar de la de la base). Una consulta, más otra para las
+    excepciones solo si aparece alguna serie virtual (y otra para los
+    periodos si se pide `periodo_id`).
+    """
+    filas = list(_en_rango_o_regla(queryset, desde, hasta).values(*dict.fromkeys(campos + _CAMPOS_REGLA)))
+    resultado = []
+    periodo_de = None
+    for fila, fecha in _expandir(filas, queryset.model, desde, hasta):
+        if fila['fecha'] == fecha:
+            resultado.append(dict(fila))
+            continue
+        virtual = dict(fila, fecha=fecha)
+        if 'periodo_id' in campos:
+            periodo_de = periodo_de or periodos_por_fecha(desde, hasta)
+            periodo = periodo_de(fecha)
+            virtual['periodo_id'] = periodo.id if periodo else None
+        resultado.append(virtual)
+    return resultado
+
+
+def instancia_virtual(base, fecha, periodo=None):
+    """
+    Ocurrencia `fecha` de la serie `base` como instancia sin guardar (pk
+    None), con `periodo` como periodo académico de esa fecha.
+    """
+    modelo = type(base)
+    ocurrencia = modelo(**{
+        campo.attname: getattr(base, campo.attname)
+        for campo in modelo._meta.concrete_fields
+        if not campo.primary_key
+    })
+    for campo in modelo._meta.concrete_fields:
+        if campo.is_relation and campo.is_cached(base):
+            campo.set_cached_value(ocurrencia, campo.get_cached_value(base))
+    ocurrencia.fecha = fecha
+    ocurrencia.fecha_original = fecha
+    ocurrencia.periodo = periodo
+    ocurrencia.prestamo_padre = base
+    ocurrencia.es_ocurrencia_generada = True
+    ocurrencia.ocurrencias_virtuales = False
+    return ocurrencia
+
+
+def prestamos_en_rango(queryset, desde, hasta):
+    """
+    Instancias de `queryset` con fecha en [desde, hasta], en el orden del
+    queryset, seguidas de las ocurrencias virtuales del rango (sin pk, ver
+    instancia_virtual). Las relaciones cargadas con select_related o
+    prefetch_related en la base quedan disponibles en sus ocurrencias vía
+    `prestamo_padre`.
+    """
+    filas = list(_en_rango_o_regla(queryset, desde, hasta))
+    expandidas = _expandir(filas, queryset.model, desde, hasta)
+    periodo_de = None
+    if any(fila.fecha != fecha for fila, fecha in expandidas):
+        periodo_de = periodos_por_fecha(desde, hasta)
+    return [
+        fila if fila.fecha == fecha else instancia_virtual(fila, fecha, periodo_de(fecha))
+        for fila, fecha in expandidas
+    ]
+
+
+def excepciones_conservadas(base, fechas):
+    """
+    Excepciones guardadas de `base` cuya `fecha_original` sigue siendo una
+    fecha de la serie con su regla actual (`fechas` si la serie se guarda por
+    fechas). Al actualizar la serie se conservan, con sus cambios o su
+    cancelación, en lugar de volver a generar esa fecha.
+    """
+    excepciones = type(base).objects.filter(prestamo_padre=base, fecha_original__isnull=False)
+    if base.ocurrencias_virtuales:
+        datos = regla(base)
+        return [
+            excepcion for excepcion in excepciones
+            if fechas_de_regla(base.fecha, datos, excepcion.fecha_original, excepcion.fecha_original)
+        ]
+    fechas = set(fechas) - {base.fecha}
+    return [excepcion for excepcion in excepciones if excepcion.fecha_original in fechas]
+
+
+def materializar_ocurrencia(base, fecha, **cambios):
+    """
+    Guarda como excepción la ocurrencia virtual `fecha` de la serie `base`,
+    con `cambios` aplicados (p.ej. estado='Rechazado' para cancelarla).
+    Devuelve (ocurrencia, creada) como get_or_create: si la excepción ya
+    existe se devuelve sin cambios. El guardado normal (señales) asigna el
+    periodo (ninguno si el de esa fecha aún no existe) y valida la
+    disponibilidad de la nueva fila.
+    """
+    modelo = type(base)
+    if not base.ocurrencias_virtuales or fecha not in fechas_de_regla(base.fecha, regla(base), fecha, fecha):
+        raise ValidationError(f'La fecha {fecha} no corresponde a una ocurrencia de la serie.')
+
+    existente = modelo.objects.filter(prestamo_padre=base, fecha_original=fecha).first()
+    if existente is not None:
+        return existente, False
+
+    ocurrencia = instancia_virtual(base, fecha)
+    for campo, valor in cambios.items():
+        setattr(ocurrencia, campo, valor)
+    ocurrencia.save()
+    return ocurrencia, True
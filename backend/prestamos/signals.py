@@ -17,6 +17,11 @@ def asignar_periodo_prestamo(sender, instance, **kwargs):
     ).order_by('-fecha_inicio', '-id').first()
 
     if periodo is None:
+        # Una excepción de una serie guardada como regla puede caer en un
+        # periodo que todavía no se ha creado: se guarda sin periodo.
+        if instance.fecha_original is not None:
+            instance.periodo = None
+            return
         raise ValidationError(
             f'La fecha del préstamo ({instance.fecha}) no está dentro de ningún periodo activo.'
         )
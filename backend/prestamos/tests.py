@@ -1,12 +1,31 @@
 import datetime
+import json
 
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
+from asignaturas.models import Asignatura
 from espacios.models import EspacioFisico, TipoEspacio
-from prestamos.models import PrestamoEspacio, PrestamoRecurso, TipoActividad
+from facultades.models import Facultad
+from grupos.models import Grupo
+from horario.conflictos import validate_many
+from horario.models import Horario
+from espacios.ocupacion import MatrizOcupacion
+from notificaciones.models import Notificacion
+from periodos.models import PeriodoAcademico
+from prestamos.models import PrestamoEspacio, PrestamoEspacioPublico, PrestamoRecurso, TipoActividad
 from prestamos.serializers import PrestamoEspacioSerializer
+from prestamos.ocurrencias import fechas_de_regla, prestamos_en_rango
+from prestamos.views import (
+    _generar_fechas_ocurrencias, check_series_disponible, create_prestamo, materializar_ocurrencia_prestamo,
+    update_prestamo,
+)
+from programas.models import Programa
 from recursos.models import Recurso
 from sedes.models import Sede
+from usuarios.models import Usuario
 
 
 class PrestamoEspacioSerializerRecursosTests(TestCase):
@@ -60,3 +79,282 @@ class PrestamoEspacioSerializerRecursosTests(TestCase):
                 'cantidad': 2,
             }],
         )
+
+
+class SeriesPrestamoTests(TestCase):
+    def setUp(self):
+        sede = Sede.objects.create(nombre='Sede de prueba')
+        self.espacio = EspacioFisico.objects.create(
+            nombre='Espacio de prueba',
+            sede=sede,
+            tipo=TipoEspacio.objects.create(nombre='Aula de prueba'),
+            capacidad=30,
+        )
+        self.periodo = PeriodoAcademico.objects.create(
+            nombre='2026-2',
+            fecha_inicio=datetime.date(2026, 7, 20),
+            fecha_fin=datetime.date(2026, 11, 30),
+        )
+        self.tipo_actividad = TipoActividad.objects.create(nombre='Actividad de prueba')
+        # Lunes semanales del 3 de agosto al 5 de octubre de 2026
+        self.lunes = [datetime.date(2026, 8, 3) + datetime.timedelta(weeks=n) for n in range(10)]
+
+    def _crear_prestamo(self, modelo, fecha, **extra):
+        return modelo.objects.create(
+            espacio=self.espacio,
+            tipo_actividad=self.tipo_actividad,
+            fecha=fecha,
+            hora_inicio=datetime.time(9, 0),
+            hora_fin=datetime.time(10, 0),
+            estado='Aprobado',
+            **extra,
+        )
+
+    def test_conflictos_por_fecha_con_tres_consultas(self):
+        programa = Programa.objects.create(
+            nombre='Programa', facultad=Facultad.objects.create(nombre='Facultad', sede=self.espacio.sede),
+        )
+        Horario.objects.create(
+            grupo=Grupo.objects.create(nombre='A', programa=programa, periodo=self.periodo, semestre=1),
+            asignatura=Asignatura.objects.create(nombre='Derecho Civil', codigo='DER-001', creditos=3, horas=2),
+            espacio=self.espacio,
+            dia_semana='Lunes',
+            hora_inicio=datetime.time(8, 0),
+            hora_fin=datetime.time(10, 0),
+            # La clase arranca a mitad de la serie
+            fecha_inicio=self.lunes[6],
+            estado='aprobado',
+        )
+        propio = self._crear_prestamo(PrestamoEspacio, self.lunes[1])
+        self._crear_prestamo(
+            PrestamoEspacioPublico, self.lunes[3],
+            nombre_solicitante='Ana', correo_solicitante='ana@example.com', telefono_solicitante='300',
+            identificacion_solicitante='1',
+        )
+
+        with self.assertNumQueries(3):
+            conflictos = check_series_disponible(
+                self.espacio.id, self.lunes, datetime.time(9, 30), datetime.time(11, 0),
+            )
+
+        self.assertEqual(sorted(conflictos), [self.lunes[1], self.lunes[3]] + self.lunes[6:])
+        self.assertIn('Préstamo Usuario', conflictos[self.lunes[1]])
+        self.assertIn('Préstamo Público', conflictos[self.lunes[3]])
+        self.assertIn('Derecho Civil', conflictos[self.lunes[6]])
+
+        # Al editar, el propio préstamo no cuenta como conflicto
+        conflictos = check_series_disponible(
+            self.espacio.id, self.lunes[:6], '09:30', '11:00', prestamo_id=propio.id,
+        )
+        self.assertEqual(list(conflictos), [self.lunes[3]])
+
+
+    def test_create_prestamo_inserta_la_serie_y_sus_recursos_en_lote(self):
+        usuario = Usuario.objects.create(
+            correo='docente@sihul.local', nombre='Docente', activo=True, contrasena_hash='!',
+        )
+        recursos = [Recurso.objects.create(nombre=f'Recurso {n}') for n in range(3)]
+        request = RequestFactory().post('/prestamos/create/', data=json.dumps({
+            'espacio_id': self.espacio.id,
+            'usuario_id': usuario.id,
+            'tipo_actividad_id': self.tipo_actividad.id,
+            'fecha': self.lunes[0].isoformat(),
+            'hora_inicio': '09:00',
+            'hora_fin': '10:00',
+            'es_recurrente': True,
+            'frecuencia': 'weekly',
+            'dias_semana': [0],
+            'fin_repeticion_tipo': 'count',
+            'fin_repeticion_ocurrencias': 10,
+            'recursos': [{'recurso_id': recurso.id, 'cantidad': 1} for recurso in recursos],
+        }), content_type='application/json')
+        request.user = usuario
+
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            response = create_prestamo(request)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(json.loads(response.content)['ocurrencias_creadas'], 10)
+        self.assertEqual(
+            sorted(PrestamoEspacio.objects.values_list('fecha', flat=True)), self.lunes,
+        )
+        self.assertEqual(PrestamoRecurso.objects.count(), 30)
+        self.assertFalse(PrestamoEspacio.objects.filter(periodo__isnull=True).exists())
+        inserts = [q for q in consultas.captured_queries if q['sql'].startswith('INSERT')]
+        # Préstamo base, ocurrencias, recursos y todas las notificaciones en un lote al confirmar
+        self.assertEqual(len(inserts), 4)
+        self.assertEqual(Notificacion.objects.filter(tipo_notificacion='PRESTAMO_SOLICITADO').count(), 2)
+
+    def test_reglas_coinciden_con_la_expansion_completa(self):
+        base = datetime.date(2026, 1, 31)
+        horizonte = datetime.date(2027, 6, 30)
+        for frecuencia, intervalo, dias_semana in (
+            ('daily', 3, []), ('weekdays', 1, []), ('weekly', 2, [1, 5]), ('monthly', 1, []),
+        ):
+            recurrencia = {
+                'es_recurrente': True, 'frecuencia': frecuencia, 'intervalo': intervalo,
+                'dias_semana': dias_semana, 'fin_repeticion_tipo': 'never',
+                'fin_repeticion_fecha': None, 'fin_repeticion_ocurrencias': None,
+            }
+            completas = [
+                fecha for fecha in _generar_fechas_ocurrencias(
+                    base, recurrencia, horizonte_fecha=horizonte, limite_ocurrencias=10000,
+                ) if fecha != base
+            ]
+            self.assertEqual(fechas_de_regla(base, recurrencia, base, horizonte), completas, frecuencia)
+            desde, hasta = datetime.date(2026, 11, 15), datetime.date(2027, 2, 10)
+            self.assertEqual(
+                fechas_de_regla(base, recurrencia, desde, hasta),
+                [fecha for fecha in completas if desde <= fecha <= hasta],
+                frecuencia,
+            )
+
+    @override_settings(PRESTAMOS_OCURRENCIAS_VIRTUALES=True)
+    def test_serie_sin_fin_se_guarda_como_regla_y_se_expande_por_rango(self):
+        usuario = Usuario.objects.create(
+            correo='docente@sihul.local', nombre='Docente', activo=True, contrasena_hash='!',
+        )
+        factory = RequestFactory()
+        request = factory.post('/prestamos/', data=json.dumps({
+            'espacio_id': self.espacio.id,
+            'usuario_id': usuario.id,
+            'tipo_actividad_id': self.tipo_actividad.id,
+            'fecha': self.lunes[0].isoformat(),
+            'hora_inicio': '09:00',
+            'hora_fin': '10:00',
+            'estado': 'Aprobado',
+            'es_recurrente': True,
+            'frecuencia': 'weekly',
+            'dias_semana': [0],
+            'fin_repeticion_tipo': 'never',
+        }), content_type='application/json')
+        request.user = usuario
+        response = create_prestamo(request)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        base = PrestamoEspacio.objects.get()
+        self.assertTrue(base.ocurrencias_virtuales)
+
+        # Las ocurrencias virtuales ocupan el espacio en disponibilidad y ocupación
+        conflictos = check_series_disponible(self.espacio.id, self.lunes[4:6], '09:30', '11:00')
+        self.assertEqual(sorted(conflictos), self.lunes[4:6])
+        matriz = MatrizOcupacion.construir(
+            None, self.lunes[5], self.lunes[5] + datetime.timedelta(days=5), ['aprobado'],
+        )
+        self.assertEqual(matriz.usos_espacio(self.espacio.id), 1)
+
+        # Cancelar una fecha la materializa como excepción y la libera
+        request = factory.post('/prestamos/ocurrencias/materializar/', data=json.dumps({
+            'id': base.id, 'fecha': self.lunes[5].isoformat(), 'cancelar': True,
+        }), content_type='application/json')
+        request.user = usuario
+        response = materializar_ocurrencia_prestamo(request)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        conflictos = check_series_disponible(self.espacio.id, self.lunes[4:6], '09:30', '11:00')
+        self.assertEqual(list(conflictos), [self.lunes[4]])
+
+        ventana = prestamos_en_rango(PrestamoEspacio.objects.all(), self.lunes[3], self.lunes[6])
+        self.assertEqual(
+            sorted((prestamo.fecha, prestamo.pk is None, prestamo.estado) for prestamo in ventana),
+            [
+                (self.lunes[3], True, 'Aprobado'),
+                (self.lunes[4], True, 'Aprobado'),
+                (self.lunes[5], False, 'Rechazado'),
+                (self.lunes[6], True, 'Aprobado'),
+            ],
+        )
+        self.assertEqual(PrestamoEspacio.objects.count(), 2)
+
+    @override_settings(PRESTAMOS_OCURRENCIAS_VIRTUALES=True)
+    def test_excepciones_periodos_y_horarios_de_series_guardadas_como_regla(self):
+        periodo_siguiente = PeriodoAcademico.objects.create(
+            nombre='2027-1', fecha_inicio=datetime.date(2027, 1, 18), fecha_fin=datetime.date(2027, 5, 31),
+        )
+        regla_semanal = {
+            'es_recurrente': True, 'frecuencia': 'weekly', 'intervalo': 1, 'dias_semana': [0],
+            'fin_repeticion_tipo': 'never', 'ocurrencias_virtuales': True,
+        }
+        base = self._crear_prestamo(PrestamoEspacio, self.lunes[0], **regla_semanal)
+        usuario = Usuario.objects.create(
+            correo='docente@sihul.local', nombre='Docente', activo=True, contrasena_hash='!',
+        )
+        factory = RequestFactory()
+
+        def materializar(datos, user=usuario):
+            request = factory.post(
+                '/prestamos/ocurrencias/materializar/', data=json.dumps(datos), content_type='application/json',
+            )
+            request.user = user
+            return materializar_ocurrencia_prestamo(request)
+
+        # Cada ocurrencia virtual toma el periodo de su fecha (o ninguno)
+        ventana = prestamos_en_rango(
+            PrestamoEspacio.objects.all(), datetime.date(2027, 1, 18), datetime.date(2027, 1, 18),
+        )
+        self.assertEqual([prestamo.periodo for prestamo in ventana], [periodo_siguiente])
+        sin_periodo = datetime.date(2026, 12, 28)
+        ventana = prestamos_en_rango(PrestamoEspacio.objects.all(), sin_periodo, sin_periodo)
+        self.assertEqual([prestamo.periodo for prestamo in ventana], [None])
+
+        # Cuerpo mal formado y fecha inválida se distinguen
+        request = factory.post(
+            '/prestamos/ocurrencias/materializar/', data='{"id": ', content_type='application/json',
+        )
+        request.user = usuario
+        response = materializar_ocurrencia_prestamo(request)
+        self.assertEqual(json.loads(response.content), {'error': 'JSON inválido.'})
+        response = materializar({'id': base.id, 'fecha': '28/12/2026'})
+        self.assertEqual(json.loads(response.content), {'error': 'Formato de fecha inválido.'})
+
+        # Una fecha sin periodo también se puede cancelar
+        response = materializar({'id': base.id, 'fecha': sin_periodo.isoformat(), 'cancelar': True})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIsNone(PrestamoEspacio.objects.get(fecha_original=sin_periodo).periodo)
+        response = materializar({'id': base.id, 'fecha': self.lunes[5].isoformat(), 'cancelar': True})
+        self.assertEqual(response.status_code, 201, response.content)
+
+        # Un horario choca con una fecha virtual de la serie
+        programa = Programa.objects.create(
+            nombre='Programa', facultad=Facultad.objects.create(nombre='Facultad', sede=self.espacio.sede),
+        )
+        conflictos = validate_many([Horario(
+            grupo=Grupo.objects.create(nombre='A', programa=programa, periodo=self.periodo, semestre=1),
+            asignatura=Asignatura.objects.create(nombre='Derecho Civil', codigo='DER-001', creditos=3, horas=2),
+            espacio=self.espacio,
+            dia_semana='Lunes',
+            hora_inicio=datetime.time(8, 0),
+            hora_fin=datetime.time(9, 30),
+            fecha_inicio=self.lunes[4],
+            fecha_fin=self.lunes[5] + datetime.timedelta(days=2),
+        )])
+        self.assertEqual([conflicto.tipo for conflicto in conflictos], ['prestamo'])
+        self.assertIn(str(self.lunes[4]), conflictos[0].mensaje)
+
+        # Actualizar la serie conserva las excepciones de fechas que siguen en ella
+        request = factory.put('/prestamos/', data=json.dumps({
+            'id': base.id, 'actualizar_serie': True, 'hora_fin': '10:30',
+        }), content_type='application/json')
+        request.user = usuario
+        response = update_prestamo(request)
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            sorted(PrestamoEspacio.objects.filter(prestamo_padre=base).values_list('fecha_original', 'estado')),
+            [(self.lunes[5], 'Rechazado'), (sin_periodo, 'Rechazado')],
+        )
+
+        # Las series públicas también se pueden materializar con su token
+        martes = [lunes + datetime.timedelta(days=1) for lunes in self.lunes]
+        publica = self._crear_prestamo(
+            PrestamoEspacioPublico, martes[0],
+            nombre_solicitante='Ana', correo_solicitante='ana@example.com', telefono_solicitante='300',
+            identificacion_solicitante='1', token_publico='token-serie', **dict(regla_semanal, dias_semana=[1]),
+        )
+        datos = {'id': publica.id, 'fecha': martes[2].isoformat(), 'publico': True}
+        self.assertEqual(materializar(datos, user=AnonymousUser()).status_code, 403)
+        response = materializar(dict(datos, token_publico='token-serie'), user=AnonymousUser())
+
+        self.assertEqual(response.status_code, 201, response.content)
+        ocurrencia = PrestamoEspacioPublico.objects.get(prestamo_padre=publica)
+        self.assertEqual((ocurrencia.fecha_original, ocurrencia.periodo), (martes[2], self.periodo))
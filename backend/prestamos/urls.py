@@ -6,6 +6,7 @@ urlpatterns = [
     path('', views.create_prestamo, name='create_prestamo'),
     path('update/', views.update_prestamo, name='update_prestamo'),
     path('delete/', views.delete_prestamo, name='delete_prestamo'),
+    path('ocurrencias/materializar/', views.materializar_ocurrencia_prestamo, name='materializar_ocurrencia_prestamo'),
     path('<int:id>/', views.get_prestamo, name='get_prestamo'),
     path('list/', views.list_prestamos, name='list_prestamos'),
     path('list/todos/', views.list_prestamos_todos_admin, name='list_prestamos_todos_admin'),  # Combina auth + públicos
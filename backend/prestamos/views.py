@@ -7,6 +7,10 @@ from django.conf import settings
 from django.utils.crypto import constant_time_compare
 from django.core.exceptions import ValidationError
 from .models import PrestamoEspacio, PrestamoEspacioPublico, TipoActividad, PrestamoRecurso
+from .ocurrencias import (
+    excepciones_conservadas, filas_en_rango, materializar_ocurrencia, prestamos_en_rango, sumar_meses,
+    usar_ocurrencias_virtuales,
+)
 from espacios.models import EspacioFisico
 from usuarios.models import Usuario
 from recursos.models import Recurso
@@ -16,7 +20,6 @@ from mysite.xss_protection import sanitize_dict, TIPO_ACTIVIDAD_SCHEMA, PRESTAMO
 import json
 import datetime
 import uuid
-import calendar
 import urllib.request
 import urllib.parse
 
@@ -44,6 +47,94 @@ def _get_seccional_scope(request):
 def _missing_seccional_response():
     return JsonResponse({'code': 'usuario_sin_seccional', 'error': MISSING_SECCIONAL_MESSAGE}, status=403)
 
+DIAS_SEMANA_NOMBRES = {
+    0: 'Lunes', 1: 'Martes', 2: 'Miércoles', 3: 'Jueves',
+    4: 'Viernes', 5: 'Sábado', 6: 'Domingo'
+}
+
+
+def check_series_disponible(espacio_id, fechas, hora_inicio, hora_fin, prestamo_id=None, es_publico=False,
+                            excluir_ids=()):
+    """
+    Verifica la disponibilidad de un espacio para todas las fechas de una serie
+    con tres consultas (préstamos autenticados, públicos y horarios académicos
+    del rango de fechas de la serie); el cruce por fecha se hace en memoria.
+    Las series guardadas como regla se expanden solo dentro de ese rango
+    (ver ocurrencias.py), con una consulta más para sus excepciones.
+    `excluir_ids` son otras filas del mismo modelo que no cuentan como
+    conflicto (las excepciones que se conservan al actualizar una serie).
+    Returns: dict {fecha: error_message} solo con las fechas en conflicto.
+    """
+    if isinstance(hora_inicio, str):
+        hora_inicio = datetime.time.fromisoformat(hora_inicio)
+    if isinstance(hora_fin, str):
+        hora_fin = datetime.time.fromisoformat(hora_fin)
+    fechas = {
+        datetime.date.fromisoformat(fecha) if isinstance(fecha, str) else fecha
+        for fecha in fechas
+    }
+    if not fechas:
+        return {}
+    desde, hasta = min(fechas), max(fechas)
+
+    conflictos = {}
+
+    def _registrar(fecha, mensaje):
+        if fecha in fechas and fecha not in conflictos:
+            conflictos[fecha] = mensaje
+
+    # 1. Préstamos de usuarios autenticados y 2. préstamos públicos
+    excluir_mismo_modelo = {*excluir_ids, *([prestamo_id] if prestamo_id else [])}
+    for modelo, etiqueta, excluir in (
+        (PrestamoEspacio, 'Préstamo Usuario', set() if es_publico else excluir_mismo_modelo),
+        (PrestamoEspacioPublico, 'Préstamo Público', excluir_mismo_modelo if es_publico else set()),
+    ):
+        prestamos_conflicto = modelo.objects.filter(
+            espacio_id=espacio_id,
+            estado__in=['Pendiente', 'Aprobado'],  # Solo préstamos activos
+            hora_inicio__lt=hora_fin,
+            hora_fin__gt=hora_inicio,
+        )
+        # Si estamos actualizando un préstamo, excluirlo
+        if excluir:
+            prestamos_conflicto = prestamos_conflicto.exclude(id__in=excluir)
+        for fila in filas_en_rango(prestamos_conflicto.order_by('id'), desde, hasta, 'hora_inicio', 'hora_fin'):
+            _registrar(
+                fila['fecha'],
+                f"El espacio ya está reservado de {fila['hora_inicio']} a {fila['hora_fin']} "
+                f"para el mismo día ({etiqueta})"
+            )
+
+    # 3. Horarios académicos vigentes en algún momento del rango
+    horarios_conflicto = Horario.objects.filter(
+        espacio_id=espacio_id,
+        hora_inicio__lt=hora_fin,
+        hora_fin__gt=hora_inicio,
+        estado__in=['pendiente', 'aprobado']
+    ).filter(
+        Q(fecha_inicio__isnull=True) | Q(fecha_inicio__lte=hasta)
+    ).filter(
+        Q(fecha_fin__isnull=True) | Q(fecha_fin__gte=desde)
+    ).order_by('id').values_list(
+        'dia_semana', 'fecha_inicio', 'fecha_fin', 'hora_inicio', 'hora_fin', 'asignatura__nombre'
+    )
+    horarios_por_dia = {}
+    for dia_semana, *resto in horarios_conflicto:
+        horarios_por_dia.setdefault((dia_semana or '').lower(), []).append(resto)
+
+    for fecha in fechas:
+        if fecha in conflictos:
+            continue
+        for fecha_inicio, fecha_fin, inicio, fin, asignatura in horarios_por_dia.get(
+            DIAS_SEMANA_NOMBRES[fecha.weekday()].lower(), []
+        ):
+            if (fecha_inicio is None or fecha_inicio <= fecha) and (fecha_fin is None or fecha_fin >= fecha):
+                conflictos[fecha] = f"El espacio está ocupado por clase de {asignatura} ({inicio} - {fin})"
+                break
+
+    return conflictos
+
+
 def check_espacio_disponible(espacio_id, fecha, hora_inicio, hora_fin, prestamo_id=None, es_publico=False):
     """
     Verifica si un espacio está disponible en la fecha y horas especificadas
@@ -51,76 +142,13 @@ def check_espacio_disponible(espacio_id, fecha, hora_inicio, hora_fin, prestamo_
     Returns: (bool, str) - (is_available, error_message)
     """
     try:
-        # Convertir strings a objetos date y time si es necesario
         if isinstance(fecha, str):
             fecha = datetime.date.fromisoformat(fecha)
-        if isinstance(hora_inicio, str):
-            hora_inicio = datetime.time.fromisoformat(hora_inicio)
-        if isinstance(hora_fin, str):
-            hora_fin = datetime.time.fromisoformat(hora_fin)
-        
-        # 1. Validar contra Préstamos de usuarios autenticados
-        prestamos_conflicto = PrestamoEspacio.objects.filter(
-            espacio_id=espacio_id,
-            fecha=fecha,
-            estado__in=['Pendiente', 'Aprobado']  # Solo préstamos activos
-        )
-        
-        # Si estamos actualizando un préstamo autenticado, excluirlo
-        if not es_publico and prestamo_id:
-            prestamos_conflicto = prestamos_conflicto.exclude(id=prestamo_id)
-        
-        prestamos_conflicto = prestamos_conflicto.filter(
-            # Verificar solapamiento de horarios
-            Q(hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio)
+        conflictos = check_series_disponible(
+            espacio_id, [fecha], hora_inicio, hora_fin, prestamo_id=prestamo_id, es_publico=es_publico
         )
-        
-        if prestamos_conflicto.exists():
-            conflicto = prestamos_conflicto.first()
-            return False, f"El espacio ya está reservado de {conflicto.hora_inicio} a {conflicto.hora_fin} para el mismo día (Préstamo Usuario)"
-        
-        # 2. Validar contra Préstamos públicos
-        prestamos_publicos_conflicto = PrestamoEspacioPublico.objects.filter(
-            espacio_id=espacio_id,
-            fecha=fecha,
-            estado__in=['Pendiente', 'Aprobado']
-        )
-        
-        # Si estamos actualizando un préstamo público, excluirlo
-        if es_publico and prestamo_id:
-            prestamos_publicos_conflicto = prestamos_publicos_conflicto.exclude(id=prestamo_id)
-        
-        prestamos_publicos_conflicto = prestamos_publicos_conflicto.filter(
-            Q(hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio)
-        )
-        
-        if prestamos_publicos_conflicto.exists():
-            conflicto = prestamos_publicos_conflicto.first()
-            return False, f"El espacio ya está reservado de {conflicto.hora_inicio} a {conflicto.hora_fin} para el mismo día (Préstamo Público)"
-
-        # 3. Validar contra Horarios Académicos
-        dias_semana = {
-            0: 'Lunes', 1: 'Martes', 2: 'Miércoles', 3: 'Jueves', 
-            4: 'Viernes', 5: 'Sábado', 6: 'Domingo'
-        }
-        dia_nombre = dias_semana[fecha.weekday()]
-        
-        horarios_conflicto = Horario.objects.filter(
-            espacio_id=espacio_id,
-            dia_semana__iexact=dia_nombre, # Case insensitive por seguridad
-            hora_inicio__lt=hora_fin,
-            hora_fin__gt=hora_inicio,
-            estado__in=['pendiente', 'aprobado']
-        ).filter(
-            Q(fecha_inicio__isnull=True) | Q(fecha_inicio__lte=fecha)
-        ).filter(
-            Q(fecha_fin__isnull=True) | Q(fecha_fin__gte=fecha)
-        )
-
-        if horarios_conflicto.exists():
-            conflicto = horarios_conflicto.first()
-            return False, f"El espacio está ocupado por clase de {conflicto.asignatura.nombre} ({conflicto.hora_inicio} - {conflicto.hora_fin})"
-        
+        if fecha in conflictos:
+            return False, conflictos[fecha]
         return True, ""
     except Exception as e:
         return False, f"Error al validar disponibilidad: {str(e)}"
@@ -255,14 +283,6 @@ def _verify_recaptcha(token, remote_ip=None):
         return False, "No se pudo validar reCAPTCHA"
 
 
-def _add_months(base_date, months):
-    month_idx = base_date.month - 1 + months
-    year = base_date.year + month_idx // 12
-    month = month_idx % 12 + 1
-    last_day = calendar.monthrange(year, month)[1]
-    return datetime.date(year, month, min(base_date.day, last_day))
-
-
 # Duracion aproximada de un semestre, usada SOLO como respaldo cuando
 # fecha_base no cae dentro de ningun PeriodoAcademico conocido (p.ej. un
 # prestamo publico para una fecha fuera de calendario academico).
@@ -373,7 +393,7 @@ def _generar_fechas_ocurrencias(fecha_base, recurrencia, horizonte_fecha=None, l
     elif frecuencia == 'monthly':
         i = 0
         while len(fechas) < limite_count:
-            fecha = _add_months(fecha_base, i * intervalo)
+            fecha = sumar_meses(fecha_base, i * intervalo)
             if fecha > limite_fecha:
                 break
             fechas.append(fecha)
@@ -394,8 +414,144 @@ def _recurrencia_payload(prestamo):
         'serie_id': prestamo.serie_id,
         'es_ocurrencia_generada': prestamo.es_ocurrencia_generada,
         'prestamo_padre_id': prestamo.prestamo_padre_id,
+        'ocurrencias_virtuales': prestamo.ocurrencias_virtuales,
+        'fecha_original': str(prestamo.fecha_original) if prestamo.fecha_original else None,
+        'es_ocurrencia_virtual': prestamo.pk is None,
     }
 
+def _recursos_solicitados(recursos):
+    """
+    Resuelve el payload [{recurso_id, cantidad}] con una sola consulta.
+    Lanza Recurso.DoesNotExist si algún recurso no existe, como Recurso.objects.get.
+    """
+    solicitados = [
+        (recurso_data.get('recurso_id'), recurso_data.get('cantidad', 1))
+        for recurso_data in recursos or []
+        if recurso_data.get('recurso_id')
+    ]
+    encontrados = Recurso.objects.in_bulk({recurso_id for recurso_id, _ in solicitados})
+    if len(encontrados) < len({recurso_id for recurso_id, _ in solicitados}):
+        raise Recurso.DoesNotExist("Recurso matching query does not exist.")
+    return [(encontrados[recurso_id], cantidad) for recurso_id, cantidad in solicitados]
+
+
+def _crear_recursos_en_lote(prestamos, recursos):
+    """Asocia los mismos recursos a todos los préstamos con un solo INSERT (sin señales)."""
+    return PrestamoRecurso.objects.bulk_create([
+        PrestamoRecurso(prestamo=prestamo, recurso=recurso, cantidad=cantidad)
+        for prestamo in prestamos
+        for recurso, cantidad in recursos
+    ])
+
+
+def _crear_ocurrencias_en_lote(base, fechas):
+    """
+    Crea con un solo INSERT las ocurrencias hijas de `base` (PrestamoEspacio o
+    PrestamoEspacioPublico) para las fechas distintas a la suya, copiando sus
+    campos. bulk_create no dispara las señales pre_save/post_save, así que:
+    - el periodo de cada fecha se asigna aquí con una sola consulta;
+    - la disponibilidad ya debe estar validada con check_series_disponible;
+    - las notificaciones quedan a cargo de _notificar_serie.
+    Una serie guardada como regla (`ocurrencias_virtuales`) no crea filas.
+    """
+    from periodos.models import PeriodoAcademico
+
+    if base.ocurrencias_virtuales:
+        return []
+
+    modelo = type(base)
+    fechas = sorted({fecha for fecha in fechas if fecha != base.fecha})
+    if not fechas:
+        return []
+
+    periodos = list(PeriodoAcademico.objects.filter(
+        fecha_inicio__lte=fechas[-1],
+        fecha_fin__gte=fechas[0],
+    ).order_by('-fecha_inicio', '-id'))
+    campos = [campo.attname for campo in modelo._meta.concrete_fields if not campo.primary_key]
+
+    ocurrencias = []
+    for fecha in fechas:
+        periodo = next((pa for pa in periodos if pa.fecha_inicio <= fecha <= pa.fecha_fin), None)
+        if periodo is None:
+            raise ValidationError(
+                f'La fecha del préstamo ({fecha}) no está dentro de ningún periodo activo.'
+            )
+        ocurrencia = modelo(**{campo: getattr(base, campo) for campo in campos})
+        ocurrencia.fecha = fecha
+        ocurrencia.periodo = periodo
+        ocurrencia.prestamo_padre = base
+        ocurrencia.es_ocurrencia_generada = True
+        ocurrencias.append(ocurrencia)
+
+    ocurrencias = modelo.objects.bulk_create(ocurrencias)
+
+    from espacios.ocupacion import invalidar_matriz_ocupacion
+    transaction.on_commit(invalidar_matriz_ocupacion)
+    return ocurrencias
+
+
+def _notificar_serie(base, ocurrencias, recursos=()):
+    """
+    Una notificación por serie (solicitante y administrador) en lugar de una
+    por ocurrencia, más las de los recursos del préstamo base, en un solo INSERT.
+    """
+    from notificaciones.signals import crear_notificaciones_en_lote, obtener_id_usuario
+
+    notificaciones = []
+    if base.usuario_id:
+        notificaciones.extend(
+            {
+                'id_usuario': base.usuario_id,
+                'tipo': 'RECURSO_AGREGADO',
+                'mensaje': f'Se ha agregado {recurso.nombre} (x{cantidad}) a tu préstamo',
+                'prioridad': 'media',
+            }
+            for recurso, cantidad in recursos
+        )
+    if ocurrencias:
+        fechas = [ocurrencia.fecha for ocurrencia in ocurrencias]
+        detalle = (
+            f'{base.espacio.nombre}: {len(ocurrencias)} ocurrencias adicionales '
+            f'del {min(fechas)} al {max(fechas)}'
+        )
+        if base.usuario_id:
+            notificaciones.append({
+                'id_usuario': base.usuario_id,
+                'tipo': 'PRESTAMO_SOLICITADO',
+                'mensaje': f'Has solicitado el préstamo recurrente del espacio {detalle}',
+                'prioridad': 'alta',
+            })
+        notificaciones.append({
+            'id_usuario': obtener_id_usuario(),
+            'tipo': 'PRESTAMO_NUEVA_SOLICITUD',
+            'mensaje': f'Nueva solicitud de préstamo recurrente: {detalle} ({base.tipo_actividad.nombre})',
+            'prioridad': 'alta',
+        })
+    crear_notificaciones_en_lote(notificaciones)
+
+
+def _ventana_listado(request):
+    """
+    Rango (?fecha_desde=&fecha_hasta=) de un listado con include_ocurrencias,
+    o None si falta o no es válido. Las series guardadas como regla no tienen
+    fin, así que sus ocurrencias virtuales solo se listan dentro de un rango.
+    """
+    try:
+        desde = datetime.date.fromisoformat(request.GET.get('fecha_desde', ''))
+        hasta = datetime.date.fromisoformat(request.GET.get('fecha_hasta', ''))
+    except ValueError:
+        return None
+    return desde, hasta
+
+
+def _id_listado(prefijo, prestamo):
+    # Una ocurrencia virtual no tiene id propio: se identifica por serie y fecha
+    if prestamo.pk is None:
+        return f"{prefijo}-{prestamo.prestamo_padre_id}-{prestamo.fecha}"
+    return f"{prefijo}-{prestamo.id}"
+
+
 # ========== TipoActividad Views ==========
 
 @csrf_exempt
@@ -512,11 +668,11 @@ def create_prestamo(request):
         # ningun registro: una fecha en conflicto mas adelante en la serie
         # (p.ej. una clase que arranca a mitad de semestre) bloquea toda la
         # solicitud, no solo esa ocurrencia.
+        conflictos = check_series_disponible(espacio_id, fechas_ocurrencias, hi, hf)
         for fecha_ocurrencia in fechas_ocurrencias:
-            is_available, error_msg = check_espacio_disponible(espacio_id, fecha_ocurrencia, hi, hf)
-            if not is_available:
+            if fecha_ocurrencia in conflictos:
                 return JsonResponse({
-                    "error": f"Conflicto en fecha {fecha_ocurrencia}: {error_msg}"
+                    "error": f"Conflicto en fecha {fecha_ocurrencia}: {conflictos[fecha_ocurrencia]}"
                 }, status=409)
 
         serie_id = str(uuid.uuid4()) if recurrencia['es_recurrente'] else None
@@ -537,6 +693,7 @@ def create_prestamo(request):
                 fin_repeticion_tipo=recurrencia['fin_repeticion_tipo'],
                 fin_repeticion_fecha=recurrencia['fin_repeticion_fecha'],
                 fin_repeticion_ocurrencias=recurrencia['fin_repeticion_ocurrencias'],
+                ocurrencias_virtuales=usar_ocurrencias_virtuales(recurrencia),
                 fecha=f,
                 hora_inicio=hi,
                 hora_fin=hf,
@@ -547,58 +704,13 @@ def create_prestamo(request):
             )
             p.save()
 
-            # Crear relaciones con recursos del préstamo base
-            for recurso_data in recursos:
-                recurso_id = recurso_data.get('recurso_id')
-                cantidad = recurso_data.get('cantidad', 1)
-                if recurso_id:
-                    recurso = Recurso.objects.get(id=recurso_id)
-                    PrestamoRecurso.objects.create(
-                        prestamo=p,
-                        recurso=recurso,
-                        cantidad=cantidad
-                    )
-
-            # Crear ocurrencias hijas para fechas distintas a la fecha base
-            ocurrencias_creadas = 1
-            for fecha_ocurrencia in fechas_ocurrencias:
-                if fecha_ocurrencia == f:
-                    continue
-
-                hijo = PrestamoEspacio.objects.create(
-                    espacio=espacio,
-                    usuario=usuario,
-                    administrador=administrador,
-                    tipo_actividad=tipo_actividad,
-                    prestamo_padre=p,
-                    serie_id=serie_id,
-                    es_ocurrencia_generada=True,
-                    es_recurrente=recurrencia['es_recurrente'],
-                    frecuencia=recurrencia['frecuencia'],
-                    intervalo=recurrencia['intervalo'],
-                    dias_semana=recurrencia['dias_semana'],
-                    fin_repeticion_tipo=recurrencia['fin_repeticion_tipo'],
-                    fin_repeticion_fecha=recurrencia['fin_repeticion_fecha'],
-                    fin_repeticion_ocurrencias=recurrencia['fin_repeticion_ocurrencias'],
-                    fecha=fecha_ocurrencia,
-                    hora_inicio=hi,
-                    hora_fin=hf,
-                    motivo=motivo,
-                    asistentes=asistentes,
-                    telefono=telefono,
-                    estado=estado
-                )
-                for recurso_data in recursos:
-                    recurso_id = recurso_data.get('recurso_id')
-                    cantidad = recurso_data.get('cantidad', 1)
-                    if recurso_id:
-                        recurso = Recurso.objects.get(id=recurso_id)
-                        PrestamoRecurso.objects.create(
-                            prestamo=hijo,
-                            recurso=recurso,
-                            cantidad=cantidad
-                        )
-                ocurrencias_creadas += 1
+            # Ocurrencias hijas (fechas distintas a la fecha base) y recursos
+            # de toda la serie en un INSERT cada uno
+            recursos_serie = _recursos_solicitados(recursos)
+            ocurrencias = _crear_ocurrencias_en_lote(p, fechas_ocurrencias)
+            _crear_recursos_en_lote([p, *ocurrencias], recursos_serie)
+            _notificar_serie(p, ocurrencias, recursos_serie)
+            ocurrencias_creadas = 1 + len(ocurrencias)
 
         return JsonResponse({
             "message": "Prestamo creado",
@@ -685,6 +797,7 @@ def update_prestamo(request):
                 p.fin_repeticion_tipo = recurrencia['fin_repeticion_tipo']
                 p.fin_repeticion_fecha = recurrencia['fin_repeticion_fecha']
                 p.fin_repeticion_ocurrencias = recurrencia['fin_repeticion_ocurrencias']
+                p.ocurrencias_virtuales = usar_ocurrencias_virtuales(recurrencia)
 
                 if p.asistentes > p.espacio.capacidad:
                     return JsonResponse({
@@ -693,71 +806,41 @@ def update_prestamo(request):
 
                 fechas_ocurrencias = _generar_fechas_ocurrencias(p.fecha, recurrencia)
 
-                # Borrar ocurrencias hijas actuales para regenerar serie
-                p.ocurrencias_generadas.all().delete()
-
-                # Validar disponibilidad del padre
-                ok, err = check_espacio_disponible(p.espacio.id, p.fecha, p.hora_inicio, p.hora_fin, prestamo_id=p.id)
-                if not ok:
-                    return JsonResponse({"error": f"Conflicto en fecha {p.fecha}: {err}"}, status=409)
-
-                # Validar disponibilidad de nuevas ocurrencias
-                for fecha_ocurrencia in fechas_ocurrencias:
-                    if fecha_ocurrencia == p.fecha:
-                        continue
-                    ok, err = check_espacio_disponible(p.espacio.id, fecha_ocurrencia, p.hora_inicio, p.hora_fin)
-                    if not ok:
-                        return JsonResponse({"error": f"Conflicto en fecha {fecha_ocurrencia}: {err}"}, status=409)
+                # Borrar ocurrencias hijas actuales para regenerar serie, salvo
+                # las excepciones (editadas o canceladas) de fechas que siguen
+                # en la serie: esas fechas no se vuelven a generar
+                conservadas = excepciones_conservadas(p, fechas_ocurrencias)
+                ids_conservadas = [excepcion.id for excepcion in conservadas]
+                fechas_conservadas = {excepcion.fecha_original for excepcion in conservadas}
+                p.ocurrencias_generadas.exclude(id__in=ids_conservadas).delete()
+                fechas_ocurrencias = [fecha for fecha in fechas_ocurrencias if fecha not in fechas_conservadas]
+
+                # Validar disponibilidad del padre y de las nuevas ocurrencias
+                # (el propio préstamo base se excluye en toda la serie)
+                fechas_serie = [p.fecha] + [fecha for fecha in fechas_ocurrencias if fecha != p.fecha]
+                conflictos = check_series_disponible(
+                    p.espacio.id, fechas_serie, p.hora_inicio, p.hora_fin, prestamo_id=p.id,
+                    excluir_ids=ids_conservadas,
+                )
+                for fecha_ocurrencia in fechas_serie:
+                    if fecha_ocurrencia in conflictos:
+                        return JsonResponse({"error": f"Conflicto en fecha {fecha_ocurrencia}: {conflictos[fecha_ocurrencia]}"}, status=409)
 
                 p.save()
 
                 recursos_payload = data.get('recursos')
                 if recursos_payload is not None:
+                    recursos_serie = _recursos_solicitados(recursos_payload)
                     p.prestamo_recursos.all().delete()
-                    for recurso_data in recursos_payload:
-                        recurso_id = recurso_data.get('recurso_id')
-                        cantidad = recurso_data.get('cantidad', 1)
-                        if recurso_id:
-                            recurso = Recurso.objects.get(id=recurso_id)
-                            PrestamoRecurso.objects.create(prestamo=p, recurso=recurso, cantidad=cantidad)
+                    _crear_recursos_en_lote([p], recursos_serie)
                 else:
-                    recursos_payload = [{
-                        'recurso_id': rr.recurso_id,
-                        'cantidad': rr.cantidad
-                    } for rr in p.prestamo_recursos.all()]
-
-                for fecha_ocurrencia in fechas_ocurrencias:
-                    if fecha_ocurrencia == p.fecha:
-                        continue
-                    hijo = PrestamoEspacio.objects.create(
-                        espacio=p.espacio,
-                        usuario=p.usuario,
-                        administrador=p.administrador,
-                        tipo_actividad=p.tipo_actividad,
-                        prestamo_padre=p,
-                        serie_id=p.serie_id,
-                        es_ocurrencia_generada=True,
-                        es_recurrente=p.es_recurrente,
-                        frecuencia=p.frecuencia,
-                        intervalo=p.intervalo,
-                        dias_semana=p.dias_semana,
-                        fin_repeticion_tipo=p.fin_repeticion_tipo,
-                        fin_repeticion_fecha=p.fin_repeticion_fecha,
-                        fin_repeticion_ocurrencias=p.fin_repeticion_ocurrencias,
-                        fecha=fecha_ocurrencia,
-                        hora_inicio=p.hora_inicio,
-                        hora_fin=p.hora_fin,
-                        motivo=p.motivo,
-                        asistentes=p.asistentes,
-                        telefono=p.telefono,
-                        estado=p.estado,
-                    )
-                    for recurso_data in recursos_payload:
-                        recurso_id = recurso_data.get('recurso_id')
-                        cantidad = recurso_data.get('cantidad', 1)
-                        if recurso_id:
-                            recurso = Recurso.objects.get(id=recurso_id)
-                            PrestamoRecurso.objects.create(prestamo=hijo, recurso=recurso, cantidad=cantidad)
+                    recursos_serie = [
+                        (rr.recurso, rr.cantidad) for rr in p.prestamo_recursos.select_related('recurso')
+                    ]
+
+                ocurrencias = _crear_ocurrencias_en_lote(p, fechas_ocurrencias)
+                _crear_recursos_en_lote(ocurrencias, recursos_serie)
+                _notificar_serie(p, ocurrencias, recursos_serie if recursos_payload is not None else ())
 
             return JsonResponse({"message": "Prestamo actualizado", "id": p.id, "actualizacion": "serie"}, status=200)
 
@@ -877,6 +960,67 @@ def delete_prestamo(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@csrf_exempt
+def materializar_ocurrencia_prestamo(request):
+    """
+    Guarda como fila (excepción) una ocurrencia de una serie guardada como
+    regla, para editarla luego con update_prestamo (o update_prestamo_publico),
+    o la cancela con `cancelar=true`.
+    Body: {id (préstamo base), fecha, cancelar, publico}. Con `publico=true`
+    la serie es un PrestamoEspacioPublico y basta su token público.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        data = json.loads(request.body)
+        id = data.get('id')
+        fecha = data.get('fecha')
+        if not id or not fecha:
+            return JsonResponse({"error": "id y fecha son requeridos"}, status=400)
+
+        es_publico = bool(data.get('publico', False))
+        if es_publico:
+            base = PrestamoEspacioPublico.objects.get(id=id, prestamo_padre__isnull=True)
+            allowed, error_response = _require_public_token(request, base, data)
+            if not allowed:
+                return error_response
+        else:
+            auth_error = _require_auth(request)
+            if auth_error:
+                return auth_error
+            base = PrestamoEspacio.objects.get(id=id, prestamo_padre__isnull=True)
+
+        cancelar = bool(data.get('cancelar', False))
+        with transaction.atomic():
+            ocurrencia, creada = materializar_ocurrencia(
+                base, datetime.date.fromisoformat(fecha), **({'estado': 'Rechazado'} if cancelar else {})
+            )
+            if creada and not es_publico:
+                _crear_recursos_en_lote([ocurrencia], [
+                    (pr.recurso, pr.cantidad) for pr in base.prestamo_recursos.select_related('recurso')
+                ])
+            elif cancelar and ocurrencia.estado != 'Rechazado':
+                ocurrencia.estado = 'Rechazado'
+                ocurrencia.save()
+
+        return JsonResponse({
+            "message": "Ocurrencia cancelada" if cancelar else "Ocurrencia materializada",
+            "id": ocurrencia.id,
+            "prestamo_padre_id": base.id,
+            "fecha": str(ocurrencia.fecha),
+        }, status=201 if creada else 200)
+    except (PrestamoEspacio.DoesNotExist, PrestamoEspacioPublico.DoesNotExist):
+        return JsonResponse({"error": "Prestamo no encontrado."}, status=404)
+    except ValidationError as e:
+        return JsonResponse({"error": " ".join(e.messages)}, status=400)
+    except json.JSONDecodeError:
+        # Subclase de ValueError: debe ir antes
+        return JsonResponse({"error": "JSON inválido."}, status=400)
+    except ValueError:
+        return JsonResponse({"error": "Formato de fecha inválido."}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
 def get_prestamo(request, id=None):
     auth_error = _require_auth(request)
     if auth_error:
@@ -972,6 +1116,9 @@ def list_prestamos(request):
 
         if not include_ocurrencias:
             items = items.filter(prestamo_padre__isnull=True)
+        ventana = _ventana_listado(request) if include_ocurrencias else None
+        if ventana:
+            items = prestamos_en_rango(items, *ventana)
         
         lst = []
         for i in items:
@@ -979,7 +1126,7 @@ def list_prestamos(request):
                 "recurso_id": pr.recurso.id,
                 "recurso_nombre": pr.recurso.nombre,
                 "cantidad": pr.cantidad
-            } for pr in i.prestamo_recursos.all()]
+            } for pr in (i if i.pk else i.prestamo_padre).prestamo_recursos.all()]
             
             item = {
                 "id": i.id,
@@ -1037,16 +1184,19 @@ def list_prestamos_todos_admin(request):
 
         if not include_ocurrencias:
             items_auth = items_auth.filter(prestamo_padre__isnull=True)
+        ventana = _ventana_listado(request) if include_ocurrencias else None
+        if ventana:
+            items_auth = prestamos_en_rango(items_auth, *ventana)
         
         for i in items_auth:
             recursos = [{
                 "recurso_id": pr.recurso.id,
                 "recurso_nombre": pr.recurso.nombre,
                 "cantidad": pr.cantidad
-            } for pr in i.prestamo_recursos.all()]
+            } for pr in (i if i.pk else i.prestamo_padre).prestamo_recursos.all()]
             
             item = {
-                "id": f"auth-{i.id}",  # ID único para evitar colisiones
+                "id": _id_listado('auth', i),  # ID único para evitar colisiones
                 "id_real": i.id,  # ID original de la base de datos
                 "tipo_prestamo": "autenticado",  # Para distinguir en frontend
                 "espacio_id": i.espacio.id,
@@ -1088,13 +1238,16 @@ def list_prestamos_todos_admin(request):
 
         if not include_ocurrencias:
             items_public = items_public.filter(prestamo_padre__isnull=True)
+        ventana = _ventana_listado(request) if include_ocurrencias else None
+        if ventana:
+            items_public = prestamos_en_rango(items_public, *ventana)
         
         for i in items_public:
             # PrestamoEspacioPublico no tiene recursos por ahora (simplificado)
             recursos = []
             
             item = {
-                "id": f"public-{i.id}",  # ID único para evitar colisiones
+                "id": _id_listado('public', i),  # ID único para evitar colisiones
                 "id_real": i.id,  # ID original de la base de datos
                 "tipo_prestamo": "publico",  # Para distinguir en frontend
                 "espacio_id": i.espacio.id,
@@ -1125,7 +1278,7 @@ def list_prestamos_todos_admin(request):
             lst.append(item)
         
         # Ordenar por ID descendente (proxy de fecha de creación para mostrar los más recientes arriba)
-        lst.sort(key=lambda x: x['id_real'], reverse=True)
+        lst.sort(key=lambda x: x['id_real'] or x['prestamo_padre_id'], reverse=True)
         
         return JsonResponse({"prestamos": lst}, status=200)
 
@@ -1152,6 +1305,9 @@ def list_prestamos_by_user(request, usuario_id):
 
             if not include_ocurrencias:
                 items = items.filter(prestamo_padre__isnull=True)
+            ventana = _ventana_listado(request) if include_ocurrencias else None
+            if ventana:
+                items = prestamos_en_rango(items, *ventana)
             
             lst = []
             for i in items:
@@ -1159,7 +1315,7 @@ def list_prestamos_by_user(request, usuario_id):
                     "recurso_id": pr.recurso.id,
                     "recurso_nombre": pr.recurso.nombre,
                     "cantidad": pr.cantidad
-                } for pr in i.prestamo_recursos.all()]
+                } for pr in (i if i.pk else i.prestamo_padre).prestamo_recursos.all()]
                 
                 item = {
                     "id": i.id,
@@ -1289,11 +1445,11 @@ def create_prestamo_publico(request):
 
         # Ver comentario equivalente en create_prestamo: se valida toda la
         # serie recurrente antes de crear ningun registro.
+        conflictos = check_series_disponible(espacio_id, fechas_ocurrencias, hi, hf, es_publico=True)
         for fecha_ocurrencia in fechas_ocurrencias:
-            is_available, error_msg = check_espacio_disponible(espacio_id, fecha_ocurrencia, hi, hf, es_publico=True)
-            if not is_available:
+            if fecha_ocurrencia in conflictos:
                 return JsonResponse({
-                    "error": f"Conflicto en fecha {fecha_ocurrencia}: {error_msg}"
+                    "error": f"Conflicto en fecha {fecha_ocurrencia}: {conflictos[fecha_ocurrencia]}"
                 }, status=409)
 
         serie_id = str(uuid.uuid4()) if recurrencia['es_recurrente'] else None
@@ -1320,6 +1476,7 @@ def create_prestamo_publico(request):
                 fin_repeticion_tipo=recurrencia['fin_repeticion_tipo'],
                 fin_repeticion_fecha=recurrencia['fin_repeticion_fecha'],
                 fin_repeticion_ocurrencias=recurrencia['fin_repeticion_ocurrencias'],
+                ocurrencias_virtuales=usar_ocurrencias_virtuales(recurrencia),
                 fecha=f,
                 hora_inicio=hi,
                 hora_fin=hf,
@@ -1329,37 +1486,8 @@ def create_prestamo_publico(request):
             )
             p.save()
 
-            ocurrencias_creadas = 1
-            for fecha_ocurrencia in fechas_ocurrencias:
-                if fecha_ocurrencia == f:
-                    continue
-                PrestamoEspacioPublico.objects.create(
-                    espacio=espacio,
-                    nombre_solicitante=nombre_completo,
-                    correo_solicitante=correo_institucional,
-                    telefono_solicitante=telefono,
-                    identificacion_solicitante=identificacion,
-                    administrador=None,
-                    tipo_actividad=tipo_actividad,
-                    token_publico=token_publico,
-                    prestamo_padre=p,
-                    serie_id=serie_id,
-                    es_ocurrencia_generada=True,
-                    es_recurrente=recurrencia['es_recurrente'],
-                    frecuencia=recurrencia['frecuencia'],
-                    intervalo=recurrencia['intervalo'],
-                    dias_semana=recurrencia['dias_semana'],
-                    fin_repeticion_tipo=recurrencia['fin_repeticion_tipo'],
-                    fin_repeticion_fecha=recurrencia['fin_repeticion_fecha'],
-                    fin_repeticion_ocurrencias=recurrencia['fin_repeticion_ocurrencias'],
-                    fecha=fecha_ocurrencia,
-                    hora_inicio=hi,
-                    hora_fin=hf,
-                    motivo=motivo,
-                    asistentes=asistentes,
-                    estado='Pendiente'
-                )
-                ocurrencias_creadas += 1
+            ocurrencias = _crear_ocurrencias_en_lote(p, fechas_ocurrencias)
+            ocurrencias_creadas = 1 + len(ocurrencias)
         
         return JsonResponse({
             "message": "Solicitud de préstamo enviada exitosamente. Recibirás una notificación al correo proporcionado.",
@@ -1421,24 +1549,22 @@ def list_espacios_disponibles_publico(request):
 
             # 1. Préstamos autenticados conflictivos
             prestamos_conflictivos = set(
-                PrestamoEspacio.objects.filter(
+                fila['espacio_id'] for fila in filas_en_rango(PrestamoEspacio.objects.filter(
                     espacio_id__in=espacios_ids,
-                    fecha=f,
                     estado__in=['Pendiente', 'Aprobado'],
                     hora_inicio__lt=hf,
                     hora_fin__gt=hi
-                ).values_list('espacio_id', flat=True)
+                ), f, f, 'espacio_id')
             )
 
             # 2. Préstamos públicos conflictivos
             prestamos_publicos_conflictivos = set(
-                PrestamoEspacioPublico.objects.filter(
+                fila['espacio_id'] for fila in filas_en_rango(PrestamoEspacioPublico.objects.filter(
                     espacio_id__in=espacios_ids,
-                    fecha=f,
                     estado__in=['Pendiente', 'Aprobado'],
                     hora_inicio__lt=hf,
                     hora_fin__gt=hi
-                ).values_list('espacio_id', flat=True)
+                ), f, f, 'espacio_id')
             )
 
             # 3. Horarios académicos conflictivos
@@ -1520,6 +1646,9 @@ def list_prestamos_publicos(request):
 
         if not include_ocurrencias:
             items = items.filter(prestamo_padre__isnull=True)
+        ventana = _ventana_listado(request) if include_ocurrencias else None
+        if ventana:
+            items = prestamos_en_rango(items, *ventana)
 
         lst = []
         for i in items:
@@ -1678,6 +1807,7 @@ def update_prestamo_publico(request):
                 p.fin_repeticion_tipo = recurrencia['fin_repeticion_tipo']
                 p.fin_repeticion_fecha = recurrencia['fin_repeticion_fecha']
                 p.fin_repeticion_ocurrencias = recurrencia['fin_repeticion_ocurrencias']
+                p.ocurrencias_virtuales = usar_ocurrencias_virtuales(recurrencia)
 
                 if p.asistentes > p.espacio.capacidad:
                     return JsonResponse({
@@ -1686,56 +1816,24 @@ def update_prestamo_publico(request):
 
                 fechas_ocurrencias = _generar_fechas_ocurrencias(p.fecha, recurrencia)
 
-                p.ocurrencias_generadas_publicas.all().delete()
+                conservadas = excepciones_conservadas(p, fechas_ocurrencias)
+                ids_conservadas = [excepcion.id for excepcion in conservadas]
+                fechas_conservadas = {excepcion.fecha_original for excepcion in conservadas}
+                p.ocurrencias_generadas_publicas.exclude(id__in=ids_conservadas).delete()
+                fechas_ocurrencias = [fecha for fecha in fechas_ocurrencias if fecha not in fechas_conservadas]
 
-                ok, err = check_espacio_disponible(
-                    p.espacio.id,
-                    p.fecha,
-                    p.hora_inicio,
-                    p.hora_fin,
-                    prestamo_id=p.id,
-                    es_publico=True
+                fechas_serie = [p.fecha] + [fecha for fecha in fechas_ocurrencias if fecha != p.fecha]
+                conflictos = check_series_disponible(
+                    p.espacio.id, fechas_serie, p.hora_inicio, p.hora_fin, prestamo_id=p.id, es_publico=True,
+                    excluir_ids=ids_conservadas,
                 )
-                if not ok:
-                    return JsonResponse({"error": f"Conflicto en fecha {p.fecha}: {err}"}, status=409)
-
-                for fecha_ocurrencia in fechas_ocurrencias:
-                    if fecha_ocurrencia == p.fecha:
-                        continue
-                    ok, err = check_espacio_disponible(p.espacio.id, fecha_ocurrencia, p.hora_inicio, p.hora_fin, es_publico=True)
-                    if not ok:
-                        return JsonResponse({"error": f"Conflicto en fecha {fecha_ocurrencia}: {err}"}, status=409)
+                for fecha_ocurrencia in fechas_serie:
+                    if fecha_ocurrencia in conflictos:
+                        return JsonResponse({"error": f"Conflicto en fecha {fecha_ocurrencia}: {conflictos[fecha_ocurrencia]}"}, status=409)
 
                 p.save()
 
-                for fecha_ocurrencia in fechas_ocurrencias:
-                    if fecha_ocurrencia == p.fecha:
-                        continue
-                    PrestamoEspacioPublico.objects.create(
-                        espacio=p.espacio,
-                        nombre_solicitante=p.nombre_solicitante,
-                        correo_solicitante=p.correo_solicitante,
-                        telefono_solicitante=p.telefono_solicitante,
-                        identificacion_solicitante=p.identificacion_solicitante,
-                        administrador=p.administrador,
-                        tipo_actividad=p.tipo_actividad,
-                        prestamo_padre=p,
-                        serie_id=p.serie_id,
-                        es_ocurrencia_generada=True,
-                        es_recurrente=p.es_recurrente,
-                        frecuencia=p.frecuencia,
-                        intervalo=p.intervalo,
-                        dias_semana=p.dias_semana,
-                        fin_repeticion_tipo=p.fin_repeticion_tipo,
-                        fin_repeticion_fecha=p.fin_repeticion_fecha,
-                        fin_repeticion_ocurrencias=p.fin_repeticion_ocurrencias,
-                        fecha=fecha_ocurrencia,
-                        hora_inicio=p.hora_inicio,
-                        hora_fin=p.hora_fin,
-                        motivo=p.motivo,
-                        asistentes=p.asistentes,
-                        estado=p.estado,
-                    )
+                _crear_ocurrencias_en_lote(p, fechas_ocurrencias)
 
             return JsonResponse({"message": "Prestamo público actualizado exitosamente", "id": p.id, "actualizacion": "serie"}, status=200)
 
@@ -1846,6 +1944,9 @@ def list_prestamos_publicos_by_identificacion(request):
 
         if not include_ocurrencias:
             items = items.filter(prestamo_padre__isnull=True)
+        ventana = _ventana_listado(request) if include_ocurrencias else None
+        if ventana:
+            items = prestamos_en_rango(items, *ventana)
 
         lst = []
         for i in items:
@@ -17,6 +17,9 @@ echo "Base de datos disponible"
 echo "Ejecutando migraciones..."
 python manage.py migrate --noinput
 
+echo "Cargando calendario de dias habiles..."
+python manage.py cargar_calendario_habil --confirmar --si-vacio
+
 echo "Recolectando archivos estaticos..."
 python manage.py collectstatic --noinput
 
@@ -24,4 +27,38 @@ echo "=========================================="
 echo "Backend listo - Iniciando servidor..."
 echo "=========================================="
 
+# Procesos auxiliares, cada uno reiniciado si termina. En docker-compose los
+# ejecutan sus propios servicios (backend-tareas, backend-flujo), que fijan
+# BACKEND_PROCESOS_AUXILIARES=0 en el backend.
+supervisar() {
+    nombre=$1
+    shift
+    (
+        while true; do
+            "$@" || true
+            echo "$nombre terminó; se reinicia en 5 segundos..."
+            sleep 5
+        done
+    ) &
+}
+
+if [ "${BACKEND_PROCESOS_AUXILIARES:-1}" = "1" ]; then
+    # Copias al NAS, expedientes unificados y archivado de notificaciones
+    # (FINANCIERO_TAREAS_ASYNC=1 por defecto: sin este worker quedan pendientes)
+    supervisar run_jobs python manage.py run_jobs --hilos 2
+fi
+
+# El flujo SSE de notificaciones (/api/notificaciones/flujo/) necesita ASGI:
+# uvicorn lo sirve en el puerto 8002 y nginx le envía solo esa ruta (ver
+# nginx2.conf). En docker-compose lo sirve el servicio backend-flujo.
+# Las notificaciones que escribe gunicorn le llegan por Redis: sin REDIS_URL
+# no se inicia y el frontend sigue consultando las estadísticas.
+if [ "${BACKEND_PROCESOS_AUXILIARES:-1}" = "1" ]; then
+    if [ -n "${REDIS_URL}" ]; then
+        supervisar uvicorn uvicorn mysite.asgi:application --host 0.0.0.0 --port 8002 --workers 2 --timeout-graceful-shutdown 5
+    else
+        echo "ADVERTENCIA: REDIS_URL no está definida; no se inicia el flujo en vivo de notificaciones."
+    fi
+fi
+
 exec gunicorn mysite.wsgi:application --bind 0.0.0.0:8000 --workers 3 --worker-class gthread --threads 4 --timeout 60
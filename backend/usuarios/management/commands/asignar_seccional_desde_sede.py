@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.db.models import F, OuterRef, Q, Subquery
 
+from mysite.identity import bump_identity_version
 from sedes.models import Sede
 from usuarios.models import Usuario
 
@@ -55,6 +56,8 @@ class Command(BaseCommand):
                     Sede.objects.filter(pk=OuterRef("sede_id")).values("seccional_id")[:1]
                 )
             )
+            # update() no dispara señales: invalida a mano la identidad cacheada.
+            transaction.on_commit(bump_identity_version)
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -20,6 +20,8 @@ from django.db.models import Q
 from asignaturas.models import Asignatura
 from espacios.models import EspacioFisico, EspacioPermitido, StgOracleEspacioFisico, TipoEspacio
 from grupos.models import Grupo, StgOracleGrupoAcademico
+from horario.conflictos import validacion_diferida
+from horario.fusionados import fusionados_diferidos
 from horario.models import Horario, StgOracleHorario
 from periodos.models import PeriodoAcademico
 from programas.models import Programa
@@ -1222,22 +1224,14 @@ class Command(BaseCommand):
         for e in espacios:
             _indexar_espacio(e)
 
-        signal_validacion_desconectada = False
-        signal_fusionado_desconectada = False
-        if not dry_run:
-            try:
-                from django.db.models.signals import post_save, pre_save
-                from horario.signals import crear_horario_fusionado, validar_horario
-                signal_validacion_desconectada = bool(pre_save.disconnect(validar_horario, sender=Horario))
-                signal_fusionado_desconectada = bool(post_save.disconnect(crear_horario_fusionado, sender=Horario))
-                if signal_validacion_desconectada:
-                    self.stdout.write(self.style.WARNING('Validacion de solapamientos desactivada temporalmente para ETL de horarios.'))
-                if signal_fusionado_desconectada:
-                    self.stdout.write(self.style.WARNING('Generacion de HorarioFusionado desactivada temporalmente para ETL de horarios.'))
-            except Exception as exc:
-                self.stdout.write(self.style.WARNING(f'No fue posible desactivar signals de horarios: {exc}'))
-
-        try:
+        # Las signals de Horario ya no se desconectan durante el ETL. Dentro
+        # de validacion_diferida() solo acumulan los horarios guardados y se
+        # validan todos juntos (en pocas consultas) al cerrar el bloque.
+        # Oracle es la fuente de verdad, asi que los conflictos se reportan
+        # pero no impiden la carga. Dentro de fusionados_diferidos() los
+        # HorarioFusionado se recalculan una sola vez por clase al final, sin
+        # notificaciones (como el resto de registros de origen SIUL).
+        with validacion_diferida() as lote_validacion, fusionados_diferidos(en_lote=True):
             for stg_horario in stg_horarios:
                 try:
                     raw = stg_horario.raw_data or {}
@@ -1550,42 +1544,35 @@ class Command(BaseCommand):
                 except Exception as exc:
                     self.stdout.write(self.style.ERROR(f'  Error en horario {stg_horario.external_id}: {exc}'))
                     horarios_error += 1
-        finally:
-            if signal_validacion_desconectada or signal_fusionado_desconectada:
-                try:
-                    from django.db.models.signals import post_save, pre_save
-                    from horario.signals import crear_horario_fusionado, validar_horario
-                    if signal_validacion_desconectada:
-                        pre_save.connect(validar_horario, sender=Horario)
-                        self.stdout.write(self.style.SUCCESS('Validacion de solapamientos reactivada al finalizar ETL de horarios.'))
-                    if signal_fusionado_desconectada:
-                        post_save.connect(crear_horario_fusionado, sender=Horario)
-                        self.stdout.write(self.style.SUCCESS('Generacion de HorarioFusionado reactivada al finalizar ETL de horarios.'))
-                except Exception as exc:
-                    self.stdout.write(self.style.WARNING(f'No fue posible reactivar signals de horarios: {exc}'))
-
-        # Reconciliacion: cualquier Horario de origen SIUL, perteneciente a un
-        # periodo que se toco en esta corrida, que no fue creado ni actualizado
-        # arriba, significa que Oracle ya no lo reporta (cambio de identidad,
-        # aula, grupo cancelado, etc.). Sin esto, los horarios obsoletos quedan
-        # huerfanos para siempre en la BD tras un cambio de aula/horario.
-        # Se omite si la corrida fue acotada (--limit o --seccional), porque en
-        # ese caso el staging procesado no representa el universo completo del
-        # periodo y borrar por ausencia seria incorrecto.
-        if not dry_run and periodo_ids_afectados and not limit and not seccional_filter:
-            huerfanos_qs = Horario.objects.filter(
-                origen='SIUL',
-                grupo__periodo_id__in=periodo_ids_afectados,
-            ).exclude(id__in=horario_ids_procesados)
-            horarios_huerfanos_eliminados = huerfanos_qs.count()
-            if horarios_huerfanos_eliminados:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f'Eliminando {horarios_huerfanos_eliminados} horarios SIUL obsoletos '
-                        '(ya no aparecen en el staging Oracle actual para su periodo).'
+
+            # Reconciliacion: cualquier Horario de origen SIUL, perteneciente a un
+            # periodo que se toco en esta corrida, que no fue creado ni actualizado
+            # arriba, significa que Oracle ya no lo reporta (cambio de identidad,
+            # aula, grupo cancelado, etc.). Sin esto, los horarios obsoletos quedan
+            # huerfanos para siempre en la BD tras un cambio de aula/horario.
+            # Se omite si la corrida fue acotada (--limit o --seccional), porque en
+            # ese caso el staging procesado no representa el universo completo del
+            # periodo y borrar por ausencia seria incorrecto.
+            if not dry_run and periodo_ids_afectados and not limit and not seccional_filter:
+                huerfanos_qs = Horario.objects.filter(
+                    origen='SIUL',
+                    grupo__periodo_id__in=periodo_ids_afectados,
+                ).exclude(id__in=horario_ids_procesados)
+                horarios_huerfanos_eliminados = huerfanos_qs.count()
+                if horarios_huerfanos_eliminados:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f'Eliminando {horarios_huerfanos_eliminados} horarios SIUL obsoletos '
+                            '(ya no aparecen en el staging Oracle actual para su periodo).'
+                        )
                     )
-                )
-                huerfanos_qs.delete()
+                    huerfanos_qs.delete()
+
+        conflictos_espacio = len(lote_validacion.conflictos)
+        if conflictos_espacio:
+            self.stdout.write(self.style.WARNING(f'Conflictos de espacio en horarios cargados: {conflictos_espacio}'))
+            for conflicto in lote_validacion.conflictos[:20]:
+                self.stdout.write(self.style.WARNING(f'  Horario {conflicto.horario.id}: {conflicto.mensaje}'))
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -1596,6 +1583,7 @@ class Command(BaseCommand):
                 f'Errores: {horarios_error}, '
                 f'Duplicados reutilizados: {duplicados_horario_reutilizados}, '
                 f'Huerfanos eliminados: {horarios_huerfanos_eliminados}, '
+                f'Conflictos de espacio: {conflictos_espacio}, '
                 f'Grupo no encontrado: {grupo_no_encontrado}, '
                 f'Asignatura no encontrada: {asignatura_no_encontrada}, '
                 f'Espacio no encontrado: {espacio_no_encontrado}, '
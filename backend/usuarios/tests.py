@@ -1,3 +1,77 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
 
-# Create your tests here.
+from componentes.models import Componente, ComponenteRol, ComponenteUsuario
+from componentes.permisos import componentes_efectivos
+from mysite.auth_helpers import get_componente_permiso, user_can_edit_componente
+from mysite.middleware import SedeFilterMiddleware
+from mysite.seccional_auth import SessionUsuarioAuthentication
+from sedes.models import Seccional, Sede
+
+from .models import Rol, Usuario
+
+
+class IdentidadYPermisosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.rol = Rol.objects.create(nombre='admin_planeacion')
+        sede = Sede.objects.create(nombre='Sede Norte', seccional=Seccional.objects.create(ciudad='Norte'))
+        self.usuario = Usuario(
+            correo='planeacion@sihul.local',
+            nombre='Admin Planeacion',
+            rol=self.rol,
+            sede=sede,
+            activo=True,
+            contrasena_hash='!',
+        )
+        self.usuario.set_unusable_password()
+        self.usuario.save()
+        self.componente = Componente.objects.create(nombre='Gestión de Usuarios')
+        ComponenteRol.objects.create(rol=self.rol, componente=self.componente, permiso='EDITAR')
+
+    def _autenticar(self):
+        request = self.factory.get('/api/usuarios/')
+        request.session = {'user_id': self.usuario.id}
+        SedeFilterMiddleware(lambda req: None).process_request(request)
+        usuario, _ = SessionUsuarioAuthentication().authenticate(request)
+        self.assertIs(usuario, request.user_obj)
+        return request, usuario
+
+    def test_identidad_y_permisos_sin_consultas_tras_la_primera_request(self):
+        with self.assertNumQueries(3):
+            _, usuario = self._autenticar()
+            self.assertTrue(user_can_edit_componente(usuario, 'Gestión de Usuarios'))
+
+        with self.assertNumQueries(0):
+            request, usuario = self._autenticar()
+            self.assertEqual(request.seccional.ciudad, 'Norte')
+            self.assertTrue(user_can_edit_componente(usuario, 'Gestión de Usuarios'))
+
+    def test_override_inactivo_invalida_la_identidad_cacheada(self):
+        _, usuario = self._autenticar()
+        self.assertTrue(user_can_edit_componente(usuario, 'Gestión de Usuarios'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ComponenteUsuario.objects.create(
+                usuario=self.usuario, componente=self.componente, permiso='EDITAR', activo=False,
+            )
+
+        _, usuario = self._autenticar()
+        self.assertFalse(user_can_edit_componente(usuario, 'Gestión de Usuarios'))
+
+    def test_mapa_de_rol_se_comparte_y_se_invalida_al_cambiar_componente_rol(self):
+        otro = Usuario.objects.create(
+            correo='otro@sihul.local', nombre='Otro', rol=self.rol, activo=True, contrasena_hash='!',
+        )
+        self.assertEqual(componentes_efectivos(self.usuario)[self.componente.id]['permiso'], 'EDITAR')
+
+        # Solo falta el override del segundo usuario: el mapa del rol ya está en caché.
+        with self.assertNumQueries(1):
+            self.assertEqual(get_componente_permiso(otro, 'Gestión de Usuarios'), 'EDITAR')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ComponenteRol.objects.filter(rol=self.rol).get().delete()
+
+        otro = Usuario.objects.get(id=otro.id)
+        self.assertIsNone(get_componente_permiso(otro, 'Gestión de Usuarios'))
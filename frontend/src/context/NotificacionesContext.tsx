@@ -1,11 +1,20 @@
 /* eslint-disable react-refresh/only-export-components */
 import { createContext, useContext, useState, useEffect, useCallback, type ReactNode } from 'react';
 import { useAuthOptional } from './AuthContext';
-import { obtenerEstadisticas } from '../services/notificaciones/notificacionesAPI';
+import {
+    obtenerEstadisticas,
+    suscribirNotificaciones,
+    type EstadisticasNotificaciones,
+    type Notificacion,
+} from '../services/notificaciones/notificacionesAPI';
 
 interface NotificacionesContextType {
     contadorNoLeidas: number;
     actualizarContador: () => Promise<void>;
+    /** Últimas estadísticas recibidas por el flujo en vivo (null sin flujo) */
+    estadisticas: EstadisticasNotificaciones | null;
+    /** Última notificación recibida por el flujo en vivo */
+    ultimaNotificacion: Notificacion | null;
 }
 
 const NotificacionesContext = createContext<NotificacionesContextType | undefined>(undefined);
@@ -16,6 +25,8 @@ export function NotificacionesProvider({ children }: { children: ReactNode }) {
     const isAuthenticated = auth?.isAuthenticated ?? false;
     const isAuthLoading = auth?.isLoading ?? false;
     const [contadorNoLeidas, setContadorNoLeidas] = useState(0);
+    const [estadisticas, setEstadisticas] = useState<EstadisticasNotificaciones | null>(null);
+    const [ultimaNotificacion, setUltimaNotificacion] = useState<Notificacion | null>(null);
 
     /**
      * Actualiza el contador de notificaciones no leídas
@@ -44,25 +55,43 @@ export function NotificacionesProvider({ children }: { children: ReactNode }) {
     }, [user?.id, isAuthenticated, isAuthLoading]);
 
     /**
-     * Polling automático cada 30 segundos
+     * Contador en vivo por el flujo de notificaciones; si el backend no lo
+     * ofrece, polling cada 30 segundos
      */
     useEffect(() => {
         if (!isAuthenticated || !user?.id || isAuthLoading) {
             setContadorNoLeidas(0);
+            setEstadisticas(null);
             return;
         }
 
-        // Carga inicial
-        actualizarContador();
+        let interval: ReturnType<typeof setInterval> | undefined;
+        const cerrar = suscribirNotificaciones({
+            onEstadisticas: (stats) => {
+                setEstadisticas(stats);
+                setContadorNoLeidas(stats.no_leidas);
+            },
+            onNotificacion: setUltimaNotificacion,
+            onNoDisponible: () => {
+                setEstadisticas(null);
+                if (interval === undefined) {
+                    // Carga inicial
+                    actualizarContador();
+                    interval = setInterval(actualizarContador, 30000);
+                }
+            },
+        });
 
-        // Polling cada 30 segundos
-        const interval = setInterval(actualizarContador, 30000);
-
-        return () => clearInterval(interval);
+        return () => {
+            cerrar();
+            if (interval !== undefined) {
+                clearInterval(interval);
+            }
+        };
     }, [actualizarContador, isAuthenticated, user?.id, isAuthLoading]);
 
     return (
-        <NotificacionesContext.Provider value={{ contadorNoLeidas, actualizarContador }}>
+        <NotificacionesContext.Provider value={{ contadorNoLeidas, actualizarContador, estadisticas, ultimaNotificacion }}>
             {children}
         </NotificacionesContext.Provider>
     );
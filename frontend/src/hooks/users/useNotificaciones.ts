@@ -103,7 +103,7 @@ const formatearFecha = (fechaISO: string): string => {
 
 export function useNotificaciones(onNotificacionesChange?: (count: number) => void) {
     const { user } = useAuth();
-    const { actualizarContador } = useNotificacionesContext();
+    const { actualizarContador, estadisticas: estadisticasEnVivo, ultimaNotificacion } = useNotificacionesContext();
     const [notificaciones, setNotificaciones] = useState<NotificacionUsuario[]>([]);
     const [filterTab, setFilterTab] = useState<CategoriaNotificacion>('pendientes');
     const [isLoading, setIsLoading] = useState(false);
@@ -226,9 +226,23 @@ export function useNotificaciones(onNotificacionesChange?: (count: number) => vo
     }, [busquedaActiva, paginaActual, filterTab, filtroTiempo, filtroPrioridad]);
 
     /**
-     * Carga inicial y polling de estadísticas
+     * Estadísticas: las del flujo en vivo cuando está disponible; si no,
+     * carga inicial y polling
      */
     useEffect(() => {
+        if (estadisticasEnVivo) {
+            setStats({
+                total: estadisticasEnVivo.total,
+                pendientes: estadisticasEnVivo.no_leidas,
+                leidas: estadisticasEnVivo.leidas,
+                eliminadas: 0,
+            });
+            if (onNotificacionesChange) {
+                onNotificacionesChange(estadisticasEnVivo.no_leidas);
+            }
+            return;
+        }
+
         cargarEstadisticas();
 
         // Polling cada 30 segundos solo para estadísticas
@@ -237,7 +251,17 @@ export function useNotificaciones(onNotificacionesChange?: (count: number) => vo
         }, 30000);
 
         return () => clearInterval(interval);
-    }, [cargarEstadisticas]);
+    }, [estadisticasEnVivo, cargarEstadisticas, onNotificacionesChange]);
+
+    /**
+     * Una notificación nueva por el flujo en vivo aparece en la primera página
+     */
+    useEffect(() => {
+        if (ultimaNotificacion && paginaActual === 1) {
+            cargarNotificaciones(1);
+        }
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [ultimaNotificacion]);
 
     /**
      * Función para cambiar de página
@@ -1,4 +1,5 @@
 import { apiClient } from '../../core/apiClient';
+import { resolveApiBaseUrl } from '../../core/backendUrl';
 import type { NotificacionBackend, NotificacionesPaginadas } from '../../models/users/notification.model';
 
 const API_URL = '/notificaciones';
@@ -167,6 +168,44 @@ export const obtenerEstadisticas = async (
   });
 };
 
+export interface SuscripcionNotificacionesHandlers {
+  onEstadisticas: (estadisticas: EstadisticasNotificaciones) => void;
+  onNotificacion?: (notificacion: Notificacion) => void;
+  /** El flujo no está disponible (p.ej. backend servido por WSGI): volver a consultar periódicamente */
+  onNoDisponible?: () => void;
+}
+
+/**
+ * Suscribirse a las notificaciones en vivo (Server-Sent Events)
+ * GET /notificaciones/flujo/
+ * Devuelve la función que cierra la conexión.
+ */
+export const suscribirNotificaciones = (handlers: SuscripcionNotificacionesHandlers): (() => void) => {
+  if (typeof EventSource === 'undefined') {
+    handlers.onNoDisponible?.();
+    return () => {};
+  }
+
+  const fuente = new EventSource(`${resolveApiBaseUrl(import.meta.env.VITE_API_URL)}${API_URL}/flujo/`, {
+    withCredentials: true,
+  });
+
+  fuente.addEventListener('estadisticas', (evento) => {
+    handlers.onEstadisticas(JSON.parse((evento as MessageEvent).data));
+  });
+  fuente.addEventListener('notificacion', (evento) => {
+    handlers.onNotificacion?.(JSON.parse((evento as MessageEvent).data));
+  });
+  fuente.onerror = () => {
+    // EventSource reintenta solo tras cortes; si queda cerrado, la respuesta no fue un flujo
+    if (fuente.readyState === EventSource.CLOSED) {
+      handlers.onNoDisponible?.();
+    }
+  };
+
+  return () => fuente.close();
+};
+
 /**
  * Marcar una notificación como leída
  * POST /notificaciones/marcar-leida/{id}/
@@ -236,6 +275,7 @@ export default {
   obtenerMisNotificaciones,
   obtenerMisNotificacionesPaginadas,
   obtenerEstadisticas,
+  suscribirNotificaciones,
   marcarComoLeida,
   marcarTodasComoLeidas,
   obtenerNotificacionesNoLeidas,